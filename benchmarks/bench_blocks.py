@@ -0,0 +1,93 @@
+"""
+===============================================================================
+ Script Name: bench_blocks.py
+ Author: Igor Latii
+ Description:
+     Size of the merged dataset stored as one wide table vs. as frequency
+     blocks (`src/frequency_blocks.py`), on the synthetic annual / quarterly /
+     monthly indicators of `bench_merge.py`:
+
+        - cells:   stored values (rows x indicators), NaN padding included;
+        - memory:  in-memory size of the DataFrame(s);
+        - file:    bytes on disk in the storage format (`PIPELINE_FORMAT`);
+        - annual:  time to load and aggregate by year (sum) from each layout.
+
+     `read_wide` is checked to rebuild exactly the wide table.
+
+ Usage:
+     python benchmarks/bench_blocks.py [--indicators 15 100 400] [--series 3]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_merge import make_tables  # noqa: E402
+from frequency_blocks import block_stem, read_blocks, read_wide, write_blocks  # noqa: E402
+from make_merged_df import align_series, indicator_series, native_frequency  # noqa: E402
+from storage import find_table, read_table, write_table  # noqa: E402
+from time_periods import FREQUENCIES  # noqa: E402
+
+
+def annual_wide(stem):
+    df = read_table(stem)
+    return df.groupby(pd.to_datetime(df['TIME_PERIOD']).dt.year).sum(numeric_only=True)
+
+
+def annual_blocks(stem):
+    yearly = [b.groupby(pd.to_datetime(b['TIME_PERIOD']).dt.year).sum(numeric_only=True)
+              for b in read_blocks(stem).values()]
+    return pd.concat(yearly, axis=1)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--indicators', type=int, nargs='+', default=[15, 100, 400])
+    parser.add_argument('--series', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'indicators':>10} {'layout':>7} {'cells':>9} {'memory MB':>10} {'file KB':>8} {'annual s':>9} {'same':>5}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.indicators:
+            tables = make_tables(n, args.series)
+            series_list = [indicator_series(df, name) for name, df in tables.items()]
+            freqs = {name: native_frequency(df) for name, df in tables.items()}
+            columns = [s.name for s in series_list]
+            blocks = {f: align_series([s for s in series_list if freqs[s.name] == f])
+                      for f in FREQUENCIES if f in freqs.values()}
+            wide = align_series(series_list)
+
+            stem = os.path.join(tmp, f"merged_{n}")
+            write_table(wide, stem + '_wide')
+            write_blocks(blocks, columns, stem)
+            same = read_wide(stem).equals(read_table(stem + '_wide'))
+
+            layouts = {
+                'wide': (wide.shape[0] * n, wide.memory_usage(deep=True).sum(),
+                         os.path.getsize(find_table(stem + '_wide')), timed(annual_wide, stem + '_wide')),
+                'blocks': (sum(b.shape[0] * (b.shape[1] - 1) for b in blocks.values()),
+                           sum(b.memory_usage(deep=True).sum() for b in blocks.values()),
+                           sum(os.path.getsize(find_table(block_stem(stem, f))) for f in blocks),
+                           timed(annual_blocks, stem)),
+            }
+            for layout, (cells, memory, size, seconds) in layouts.items():
+                print(f"{n:>10} {layout:>7} {cells:>9,} {memory / 1e6:>10.2f} {size / 1e3:>8.0f} "
+                      f"{seconds:>9.3f} {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
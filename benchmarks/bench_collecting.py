@@ -0,0 +1,153 @@
+"""
+===============================================================================
+ Script Name: bench_collecting.py
+ Author: Igor Latii
+ Description:
+     Measures how the concurrent collector in `src/collecting_data.py` scales
+     with the number of worker threads, without touching the real Eurostat API.
+
+     A local stand-in HTTP server answers `/data/{code}?format=TSV&compressed=true`
+     with a synthetic gzip-compressed Eurostat TSV after an artificial latency.
+     A fraction of requests can be answered with HTTP 503 to exercise the retry
+     and backoff path. The 15 indicators of `/reports/indicators.csv` are then
+     collected with 1, 2, 4, 8 and 15 workers and the wall times are printed.
+
+     The server also sends an ETag and answers conditional requests with
+     HTTP 304, so `--cache` measures a cold run against a warm, unchanged
+     refresh through `download_cache.py`. Like Eurostat, it serves a data
+     structure per dataset and honours SDMX query keys (`/data/{code}/{key}`).
+
+ Usage:
+     python benchmarks/bench_collecting.py [--latency 0.5] [--fail-rate 0.1] [--cache]
+===============================================================================
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from collecting_data import collect_all  # noqa: E402
+from download_cache import DownloadCache  # noqa: E402
+from eurostat_client import EurostatClient  # noqa: E402
+from indicator_config import load_indicators  # noqa: E402
+
+
+DIMENSIONS = ['freq', 'unit', 'geo']
+STRUCTURE = ('<Structure><DimensionList>'
+             + ''.join(f'<Dimension id="{dim}" position="{i + 1}"/>' for i, dim in enumerate(DIMENSIONS))
+             + '<TimeDimension id="TIME_PERIOD" position="4"/></DimensionList></Structure>').encode('utf-8')
+
+
+def make_tsv(code, n_geos=30, n_years=25):
+    """Build a small synthetic Eurostat TSV (annual, two units) for `code`, as a list of lines."""
+    geos = ['LV'] + [f"G{i:02d}" for i in range(n_geos - 1)]
+    years = [str(2000 + y) for y in range(n_years)]
+    lines = ['freq,unit,geo\\TIME_PERIOD\t' + '\t'.join(f"{y} " for y in years)]
+    rnd = random.Random(code)
+    for unit in ('NR', 'PC'):
+        for geo in geos:
+            cells = [f"{rnd.uniform(1, 1000):.1f} " if rnd.random() > 0.1 else ': ' for _ in years]
+            lines.append(f"A,{unit},{geo}\t" + '\t'.join(cells))
+    return lines
+
+
+def select(lines, key):
+    """Apply an SDMX query key such as '.NR.LV+EE' to the TSV lines."""
+    allowed = [set(part.split('+')) if part else None for part in key.split('.')]
+    kept = [line for line in lines[1:]
+            if all(a is None or k in a for a, k in zip(allowed, line.split('\t')[0].split(',')))]
+    return [lines[0]] + kept
+
+
+def make_handler(payloads, latency, fail_rate):
+    class StandInHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path).path.strip('/').split('/')
+            time.sleep(latency)
+            if parts[0] == 'datastructure' and parts[-1] in payloads:
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(STRUCTURE)))
+                self.end_headers()
+                self.wfile.write(STRUCTURE)
+                return
+            code = parts[1] if parts[0] == 'data' and len(parts) > 1 else None
+            if code not in payloads:
+                self.send_error(404)
+                return
+            if random.random() < fail_rate:
+                self.send_error(503)
+                return
+            lines = select(payloads[code], parts[2]) if len(parts) > 2 else payloads[code]
+            body = gzip.compress('\r\n'.join(lines).encode('utf-8'), mtime=0)
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StandInHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.5, help="artificial server latency in seconds")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 15])
+    parser.add_argument('--cache', action='store_true', help="also time a cold and a warm cached refresh")
+    args = parser.parse_args()
+
+    # The synthetic tables only have freq/unit/geo, so the real dimension selections do not apply
+    indicators = load_indicators().drop(columns='dimensions', errors='ignore')
+    payloads = {code: make_tsv(code) for code in indicators['code']}
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(payloads, args.latency, args.fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for workers in args.workers:
+            client = EurostatClient(base_url, max_per_host=workers, retries=4, backoff=0.05)
+            start = time.perf_counter()
+            succeeded, failed = collect_all(indicators, client, workers, out_dir)
+            results.append((workers, time.perf_counter() - start, len(succeeded), len(failed)))
+
+        cache_results = []
+        if args.cache:
+            cache = DownloadCache(os.path.join(out_dir, 'cache'))
+            client = EurostatClient(base_url, max_per_host=4, retries=4, backoff=0.05)
+            for label in ('cold', 'warm'):
+                start = time.perf_counter()
+                collect_all(indicators, client, 4, out_dir, cache, use_toc=False)
+                cache_results.append((label, time.perf_counter() - start, cache.format_stats()))
+    server.shutdown()
+
+    print(f"\n{'workers':>8} {'seconds':>9} {'speedup':>8} {'ok':>4} {'failed':>7}")
+    for workers, seconds, ok, bad in results:
+        print(f"{workers:>8} {seconds:>9.2f} {results[0][1] / seconds:>8.2f} {ok:>4} {bad:>7}")
+    for label, seconds, stats in cache_results:
+        print(f"{label:>8} {seconds:>9.2f}  {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+===============================================================================
+ Script Name: bench_correlation.py
+ Author: Igor Latii
+ Description:
+     Correlation analysis of a synthetic annual table (30 years) with many
+     indicators and research questions over overlapping indicator sets:
+
+        - before:   `eda_visualization.py` before `src/correlation.py`, one
+                    `replace(0, NA).dropna().corr()` per RQ;
+        - engine:   one `CorrelationEngine` over the union of indicators,
+                    every RQ served from the cached matrix;
+        - lagged:   cross-correlations of all ordered pairs, lags -3..3;
+        - rolling:  10-year rolling correlations of all pairs;
+        - boot:     bootstrap 95% intervals of all pairs (--boot resamples).
+
+     The matrix of the engine is checked against pandas' pairwise-complete
+     `DataFrame.corr()`.
+
+ Usage:
+     python benchmarks/bench_correlation.py [--indicators 100 300] [--rqs 50] [--boot 1000]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from correlation import CorrelationEngine  # noqa: E402
+
+
+def make_annual(n_indicators, seed=0):
+    """Annual table (Year, indicators) with correlated series, 10% missing values and a few zeros."""
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(size=(30, 5))
+    values = factors @ rng.normal(size=(5, n_indicators)) + rng.normal(size=(30, n_indicators))
+    values = values * rng.uniform(1, 1000, n_indicators) + rng.uniform(0, 5000, n_indicators)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[rng.random(values.shape) < 0.01] = 0
+    df = pd.DataFrame(values, columns=[f"Indicator {i:03d}" for i in range(n_indicators)])
+    df.insert(0, 'Year', np.arange(1995, 2025))
+    return df
+
+
+def make_rqs(names, n_rqs, per_rq=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(names, per_rq, replace=False)) for _ in range(n_rqs)]
+
+
+def correlations_before(df, rqs):
+    return [df[indicators].replace(0, pd.NA).dropna().corr() for indicators in rqs]
+
+
+def correlations_engine(df, rqs):
+    engine = CorrelationEngine(df, [ind for indicators in rqs for ind in indicators])
+    return [engine.matrix(indicators) for indicators in rqs]
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--indicators', type=int, nargs='+', default=[100, 300])
+    parser.add_argument('--rqs', type=int, default=50)
+    parser.add_argument('--boot', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'indicators':>10} {'before s':>9} {'engine s':>9} {'lagged s':>9} {'rolling s':>10} "
+          f"{'boot s':>7} {'max diff':>9}")
+    for n in args.indicators:
+        df = make_annual(n)
+        names = list(df.columns[1:])
+        rqs = make_rqs(names, args.rqs)
+        before_s, _ = timed(correlations_before, df, rqs)
+        engine_s, _ = timed(correlations_engine, df, rqs)
+
+        engine = CorrelationEngine(df, names)
+        lagged_s, _ = timed(engine.lagged, 3)
+        rolling_s, _ = timed(engine.rolling, 10)
+        boot_s, _ = timed(engine.bootstrap, args.boot)
+        diff = np.nanmax(np.abs(engine.matrix().to_numpy() - df[names].replace(0, np.nan).corr().to_numpy()))
+        print(f"{n:>10} {before_s:>9.3f} {engine_s:>9.3f} {lagged_s:>9.3f} {rolling_s:>10.3f} "
+              f"{boot_s:>7.2f} {diff:>9.1e}")
+
+
+if __name__ == '__main__':
+    main()
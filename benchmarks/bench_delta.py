@@ -0,0 +1,219 @@
+"""
+===============================================================================
+ Script Name: bench_delta.py
+ Author: Igor Latii
+ Description:
+     Cost of a monthly refresh with and without delta updates
+     (`pipeline.py --delta`), on a synthetic multi-country dataset
+     (`synthetic_data.py`, panel mode).
+
+     The pipeline first runs once over the whole history. Then Eurostat
+     "publishes a new month" of `--datasets` monthly datasets: their raw
+     tables (one per geo) get a new period column (the month after the last
+     one) and revised values for the last `--revised` months of a few
+     series. The same refresh is run on two copies of the data:
+
+        - full    incremental runs as before: the refreshed tables are
+                  transformed and formatted again, merge, annual and the
+                  feature store rebuild the whole history;
+        - delta   the same, but merge reads only the refreshed indicators and
+                  rebuilds only their frequency blocks, annual aggregates
+                  only the periods holding a new or revised value, and the
+                  feature store computes again only the rows depending on
+                  them.
+
+     In both runs the refreshed raw tables go through the long-format and
+     formatting stages over their whole history (no delta there), so these
+     stages take the same time in both columns.
+
+     In both runs the EDA redraws only the figures whose data changed (its
+     figure cache). Per-stage wall times come from the telemetry of the runs
+     (telemetry.py); the merged, annual and feature outputs of the two runs
+     are compared value by value.
+
+ Usage:
+     python benchmarks/bench_delta.py [--geos 27] [--years 30] [--indicators 30]
+            [--dimensions 2] [--codes 2] [--datasets 1] [--revised 3] [--months 1]
+===============================================================================
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from synthetic_data import LAST_YEAR, generate  # noqa: E402
+
+LOCAL_STAGES = ['long_estat', 'long_wb', 'format', 'merge', 'annual', 'features', 'eda']
+
+
+# === Child process: one pipeline run ===
+def run_pipeline_child():
+    """Run the local stages incrementally in this process (EDA questions of the synthetic data: rqs.json)."""
+    import pipeline
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            summary = pipeline.run_pipeline()
+        finally:
+            sys.stdout = stdout
+    return {stage: {'rebuilt': c['rebuilt'], 'keys': None if c.get('keys') is None else len(c['keys'])}
+            for stage, c in summary.items()}
+
+
+def run_pipeline(data_dir, reports_dir, delta, telemetry_file=None):
+    env = dict(os.environ, PIPELINE_DATA_DIR=data_dir, PIPELINE_REPORTS_DIR=reports_dir, PIPELINE_PANEL='1',
+               PIPELINE_DELTA='1' if delta else '0')
+    env.pop('PIPELINE_TELEMETRY', None)
+    if telemetry_file:
+        env['PIPELINE_TELEMETRY'] = telemetry_file
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("Pipeline run failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def stage_seconds(telemetry_file):
+    """Wall time of every stage and number of figures drawn by the EDA, from a telemetry file."""
+    with open(telemetry_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    seconds = {r['name']: r['wall_s'] for r in records if r['cat'] == 'stage'}
+    return seconds, sum(r['cat'] == 'file' and r['parent'] == 'eda' for r in records)
+
+
+# === The refresh ===
+def next_month(label):
+    year, month = int(label[:4]), int(label[5:7])
+    return f"{year + month // 12}-{month % 12 + 1:02d}"
+
+
+def refresh_raw(raw_dir, datasets=1, months=1, revised=3, seed=1):
+    """
+    Add `months` new monthly periods to the raw tables (all geos) of the
+    first `datasets` Eurostat datasets with monthly series (0: all of them),
+    and revise the last `revised` months of a fifth of their series; returns
+    the number of tables refreshed and the dataset codes.
+    """
+    from storage import list_tables, read_columns, read_table, write_table
+    rng = np.random.default_rng(seed)
+    refreshed, codes = 0, []
+    for stem in list_tables(raw_dir, suffix='_raw'):
+        monthly = [c for c in read_columns(stem) if len(c) == 7 and c[4] == '-' and c[5:].isdigit()]
+        code = os.path.basename(stem).split('__')[0]
+        if not monthly or (code not in codes and datasets and len(codes) == datasets):
+            continue
+        codes += [code] if code not in codes else []
+        df = read_table(stem)
+        rows = (df['freq'].astype(str) == 'M').to_numpy()
+        revised_rows = rows & (rng.random(len(df)) < 0.2)
+        for column in monthly[-revised:]:
+            df[column] = df[column].astype('float64').mask(revised_rows, df[column] * 1.01)
+        last = df[monthly[-1]].astype('float64')
+        for _ in range(months):
+            column = next_month(monthly[-1])
+            monthly.append(column)
+            last = (last * np.exp(rng.normal(0, 0.03, len(df)))).round(1)
+            df[column] = np.where(rows, last, np.nan)
+        write_table(df, stem)
+        refreshed += 1
+    return refreshed, codes
+
+
+# === Comparison ===
+def compare_outputs(a, b):
+    """Names of the merged / annual / feature tables that differ between two data directories."""
+    from frequency_blocks import read_wide
+    from storage import read_table
+    merged = os.path.join('processed', 'merged')
+    differ = []
+    frames = {'merged (wide)': lambda d: read_wide(os.path.join(d, merged, 'merged_df_readable')),
+              'merged_df_readable.csv': lambda d: pd.read_csv(os.path.join(d, merged, 'merged_df_readable.csv')),
+              'merged_df_annual': lambda d: read_table(os.path.join(d, merged, 'merged_df_annual')),
+              'merged_df_annual.csv': lambda d: pd.read_csv(os.path.join(d, merged, 'merged_df_annual.csv')),
+              'merged_df_features': lambda d: read_table(os.path.join(d, merged, 'merged_df_features'))}
+    for name, read in frames.items():
+        x, y = read(a), read(b)
+        x = x.astype({c: str for c in x.columns if isinstance(x[c].dtype, pd.CategoricalDtype)})
+        y = y.astype({c: str for c in y.columns if isinstance(y[c].dtype, pd.CategoricalDtype)})
+        if not x.equals(y):
+            differ.append(name)
+    with open(os.path.join(a, merged, 'merged_df_readable.csv'), 'rb') as x, \
+            open(os.path.join(b, merged, 'merged_df_readable.csv'), 'rb') as y:
+        if x.read() != y.read(): # the delta run patches the lines of this file in place
+            differ.append('merged_df_readable.csv (bytes)')
+    return differ
+
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == '--child':
+        print(json.dumps(run_pipeline_child()))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=27)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--indicators', type=int, default=30)
+    parser.add_argument('--dimensions', type=int, default=2)
+    parser.add_argument('--codes', type=int, default=2)
+    parser.add_argument('--datasets', type=int, default=1, help="monthly datasets refreshed (0: all)")
+    parser.add_argument('--revised', type=int, default=3, help="months revised in every refreshed table")
+    parser.add_argument('--months', type=int, default=1, help="new months per refreshed table")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base, reports_dir = os.path.join(tmp, 'base'), os.path.join(tmp, 'reports')
+        data = generate(base, reports_dir, args.geos, args.years, args.indicators, args.dimensions, args.codes,
+                        wb_indicators=2)
+        print(f"{data['raw_files']} raw files, {data['raw_bytes'] / 1e6:.1f} MB, history {LAST_YEAR - args.years + 1}"
+              f"-{LAST_YEAR}")
+        run_pipeline(base, reports_dir, delta=False)
+
+        # --- Two copies of the up-to-date data, each run once so that the runner knows their files ---
+        dirs = {mode: os.path.join(tmp, mode) for mode in ('full', 'delta')}
+        for mode, data_dir in dirs.items():
+            shutil.copytree(base, data_dir, symlinks=True)
+            run_pipeline(data_dir, reports_dir, delta=mode == 'delta')
+
+        for data_dir in dirs.values():
+            tables, codes = refresh_raw(os.path.join(data_dir, 'raw'), args.datasets, args.months, args.revised)
+        print(f"Refresh of {', '.join(codes)}: {tables} raw tables with {args.months} new month(s) and "
+              f"{args.revised} revised month(s)\n")
+
+        seconds, summaries, figures = {}, {}, {}
+        for mode, data_dir in dirs.items():
+            telemetry_file = os.path.join(tmp, f"{mode}.jsonl")
+            summaries[mode] = run_pipeline(data_dir, reports_dir, mode == 'delta', telemetry_file)
+            seconds[mode], figures[mode] = stage_seconds(telemetry_file)
+
+        print(f"{'stage':<11} {'full':>9} {'delta':>9} {'speed-up':>9}   outputs rebuilt")
+        for stage in LOCAL_STAGES:
+            full, delta = seconds['full'].get(stage, 0.0), seconds['delta'].get(stage, 0.0)
+            counts = summaries['delta'][stage]
+            keys = f" (delta, {counts['keys']} changed keys)" if counts['keys'] is not None else ''
+            keys += f" ({figures['delta']} figures redrawn)" if stage == 'eda' else ''
+            print(f"{stage:<11} {full:>8.2f}s {delta:>8.2f}s {full / delta if delta else 0:>8.1f}x   "
+                  f"{counts['rebuilt']}{keys}")
+        total = {mode: sum(seconds[mode].get(s, 0.0) for s in LOCAL_STAGES) for mode in dirs}
+        print(f"{'total':<11} {total['full']:>8.2f}s {total['delta']:>8.2f}s {total['full'] / total['delta']:>8.1f}x")
+
+        differ = compare_outputs(dirs['full'], dirs['delta'])
+        print(f"\nOutputs of the two runs: {'identical' if not differ else 'DIFFERENT: ' + ', '.join(differ)}")
+        if differ:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
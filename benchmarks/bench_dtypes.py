@@ -0,0 +1,108 @@
+"""
+===============================================================================
+ Script Name: bench_dtypes.py
+ Author: Igor Latii
+ Description:
+     Memory report of the load-time dtype policy (storage.py) on a synthetic
+     multi-country dataset (`synthetic_data.py`, panel mode). The same raw
+     data goes through the stages (long format -> annual) with:
+
+        - csv plain       CSV tables, types as read by pandas (text columns
+                          as Python strings), the behaviour before the policy;
+        - csv compact     CSV tables, text columns -> categorical;
+        - parquet         Parquet tables (categoricals stored in the files);
+        - parquet f32     Parquet tables, values as float32
+                          (PIPELINE_FLOAT32=1).
+
+     Every stage runs in a fresh process (see bench_pipeline.py) and reports:
+        - memory_in    in-memory size of the tables the stage loaded (deep,
+                       summed over files and chunks, from telemetry.py);
+        - peak_rss_mb  peak resident memory of the stage process (it includes
+                       about 120 MB of interpreter and libraries);
+        - seconds      wall time.
+
+ Usage:
+     python benchmarks/bench_dtypes.py [--geos 27] [--years 30] [--indicators 20]
+            [--dimensions 3] [--codes 3] [--stages long_estat format merge annual]
+===============================================================================
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import STAGES, run_child  # noqa: E402
+from synthetic_data import generate  # noqa: E402
+
+CONFIGS = {
+    'csv plain': {'PIPELINE_FORMAT': 'csv', 'PIPELINE_DTYPES': 'plain'},
+    'csv compact': {'PIPELINE_FORMAT': 'csv', 'PIPELINE_DTYPES': 'compact'},
+    'parquet': {'PIPELINE_FORMAT': 'parquet', 'PIPELINE_DTYPES': 'compact'},
+    'parquet f32': {'PIPELINE_FORMAT': 'parquet', 'PIPELINE_DTYPES': 'compact', 'PIPELINE_FLOAT32': '1'},
+}
+
+
+def memory_in(telemetry_file, stage):
+    """memory_in of the last record of `stage` in a telemetry file (JSON lines)."""
+    with open(telemetry_file, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    return [r for r in records if r['cat'] == 'stage' and r['name'] == stage][-1]['memory_in']
+
+
+def run_config(tmp, name, overrides, reports_dir, stages):
+    """Run the stages (and the ones before them) on a copy-free view of the raw data; returns the records."""
+    data_dir = os.path.join(tmp, name.replace(' ', '_'))
+    os.makedirs(data_dir)
+    os.symlink(os.path.join(tmp, 'raw_data', 'raw'), os.path.join(data_dir, 'raw'))
+    telemetry_file = os.path.join(tmp, name.replace(' ', '_') + '.jsonl')
+    env = dict(os.environ, PIPELINE_DATA_DIR=data_dir, PIPELINE_REPORTS_DIR=reports_dir, PIPELINE_PANEL='1',
+               PIPELINE_TELEMETRY=telemetry_file, **overrides)
+    records = []
+    for stage in STAGES[:max(STAGES.index(s) for s in stages) + 1]:
+        result = run_child(stage, reports_dir, env)
+        if stage in stages:
+            records.append({'config': name, 'stage': stage, **result,
+                            'memory_in_mb': memory_in(telemetry_file, stage) / 1024 ** 2})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=27)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--indicators', type=int, default=20)
+    parser.add_argument('--dimensions', type=int, default=3)
+    parser.add_argument('--codes', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=['long_estat', 'format', 'merge', 'annual'])
+    args = parser.parse_args()
+
+    stages = [s for s in STAGES if s in args.stages]
+    with tempfile.TemporaryDirectory() as tmp:
+        reports_dir = os.path.join(tmp, 'reports')
+        data = generate(os.path.join(tmp, 'raw_data'), reports_dir, args.geos, args.years, args.indicators,
+                        args.dimensions, args.codes, wb_indicators=2)
+        print(f"{data['raw_files']} raw files, {data['raw_bytes'] / 1e6:.1f} MB\n")
+        print(f"{'config':<13} {'stage':<11} {'memory_in':>10} {'peak RSS':>9} {'time':>8}")
+        records = []
+        for name, overrides in CONFIGS.items():
+            for r in run_config(tmp, name, overrides, reports_dir, stages):
+                records.append(r)
+                print(f"{name:<13} {r['stage']:<11} {r['memory_in_mb']:>7.1f} MB {r['peak_rss_mb']:>6.0f} MB "
+                      f"{r['seconds']:>7.2f}s")
+
+    # --- Reduction of the loaded table memory against the CSV tables of pandas ---
+    print()
+    plain = {r['stage']: r['memory_in_mb'] for r in records if r['config'] == 'csv plain'}
+    for name in list(CONFIGS)[1:]:
+        ratios = [f"{r['stage']} x{plain[r['stage']] / r['memory_in_mb']:.1f}" for r in records
+                  if r['config'] == name and r['memory_in_mb']]
+        print(f"{name:<13} memory_in smaller than csv plain: {', '.join(ratios)}")
+
+
+if __name__ == '__main__':
+    main()
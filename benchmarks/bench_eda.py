@@ -0,0 +1,111 @@
+"""
+===============================================================================
+ Script Name: bench_eda.py
+ Author: Igor Latii
+ Description:
+     EDA plot rendering of a synthetic annual panel (geo, Year, indicators)
+     with many research questions:
+
+        - before:  `eda_visualization.py` before the plot cache, every figure
+                   drawn one after another with the pyplot state machine;
+        - cold:    `run_eda` on an empty plot folder (all figures rendered,
+                   in `--workers` processes);
+        - warm:    `run_eda` again on unchanged data (no figure redrawn);
+        - edit:    `run_eda` after one indicator changed (only its figures
+                   redrawn);
+        - grid:    `run_eda --grid` on an empty plot folder (one time series
+                   figure per RQ).
+
+ Usage:
+     python benchmarks/bench_eda.py [--geos 3 27] [--rqs 6] [--workers 4]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+import eda_visualization  # noqa: E402
+from bench_panel import EU27  # noqa: E402
+from eda_visualization import plot_specs, render_plot, run_eda  # noqa: E402
+from storage import read_table, write_table  # noqa: E402
+
+
+def make_annual(directory, geos, n_indicators, seed=0):
+    """Synthetic annual panel table; returns its stem and the indicator names."""
+    rng = np.random.default_rng(seed)
+    years = np.arange(1995, 2025)
+    names = [f"Indicator {i:02d}" for i in range(n_indicators)]
+    df = pd.DataFrame({'geo': np.repeat(geos, len(years)), 'Year': np.tile(years, len(geos))})
+    for name in names:
+        df[name] = rng.uniform(1, 1000, len(df)).round(1)
+    stem = os.path.join(directory, 'merged_df_annual')
+    write_table(df, stem)
+    return stem, names
+
+
+def make_rqs(names, n_rqs, per_rq=6):
+    """RQs over overlapping windows of the indicators, with two scatter pairs each."""
+    rqs = {}
+    for r in range(n_rqs):
+        indicators = [names[(r * 3 + j) % len(names)] for j in range(per_rq)]
+        rqs[f"RQ{r + 1}"] = {'indicators': indicators,
+                             'scatter_pairs': [(indicators[0], indicators[1]), (indicators[0], indicators[2])]}
+    return rqs
+
+
+def render_sequential(input_stem, output_dir):
+    """Previous rendering: every figure drawn in this process, no cache."""
+    df = read_table(input_stem)
+    for rq_name, rq_info in eda_visualization.RQs.items():
+        for spec in plot_specs(df, rq_name, rq_info['indicators'], rq_info['scatter_pairs'],
+                               rq_info.get('combined'), output_dir):
+            render_plot(spec)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, nargs='+', default=[3, 27])
+    parser.add_argument('--rqs', type=int, default=6)
+    parser.add_argument('--indicators', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'geos':>5} {'figures':>8} {'before s':>9} {'cold s':>7} {'warm s':>7} {'edit s':>7} {'grid s':>7}")
+    for n_geos in args.geos:
+        with tempfile.TemporaryDirectory() as tmp:
+            stem, names = make_annual(tmp, EU27[:n_geos], args.indicators)
+            eda_visualization.RQs = make_rqs(names, args.rqs)
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull # The scripts report every run
+                try:
+                    before_s = timed(render_sequential, stem, os.path.join(tmp, 'before'))
+                    cold_s = timed(run_eda, stem, os.path.join(tmp, 'plots'), False, args.workers)
+                    warm_s = timed(run_eda, stem, os.path.join(tmp, 'plots'), False, args.workers)
+                    df = read_table(stem)
+                    df[names[0]] += 1 # Its time series, scatter plots and heatmaps change
+                    write_table(df, stem)
+                    edit_s = timed(run_eda, stem, os.path.join(tmp, 'plots'), False, args.workers)
+                    grid_s = timed(run_eda, stem, os.path.join(tmp, 'grid'), True, args.workers)
+                finally:
+                    sys.stdout = stdout
+            figures = sum(f.endswith('.png') for _, _, files in os.walk(os.path.join(tmp, 'plots')) for f in files)
+        print(f"{n_geos:>5} {figures:>8} {before_s:>9.2f} {cold_s:>7.2f} {warm_s:>7.2f} {edit_s:>7.2f} {grid_s:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+===============================================================================
+ Script Name: bench_features.py
+ Author: Igor Latii
+ Description:
+     The derived-feature store (src/feature_store.py) on a synthetic annual
+     panel of `--geos` countries, `--years` years and `--indicators`
+     indicators (plus Population, a few gaps and zeros), with the features
+     growth (1 and 5 years), rolling means (3 and 10 years), lags (1 and 2)
+     and per-capita ratios of every indicator.
+
+     The features of the whole history minus its last `--new` years are
+     built first. Then the new years arrive, with revised values in the
+     last year before them, and the features are refreshed twice:
+
+        - full    build(): every row computed again;
+        - delta   update(): only the rows depending on a new or revised
+                  annual row, the others kept from the stored table.
+
+     Both results are compared value by value, and their stored files byte
+     by byte.
+
+ Usage:
+     python benchmarks/bench_features.py [--geos 27] [--years 60] [--indicators 200] [--new 1]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import feature_store  # noqa: E402
+from bench_panel import EU27  # noqa: E402
+from storage import find_table, read_table, write_table  # noqa: E402
+
+
+def make_annual(geos, years, n_indicators, seed=0):
+    """Annual panel table (geo, Year, Population, ind000 …) with gaps and zeros."""
+    rng = np.random.default_rng(seed)
+    keys = pd.MultiIndex.from_product([geos, range(1990, 1990 + years)], names=['geo', 'Year']).to_frame(index=False)
+    values = rng.lognormal(3, 1, (len(keys), n_indicators + 1))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[rng.random(values.shape) < 0.01] = 0.0
+    columns = ['Population'] + [f"ind{i:03d}" for i in range(n_indicators)]
+    annual = pd.concat([keys, pd.DataFrame(values, columns=columns)], axis=1)
+    return annual.astype({'geo': 'category'})
+
+
+def make_specs():
+    return pd.DataFrame({'feature': ['growth', 'growth', 'rolling_mean', 'rolling_mean', 'lag', 'lag', 'per_capita'],
+                         'indicators': ['*'] * 7,
+                         'periods': [1, 5, 3, 10, 1, 2, 1],
+                         'base': [''] * 6 + ['Population']})
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=27)
+    parser.add_argument('--years', type=int, default=60)
+    parser.add_argument('--indicators', type=int, default=200)
+    parser.add_argument('--new', type=int, default=1, help="years arriving in the refresh")
+    args = parser.parse_args()
+
+    geos = (EU27 * (args.geos // len(EU27) + 1))[:args.geos]
+    geos = [g if i < len(EU27) else f"{g}{i // len(EU27)}" for i, g in enumerate(geos)]
+    annual = make_annual(geos, args.years, args.indicators)
+    last = annual['Year'].max() - args.new
+    revised = annual.copy()
+    rows = revised.index[revised['Year'] == last]
+    revised.loc[rows, 'ind000'] = revised.loc[rows, 'ind000'] * 1.01
+    specs = make_specs()
+    columns = sum(len(cols) for *_, cols in feature_store.plan(specs, feature_store.indicator_columns(annual)))
+    print(f"Data: {args.geos} geos x {args.years} years x {args.indicators} indicators, {columns} feature columns, "
+          f"{args.new} new year(s)\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = {}
+        for mode in ('full', 'delta'):
+            out_dir = os.path.join(tmp, mode)
+            os.makedirs(out_dir)
+            input_file = os.path.join(out_dir, 'merged_df_annual')
+            write_table(annual[annual['Year'] <= last].reset_index(drop=True), input_file)
+            _, history = timed(feature_store.build, input_file, out_dir, specs)
+            write_table(revised, input_file)
+            if mode == 'full':
+                _, seconds = timed(feature_store.build, input_file, out_dir, specs)
+            else:
+                keys, seconds = timed(feature_store.update, input_file, out_dir, specs)
+                assert keys is not None, "update fell back to a full build"
+            outputs[mode] = out_dir
+            print(f"{mode:>6}: history {history:.2f}s, refresh {seconds:.2f}s\n")
+
+        full, delta = (read_table(os.path.join(outputs[m], feature_store.output_name)) for m in ('full', 'delta'))
+        identical = []
+        for stem in (feature_store.output_name, feature_store.output_name + '_levels'):
+            paths = [find_table(os.path.join(outputs[m], stem)) for m in ('full', 'delta')]
+            with open(paths[0], 'rb') as fa, open(paths[1], 'rb') as fb:
+                identical.append(fa.read() == fb.read())
+        print(f"features: {full.shape[0]} rows x {full.shape[1]} columns; "
+              f"{'same values' if full.equals(delta) else 'VALUES DIFFER'}, "
+              f"{'identical files' if all(identical) else 'files differ'}")
+
+
+if __name__ == '__main__':
+    main()
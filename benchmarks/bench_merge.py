@@ -0,0 +1,98 @@
+"""
+===============================================================================
+ Script Name: bench_merge.py
+ Author: Igor Latii
+ Description:
+     Scaling of the merge step of `src/make_merged_df.py` with the number of
+     indicators, on synthetic formatted tables held in memory (no file I/O):
+
+        - pairwise:  the previous implementation: per indicator a groupby /
+                     rename / drop_duplicates, then `pd.merge(..., how='outer')`
+                     in a loop and a final `sort_values`;
+        - k-way:     `indicator_series` + `align_series`: one alignment of all
+                     series on the union of their timestamps.
+
+     Indicators mix annual, quarterly and monthly frequencies over different
+     year ranges, with duplicate timestamps (several series per table), as
+     the real Eurostat tables across countries. The two results are compared
+     with `pd.testing.assert_frame_equal`.
+
+ Usage:
+     python benchmarks/bench_merge.py [--indicators 15 50 100 200 400] [--series 3]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from make_merged_df import align_series, indicator_series  # noqa: E402
+
+
+def make_tables(n_indicators, n_series, seed=0):
+    """Synthetic formatted tables: {name: DataFrame(TIME_PERIOD, VALUE)}."""
+    rng = np.random.default_rng(seed)
+    tables = {}
+    for i in range(n_indicators):
+        freq = ('YS', 'QS', 'MS')[i % 3]
+        start = 1960 + int(rng.integers(0, 40))
+        dates = pd.date_range(f"{start}-01-01", '2024-12-01', freq=freq)
+        dates = dates[rng.random(len(dates)) > 0.1] # gaps
+        df = pd.DataFrame({'TIME_PERIOD': np.tile(dates.values, n_series),
+                           'VALUE': rng.uniform(0, 1000, len(dates) * n_series).round(1)})
+        tables[f"Indicator {i:03d}"] = df.sort_values('TIME_PERIOD', kind='stable').reset_index(drop=True)
+    return tables
+
+
+def merge_pairwise(tables):
+    """make_merged_df.py before the k-way alignment."""
+    dfs = []
+    for name, df in tables.items():
+        df = df.groupby('TIME_PERIOD', as_index=False)['VALUE'].sum()
+        df = df[['TIME_PERIOD', 'VALUE']].rename(columns={'VALUE': name})
+        df = df.drop_duplicates(subset=['TIME_PERIOD'])
+        dfs.append(df)
+    merged_df = dfs[0]
+    for df in dfs[1:]:
+        merged_df = pd.merge(merged_df, df, on='TIME_PERIOD', how='outer')
+    return merged_df.sort_values('TIME_PERIOD').reset_index(drop=True)
+
+
+def merge_kway(tables):
+    return align_series([indicator_series(df, name) for name, df in tables.items()])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--indicators', type=int, nargs='+', default=[15, 50, 100, 200, 400])
+    parser.add_argument('--series', type=int, default=3, help="series (duplicate timestamps) per indicator")
+    args = parser.parse_args()
+
+    print(f"{'indicators':>10} {'rows':>7} {'pairwise s':>11} {'k-way s':>9} {'speedup':>8} {'equal':>6}")
+    for n in args.indicators:
+        tables = make_tables(n, args.series)
+        pairwise_s, expected = timed(merge_pairwise, tables)
+        kway_s, result = timed(merge_kway, tables)
+        try:
+            pd.testing.assert_frame_equal(result, expected)
+            equal = True
+        except AssertionError:
+            equal = False
+        print(f"{n:>10} {len(result):>7} {pairwise_s:>11.3f} {kway_s:>9.3f} {pairwise_s / kway_s:>8.1f} {str(equal):>6}")
+
+
+if __name__ == '__main__':
+    main()
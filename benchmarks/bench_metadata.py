@@ -0,0 +1,226 @@
+"""
+===============================================================================
+ Script Name: bench_metadata.py
+ Author: Igor Latii
+ Description:
+     Cost of the Eurostat metadata cache (`src/eurostat_metadata.py`) against
+     a local stand-in of the Eurostat API, without touching the real one.
+
+     The stand-in serves a synthetic table of contents of the real size
+     (~10,000 datasets and tables in ~1,500 folders, with titles drawn from a
+     statistical vocabulary), one data structure per dataset (freq, unit,
+     s_adj, na_item, geo) and their code lists (GEO with ~1,000 codes). Like
+     Eurostat, it sends an ETag with the table of contents and answers
+     conditional requests with HTTP 304; every request is counted.
+
+        - refresh:  requests and seconds of a cold refresh for the datasets
+                    of the study, a warm refresh with nothing changed, and a
+                    refresh after new data in one dataset and a structure
+                    change in another;
+        - lookups:  time to open the cache and build the index, then dataset
+                    titles and dimension labels per second;
+        - search:   latency of word / prefix queries with the index, against a
+                    scan of the table of contents with `str.contains` (what a
+                    lookup without the index costs), with identical results.
+
+ Usage:
+     python benchmarks/bench_metadata.py [--datasets 10000] [--selected 40] [--geos 1000]
+===============================================================================
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from eurostat_client import EurostatClient  # noqa: E402
+from eurostat_metadata import EurostatMetadata  # noqa: E402
+
+WORDS = ('population employment unemployment gross domestic product prices consumer harmonised index '
+         'energy electricity gas transport passenger freight road rail air maritime tourism nights '
+         'accommodation trade exports imports services goods industry production turnover retail '
+         'construction wages labour cost households government debt deficit migration emigration '
+         'immigration citizenship health education research innovation agriculture fisheries '
+         'environment emissions waste regional annual quarterly monthly sex age nuts').split()
+DIMENSIONS = {'FREQ': 4, 'UNIT': 300, 'S_ADJ': 6, 'NA_ITEM': 200, 'GEO': 1000}
+QUERIES = ['unemployment', 'gross domestic', 'tour night', 'price energy household', 'emis', 'xyz']
+
+
+# === Synthetic Eurostat metadata ===
+def make_toc(n_datasets, seed=0):
+    """Entries (code, title, type, last update, structure change) of a synthetic table of contents."""
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(n_datasets):
+        if i % 7 == 0:
+            entries.append([f"folder_{i:05d}", ' '.join(rnd.sample(WORDS, 2)).capitalize(), 'folder', '', ''])
+        title = ' '.join(rnd.sample(WORDS, rnd.randint(4, 9))).capitalize()
+        day = f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.2025"
+        entries.append([f"ds_{i:05d}_{rnd.choice(WORDS)[:4]}", title, 'dataset' if i % 5 else 'table',
+                        f"{day} 23:00", f"{day} 11:00"])
+    return entries
+
+
+def toc_text(entries):
+    header = ['title', 'code', 'type', 'last update of data', 'last table structure change', 'data start',
+              'data end', 'values']
+    lines = ['\t'.join(f'"{h}"' for h in header)]
+    for code, title, kind, update, change in entries:
+        lines.append('\t'.join(f'"{c}"' for c in [title, code, kind, update, change, '2000', '2024', '']))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def structure_xml(code):
+    dims = ''.join(f'<s:Dimension id="{dim.lower()}" position="{i + 1}"><s:LocalRepresentation><s:Enumeration>'
+                   f'<Ref id="{dim}" agencyID="ESTAT"/></s:Enumeration></s:LocalRepresentation></s:Dimension>'
+                   for i, dim in enumerate(DIMENSIONS))
+    return (f'<m:Structure xmlns:m="m" xmlns:s="s"><m:Structures><s:DataStructure id="{code.upper()}">'
+            f'<s:DimensionList>{dims}<s:TimeDimension id="TIME_PERIOD" position="6"/></s:DimensionList>'
+            f'</s:DataStructure></m:Structures></m:Structure>').encode('utf-8')
+
+
+def codelist_xml(codelist, n_codes, seed=0):
+    rnd = random.Random(f"{codelist}{seed}")
+    codes = ''.join(f'<s:Code id="{codelist[:2]}{i:04d}"><c:Name xml:lang="en">'
+                    f'{" ".join(rnd.sample(WORDS, 3)).capitalize()}</c:Name></s:Code>' for i in range(n_codes))
+    return (f'<m:Structure xmlns:m="m" xmlns:s="s" xmlns:c="c"><m:Structures><s:Codelists>'
+            f'<s:Codelist id="{codelist}">{codes}</s:Codelist></s:Codelists></m:Structures></m:Structure>'
+            ).encode('utf-8')
+
+
+def make_handler(site, requests):
+    class StandInHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path).path.strip('/').split('/')
+            requests['toc' if parts[-2] == 'toc' else parts[-3]] += 1
+            if parts[-2] == 'toc':
+                body = site['toc']
+            elif parts[-3] == 'datastructure':
+                body = structure_xml(parts[-1])
+            elif parts[-3] == 'codelist' and parts[-1] in DIMENSIONS:
+                body = codelist_xml(parts[-1], site['codes'].get(parts[-1], DIMENSIONS[parts[-1]]))
+            else:
+                self.send_error(404)
+                return
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StandInHandler
+
+
+# === Measurements ===
+def timed_refresh(label, metadata, client, codes, requests):
+    requests.clear()
+    start = time.perf_counter()
+    stats = metadata.refresh(client, codes)
+    seconds = time.perf_counter() - start
+    print(f"{label:>22} {seconds:>8.2f}s {sum(requests.values()):>5} requests  {dict(requests)}  {stats}")
+
+
+def scan_search(toc, query):
+    """Search without the index: every title and code scanned for every word."""
+    text = (toc['code'] + ' ' + toc['title']).str.lower()
+    mask = toc['type'].isin(['dataset', 'table'])
+    for word in re.findall(r'[a-z0-9]+', query.lower()):
+        mask &= text.str.contains(f'(?<![a-z0-9]){word}', regex=True)
+    return set(toc.loc[mask, 'code'])
+
+
+def per_second(func, items, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(*item)
+    return repeat * len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--datasets', type=int, default=10000, help="datasets and tables in the table of contents")
+    parser.add_argument('--selected', type=int, default=40, help="datasets of the study (structures cached)")
+    parser.add_argument('--geos', type=int, default=1000, help="codes of the GEO code list")
+    args = parser.parse_args()
+    DIMENSIONS['GEO'] = args.geos
+
+    entries = make_toc(args.datasets)
+    site = {'toc': toc_text(entries), 'codes': {}}
+    requests = Counter()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(site, requests))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = EurostatClient(f"http://127.0.0.1:{server.server_address[1]}/eurostat/api/dissemination/sdmx/2.1/",
+                            retries=1, backoff=0.05)
+    datasets = [e for e in entries if e[2] != 'folder']
+    codes = [e[0] for e in random.Random(1).sample(datasets, args.selected)]
+    print(f"Table of contents: {len(entries):,} entries, {len(site['toc']) / 1024 ** 2:.1f} MB; "
+          f"{len(codes)} datasets of the study, {len(DIMENSIONS)} code lists")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'metadata')
+        metadata = EurostatMetadata(directory)
+        print(f"\n{'refresh':>22} {'time':>9} {'':>5}")
+        timed_refresh('cold', metadata, client, codes, requests)
+        timed_refresh('warm, unchanged', metadata, client, codes, requests)
+        # New data in one dataset, a new structure (and a larger UNIT code list) in another
+        changed = {codes[0]: 3, codes[1]: 4}
+        for entry in entries:
+            if entry[0] in changed:
+                entry[changed[entry[0]]] = '01.01.2026 11:00'
+        site['toc'], site['codes'] = toc_text(entries), {'UNIT': DIMENSIONS['UNIT'] + 1}
+        timed_refresh('one data, one structure', metadata, client, codes, requests)
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        print(f"{'stored':>22} {size / 1024:>8.0f} KB in {directory}")
+
+        # --- Lookups on a freshly opened cache ---
+        start = time.perf_counter()
+        metadata = EurostatMetadata(directory)
+        metadata.title(codes[0])
+        opened = time.perf_counter() - start
+        titles = [(e[0],) for e in random.Random(2).sample(datasets, 1000)]
+        labels = [(dim.lower(), f"{dim[:2]}{i % DIMENSIONS[dim]:04d}", codes[i % len(codes)])
+                  for i, dim in enumerate(list(DIMENSIONS) * 200)]
+        print(f"\nopen + index: {opened * 1000:.0f} ms; "
+              f"titles: {per_second(metadata.title, titles):,.0f}/s; "
+              f"dimension labels: {per_second(metadata.code_label, labels):,.0f}/s")
+
+        # --- Search: index against a scan ---
+        toc = metadata.table('toc').astype(str)
+        start = time.perf_counter()
+        metadata.search('x')
+        print(f"search index built in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+        print(f"{'query':>24} {'found':>6} {'index ms':>9} {'scan ms':>8} {'same':>5}")
+        for query in QUERIES:
+            start = time.perf_counter()
+            found = metadata.search(query, limit=None)
+            indexed = time.perf_counter() - start
+            start = time.perf_counter()
+            scanned = scan_search(toc, query)
+            scan = time.perf_counter() - start
+            print(f"{query:>24} {len(found):>6} {indexed * 1000:>9.2f} {scan * 1000:>8.1f} "
+                  f"{str(set(found['code']) == scanned):>5}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+===============================================================================
+ Script Name: bench_panel.py
+ Author: Igor Latii
+ Description:
+     Merge + annual aggregation of many countries (e.g. EU-27), on synthetic
+     formatted tables `{indicator}__{geo}_raw_formatted` of mixed frequencies:
+
+        - per country:  `make_merged_df.merge_tables` and
+                        `aggregate_annual_indicators.aggregate` run once per
+                        geo on that geo's tables (the single-country pipeline
+                        repeated);
+        - panel:        one run in panel mode, keyed on (geo, TIME_PERIOD),
+                        for all countries at once.
+
+     The annual tables of both are compared country by country.
+
+ Usage:
+     python benchmarks/bench_panel.py [--geos 1 9 27] [--indicators 15]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from aggregate_annual_indicators import aggregate  # noqa: E402
+from make_merged_df import input_stems, merge_tables, output_stem  # noqa: E402
+from storage import read_table, write_table  # noqa: E402
+
+EU27 = ['AT', 'BE', 'BG', 'HR', 'CY', 'CZ', 'DK', 'EE', 'FI', 'FR', 'DE', 'EL', 'HU', 'IE',
+        'IT', 'LV', 'LT', 'LU', 'MT', 'NL', 'PL', 'PT', 'RO', 'SK', 'SI', 'ES', 'SE']
+
+
+def make_formatted(directory, geos, n_indicators, seed=0):
+    """Synthetic formatted tables (TIME_PERIOD, VALUE, FREQ, geo), one per indicator and geo."""
+    rng = np.random.default_rng(seed)
+    for i in range(n_indicators):
+        freq = 'AQM'[i % 3]
+        dates = pd.date_range('1995-01-01', '2024-12-01', freq={'A': 'YS', 'Q': 'QS', 'M': 'MS'}[freq])
+        for geo in geos:
+            keep = dates[rng.random(len(dates)) > 0.1]
+            df = pd.DataFrame({'TIME_PERIOD': np.tile(keep.values, 2),
+                               'VALUE': rng.uniform(1, 1000, 2 * len(keep)).round(1),
+                               'FREQ': freq, 'geo': geo})
+            write_table(df.sort_values('TIME_PERIOD', kind='stable'),
+                        os.path.join(directory, f"ind{i:02d}__{geo}_raw_formatted"))
+
+
+def make_rules(names):
+    return pd.DataFrame({'aggregation': ['sum' if j % 2 == 0 else 'mean' for j in range(len(names))],
+                         'min_count': 0,
+                         'interpolation': ['linear' if j % 2 == 0 else 'none' for j in range(len(names))],
+                         'max_gap': np.nan}, index=pd.Index(names, name='indicator'))
+
+
+def run_per_country(formatted, out_dir, geos, n_indicators):
+    """Single-country pipeline once per geo; returns {geo: annual table}."""
+    results = {}
+    for geo in geos:
+        geo_dir = os.path.join(out_dir, geo)
+        merge_tables([s for s in input_stems(formatted) if s.endswith(f"__{geo}_raw_formatted")], geo_dir, panel=False)
+        rules = make_rules([f"ind{i:02d}__{geo}" for i in range(n_indicators)])
+        annual = read_table(aggregate(output_stem(geo_dir), ['A'], geo_dir, rules)[0])
+        results[geo] = annual.rename(columns=lambda c: c.split('__')[0])
+    return results
+
+
+def run_panel(formatted, out_dir, n_indicators):
+    merge_tables(input_stems(formatted), out_dir, panel=True)
+    rules = make_rules([f"ind{i:02d}" for i in range(n_indicators)])
+    return read_table(aggregate(output_stem(out_dir), ['A'], out_dir, rules)[0])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, nargs='+', default=[1, 9, 27])
+    parser.add_argument('--indicators', type=int, default=15)
+    args = parser.parse_args()
+
+    rows = []
+    for n_geos in args.geos:
+        geos = EU27[:n_geos]
+        with tempfile.TemporaryDirectory() as tmp:
+            formatted = os.path.join(tmp, 'formatted')
+            make_formatted(formatted, geos, args.indicators)
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull # The scripts report every table
+                try:
+                    loop_s, per_country = timed(run_per_country, formatted, os.path.join(tmp, 'loop'), geos,
+                                                args.indicators)
+                    panel_s, panel = timed(run_panel, formatted, os.path.join(tmp, 'panel'), args.indicators)
+                finally:
+                    sys.stdout = stdout
+
+        equal = True
+        for geo, expected in per_country.items():
+            got = panel[panel['geo'].astype(str) == geo].drop(columns='geo').reset_index(drop=True)
+            equal &= got.shape == expected.shape and np.allclose(got.to_numpy(float), expected.to_numpy(float),
+                                                                 equal_nan=True)
+        rows.append((n_geos, loop_s, panel_s, equal))
+
+    print(f"{'geos':>5} {'indicators':>10} {'per country s':>14} {'panel s':>8} {'speedup':>8} {'equal':>6}")
+    for n_geos, loop_s, panel_s, equal in rows:
+        print(f"{n_geos:>5} {args.indicators:>10} {loop_s:>14.2f} {panel_s:>8.2f} {loop_s / panel_s:>8.1f} {str(equal):>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+===============================================================================
+ Script Name: bench_parallel.py
+ Author: Igor Latii
+ Description:
+     Wall time of the per-file stages (Eurostat long format + time period
+     formatting) run through `src/parallel.py` with 1, 2, 4, ... worker
+     processes, on synthetic raw tables for several indicators and countries
+     (`--tables`, e.g. 15 indicators x 4 geos = 60 tables).
+
+     For every worker count the stage outputs are hashed and compared with the
+     single-process run: the parallel mode must produce byte-identical files.
+     Speedup is bounded by the number of CPUs available to the process, which
+     is printed first.
+
+ Usage:
+     python benchmarks/bench_parallel.py [--tables 60] [--rows 3000] [--workers 1 2 4 8]
+===============================================================================
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_transform import make_raw_table  # noqa: E402
+from parallel import default_workers, run_per_file  # noqa: E402
+import format_time_periods  # noqa: E402
+import transform_to_long_format_EStat as transform_estat  # noqa: E402
+
+
+def hash_outputs(directory):
+    """SHA-1 of every file in `directory`, by file name."""
+    digests = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            digests[name] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+
+def run_stages(raw_dir, out_dir, workers):
+    """Long format, then formatting, of all raw tables; returns (seconds, failures)."""
+    long_dir, formatted_dir = os.path.join(out_dir, 'long'), os.path.join(out_dir, 'formatted')
+    start = time.perf_counter()
+    results = run_per_file(partial(transform_estat.transform_file, output_dir=long_dir, dimension_filters={}),
+                           transform_estat.input_stems(raw_dir), workers, verbose=False)
+    results += run_per_file(partial(format_time_periods.format_file, output_dir=formatted_dir),
+                            format_time_periods.input_stems(long_dir), workers, verbose=False)
+    return time.perf_counter() - start, sum(1 for r in results if r['error'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=60, help="number of raw tables")
+    parser.add_argument('--rows', type=int, default=3000, help="raw rows per table")
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"CPUs available: {default_workers()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, 'raw')
+        for i in range(args.tables):
+            make_raw_table(os.path.join(raw_dir, f"ind{i // 4:02d}__G{i % 4}_raw"), args.rows, args.years, seed=i)
+        print(f"Synthetic raw tables: {args.tables} x {args.rows} rows x {args.years * 12} months")
+
+        results, reference = [], None
+        for workers in args.workers:
+            out_dir = os.path.join(tmp, f"out_{workers}")
+            seconds, failed = run_stages(raw_dir, out_dir, workers)
+            digests = {**hash_outputs(os.path.join(out_dir, 'long')), **hash_outputs(os.path.join(out_dir, 'formatted'))}
+            reference = reference or digests
+            results.append((workers, seconds, failed, digests == reference))
+
+    print(f"\n{'workers':>8} {'seconds':>9} {'speedup':>8} {'failed':>7} {'identical':>10}")
+    for workers, seconds, failed, identical in results:
+        print(f"{workers:>8} {seconds:>9.2f} {results[0][1] / seconds:>8.2f} {failed:>7} {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+===============================================================================
+ Script Name: bench_pipeline.py
+ Author: Igor Latii
+ Description:
+     Benchmark harness of the whole local pipeline, from the long-format
+     transforms through the EDA, on synthetic data (`synthetic_data.py`) at
+     several scale points.
+
+     For every scale point (geos x years x Eurostat indicators x dimensions)
+     the raw data and its configuration are generated in a temporary
+     directory, then every stage runs in a fresh Python process through
+     `pipeline.py` (`--force`, panel mode when there are several geos), which
+     reports:
+
+        - seconds           wall time of the stage;
+        - peak_rss_mb       peak resident memory of the stage process;
+        - worker_rss_mb     peak resident memory of its largest worker
+                            process (per-file stages, EDA rendering);
+        - outputs, failed   files rebuilt and failed;
+        - output_bytes      size of the stage's output directory.
+
+     Results are saved as JSON (scale points, machine and library versions,
+     one record per scale point and stage). With `--baseline` an earlier
+     result file is compared stage by stage; the exit status is 1 if a stage
+     became slower (by more than `--min-seconds`) or larger than the
+     tolerance.
+
+ Usage:
+     python benchmarks/bench_pipeline.py [--scale 1x30x15x2 9x30x50x2 27x30x100x3]
+            [--wb-indicators 2] [--stages long_estat ... eda] [--workers 4]
+            [--output benchmarks/results/pipeline.json]
+            [--repeat 3] [--baseline old.json] [--tolerance 0.25] [--min-seconds 0.5]
+
+     A scale point is GEOSxYEARSxINDICATORSxDIMENSIONS.
+===============================================================================
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+STAGES = ['long_estat', 'long_wb', 'format', 'merge', 'annual', 'features', 'eda']
+OUTPUT_DIRS = {'long_estat': 'processed/transformed_to_long_format', 'long_wb': 'processed/transformed_to_long_format',
+               'format': 'processed/formatted_time_periods', 'merge': 'processed/merged',
+               'annual': 'processed/merged', 'features': 'processed/merged', 'eda': 'eda_plots'}
+
+
+# === Child process: one stage ===
+def run_stage(stage):
+    """Run one stage through pipeline.py in this process; returns its measurements."""
+    import pipeline # The EDA reads the questions of the synthetic data from the reports directory (rqs.json)
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull # The stages report every file
+        try:
+            start = time.perf_counter()
+            summary = pipeline.run_pipeline(only=[stage], force=True)
+            seconds = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+    counts = summary[stage]
+    return {'seconds': seconds,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+            'outputs': counts['rebuilt'], 'failed': counts['failed']}
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+# === Parent process: scale points ===
+def parse_scale(text):
+    geos, years, indicators, dimensions = (int(v) for v in text.lower().split('x'))
+    return {'geos': geos, 'years': years, 'indicators': indicators, 'dimensions': dimensions}
+
+
+def run_child(stage, env):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', stage],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit(f"Stage {stage} failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_scale(scale, stages, wb_indicators, workers, repeat=1):
+    """
+    Generate one scale point and time its stages; returns the records of the
+    `stages` (the earlier stages they depend on run too, unrecorded). Each
+    stage runs `repeat` times: best time, highest memory.
+    """
+    from synthetic_data import generate
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, reports_dir = os.path.join(tmp, 'data'), os.path.join(tmp, 'reports')
+        start = time.perf_counter()
+        data = generate(data_dir, reports_dir, scale['geos'], scale['years'], scale['indicators'],
+                        scale['dimensions'], wb_indicators=wb_indicators)
+        print(f"\n{scale_name(scale)}: {data['raw_files']} raw files, {data['raw_bytes'] / 1e6:.1f} MB "
+              f"(generated in {time.perf_counter() - start:.1f}s)")
+
+        env = dict(os.environ, PIPELINE_DATA_DIR=data_dir, PIPELINE_REPORTS_DIR=reports_dir,
+                   PIPELINE_PANEL='1' if scale['geos'] > 1 else '0')
+        if workers:
+            env['PIPELINE_WORKERS'] = str(workers)
+        for stage in STAGES[:max(STAGES.index(s) for s in stages) + 1]:
+            runs = [run_child(stage, env) for _ in range(repeat if stage in stages else 1)]
+            if stage not in stages:
+                continue
+            measured = {**runs[0], 'seconds': min(r['seconds'] for r in runs),
+                        **{m: max(r[m] for r in runs) for m in ('peak_rss_mb', 'worker_rss_mb')}}
+            record = {**scale, **{k: data[k] for k in ('raw_files', 'raw_bytes')}, 'stage': stage, **measured,
+                      'output_bytes': directory_bytes(os.path.join(data_dir, OUTPUT_DIRS[stage]))}
+            records.append(record)
+            print(f"  {stage:<11} {record['seconds']:>8.2f}s {record['peak_rss_mb']:>8.0f} MB "
+                  f"{record['worker_rss_mb']:>8.0f} MB {record['outputs']:>6} {record['failed']:>4}")
+    return records
+
+
+def scale_name(scale):
+    return f"{scale['geos']}x{scale['years']}x{scale['indicators']}x{scale['dimensions']}"
+
+
+def environment(workers):
+    import numpy
+    import pandas
+    import pyarrow
+    from parallel import default_workers
+    from storage import default_format
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'workers': workers or default_workers(), 'pandas': pandas.__version__, 'numpy': numpy.__version__,
+            'pyarrow': pyarrow.__version__, 'format': default_format(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(records, baseline_path, tolerance, min_seconds=0.5):
+    """
+    Print the ratios to a baseline result file; returns the number of
+    regressions (time: also at least `min_seconds` slower, against noise).
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scale'], r['stage']): r for r in json.load(f)['results']}
+    print(f"\n=== Compared with {baseline_path} (tolerance {tolerance:.0%}) ===")
+    regressions = 0
+    for record in records:
+        old = baseline.get((record['scale'], record['stage']))
+        if old is None:
+            continue
+        ratios = {m: record[m] / old[m] if old[m] else 1.0 for m in ('seconds', 'peak_rss_mb')}
+        slower = [m for m, ratio in ratios.items() if ratio > 1 + tolerance
+                  and (m != 'seconds' or record[m] - old[m] >= min_seconds)]
+        regressions += bool(slower)
+        print(f"  {record['scale']:<14} {record['stage']:<11} time x{ratios['seconds']:.2f} "
+              f"memory x{ratios['peak_rss_mb']:.2f}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        print(json.dumps(run_stage(sys.argv[2])))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', nargs='+', default=['1x30x15x2', '9x30x50x2', '27x30x100x3'],
+                        help="scale points GEOSxYEARSxINDICATORSxDIMENSIONS")
+    parser.add_argument('--wb-indicators', type=int, default=2)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--workers', type=int, help="worker processes (default: PIPELINE_WORKERS or CPUs)")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results', 'pipeline.json'))
+    parser.add_argument('--baseline', help="earlier result file to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown / growth (0.25 = 25%%)")
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="smallest slowdown reported as a regression")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per stage (best time is kept)")
+    args = parser.parse_args()
+
+    stages = [s for s in STAGES if s in args.stages]
+    print(f"{'stage':<13} {'time':>9} {'peak RSS':>11} {'workers':>11} {'files':>6} {'fail':>4}")
+    records = []
+    for text in args.scale:
+        scale = parse_scale(text)
+        records += [{'scale': scale_name(scale), **r} for r in bench_scale(scale, stages, args.wb_indicators,
+                                                                           args.workers, args.repeat)]
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(args.workers), 'results': records}, f, indent=2)
+    print(f"\nResults saved in {args.output}")
+
+    if args.baseline and compare(records, args.baseline, args.tolerance, args.min_seconds):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+===============================================================================
+ Script Name: bench_query.py
+ Author: Igor Latii
+ Description:
+     Latency and throughput of the query service (`src/query_service.py`) on a
+     synthetic panel: the merged frequency blocks and the annual dataset of
+     `--geos` countries and `--indicators` indicators, written and aggregated
+     by the pipeline modules in a temporary directory.
+
+        - before:   what a dashboard does per request: read
+                    `merged_df_annual.csv` and filter it with pandas;
+        - service:  the same slices in-process, first (cache miss: index
+                    lookups and binary searches) and repeated (LRU cache hit),
+                    with results identical to the pandas filter;
+        - http:     `--clients` threads on keep-alive connections sending a
+                    mix of `--distinct` queries for `--seconds`, as requests
+                    per second and latency percentiles;
+        - reload:   time until a rewritten annual table is served.
+
+ Usage:
+     python benchmarks/bench_query.py [--geos 27] [--indicators 60] [--distinct 200]
+            [--clients 4] [--seconds 5]
+===============================================================================
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from aggregate_annual_indicators import aggregate, output_stem  # noqa: E402
+from bench_resample import make_panel, make_rules  # noqa: E402
+from frequency_blocks import write_blocks  # noqa: E402
+from query_service import QueryService, make_server  # noqa: E402
+from storage import read_table, write_table  # noqa: E402
+
+
+def make_queries(columns, geos, n, seed=0):
+    """`n` distinct annual slices: 1-3 indicators, 1-5 geos, a year range."""
+    rnd = random.Random(seed)
+    queries = set()
+    while len(queries) < n:
+        first = rnd.randint(1990, 2020)
+        queries.add((tuple(rnd.sample(columns, rnd.randint(1, 3))), tuple(sorted(rnd.sample(geos, rnd.randint(1, 5)))),
+                     str(first), str(first + rnd.randint(0, 10))))
+    return sorted(queries)
+
+
+def pandas_slice(csv_path, indicators, geos, start, end):
+    """Per-request read and filter of the annual CSV, in the service's output layout."""
+    df = pd.read_csv(csv_path, float_precision='round_trip')
+    df = df[df['geo'].isin(geos) & df['Year'].between(int(start), int(end))]
+    df = df[['geo', 'Year', *indicators]].dropna(subset=list(indicators), how='all')
+    return df.rename(columns={'Year': 'TIME_PERIOD'}).astype({'TIME_PERIOD': str}).reset_index(drop=True)
+
+
+def latencies(func, queries):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        func(*query)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def describe(times):
+    return f"p50 {np.percentile(times, 50):8.3f} ms  p99 {np.percentile(times, 99):8.3f} ms"
+
+
+def load_test(port, queries, clients, seconds):
+    """Requests per second and latencies of `clients` threads sending random queries for `seconds`."""
+    paths = [('/query?' + urlencode({'dataset': 'annual', 'indicator': list(ind), 'geo': ';'.join(geos),
+                                     'start': start, 'end': end}, doseq=True)) for ind, geos, start, end in queries]
+    stop = time.perf_counter() + seconds
+    results = [[] for _ in range(clients)]
+
+    def client(times, seed):
+        rnd = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            connection.request('GET', rnd.choice(paths))
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            times.append(time.perf_counter() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(times, i)) for i, times in enumerate(results)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times = np.concatenate([np.array(t) for t in results]) * 1000
+    return len(times) / seconds, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=27)
+    parser.add_argument('--indicators', type=int, default=60)
+    parser.add_argument('--distinct', type=int, default=200, help="distinct queries of the mix")
+    parser.add_argument('--clients', type=int, default=4, help="concurrent HTTP clients")
+    parser.add_argument('--seconds', type=float, default=5.0, help="duration of the HTTP load test")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        blocks = make_panel(args.geos, args.indicators)
+        columns = [c for b in blocks.values() for c in b.columns if c not in ('geo', 'TIME_PERIOD')]
+        stem = os.path.join(tmp, 'merged_df_readable')
+        write_blocks(blocks, columns, stem)
+        aggregate(stem, ['A'], tmp, make_rules(columns))
+        csv_path = output_stem('A', tmp) + '.csv'
+        geos = sorted(blocks['A']['geo'].unique())
+        print(f"Data: {args.geos} geos x {args.indicators} indicators, annual CSV "
+              f"{os.path.getsize(csv_path) / 1024 ** 2:.1f} MB (built in {time.perf_counter() - start:.1f}s)")
+
+        service = QueryService(tmp, cache_size=4096, check_interval=0.2)
+        stats = service.cache_stats()
+        print(f"Service: {stats['loaded_mb']:.1f} MB of arrays loaded in {stats['load_seconds'] * 1000:.0f} ms\n")
+
+        queries = make_queries(columns, geos, args.distinct)
+        sample = queries[:20]
+        same = all(service.query('annual', *q)['A'].equals(pandas_slice(csv_path, *q)) for q in sample)
+        service = QueryService(tmp, cache_size=4096, check_interval=0.2) # empty cache again
+        before = latencies(lambda *q: pandas_slice(csv_path, *q), sample)
+        first = latencies(lambda *q: service.query('annual', *q), queries)
+        repeat = latencies(lambda *q: service.query('annual', *q), queries)
+        encoded = latencies(lambda *q: service.query_json('annual', *q), queries)
+        encoded_repeat = latencies(lambda *q: service.query_json('annual', *q), queries)
+        print(f"{'before (read CSV + filter)':>30}  {describe(before)}")
+        print(f"{'service, first':>30}  {describe(first)}")
+        print(f"{'service, repeated':>30}  {describe(repeat)}")
+        print(f"{'service JSON, first':>30}  {describe(encoded)}")
+        print(f"{'service JSON, repeated':>30}  {describe(encoded_repeat)}")
+        print(f"{'same as pandas':>30}  {same}\n")
+
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        rate, times = load_test(server.server_address[1], queries, args.clients, args.seconds)
+        stats = service.cache_stats()
+        print(f"HTTP, {args.clients} clients, {args.distinct} distinct queries: {rate:,.0f} requests/s, "
+              f"{describe(times)}  (cache: {stats['hits']:,} hits, {stats['misses']:,} misses)")
+
+        # --- Reload after the pipeline rewrote the annual table ---
+        annual = read_table(output_stem('A', tmp))
+        annual[columns[0]] = annual[columns[0]] + 1.0
+        query = ((columns[0],), (geos[0],), '2000', '2000')
+        old = service.query('annual', *query)['A'][columns[0]].tolist()
+        write_table(annual, output_stem('A', tmp), export_csv=True)
+        start = time.perf_counter()
+        while service.query('annual', *query)['A'][columns[0]].tolist() == old:
+            time.sleep(0.01)
+        print(f"Reload: new annual table served after {time.perf_counter() - start:.2f}s "
+              f"(check interval 0.2s, {service.cache_stats()['reloads']} loads)")
+        server.shutdown()
+        print(json.dumps(service.cache_stats()))
+
+
+if __name__ == '__main__':
+    main()
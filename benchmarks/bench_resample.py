@@ -0,0 +1,110 @@
+"""
+===============================================================================
+ Script Name: bench_resample.py
+ Author: Igor Latii
+ Description:
+     Resampling of a multi-country panel of synthetic annual / quarterly /
+     monthly indicators (the tables of `bench_merge.py`, one set per geo):
+
+        - before:  `aggregate_annual_indicators.py` before `src/resampling.py`,
+                   run once per country: wide table, `groupby('Year').agg()`
+                   with a dict of sum / mean rules, interpolation of the
+                   whole table;
+        - after:   `resampling.resample` on the frequency blocks of all
+                   countries at once (`by=['geo']`), for the annual target,
+                   then for the quarterly and monthly targets.
+
+     Half of the indicators are summed and interpolated, half averaged. The
+     annual results of both are compared.
+
+ Usage:
+     python benchmarks/bench_resample.py [--geos 1 10 30] [--indicators 100]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_merge import make_tables  # noqa: E402
+from frequency_blocks import widen  # noqa: E402
+from make_merged_df import align_series, indicator_series, native_frequency  # noqa: E402
+from resampling import resample  # noqa: E402
+
+
+def make_panel(n_geos, n_indicators):
+    """Frequency blocks {freq: DataFrame(geo, TIME_PERIOD, indicators)} of a synthetic panel."""
+    blocks = {}
+    for g in range(n_geos):
+        tables = make_tables(n_indicators, 2, seed=g)
+        freqs = {name: native_frequency(df) for name, df in tables.items()}
+        for freq in sorted(set(freqs.values())):
+            block = align_series([indicator_series(df, name) for name, df in tables.items() if freqs[name] == freq])
+            block.insert(0, 'geo', f"G{g:02d}")
+            blocks.setdefault(freq, []).append(block)
+    return {freq: pd.concat(parts, ignore_index=True) for freq, parts in blocks.items()}
+
+
+def make_rules(columns):
+    half = len(columns) // 2
+    return pd.DataFrame({'aggregation': ['sum'] * half + ['mean'] * (len(columns) - half),
+                         'min_count': 0,
+                         'interpolation': ['linear'] * half + ['none'] * (len(columns) - half),
+                         'max_gap': np.nan}, index=pd.Index(columns, name='indicator'))
+
+
+def resample_before(blocks, rules):
+    """Previous annual aggregation, one country at a time on its wide table."""
+    continuous = [c for c in rules.index if rules.loc[c, 'aggregation'] == 'sum']
+    discrete = [c for c in rules.index if rules.loc[c, 'aggregation'] == 'mean']
+    results = []
+    for geo in sorted(set().union(*(b['geo'].unique() for b in blocks.values()))):
+        geo_blocks = {f: b[b['geo'] == geo].drop(columns='geo') for f, b in blocks.items()}
+        df = widen(geo_blocks, list(rules.index))
+        df['Year'] = df['TIME_PERIOD'].dt.year
+        agg_dict = {col: 'sum' for col in continuous}
+        agg_dict.update({col: 'mean' for col in discrete})
+        annual_df = df.groupby('Year').agg(agg_dict).reset_index()
+        annual_df[continuous] = annual_df[continuous].interpolate(method='linear')
+        annual_df.insert(0, 'geo', geo)
+        results.append(annual_df)
+    return pd.concat(results, ignore_index=True)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--indicators', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'geos':>5} {'indicators':>10} {'before A s':>11} {'after A s':>10} {'speedup':>8} "
+          f"{'after Q s':>10} {'after M s':>10} {'equal':>6}")
+    for n_geos in args.geos:
+        blocks = make_panel(n_geos, args.indicators)
+        rules = make_rules([f"Indicator {i:03d}" for i in range(args.indicators)])
+        before_s, before = timed(resample_before, blocks, rules)
+        after_s, after = timed(resample, blocks, rules, 'A', by=['geo'])
+        quarterly_s, _ = timed(resample, blocks, rules, 'Q', by=['geo'])
+        monthly_s, _ = timed(resample, blocks, rules, 'M', by=['geo'])
+        after['Year'] = after['Year'].astype(before['Year'].dtype)
+        equal = np.allclose(before[list(rules.index)], after[list(rules.index)], equal_nan=True) \
+            and before[['geo', 'Year']].equals(after[['geo', 'Year']])
+        print(f"{n_geos:>5} {args.indicators:>10} {before_s:>11.3f} {after_s:>10.3f} {before_s / after_s:>8.1f} "
+              f"{quarterly_s:>10.3f} {monthly_s:>10.3f} {str(equal):>6}")
+
+
+if __name__ == '__main__':
+    main()
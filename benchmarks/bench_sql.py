@@ -0,0 +1,135 @@
+"""
+===============================================================================
+ Script Name: bench_sql.py
+ Author: Igor Latii
+ Description:
+     The two execution backends of merge + annual aggregation (see
+     src/sql_engine.py) on the same synthetic panel: formatted tables
+     `{indicator}__{geo}_raw_formatted` of mixed frequencies
+     (bench_panel.py) for `--geos` countries and `--indicators` indicators,
+     with rules covering every aggregation (sum / mean / first / last / min /
+     max / weighted, some with min_count).
+
+        - pandas:  the in-memory steps (PIPELINE_ENGINE=pandas, default);
+        - sqlite:  SQL queries over a temporary on-disk database, the tables
+                   streamed in from disk (PIPELINE_ENGINE=sqlite).
+
+     Each backend runs in a fresh process, which reports the wall time of
+     the merge and of the aggregation and its peak resident memory (about
+     100 MB of it is the interpreter and libraries). The stored outputs of
+     both (frequency blocks, wide view, annual periods and annual table)
+     are then compared file by file, and as tables.
+
+ Usage:
+     python benchmarks/bench_sql.py [--geos 27] [--indicators 60] [--chunk-rows 100000]
+===============================================================================
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from aggregate_annual_indicators import aggregate  # noqa: E402
+from bench_panel import EU27, make_formatted  # noqa: E402
+from make_merged_df import input_stems, merge_tables, output_stem  # noqa: E402
+from resampling import load_rules  # noqa: E402
+from storage import read_table  # noqa: E402
+
+ENGINES = ['pandas', 'sqlite']
+RULES = [('sum', 0), ('mean', 0), ('sum', 2), ('first', 0), ('last', 0), ('min', 0), ('max', 0),
+         ('weighted', 0), ('mean', 3)]
+
+
+def make_rules(names):
+    aggregation, min_count = zip(*(RULES[j % len(RULES)] for j in range(len(names))))
+    return pd.DataFrame({'indicator': names, 'aggregation': aggregation, 'min_count': min_count,
+                         'interpolation': ['linear' if j % 4 == 0 else 'none' for j in range(len(names))],
+                         'max_gap': ''})
+
+
+def run_child(engine, formatted, out_dir, rules_file):
+    """Merge and aggregate in this process with `engine`; prints the timings and peak RSS as JSON."""
+    os.environ['PIPELINE_ENGINE'] = engine
+    start = time.perf_counter()
+    merge_tables(input_stems(formatted), out_dir, panel=True)
+    merged = time.perf_counter()
+    aggregate(output_stem(out_dir), ['A'], out_dir, load_rules(rules_file))
+    done = time.perf_counter()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'merge': merged - start, 'annual': done - merged, 'peak_rss_mb': peak}))
+
+
+def run_engine(engine, tmp, formatted, rules_file, chunk_rows):
+    out_dir = os.path.join(tmp, engine)
+    env = {**os.environ, 'PIPELINE_DATA_DIR': out_dir, 'PIPELINE_SQL_CHUNK_ROWS': str(chunk_rows)}
+    result = subprocess.run([sys.executable, __file__, '--child', engine, formatted, out_dir, rules_file],
+                            env=env, capture_output=True, text=True, check=True)
+    return out_dir, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare_outputs(a, b):
+    """Files of the output directories `a` and `b` that differ in bytes, and in content as tables."""
+    files = sorted(f for f in os.listdir(a) if os.path.isfile(os.path.join(a, f)))
+    differ_bytes, differ_tables = [], []
+    for name in files:
+        with open(os.path.join(a, name), 'rb') as fa, open(os.path.join(b, name), 'rb') as fb:
+            if fa.read() != fb.read():
+                differ_bytes.append(name)
+        if not name.endswith('.json') and not read_table(os.path.join(a, name)).equals(read_table(os.path.join(b, name))):
+            differ_tables.append(name)
+    return files, differ_bytes, differ_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=27)
+    parser.add_argument('--indicators', type=int, default=60)
+    parser.add_argument('--chunk-rows', type=int, default=100_000, help="PIPELINE_SQL_CHUNK_ROWS of the sqlite backend")
+    parser.add_argument('--child', nargs=4, metavar=('ENGINE', 'FORMATTED', 'OUT', 'RULES'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(*args.child)
+        return
+
+    geos = (EU27 * (args.geos // len(EU27) + 1))[:args.geos]
+    geos = [g if i < len(EU27) else f"{g}{i // len(EU27)}" for i, g in enumerate(geos)]
+    with tempfile.TemporaryDirectory() as tmp:
+        formatted = os.path.join(tmp, 'formatted')
+        start = time.perf_counter()
+        make_formatted(formatted, geos, args.indicators)
+        rules_file = os.path.join(tmp, 'resampling.csv')
+        make_rules([f"ind{i:02d}" for i in range(args.indicators)]).to_csv(rules_file, index=False)
+        size = sum(os.path.getsize(os.path.join(formatted, f)) for f in os.listdir(formatted))
+        print(f"Data: {args.geos} geos x {args.indicators} indicators, {len(os.listdir(formatted))} formatted tables, "
+              f"{size / 1024 ** 2:.1f} MB (built in {time.perf_counter() - start:.1f}s)\n")
+
+        print(f"{'engine':>8} {'merge s':>8} {'annual s':>9} {'total s':>8} {'peak RSS MB':>12}")
+        outputs = {}
+        for engine in ENGINES:
+            outputs[engine], stats = run_engine(engine, tmp, formatted, rules_file, args.chunk_rows)
+            print(f"{engine:>8} {stats['merge']:>8.2f} {stats['annual']:>9.2f} "
+                  f"{stats['merge'] + stats['annual']:>8.2f} {stats['peak_rss_mb']:>12.0f}")
+
+        files, differ_bytes, differ_tables = compare_outputs(*(outputs[e] for e in ENGINES))
+        print(f"\n{len(files)} output files compared: "
+              f"{'all identical' if not differ_bytes else 'bytes differ in ' + ', '.join(differ_bytes)}; "
+              f"{'same tables' if not differ_tables else 'tables differ: ' + ', '.join(differ_tables)}")
+        annual = read_table(os.path.join(outputs['pandas'], 'merged_df_annual'))
+        print(f"annual table: {annual.shape[0]} rows x {annual.shape[1]} columns, "
+              f"{int(np.isnan(annual.select_dtypes('float64').to_numpy()).sum()):,} missing values")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+===============================================================================
+ Script Name: bench_storage.py
+ Author: Igor Latii
+ Description:
+     Compares the storage formats of `src/storage.py` on a synthetic formatted
+     indicator table (TIME_PERIOD, VALUE and a few Eurostat dimension columns,
+     monthly, many dimension combinations):
+
+        - csv      the original text files: every reader re-parses the text
+                   and has to run `pd.to_datetime` again;
+        - parquet  zstd-compressed columnar file with the typed schema;
+        - feather  Arrow IPC file (zstd) with the typed schema.
+
+     For each format the script reports the file size, the write time and the
+     time to load the table back into typed columns (datetime TIME_PERIOD,
+     float64 VALUE, categorical dimensions), i.e. what the next stage needs.
+
+ Usage:
+     python benchmarks/bench_storage.py [--series 2000] [--years 30] [--repeat 3]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from storage import HAS_PYARROW, apply_schema, read_table, table_path, write_table  # noqa: E402
+
+
+def make_table(n_series, n_years, seed=0):
+    """Synthetic long/formatted table: n_series dimension combinations x monthly dates."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(f"{2025 - n_years}-01-01", periods=n_years * 12, freq='MS')
+    series = pd.DataFrame({
+        'unit': [f"U{i % 7}" for i in range(n_series)],
+        's_adj': [('NSA', 'SA', 'SCA')[i % 3] for i in range(n_series)],
+        'nace_r2': [f"C{i // 21:03d}" for i in range(n_series)],
+        'geo': 'LV',
+    })
+    df = series.loc[series.index.repeat(len(dates))].reset_index(drop=True)
+    df['TIME_PERIOD'] = np.tile(dates, n_series)
+    df['VALUE'] = rng.uniform(0, 1000, len(df)).round(1)
+    df.loc[rng.random(len(df)) < 0.15, 'VALUE'] = np.nan
+    return df
+
+
+def load_typed(stem, fmt):
+    """Load a table and bring it to the typed schema, as a stage would."""
+    df = read_table(table_path(stem, fmt))
+    if fmt == 'csv':
+        # Text files lose the types: dates and categories must be rebuilt
+        df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'])
+        df = apply_schema(df)
+    return df
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=2000, help="number of dimension combinations")
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    formats = ['csv', 'parquet', 'feather'] if HAS_PYARROW else ['csv']
+    df = make_table(args.series, args.years)
+    print(f"Synthetic table: {len(df):,} rows x {len(df.columns)} columns")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in formats:
+            stem = os.path.join(tmp, fmt, 'table_formatted')
+            write_s, path = best_of(args.repeat, lambda: write_table(df, stem, fmt=fmt, export_csv=False))
+            read_s, loaded = best_of(args.repeat, lambda: load_typed(stem, fmt))
+            same = np.allclose(loaded['VALUE'], df['VALUE'], equal_nan=True) and \
+                (loaded['TIME_PERIOD'].values == df['TIME_PERIOD'].values).all()
+            results.append((fmt, os.path.getsize(path) / 1024 ** 2, write_s, read_s, same))
+
+    print(f"\n{'format':>8} {'size MB':>9} {'write s':>9} {'load s':>9} {'load speedup':>13} {'round-trip':>11}")
+    for fmt, size, write_s, read_s, same in results:
+        print(f"{fmt:>8} {size:>9.2f} {write_s:>9.3f} {read_s:>9.3f} {results[0][3] / read_s:>13.1f} "
+              f"{'ok' if same else 'DIFF':>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+===============================================================================
+ Script Name: bench_streaming.py
+ Author: Igor Latii
+ Description:
+     Compares the two ingestion paths of `src/collecting_data.py` on a synthetic
+     large Eurostat bulk file (monthly, many geos and dimension combinations):
+
+        - dataframe: decompress, `parse_tsv` into a DataFrame, filter by geo,
+          `to_csv` (the default path, equivalent to `eurostat.get_data_df`);
+        - streaming: `eurostat_stream.stream_filter`, filtering while reading.
+
+     Each path runs in a fresh subprocess so that its peak RSS can be measured
+     on its own. The outputs of both paths are compared byte for byte.
+
+ Usage:
+     python benchmarks/bench_streaming.py [--geos 40] [--nace 60] [--years 35]
+===============================================================================
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+
+def make_bulk_file(path, n_geos, n_nace, n_years, seed=0):
+    """Write a synthetic monthly Eurostat TSV.gz: geos x nace x unit x s_adj rows."""
+    rnd = random.Random(seed)
+    geos = ['LV'] + [f"G{i:02d}" for i in range(n_geos - 1)]
+    periods = [f"{1990 + y}-{m:02d}" for y in range(n_years) for m in range(1, 13)]
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        f.write('freq,s_adj,unit,nace_r2,geo\\TIME_PERIOD\t' + '\t'.join(f"{p} " for p in periods) + '\r\n')
+        for nace in range(n_nace):
+            for unit in ('I15', 'I21', 'PCH_PRE', 'PCH_SM'):
+                for s_adj in ('NSA', 'SA', 'SCA'):
+                    for geo in geos:
+                        cells = (f"{rnd.uniform(0, 200):.1f} {rnd.choice(['', '', 'p'])}" if rnd.random() > 0.2
+                                 else ': ' for _ in periods)
+                        f.write(f"M,{s_adj},{unit},C{nace:02d},{geo}\t" + '\t'.join(cells) + '\r\n')
+
+
+def peak_rss_mb():
+    # VmHWM starts fresh in every process; ru_maxrss is inherited from the parent across fork/exec on Linux
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_mode(mode, source, output):
+    """Run one ingestion path in this process and print its timing as JSON."""
+    # Both paths pay for the same imports, so the RSS difference is the data itself
+    from eurostat_client import parse_tsv
+    from eurostat_stream import stream_filter
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    if mode == 'dataframe':
+        with open(source, 'rb') as f:
+            df = parse_tsv(gzip.decompress(f.read()).decode('utf-8'))
+        df = df[df['geo\\TIME_PERIOD'] == 'LV']
+        df.to_csv(output, index=False)
+    else:
+        stream_filter(source, {'LV': output})
+    print(json.dumps({'mode': mode, 'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb(),
+                      'baseline_rss_mb': baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geos', type=int, default=40)
+    parser.add_argument('--nace', type=int, default=60)
+    parser.add_argument('--years', type=int, default=35)
+    parser.add_argument('--run', nargs=3, metavar=('MODE', 'SOURCE', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(*args.run)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'bulk.tsv.gz')
+        make_bulk_file(source, args.geos, args.nace, args.years)
+        n_rows = args.geos * args.nace * 12
+        print(f"Synthetic file: {n_rows} rows x {args.years * 12} months, "
+              f"{os.path.getsize(source) / 1024 ** 2:.1f} MB compressed")
+
+        results = {}
+        for mode in ('dataframe', 'streaming'):
+            output = os.path.join(tmp, f"{mode}.csv")
+            proc = subprocess.run([sys.executable, __file__, '--run', mode, source, output],
+                                  capture_output=True, text=True, check=True)
+            results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+            with open(output, 'rb') as f:
+                results[mode]['output'] = f.read()
+
+    identical = results['dataframe']['output'] == results['streaming']['output']
+    print(f"\n{'mode':>10} {'seconds':>9} {'peak RSS MB':>12} {'above imports':>14}")
+    for mode, res in results.items():
+        print(f"{mode:>10} {res['seconds']:>9.2f} {res['peak_rss_mb']:>12.1f} "
+              f"{res['peak_rss_mb'] - res['baseline_rss_mb']:>14.1f}")
+    print(f"Outputs identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+===============================================================================
+ Script Name: bench_time_periods.py
+ Author: Igor Latii
+ Description:
+     Compares the TIME_PERIOD conversion of `src/format_time_periods.py` before
+     and after `src/time_periods.py` on a synthetic column of millions of
+     labels (annual, semestrial, quarterly and monthly, 1960-2024):
+
+        - before:  four regex `str.match` passes, an object column filled with
+                   several `df.loc` writes, string concatenation +
+                   `pd.to_datetime` for quarters and semesters;
+        - after:   `parse_time_periods`: factorize, parse each distinct label
+                   once, broadcast through the category codes.
+
+     Both are timed on a plain string column (as read from CSV) and on a
+     categorical column (as stored in the Parquet/Feather long tables), and
+     the resulting dates are compared.
+
+ Usage:
+     python benchmarks/bench_time_periods.py [--rows 5000000] [--repeat 3]
+===============================================================================
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from time_periods import parse_label, parse_time_periods  # noqa: E402
+
+
+def make_labels(n_rows, seed=0):
+    """Random TIME_PERIOD labels of mixed frequencies, as a string Series."""
+    years = range(1960, 2025)
+    labels = ([f"{y}" for y in years] + [f"{y}-S{s}" for y in years for s in (1, 2)]
+              + [f"{y}-Q{q}" for y in years for q in range(1, 5)]
+              + [f"{y}-{m:02d}" for y in years for m in range(1, 13)])
+    rng = np.random.default_rng(seed)
+    return pd.Series(np.array(labels, dtype=object)[rng.integers(0, len(labels), n_rows)], name='TIME_PERIOD')
+
+
+def convert_before(column):
+    """TIME_PERIOD conversion as done by format_time_periods.py before time_periods.py."""
+    df = pd.DataFrame({'TIME_PERIOD': column})
+    tp = df['TIME_PERIOD'].astype(str)
+    df['TIME_PERIOD'] = df['TIME_PERIOD'].astype(object)
+
+    mask_year = tp.str.match(r'^\d{4}$')
+    mask_month = tp.str.match(r'^\d{4}-\d{2}$')
+    mask_quarter = tp.str.match(r'^\d{4}-Q[1-4]$')
+    mask_semester = tp.str.match(r'^\d{4}-S[1-2]$')
+
+    df.loc[mask_year, 'TIME_PERIOD'] = pd.to_datetime(tp[mask_year] + '-01-01', format='%Y-%m-%d', errors='coerce')
+    df.loc[mask_month, 'TIME_PERIOD'] = pd.to_datetime(tp[mask_month] + '-01', format='%Y-%m-%d', errors='coerce')
+    years = tp[mask_quarter].str[:4].astype(int)
+    months = (tp[mask_quarter].str[-1].astype(int) - 1) * 3 + 1
+    df.loc[mask_quarter, 'TIME_PERIOD'] = pd.to_datetime(
+        years.astype(str) + '-' + months.astype(str).str.zfill(2) + '-01', format='%Y-%m-%d', errors='coerce')
+    years_s = tp[mask_semester].str[:4].astype(int)
+    months_s = (tp[mask_semester].str[-1].astype(int) - 1) * 6 + 1
+    df.loc[mask_semester, 'TIME_PERIOD'] = pd.to_datetime(
+        years_s.astype(str) + '-' + months_s.astype(str).str.zfill(2) + '-01', format='%Y-%m-%d', errors='coerce')
+    # The column is left as objects; the storage layer converted it with pd.to_datetime afterwards
+    return pd.to_datetime(df['TIME_PERIOD'])
+
+
+def convert_after(column):
+    parse_label.cache_clear() # Measure a cold cache
+    return parse_time_periods(column)[0]
+
+
+def best_of(repeat, func, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    labels = make_labels(args.rows)
+    inputs = {'string': labels, 'categorical': labels.astype('category')}
+    print(f"{args.rows:,} labels, {labels.nunique()} distinct")
+
+    print(f"\n{'input':>12} {'before s':>9} {'after s':>9} {'speedup':>8} {'same dates':>11}")
+    for name, column in inputs.items():
+        before_s, before = best_of(args.repeat, convert_before, column)
+        after_s, after = best_of(args.repeat, convert_after, column)
+        same = before.reset_index(drop=True).equals(after.reset_index(drop=True))
+        print(f"{name:>12} {before_s:>9.2f} {after_s:>9.3f} {before_s / after_s:>8.1f} {str(same):>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+===============================================================================
+ Script Name: bench_transform.py
+ Author: Igor Latii
+ Description:
+     Memory and time of the wide-to-long transform of
+     `src/transform_to_long_format_EStat.py` on a synthetic wide monthly raw
+     table (many dimension combinations, 35 years of months, ~60% empty cells,
+     as in `sts_inpr_m` or `tour_occ_nim` across many geos):
+
+        - before:   the previous implementation: read the whole table,
+                    `df.melt(...)` over all cells, then `dropna` on VALUE;
+        - full:     `transform_file(..., chunk_rows=None)`: the whole table at
+                    once, but empty cells are skipped while reshaping;
+        - chunked:  `transform_file` with `--chunk-rows` raw rows at a time,
+                    each chunk appended to the output table.
+
+     Each mode runs in a fresh subprocess so that its peak RSS is measured on
+     its own. The outputs of all modes are compared with an order-independent
+     checksum (sum of row hashes), since chunking changes the row order but
+     not the content.
+
+ Usage:
+     python benchmarks/bench_transform.py [--rows 60000] [--years 35] [--chunk-rows 500 2000 10000]
+===============================================================================
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_streaming import peak_rss_mb  # noqa: E402
+
+
+def make_raw_table(stem, n_rows, n_years, empty_share=0.6, seed=0):
+    """Write a synthetic wide monthly raw table (typed, default storage format)."""
+    from storage import write_table
+    rng = np.random.default_rng(seed)
+    periods = [f"{1990 + y}-{m:02d}" for y in range(n_years) for m in range(1, 13)]
+    df = pd.DataFrame({
+        'freq': 'M',
+        's_adj': [('NSA', 'SA', 'SCA')[i % 3] for i in range(n_rows)],
+        'unit': [('I15', 'I21', 'PCH_PRE', 'PCH_SM')[i // 3 % 4] for i in range(n_rows)],
+        'nace_r2': [f"C{i // 12 % 100:02d}" for i in range(n_rows)],
+        'geo\\TIME_PERIOD': [f"G{i // 1200:02d}" for i in range(n_rows)],
+    })
+    values = rng.uniform(0, 200, (n_rows, len(periods))).round(1)
+    values[rng.random(values.shape) < empty_share] = np.nan
+    df = pd.concat([df, pd.DataFrame(values, columns=periods)], axis=1)
+    return write_table(df, stem)
+
+
+def transform_before(source, output_dir):
+    """The transform as it was before chunking (full read, full melt, then dropna)."""
+    from storage import read_table, write_table
+    df = read_table(source).rename(columns={'geo\\TIME_PERIOD': 'geo'})
+    period_cols = [c for c in df.columns if c[:4].isdigit() or 'Q' in c]
+    meta_cols = [c for c in df.columns if c not in period_cols]
+    df_long = df.melt(id_vars=meta_cols, value_vars=period_cols, var_name='TIME_PERIOD', value_name='VALUE')
+    df_long = df_long.dropna(subset=["VALUE"])
+    return write_table(df_long, os.path.join(output_dir, os.path.basename(source) + "_long"))
+
+
+def run_mode(mode, source, output_dir):
+    """Transform `source` in this process and print the timing as JSON."""
+    import transform_to_long_format_EStat as transform
+    from storage import read_table
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'before':
+        path = transform_before(source, output_dir)
+    else:
+        path = transform.transform_file(source, output_dir, {}, chunk_rows=None if mode == 'full' else int(mode))
+    seconds, peak = time.perf_counter() - start, peak_rss_mb()
+
+    df = read_table(path)
+    checksum = int(pd.util.hash_pandas_object(df, index=False).sum())
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak, 'baseline_rss_mb': baseline,
+                      'rows': len(df), 'checksum': checksum}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=60000, help="raw rows (series) in the synthetic table")
+    parser.add_argument('--years', type=int, default=35)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[500, 2000, 10000])
+    parser.add_argument('--run', nargs=3, metavar=('MODE', 'SOURCE', 'OUTPUT_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(*args.run)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'raw', 'bench_raw')
+        path = make_raw_table(source, args.rows, args.years)
+        print(f"Synthetic table: {args.rows} rows x {args.years * 12} months, "
+              f"{os.path.getsize(path) / 1024 ** 2:.1f} MB on disk ({os.path.basename(path)})")
+
+        results = []
+        for mode in ['before', 'full'] + [str(n) for n in args.chunk_rows]:
+            output_dir = os.path.join(tmp, f"out_{mode}")
+            proc = subprocess.run([sys.executable, __file__, '--run', mode, source, output_dir],
+                                  capture_output=True, text=True, check=True)
+            results.append((mode, json.loads(proc.stdout.strip().splitlines()[-1])))
+
+    reference = results[0][1]
+    print(f"\n{'mode':>10} {'seconds':>9} {'peak RSS MB':>12} {'above imports':>14} {'rows':>11} {'same':>5}")
+    for mode, res in results:
+        same = (res['rows'], res['checksum']) == (reference['rows'], reference['checksum'])
+        print(f"{mode:>10} {res['seconds']:>9.2f} {res['peak_rss_mb']:>12.1f} "
+              f"{res['peak_rss_mb'] - res['baseline_rss_mb']:>14.1f} {res['rows']:>11,} {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+===============================================================================
+ Script Name: bench_wb.py
+ Author: Igor Latii
+ Description:
+     Memory and time of the World Bank ingestion
+     (`src/transform_to_long_format_WB.py`) on the bulk export of the World
+     Development Indicators: every indicator of every economy in one CSV
+     (`WDICSV.csv`, ~1,500 indicators x 266 economies x 65 years), from which
+     a few indicators of the study countries are needed.
+
+        - before:   the previous implementation applied to the bulk file: read
+                    every row and column, melt all of them, then keep the
+                    selected countries and indicators;
+        - pruned:   `transform_file`: only the lines of the selected countries
+                    and indicators are parsed, and only their year columns;
+        - zip:      the same, reading the data file of `WDI_CSV.zip` without
+                    extracting it.
+
+     By default a synthetic bulk export of the real size is generated (one row
+     per economy and indicator, ~40% empty cells); `--bulk` uses a downloaded
+     `WDI_CSV.zip` (https://datacatalog.worldbank.org, World Development
+     Indicators, CSV) instead. Each mode runs in a fresh subprocess so that its
+     peak RSS is measured on its own; the outputs of all modes are compared
+     with an order-independent checksum.
+
+ Usage:
+     python benchmarks/bench_wb.py [--indicators 1500] [--economies 266] [--select 20] [--geos 27]
+            [--years 1995-2024] [--bulk WDI_CSV.zip]
+===============================================================================
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from bench_streaming import peak_rss_mb  # noqa: E402
+
+ALL_YEARS = [str(y) for y in range(1960, 2025)]
+
+
+# === Synthetic bulk export ===
+def economies(n):
+    """(name, ISO3) of `n` economies: the countries known to the pipeline first, then made-up ones."""
+    from transform_to_long_format_WB import eurostat_geo
+    known = [(f"Country {iso3}", iso3) for iso3 in eurostat_geo]
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    extra = [(f"Economy {a}{b}, other", f"Q{a}{b}") for a in letters for b in letters]
+    return (known + extra)[:n]
+
+
+def indicator_codes(n):
+    return [f"SYN.{i // 100:02d}.{i % 100:02d}.ZS" for i in range(n)]
+
+
+def make_bulk(path, n_indicators, n_economies, empty_share=0.4, seed=0):
+    """Write a WDICSV.csv-shaped file (header on the first line, one row per economy and indicator)."""
+    rng = np.random.default_rng(seed)
+    countries = economies(n_economies)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code'] + ALL_YEARS) + '\n')
+        for code in indicator_codes(n_indicators):
+            values = rng.uniform(0, 1000, (len(countries), len(ALL_YEARS))).round(2)
+            values[rng.random(values.shape) < empty_share] = np.nan
+            df = pd.DataFrame(values, columns=ALL_YEARS)
+            df.insert(0, 'Indicator Code', code)
+            df.insert(0, 'Indicator Name', f"Synthetic indicator {code} (%, of total)")
+            df.insert(0, 'Country Code', [c[1] for c in countries])
+            df.insert(0, 'Country Name', [c[0] for c in countries])
+            df.to_csv(f, header=False, index=False)
+    return path
+
+
+def make_zip(csv_path, zip_path):
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.write(csv_path, 'WDICSV.csv')
+        archive.writestr('WDICountry.csv', 'Country Code,Short Name\n')
+    return zip_path
+
+
+def bulk_codes(path, n):
+    """First `n` indicator codes of a bulk file (CSV or zip)."""
+    from transform_to_long_format_WB import open_data, read_header
+    codes = []
+    with open_data(path) as stream:
+        read_header(stream)
+        for line in stream:
+            code = next(csv.reader([line]))[3]
+            if code not in codes:
+                codes.append(code)
+                if len(codes) == n:
+                    break
+    return codes
+
+
+# === Modes ===
+def transform_before(source, output_dir, indicators):
+    """The previous implementation on the bulk file: full read, full melt, then filter; one table per code."""
+    from storage import compact_dtypes, write_table
+    from transform_to_long_format_WB import LONG_COLUMNS, eurostat_geo
+    from indicator_config import parse_geos, parse_years
+    df = pd.read_csv(source)
+    df.columns = [c.strip() for c in df.columns]
+    df = compact_dtypes(df)
+    meta_cols = ["Country Name", "Country Code", "Indicator Name", "Indicator Code"]
+    period_cols = [c for c in df.columns if c not in meta_cols]
+    df_long = df.melt(id_vars=meta_cols, value_vars=period_cols, var_name="TIME_PERIOD", value_name="VALUE")
+    df_long["VALUE"] = pd.to_numeric(df_long["VALUE"], errors='coerce')
+    df_long = df_long.dropna(subset=["VALUE"])
+    df_long["geo"] = df_long["Country Code"].map(eurostat_geo)
+    paths = []
+    for _, row in indicators.iterrows():
+        years = parse_years(row.get('years'))
+        part = df_long[(df_long["Indicator Code"] == row['code']) & df_long["geo"].isin(parse_geos(row['geo_filter']))]
+        if years is not None:
+            part = part[part["TIME_PERIOD"].astype(str).astype(int).isin(years)]
+        part = part.rename(columns={"Indicator Code": "indicator"}).assign(freq='A')
+        paths.append(write_table(compact_dtypes(part[LONG_COLUMNS].copy()),
+                                 os.path.join(output_dir, f"WDI_{row['code']}_long")))
+    return paths
+
+
+def checksum(paths):
+    from storage import read_table
+    df = pd.concat([read_table(p).astype(str) for p in paths], ignore_index=True)
+    return len(df), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def run_mode(mode, source, output_dir, indicators_path):
+    """Run one mode in this process and print the timing as JSON."""
+    import transform_to_long_format_WB as wb
+    indicators = pd.read_csv(indicators_path, dtype=str, keep_default_na=False)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'before':
+        paths = transform_before(source, output_dir, indicators)
+    else:
+        written = wb.transform_file(source, output_dir, indicators)
+        paths = written if isinstance(written, list) else [written]
+    seconds, peak = time.perf_counter() - start, peak_rss_mb()
+    rows, digest = checksum(paths)
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak, 'baseline_rss_mb': baseline,
+                      'rows': rows, 'checksum': digest}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--indicators', type=int, default=1500, help="indicators of the synthetic bulk export")
+    parser.add_argument('--economies', type=int, default=266, help="economies (countries and aggregates)")
+    parser.add_argument('--select', type=int, default=20, help="indicators taken from the bulk export")
+    parser.add_argument('--geos', type=int, default=27, help="study countries (EU-27 first)")
+    parser.add_argument('--years', default='1995-2024', help="years of the selected indicators ('' for all)")
+    parser.add_argument('--bulk', help="downloaded WDI_CSV.zip instead of the synthetic export")
+    parser.add_argument('--run', nargs=4, metavar=('MODE', 'SOURCE', 'OUTPUT_DIR', 'INDICATORS'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(*args.run)
+        return
+
+    from transform_to_long_format_WB import data_member, eurostat_geo
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, 'raw')
+        os.makedirs(raw)
+        start = time.perf_counter()
+        if args.bulk:
+            sources = {'zip': os.path.join(raw, 'WDI_CSV.zip')}
+            shutil.copy(args.bulk, sources['zip'])
+            with zipfile.ZipFile(sources['zip']) as archive:
+                archive.extract(data_member(sources['zip']), tmp)
+            csv_path = os.path.join(tmp, data_member(sources['zip']))
+        else:
+            csv_path = make_bulk(os.path.join(tmp, 'WDICSV.csv'), args.indicators, args.economies)
+            sources = {'zip': make_zip(csv_path, os.path.join(raw, 'WDI_CSV.zip'))}
+        sources = {'before': csv_path, 'pruned': csv_path, **sources}
+        print(f"Bulk export: {os.path.getsize(csv_path) / 1024 ** 2:.0f} MB CSV, "
+              f"{os.path.getsize(sources['zip']) / 1024 ** 2:.0f} MB zip "
+              f"({'downloaded' if args.bulk else f'generated in {time.perf_counter() - start:.0f}s'})")
+
+        geos = list(dict.fromkeys(eurostat_geo.values()))[:args.geos]
+        codes = bulk_codes(csv_path, args.select)
+        indicators_path = os.path.join(tmp, 'indicators.csv')
+        pd.DataFrame({'code': codes, 'name': codes, 'geo_filter': ';'.join(geos), 'dimensions': '',
+                      'years': args.years}).to_csv(indicators_path, index=False)
+        print(f"Selected: {len(codes)} indicators x {len(geos)} countries, years {args.years or 'all'}")
+
+        results = []
+        for mode, source in sources.items():
+            output_dir = os.path.join(tmp, f"out_{mode}")
+            proc = subprocess.run([sys.executable, __file__, '--run', mode, source, output_dir, indicators_path],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(proc.stderr)
+                raise SystemExit(f"Mode {mode} failed")
+            results.append((mode, json.loads(proc.stdout.strip().splitlines()[-1])))
+
+    reference = results[0][1]
+    print(f"\n{'mode':>8} {'seconds':>9} {'peak RSS MB':>12} {'above imports':>14} {'rows':>9} {'same':>5}")
+    for mode, res in results:
+        same = (res['rows'], res['checksum']) == (reference['rows'], reference['checksum'])
+        print(f"{mode:>8} {res['seconds']:>9.2f} {res['peak_rss_mb']:>12.1f} "
+              f"{res['peak_rss_mb'] - res['baseline_rss_mb']:>14.1f} {res['rows']:>9,} {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+===============================================================================
+ Script Name: synthetic_data.py
+ Author: Igor Latii
+ Description:
+     Synthetic input data of the pipeline at a configurable scale, for the
+     benchmarks (`bench_pipeline.py`) and for sizing runs with more countries:
+
+        - Eurostat-shaped raw tables, as written by `collecting_data.py`:
+          dimension columns (`freq`, `dim1`..`dimN`), `geo\\TIME_PERIOD` and
+          one column per period label (`2001`, `2001-Q1`, `2001-01`), with
+          missing values and a few zeros. Most indicators have one frequency
+          (annual, quarterly or monthly, in turn), every fifth one mixes all
+          three, as `avia_paocc`. One table per geo (`{code}__{geo}_raw`)
+          when there are several geos, `{code}_raw` otherwise;
+        - World Bank-shaped CSV files (`API_{code}_DS2_en_csv_v2_126864.csv`:
+          4 metadata lines, one row per country including aggregates, one
+          column per year since 1960);
+        - the matching configuration in a reports directory: indicators.csv
+          (geo filter, and a dimension selection for every other Eurostat
+          indicator), resampling.csv (sum / mean rules in turn), features.csv
+          (growth, 3-year mean and lag of all indicators, per-capita values
+          with the first indicator as population) and rqs.json (research
+          questions of 6 indicators for the EDA, read by eda_visualization.py).
+
+     Values are seeded random walks, so runs are reproducible.
+
+ Usage:
+     python benchmarks/synthetic_data.py <data_dir> <reports_dir>
+            [--geos 3] [--years 30] [--indicators 15] [--dimensions 2]
+            [--codes 2] [--wb-indicators 1]
+
+     then run the pipeline on it:
+     PIPELINE_DATA_DIR=<data_dir> PIPELINE_REPORTS_DIR=<reports_dir> PIPELINE_PANEL=1 python src/pipeline.py
+
+ Dependencies:
+     - pandas, numpy
+     - argparse, itertools, json, os, sys
+     - storage.py, transform_to_long_format_WB.py (ISO3 -> geo codes)
+===============================================================================
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from storage import write_table  # noqa: E402
+from transform_to_long_format_WB import eurostat_geo  # noqa: E402
+
+GEOS = list(dict.fromkeys(eurostat_geo.values()))   # EU-27 first, then the other European countries
+ISO3 = {geo: iso3 for iso3, geo in eurostat_geo.items()}
+WB_AGGREGATES = [('European Union', 'EUU'), ('World', 'WLD')]
+LAST_YEAR = 2024
+
+
+# === Periods ===
+def period_labels(freq, years):
+    """Eurostat period labels of `freq` ('A', 'Q' or 'M') for the given years."""
+    if freq == 'A':
+        return [str(y) for y in years]
+    if freq == 'Q':
+        return [f"{y}-Q{q}" for y in years for q in range(1, 5)]
+    return [f"{y}-{m:02d}" for y in years for m in range(1, 13)]
+
+
+def indicator_frequencies(i):
+    return 'AQM' if i % 5 == 4 else 'AQM'[i % 3]
+
+
+# === Values ===
+def random_walks(rng, n_series, length, missing=0.15, zeros=0.01):
+    """Positive seeded random walks (series x periods), with missing values and a few zeros."""
+    level = rng.uniform(10, 1000, (n_series, 1))
+    steps = rng.normal(0, 0.03, (n_series, length)).cumsum(axis=1)
+    values = (level * np.exp(steps)).round(1)
+    values[rng.random(values.shape) < missing] = np.nan
+    values[rng.random(values.shape) < zeros] = 0.0
+    return values
+
+
+# === Eurostat ===
+def eurostat_table(rng, geos, years, freqs, n_dimensions, n_codes):
+    """Raw Eurostat-shaped wide table of one indicator, all geos."""
+    dimensions = [f"dim{d + 1}" for d in range(n_dimensions)]
+    codes = [[f"C{c}" for c in range(n_codes)]] * n_dimensions
+    columns = sorted({label for freq in freqs for label in period_labels(freq, years)})
+    position = {label: j for j, label in enumerate(columns)}
+    parts = []
+    for freq in freqs:
+        labels = period_labels(freq, years)
+        combos = list(itertools.product(*codes))
+        keys = pd.DataFrame([(freq, *combo, geo) for combo in combos for geo in geos],
+                            columns=['freq'] + dimensions + ['geo\\TIME_PERIOD'])
+        values = np.full((len(keys), len(columns)), np.nan)
+        values[:, [position[label] for label in labels]] = random_walks(rng, len(keys), len(labels))
+        parts.append(pd.concat([keys, pd.DataFrame(values, columns=columns)], axis=1))
+    return pd.concat(parts, ignore_index=True)
+
+
+def eurostat_code(i):
+    return f"syn_{i:03d}"
+
+
+def write_eurostat(raw_dir, rng, geos, years, n_indicators, n_dimensions, n_codes):
+    """Write the raw Eurostat tables; returns the indicators.csv rows."""
+    rows = []
+    for i in range(n_indicators):
+        code = eurostat_code(i)
+        df = eurostat_table(rng, geos, years, indicator_frequencies(i), n_dimensions, n_codes)
+        if len(geos) == 1:
+            write_table(df, os.path.join(raw_dir, f"{code}_raw"))
+        else:
+            for geo, part in df.groupby('geo\\TIME_PERIOD', sort=False):
+                write_table(part.reset_index(drop=True), os.path.join(raw_dir, f"{code}__{geo}_raw"))
+        # Every other indicator selects one code per dimension, the others keep all rows (summed)
+        dims = ';'.join(f"dim{d + 1}=C0" for d in range(n_dimensions)) if i % 2 == 0 else ''
+        rows.append({'code': code, 'name': f"Synthetic indicator {i:03d}", 'geo_filter': ';'.join(geos),
+                     'dimensions': dims})
+    return rows
+
+
+# === World Bank ===
+def wb_code(i):
+    return f"SYN.WB.{i:03d}"
+
+
+def wb_file_name(i):
+    return f"API_{wb_code(i)}_DS2_en_csv_v2_126864.csv"
+
+
+def write_world_bank(raw_dir, rng, geos, years, n_indicators):
+    """Write the World Bank CSV files; returns the indicators.csv rows."""
+    rows = []
+    all_years = list(range(1960, LAST_YEAR + 1))
+    countries = [(f"Country {ISO3[g]}", ISO3[g]) for g in GEOS] + WB_AGGREGATES
+    for i in range(n_indicators):
+        values = np.full((len(countries), len(all_years)), np.nan)
+        values[:, all_years.index(years[0]):] = random_walks(rng, len(countries), len(years), zeros=0)
+        with open(os.path.join(raw_dir, wb_file_name(i)), 'w', encoding='utf-8') as f:
+            f.write('"Data Source","World Development Indicators",\n\n"Last Updated Date","2025-10-07",\n\n')
+            f.write(','.join(f'"{c}"' for c in ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+                             + [str(y) for y in all_years]) + ',\n')
+            for (name, iso3), row in zip(countries, values):
+                cells = ['""' if np.isnan(v) else f'"{v}"' for v in row]
+                f.write(f'"{name}","{iso3}","Synthetic WB indicator {i:03d}","{wb_code(i)}",' + ','.join(cells) + ',\n')
+        rows.append({'code': wb_code(i), 'name': f"Synthetic WB indicator {i:03d}", 'geo_filter': ';'.join(geos),
+                     'dimensions': ''})
+    return rows
+
+
+# === Configuration ===
+def merged_names(n_indicators, n_wb):
+    """Column names of the indicators in the merged dataset (panel mode, or a single geo)."""
+    return [eurostat_code(i) for i in range(n_indicators)] + [wb_file_name(i)[:-len('.csv')] for i in range(n_wb)]
+
+
+def research_questions(names, per_rq=6):
+    """
+    RQs of `per_rq` consecutive indicators, with two scatter pairs and two
+    derived features (see features.csv) each; the first one has a combined plot.
+    """
+    rqs = {}
+    for r, first in enumerate(range(0, len(names), per_rq)):
+        indicators = names[first:first + per_rq]
+        rq = {'indicators': indicators,
+              'scatter_pairs': [(indicators[0], y) for y in indicators[1:3]],
+              'features': [f"{indicators[0]} (YoY %)", f"{indicators[-1]} (3y mean)"]}
+        if r == 0:
+            rq['combined'] = indicators[:3]
+        rqs[f"RQ{r + 1}_Synthetic"] = rq
+    return rqs
+
+
+def generate(data_dir, reports_dir, geos=3, years=30, indicators=15, dimensions=2, codes=2, wb_indicators=1,
+             seed=0):
+    """
+    Write the raw data and the configuration of one scale point; returns a
+    summary dict (scale, number of files and bytes of raw data).
+    """
+    if geos > len(GEOS):
+        raise ValueError(f"At most {len(GEOS)} geos are supported (got {geos})")
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(data_dir, 'raw')
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(reports_dir, exist_ok=True)
+    geo_codes = GEOS[:geos]
+    year_range = list(range(LAST_YEAR - years + 1, LAST_YEAR + 1))
+
+    rows = write_eurostat(raw_dir, rng, geo_codes, year_range, indicators, dimensions, codes)
+    rows += write_world_bank(raw_dir, rng, geo_codes, year_range, wb_indicators)
+    pd.DataFrame(rows).to_csv(os.path.join(reports_dir, 'indicators.csv'), index=False)
+
+    names = merged_names(indicators, wb_indicators)
+    pd.DataFrame({'indicator': names,
+                  'aggregation': ['sum' if j % 2 == 0 else 'mean' for j in range(len(names))],
+                  'min_count': 0,
+                  'interpolation': ['linear' if j % 2 == 0 else 'none' for j in range(len(names))],
+                  'max_gap': ''}).to_csv(os.path.join(reports_dir, 'resampling.csv'), index=False)
+    pd.DataFrame({'feature': ['growth', 'rolling_mean', 'lag', 'per_capita'], 'indicators': '*',
+                  'periods': [1, 3, 1, ''], 'base': ['', '', '', names[0]]}).to_csv(
+        os.path.join(reports_dir, 'features.csv'), index=False)
+    with open(os.path.join(reports_dir, 'rqs.json'), 'w', encoding='utf-8') as f:
+        json.dump(research_questions(names), f, indent=2)
+
+    files = [os.path.join(raw_dir, name) for name in os.listdir(raw_dir)]
+    return {'geos': geos, 'years': years, 'indicators': indicators, 'dimensions': dimensions, 'codes': codes,
+            'wb_indicators': wb_indicators, 'raw_files': len(files),
+            'raw_bytes': sum(os.path.getsize(p) for p in files)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_dir')
+    parser.add_argument('reports_dir')
+    parser.add_argument('--geos', type=int, default=3)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--indicators', type=int, default=15, help="Eurostat indicators")
+    parser.add_argument('--dimensions', type=int, default=2, help="dimension columns besides freq")
+    parser.add_argument('--codes', type=int, default=2, help="codes per dimension")
+    parser.add_argument('--wb-indicators', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    summary = generate(args.data_dir, args.reports_dir, args.geos, args.years, args.indicators, args.dimensions,
+                       args.codes, args.wb_indicators, args.seed)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
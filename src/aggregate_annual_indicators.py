@@ -4,82 +4,190 @@
  Author: Igor Latii
  Description:
      This script performs annual aggregation and interpolation on the merged
-     dataset (`merged_df_readable.csv`) created in the previous phase.
+     dataset (`merged_df_readable`) created in the previous phase.
 
      The purpose is to harmonize indicators with different temporal frequencies
      (monthly, quarterly, annual) into a single annual dataset suitable for
-     exploratory data analysis (EDA).
+     exploratory data analysis (EDA). Quarterly and monthly datasets can be
+     produced the same way (`--target Q M`).
 
      Specifically, the script:
-        1. Loads the merged multi-indicator dataset.
-        2. Groups observations by year.
-        3. Sums continuous (economic and transport) indicators to represent
-           total annual activity.
-        4. Averages discrete (event-based or demographic) indicators to obtain
-           representative annual levels.
-        5. Applies linear interpolation to continuous indicators with small gaps.
-        6. Saves the resulting annual dataset for use in subsequent analysis.
+        1. Loads the merged multi-indicator dataset, one frequency block at a
+           time (see frequency_blocks.py), without the NaN padding of the wide
+           view, and only the indicators listed in `/reports/resampling.csv`.
+        2. Groups the observations of each block by target period (year).
+        3. Aggregates every indicator with its rule from the configuration:
+           continuous (economic and transport) indicators are summed to
+           represent total annual activity, discrete (event-based or
+           demographic) indicators are averaged to obtain representative
+           annual levels.
+        4. Joins the blocks and interpolates the indicators whose rule asks
+           for it (linear, for continuous indicators).
+        5. Saves the resulting dataset for use in subsequent analysis, and
+           the aggregated periods before interpolation (`*_periods`).
+
+     In delta mode (`pipeline.py --delta`) only the periods holding a new or
+     revised value of the merged dataset are aggregated again (`update`);
+     the other periods come from the stored `*_periods` table, and step 4
+     runs again over all periods. Only the block rows of the changed geos
+     within these periods are read (Parquet row filters, see storage.py).
+
+     The aggregation and interpolation themselves are done by resampling.py.
+     With `PIPELINE_ENGINE=sqlite` steps 1-3 run as SQL queries over the
+     stored blocks instead, streamed from disk (see sql_engine.py), with
+     identical results.
+     A panel dataset (keyed on geo and TIME_PERIOD, see make_merged_df.py) is
+     resampled for all countries at once, with one row per geo and period.
 
  Output:
-     /data/processed/merged/merged_df_annual.csv
+     /data/processed/merged/merged_df_annual.parquet (+ .csv export)
+     /data/processed/merged/merged_df_quarterly, merged_df_monthly (--target Q / M)
+     /data/processed/merged/merged_df_annual_periods (aggregated periods, for delta updates)
+
+     Runs on its own, or from `pipeline.py` when the merged dataset or the
+     rules changed. `PIPELINE_TARGETS` (e.g. `A,Q`) sets the targets built by
+     default.
 
  Dependencies:
      - pandas
-     - os
+     - argparse, os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py,
+       frequency_blocks.py, resampling.py, sql_engine.py, telemetry.py
 ===============================================================================
 """
 
-import pandas as pd
+import argparse
 import os
 
+import pandas as pd
+
+from frequency_blocks import read_blocks, read_manifest, records_frame
+from pipeline_paths import merged_dir
+from resampling import MONTHS, TARGETS, aggregate_periods, complete, load_rules, period_start, rules_path
+import sql_engine
+from storage import find_table, read_table, write_table
+import telemetry
+
 # === PATH CONFIGURATION ===
-input_file = "../data/processed/merged/merged_df_readable.csv"
-output_dir = "../data/processed/merged"
-os.makedirs(output_dir, exist_ok=True)
-output_file = os.path.join(output_dir, "merged_df_annual.csv")
-
-# === LOAD MERGED DATA ===
-# Load the previously merged dataset and ensure TIME_PERIOD is parsed as datetime.
-df = pd.read_csv(input_file, parse_dates=['TIME_PERIOD'])
-
-# Extract the year component for aggregation.
-df['Year'] = df['TIME_PERIOD'].dt.year
-
-# === DEFINE INDICATOR CATEGORIES ===
-# Continuous indicators (summed annually and interpolated)
-continuous_cols = [
-    'GDP (Quarterly)',
-    'Population',
-    'Exports (National Accounts)',
-    'Air Passenger Transport',
-    'Freight Transport',
-    'Inflation (HICP Manufacturing)',
-    'Road Passenger Transport',
-    'Industrial Production Index',
-    'Retail Trade Turnover',
-    'Energy Prices'
-]
-
-# Discrete / event-based indicators (averaged annually; not interpolated)
-discrete_cols = [
-    'Net Migration (World Bank)',
-    'Unemployment Rate',
-    'Emigration of Citizens'
-]
-
-# === DEFINE AGGREGATION STRATEGY ===
-# Continuous indicators → annual totals
-# Discrete indicators → annual averages
-agg_dict = {col: 'sum' for col in continuous_cols}  # sum for transport, economy
-agg_dict.update({col: 'mean' for col in discrete_cols})  # to have one meaning per year
-
-# Perform the aggregation by year.
-annual_df = df.groupby('Year').agg(agg_dict).reset_index()
-
-# === INTERPOLATE CONTINUOUS INDICATORS ===
-# Fill small gaps in continuous indicators using linear interpolation.
-annual_df[continuous_cols] = annual_df[continuous_cols].interpolate(method='linear')
-
-# === SAVE OUTPUT FILE ===
-annual_df.to_csv(output_file, index=False)
-print(f"🎯 Успешно создан merged_df_annual.csv ({annual_df.shape[0]} строк, {annual_df.shape[1]} колонок)")
+input_file = os.path.join(merged_dir, "merged_df_readable") # Dataset stem (frequency blocks + manifest)
+output_names = {'A': 'merged_df_annual', 'Q': 'merged_df_quarterly', 'M': 'merged_df_monthly'}
+
+# Target frequencies built by default (and by pipeline.py)
+targets = [t.strip().upper() for t in os.environ.get('PIPELINE_TARGETS', 'A').split(',') if t.strip()]
+
+
+def output_stem(target, output_dir=merged_dir):
+    return os.path.join(output_dir, output_names[target])
+
+
+def periods_stem(target, output_dir=merged_dir):
+    """Aggregated periods of a target before interpolation, kept for delta updates."""
+    return output_stem(target, output_dir) + '_periods'
+
+
+def read_periods(target, by, output_dir=merged_dir):
+    """Stored aggregated periods of `target`, indexed by (`by`..., TIME_PERIOD) with geo codes as text."""
+    df = read_table(periods_stem(target, output_dir))
+    if not pd.api.types.is_datetime64_any_dtype(df['TIME_PERIOD']):
+        df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'].astype(str)) # CSV tables
+    return period_index(df, by)
+
+
+def period_index(df, by):
+    df = df.astype({c: str for c in by})
+    return df.set_index(list(by) + ['TIME_PERIOD'])
+
+
+def save(aggregated, rules, target, by, output_dir=merged_dir):
+    """Save the aggregated periods of `target`, then interpolate them and save the output table."""
+    write_table(aggregated.reset_index(), periods_stem(target, output_dir))
+    df = complete(aggregated, rules, target, by)
+    output = write_table(df, output_stem(target, output_dir), export_csv=True) # CSV copy kept as a deliverable
+    print(f"🎯 Успешно создан {output_names[target]}.csv ({df.shape[0]} строк, {df.shape[1]} колонок)")
+    return output
+
+
+def aggregate(input_file=input_file, targets=targets, output_dir=merged_dir, rules=None):
+    """Resample the merged dataset to every target frequency; returns the written paths."""
+    rules = load_rules() if rules is None else rules
+
+    by = [k for k in read_manifest(input_file).get('keys', ['TIME_PERIOD']) if k != 'TIME_PERIOD'] # ['geo'] for panels
+    if sql_engine.selected_engine() == 'sqlite':
+        # === AGGREGATE IN SQL, STREAMING THE BLOCKS FROM DISK (see sql_engine.py) ===
+        return [save(sql_engine.aggregate_periods(input_file, rules, target, by), rules, target, by, output_dir)
+                for target in targets]
+
+    # === LOAD MERGED DATA ===
+    # Only the configured indicators are read, block by block.
+    blocks = read_blocks(input_file, columns=list(rules.index))
+
+    outputs = []
+    for target in targets:
+        # === AGGREGATE AND INTERPOLATE (see resampling.py) ===
+        outputs.append(save(aggregate_periods(blocks, rules, target, by), rules, target, by, output_dir))
+    return outputs
+
+
+def period_filters(changed, targets, by):
+    """
+    Row filters (see storage.read_table) covering the target periods of the
+    `changed` keys: from the start of the first to the end of the last
+    period, in the changed geos only; None (all rows) without changed keys.
+    """
+    if changed.empty:
+        return None
+    first, last = changed['TIME_PERIOD'].min(), changed['TIME_PERIOD'].max()
+    start = min(period_start([first], t)[0] for t in targets)
+    end = max((period_start([last], t).astype('datetime64[M]') + MONTHS[t])[0] for t in targets)
+    filters = [('TIME_PERIOD', '>=', pd.Timestamp(start)), ('TIME_PERIOD', '<', pd.Timestamp(end))]
+    return filters + [(key, 'in', sorted(changed[key].astype(str).unique())) for key in by]
+
+
+def update(keys, input_file=input_file, targets=targets, output_dir=merged_dir, rules=None):
+    """
+    Delta update after the merged dataset changed at `keys` ([geo,
+    'YYYY-MM-DD'] pairs, see make_merged_df.update_tables): for every target
+    only the periods holding a changed key are aggregated again, from their
+    own observations, and replace those periods in the stored aggregated
+    periods; zero totals and interpolation then run over all periods (a new
+    observation can fill a gap before it). Returns the written paths, or None
+    if the aggregated periods were not stored (full run needed).
+    """
+    rules = load_rules() if rules is None else rules
+    by = [k for k in read_manifest(input_file).get('keys', ['TIME_PERIOD']) if k != 'TIME_PERIOD']
+    changed = records_frame(keys)
+    if any(find_table(periods_stem(t, output_dir)) is None for t in targets) or set(by) - set(changed.columns):
+        return None
+    # Only the rows of the changed geos within the periods holding a changed key are read
+    blocks = read_blocks(input_file, columns=list(rules.index), filters=period_filters(changed, targets, by))
+
+    outputs = []
+    for target in targets:
+        # === PERIODS HOLDING A CHANGED KEY ===
+        periods = period_index(changed.assign(TIME_PERIOD=period_start(changed['TIME_PERIOD'], target)), by).index
+        selected = {}
+        for freq, block in blocks.items():
+            block_periods = period_index(block[by].assign(TIME_PERIOD=period_start(block['TIME_PERIOD'], target)), by)
+            selected[freq] = block[block_periods.index.isin(periods)]
+
+        # === AGGREGATE THEM AGAIN, KEEP THE OTHER PERIODS ===
+        stored = read_periods(target, by, output_dir)
+        recomputed = period_index(aggregate_periods(selected, rules, target, by).reset_index(), by)
+        aggregated = pd.concat([stored[~stored.index.isin(periods)], recomputed]).sort_index()
+        print(f"DELTA: {output_names[target]}: {len(recomputed)} of {len(aggregated)} periods aggregated again")
+        outputs.append(save(aggregated, rules, target, by, output_dir))
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resample the merged dataset to annual / quarterly / monthly tables.")
+    parser.add_argument('--target', nargs='+', choices=TARGETS, default=targets,
+                        help="target frequencies (default: PIPELINE_TARGETS or A)")
+    parser.add_argument('--rules', default=rules_path, help="resampling rules (CSV)")
+    args = parser.parse_args(argv)
+    aggregate(input_file, args.target, merged_dir, load_rules(args.rules))
+
+
+if __name__ == '__main__':
+    with telemetry.stage('annual'):
+        main()
@@ -6,71 +6,311 @@
      This script automates the data acquisition process from Eurostat for a
      predefined list of indicators specified in the file `/reports/indicators.csv`.
 
-     It connects to the Eurostat API via the `eurostat` Python package, downloads
-     each dataset, filters it for the selected country (default: Latvia, LV), and
-     saves the cleaned raw data in CSV format to the `/data/raw/` directory.
+     It connects to the Eurostat API (see `eurostat_client.py`), downloads
+     each dataset, filters it for the selected countries (column `geo_filter`,
+     default: Latvia, LV), and saves the cleaned raw data to the `/data/raw/`
+     directory through the storage layer (`storage.py`: Parquet by default,
+     Feather or CSV via `PIPELINE_FORMAT`).
+
+     Several countries can be listed per indicator, separated by ';'
+     (e.g. `LV;EE;LT`). Each table is then still downloaded only once and split
+     into one table per geo in a single pass: `{code}__{geo}_raw`. With a
+     single geo the table keeps its usual name `{code}_raw`.
+
+     The optional `dimensions` column of `indicators.csv` (e.g.
+     `unit=CP_MEUR;s_adj=SCA`) selects series within a table. Together with the
+     geos it is sent to Eurostat as a query key, so only the selected series
+     are downloaded, and it is enforced again on the downloaded rows.
+
+     With `--streaming`, large tables are never loaded as a whole: the
+     compressed TSV is written to disk and filtered line by line while reading
+     (see `eurostat_stream.py`), keeping peak memory bounded.
+
+     Indicators are downloaded concurrently by a pool of worker threads. The
+     number of requests sent to the same host at once is capped, and transient
+     failures are retried with exponential backoff.
+
+     Raw payloads are kept in an on-disk cache (`/data/cache/raw/`, see
+     `download_cache.py`). A dataset is not downloaded again while its
+     "last update of data" date in the Eurostat table of contents is unchanged,
+     and its raw table is not rewritten when the payload and geo are unchanged.
+     The table of contents comes from the local metadata cache
+     (`/data/cache/metadata/`, see `eurostat_metadata.py`), refreshed by a
+     conditional request, which also keeps the code lists of the selected
+     dimensions: the `dimensions` selections are printed with their labels.
 
  Workflow:
      1. Load the list of indicators and metadata from `/reports/indicators.csv`.
-     2. For each indicator:
-         - Fetch the corresponding dataset from the Eurostat API.
-         - Filter data for the selected country (geo = LV).
-         - Save the dataset as a raw CSV file in `/data/raw/`.
-     3. Log progress and handle missing or malformed datasets gracefully.
+     2. For each indicator (in parallel):
+         - Fetch the corresponding dataset from the Eurostat API (or the cache).
+         - Filter data for the selected countries (default geo = LV) and dimensions.
+         - Save one raw table per geo atomically in `/data/raw/`.
+     3. Print a summary of succeeded and failed downloads and cache statistics.
+
+ Usage:
+     python collecting_data.py [--workers 4] [--per-host 4] [--retries 4]
+                               [--base-url URL] [--output-dir DIR]
+                               [--no-cache] [--no-toc] [--cache-max-mb 2048]
+                               [--geos 'LV;EE;LT'] [--streaming] [--metadata-dir DIR]
 
  Output:
-     Raw CSV files in `../data/raw/`, one per indicator.
+     Raw tables in `../data/raw/` (`{code}_raw.parquet` by default), one per
+     indicator and geo.
 
  Dependencies:
-     - eurostat
+     - requests
      - pandas
      - os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py, telemetry.py,
+       eurostat_metadata.py
 ===============================================================================
 """
 
-import eurostat
-import pandas as pd
+import argparse
+import gzip
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from download_cache import DownloadCache
+from eurostat_client import EUROSTAT_BASE_URL, EurostatClient, cache_key, parse_tsv
+from eurostat_metadata import EurostatMetadata
+from eurostat_stream import stream_filter
+from indicator_config import (apply_dimension_filters, indicators_path, load_indicators,
+                              parse_dimension_filters, parse_geos)
+from pipeline_paths import cache_dir, metadata_dir, raw_dir
+from storage import default_format, remove_other_formats, table_path, write_table
+import telemetry
 
-# === File paths ===
-base_dir = os.path.dirname(__file__)
-data_dir = os.path.join(base_dir, '../data/raw')
-indicators_path = os.path.join(base_dir, '../reports/indicators.csv')
-# === Create data folder if it doesn't exist ===
-os.makedirs(data_dir, exist_ok=True)
 
-# === Load indicators ===
-indicators = pd.read_csv(indicators_path)
-print(f"Found {len(indicators)} indicators to load...")
+def raw_output_stem(output_dir, code, geo, multi_geo):
+    """
+    Raw table stem for one (indicator, geo) pair: `{code}_raw` when a single
+    geo is collected, `{code}__{geo}_raw` when several are (see `storage.py`).
+    """
+    name = f"{code}__{geo}_raw" if multi_geo else f"{code}_raw"
+    return os.path.join(output_dir, name)
 
-# === Iterate through all selected codes and download data ===
-for _, ind in indicators.iterrows():
-    code = ind['code']
-    name = ind.get('name', code)
-    geo = ind.get('geo', 'LV')  # from indicators.csv
 
-    print(f"INFO: Loading {name} ({code}) for {geo} ...")
+def stream_to_tables(payload_path, output_stems, dim_filters):
+    """
+    Stream a payload into per-geo raw tables. Rows are streamed to CSV; for
+    columnar formats the (already filtered, small) CSVs are then converted.
+    """
+    fmt = default_format()
+    if fmt == 'csv':
+        counts = stream_filter(payload_path, {geo: table_path(stem, 'csv') for geo, stem in output_stems.items()},
+                               dim_filters)
+        for stem in output_stems.values():
+            remove_other_formats(stem, keep=['csv'])
+        return counts
+
+    tmp_paths = {geo: os.path.join(os.path.dirname(stem), f".{os.path.basename(stem)}.stream.csv")
+                 for geo, stem in output_stems.items()}
     try:
-        # Loading the entire dataset
-        df = eurostat.get_data_df(code)
+        counts = stream_filter(payload_path, tmp_paths, dim_filters)
+        for geo, stem in output_stems.items():
+            write_table(pd.read_csv(tmp_paths[geo]), stem, fmt)
+    finally:
+        for path in tmp_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+    return counts
+
+
+def collect_indicator(client, code, name, geos, output_dir=raw_dir, cache=None, last_update=None,
+                      streaming=False, dim_filters=None):
+    """
+    Download one indicator once, split it by geo and save one raw table per geo.
+    `dim_filters` ({dimension: [codes]}) and the geos are sent to Eurostat as
+    query filters and enforced again locally.
+    With `streaming`, the compressed file goes to disk and is filtered line by
+    line (see `eurostat_stream.py`) instead of being loaded into a DataFrame.
+    Returns a dict describing the result (used for the final summary).
+    """
+    start = time.perf_counter()
+    dim_filters = dim_filters or {}
+    spec = ';'.join(f"{dim}={'+'.join(codes)}" for dim, codes in dim_filters.items())
+    print(f"INFO: Loading {name} ({code}) for {', '.join(geos)} {spec} ...")
+
+    # Loading the selected series (served from the cache when unchanged)
+    query_filters = {**dim_filters, 'geo': geos}
+    if streaming:
+        payload_path, changed = client.fetch_payload_file(code, output_dir, cache, last_update, query_filters)
+        payload_bytes = os.path.getsize(payload_path)
+    else:
+        payload, changed = client.fetch_payload(code, cache, last_update, query_filters)
+        payload_bytes = len(payload)
+    telemetry.record_input(nbytes=payload_bytes)
+    key = cache_key(code, query_filters)
+    multi_geo = len(geos) > 1
+    output_stems = {geo: raw_output_stem(output_dir, code, geo, multi_geo) for geo in geos}
+    output_paths = {geo: table_path(stem) for geo, stem in output_stems.items()}
+    result = {'code': code, 'paths': list(output_paths.values()), 'payload_bytes': payload_bytes}
+
+    # Skip parsing and rewriting when all tables were produced from this exact payload
+    if cache is not None and all(cache.output_is_current(key, path, {'geo': geo})
+                                 for geo, path in output_paths.items()):
+        print(f"  SUCCESS: {code}: unchanged, keeping {len(output_paths)} file(s)")
+        return {**result, 'rows': None, 'status': 'unchanged', 'seconds': time.perf_counter() - start}
+
+    if streaming:
+        try:
+            counts = stream_to_tables(payload_path, output_stems, dim_filters)
+        finally:
+            if cache is None:
+                os.remove(payload_path)  # temporary download, not kept
+        rows, rows_read = sum(counts[geo] for geo in geos), counts['rows_read']
+        for geo, output_path in output_paths.items():
+            if counts[geo] == 0:
+                print(f"  WARNING: {code}: no rows for geo={geo}.")
+            if cache is not None:
+                cache.record_output(key, output_path, {'geo': geo})
+    else:
+        df = parse_tsv(gzip.decompress(payload).decode('utf-8'))
+        rows_read = len(df)
+        df = apply_dimension_filters(df, dim_filters, code)
 
-        # Filter by GEO (if applicable)
-#        print("  Columns:", list(df.columns))
+        # Split by GEO in one pass (if applicable): keep the requested geos, then group
         if 'geo\\TIME_PERIOD' in df.columns:
-            df = df[df['geo\\TIME_PERIOD'] == geo]
-            print(f"  INFO: Filtered by geo={geo}, remaining {len(df)} rows.")
+            selected = df[df['geo\\TIME_PERIOD'].isin(geos)]
+            parts = dict(tuple(selected.groupby('geo\\TIME_PERIOD', sort=False)))
         else:
             print(f"  WARNING: 'geo' column not found in dataset {code}.")
+            parts = {geo: df for geo in geos}
+
+        # Save one table per geo (written to a temp file first, then moved into place)
+        rows = 0
+        for geo, output_path in output_paths.items():
+            part = parts.get(geo, df.iloc[0:0])
+            if part.empty:
+                print(f"  WARNING: {code}: no rows for geo={geo}.")
+            write_table(part, output_stems[geo])
+            if cache is not None:
+                cache.record_output(key, output_path, {'geo': geo})
+            rows += len(part)
+
+    telemetry.record_input(rows_read)
+    print(f"  SUCCESS: {code}: {payload_bytes / 1024:.1f} KB downloaded, kept {rows} of {rows_read} rows "
+          f"in {len(output_paths)} file(s)")
+    return {**result, 'rows': rows, 'rows_read': rows_read,
+            'status': 'updated' if changed else 'rewritten', 'seconds': time.perf_counter() - start}
+
+
+def describe_selections(indicators, metadata):
+    """Print the dimension selections of indicators.csv with their labels; warn about codes missing from the code lists."""
+    for _, ind in indicators.iterrows():
+        dim_filters = parse_dimension_filters(ind.get('dimensions'))
+        if dim_filters:
+            print(f"  {ind['code']}: {metadata.describe(ind['code'], dim_filters)}")
+        for dim, codes in metadata.unknown_codes(ind['code'], dim_filters).items():
+            print(f"  WARNING: {ind['code']}: {dim}={'+'.join(codes)} not in code list {metadata.codelist(dim, ind['code'])}")
+
+
+def collect_all(indicators, client=None, workers=4, output_dir=raw_dir, cache=None, use_toc=True,
+                geos_override=None, streaming=False, metadata=None):
+    """
+    Download all indicators with a pool of `workers` threads. Each table is
+    downloaded once, whatever the number of geos requested for it
+    (`geo_filter` column, or `geos_override` for all indicators).
+    With a `cache`, the Eurostat table of contents is fetched once (unless
+    `use_toc` is False) to find datasets whose data has not been updated;
+    with a `metadata` cache (eurostat_metadata.py) it is refreshed instead,
+    together with the dimension code lists of the indicators, and the
+    selected dimension codes are checked against them.
+    Returns a (succeeded, failed) pair of lists of result dicts.
+    """
+    client = client or EurostatClient()
+    os.makedirs(output_dir, exist_ok=True)
+
+    last_updates = {}
+    if cache is not None and use_toc:
+        try:
+            if metadata is None:
+                last_updates = client.get_last_updates()
+            else:
+                print(f"  {metadata.format_stats(metadata.refresh(client, list(indicators['code'])))}")
+                last_updates = metadata.last_updates()
+                describe_selections(indicators, metadata)
+        except Exception as e:
+            print(f"  WARNING: Table of contents unavailable, falling back to conditional requests: {e}")
+
+    succeeded, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for _, ind in indicators.iterrows():
+            code = ind['code']
+            name = ind.get('name', code)
+            geos = geos_override or parse_geos(ind.get('geo_filter', ind.get('geo')))  # from indicators.csv
+            dim_filters = parse_dimension_filters(ind.get('dimensions'))
+            futures[pool.submit(telemetry.call, code, collect_indicator, client, code, name, geos, output_dir,
+                                cache, last_updates.get(code), streaming, dim_filters)] = code # One span per indicator
+
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                succeeded.append(future.result())
+            except Exception as e:
+                print(f"  ERROR: Error loading {code}: {e}")
+                failed.append({'code': code, 'error': str(e)})
+
+    return succeeded, failed
+
+
+def print_summary(succeeded, failed, elapsed):
+    """Print the end-of-run summary of succeeded and failed downloads."""
+    print(f"\n=== Summary: {len(succeeded)} succeeded, {len(failed)} failed in {elapsed:.1f}s ===")
+    for res in sorted(succeeded, key=lambda r: r['code']):
+        rows = '-' if res['rows'] is None else res['rows']
+        print(f"  OK      {res['code']:<16} {rows:>7} rows  {res['payload_bytes'] / 1024:>9.1f} KB  "
+              f"{res['seconds']:6.1f}s  {res['status']}")
+    for res in sorted(failed, key=lambda r: r['code']):
+        print(f"  FAILED  {res['code']:<16} {res['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download Eurostat indicators listed in indicators.csv.")
+    parser.add_argument('--workers', type=int, default=4, help="number of concurrent download threads")
+    parser.add_argument('--per-host', type=int, default=4, help="max concurrent requests per host")
+    parser.add_argument('--retries', type=int, default=4, help="retries per request on transient errors")
+    parser.add_argument('--backoff', type=float, default=1.0, help="initial backoff in seconds")
+    parser.add_argument('--base-url', default=EUROSTAT_BASE_URL, help="Eurostat SDMX 2.1 API base URL")
+    parser.add_argument('--indicators', default=indicators_path, help="path to indicators.csv")
+    parser.add_argument('--streaming', action='store_true',
+                        help="stream each TSV.gz from disk and filter while reading (bounded memory)")
+    parser.add_argument('--geos', help="geos for all indicators, e.g. 'LV;EE;LT' (overrides geo_filter)")
+    parser.add_argument('--output-dir', default=raw_dir, help="directory for the raw tables")
+    parser.add_argument('--cache-dir', default=cache_dir, help="directory of the raw download cache")
+    parser.add_argument('--cache-max-mb', type=float, default=2048, help="cache size limit before LRU eviction")
+    parser.add_argument('--no-cache', action='store_true', help="always download and rewrite everything")
+    parser.add_argument('--no-toc', action='store_true',
+                        help="do not use the table of contents for freshness checks (conditional GET only)")
+    parser.add_argument('--metadata-dir', default=metadata_dir, help="directory of the Eurostat metadata cache")
+    args = parser.parse_args(argv)
+
+    # === Load indicators ===
+    indicators = load_indicators(args.indicators)
+    print(f"Found {len(indicators)} indicators to load...")
 
-        # Checking the structure
-        print(f"  SUCCESS: Successfully loaded: {df.shape[0]} rows, {df.shape[1]} columns")
+    # === Download all selected codes concurrently ===
+    client = EurostatClient(args.base_url, max_per_host=args.per_host,
+                            retries=args.retries, backoff=args.backoff)
+    cache = None if args.no_cache else DownloadCache(args.cache_dir, int(args.cache_max_mb * 1024 ** 2))
+    metadata = EurostatMetadata(args.metadata_dir)
+    start = time.perf_counter()
+    succeeded, failed = collect_all(indicators, client, args.workers, args.output_dir,
+                                    cache, use_toc=not args.no_toc,
+                                    geos_override=parse_geos(args.geos) if args.geos else None,
+                                    streaming=args.streaming, metadata=metadata)
+    print_summary(succeeded, failed, time.perf_counter() - start)
+    if cache is not None:
+        print(f"  {cache.format_stats()}")
 
-        # Save filtered by geo dataset
-        output_path = os.path.join(data_dir, f"{code}_raw.csv")
-        df.to_csv(output_path, index=False)
-        print(f"  SUCCESS: Saved in: {output_path}")
+    print(f"\n=== Completed. All available indicators for selected geo are saved in {args.output_dir} ===")
 
-    except Exception as e:
-        print(f"  ERROR: Error loading {code}: {e}")
 
-print("\n=== Completed. All available indicators for selected geo are saved in ../data/raw/ ===")
\ No newline at end of file
+if __name__ == '__main__':
+    with telemetry.stage('collect'):
+        main()
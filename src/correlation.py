@@ -0,0 +1,315 @@
+"""
+===============================================================================
+ Module Name: correlation.py
+ Author: Igor Latii
+ Description:
+     Correlation engine of the EDA (`eda_visualization.py`). The statistics of
+     all indicators are computed once, over the union of the indicators of
+     all research questions, and every RQ reads its submatrix from the cache:
+
+        - pairwise-complete Pearson correlations (each pair uses the rows
+          where both indicators are present, as `DataFrame.corr()`), with the
+          number of observations of every pair;
+        - lagged cross-correlations corr(x[t], y[t + lag]) for a range of
+          lags;
+        - rolling-window correlations over time;
+        - bootstrap confidence intervals (percentile, rows resampled with
+          replacement).
+
+     Everything is computed with NumPy for all pairs at once: the sums of a
+     Pearson correlation (n, Σx, Σy, Σx², Σy², Σxy over the rows where both
+     values are present) are matrix products of the value and presence
+     masks, so no Python loop runs over indicators or pairs.
+
+     With `by` (e.g. 'geo' for a panel) the correlations are computed within
+     each group: values are centred on their group means, the co-moments of
+     all groups are pooled for the main matrix and also kept per group
+     (`by_group`). Lags and rolling windows never cross groups.
+
+     Zeros are treated as missing by default: in the annual dataset an empty
+     period summed with min_count 0 gives 0 (see resampling.py).
+
+ Dependencies:
+     - pandas, numpy
+===============================================================================
+"""
+
+import numpy as np
+import pandas as pd
+
+TOLERANCE = 1e-10  # Relative variance below which a series counts as constant
+MAX_CELLS = 2_000_000  # Float cells per intermediate array (bootstrap / rolling batches)
+
+
+# === Co-moments ===
+def comoments(x, y, weights):
+    """
+    Sums of a Pearson correlation between every column of `x` and every
+    column of `y` (rows x columns arrays with NaNs; `y` None: `x` with
+    itself), over the rows where both values are present, for every row of
+    `weights` (replicates x rows).
+    Returns n, Σx, Σy, Σx², Σy², Σxy, each of shape (replicates, kx, ky).
+    """
+    mx = ~np.isnan(x)
+    x0 = np.where(mx, x, 0)
+    if y is None: # Symmetric: the y sums are the transposed x sums
+        mx = mx.astype(x.dtype)
+        n, sx, sxx = np.split(np.concatenate([mx, x0, x0 * x0], axis=1).T @ (weights[:, :, None] * mx), 3, axis=1)
+        sxy = x0.T @ (weights[:, :, None] * x0)
+        return n, sx, sx.swapaxes(1, 2), sxx, sxx.swapaxes(1, 2), sxy
+    my = ~np.isnan(y)
+    y0 = np.where(my, y, 0)
+    wy = weights[:, :, None] * my                       # (B, rows, ky)
+    wv = weights[:, :, None] * y0
+    n, sx, sxx = np.split(np.concatenate([mx, x0, x0 * x0], axis=1).T @ wy, 3, axis=1)
+    sy = mx.T.astype(x.dtype) @ wv
+    syy = mx.T.astype(x.dtype) @ (wv * y0)
+    sxy = x0.T @ wv
+    return n, sx, sy, sxx, syy, sxy
+
+
+def centred(n, sx, sy, sxx, syy, sxy):
+    """Co-variance and variances (sums of centred products) from `comoments`."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x, mean_y = sx / n, sy / n
+    cov = np.where(n > 0, sxy - sx * mean_y, 0.0)
+    vx = np.where(n > 0, sxx - sx * mean_x, 0.0)
+    vy = np.where(n > 0, syy - sy * mean_y, 0.0)
+    return cov, vx, vy, sxx, syy
+
+
+def normalise(cov, vx, vy, sxx, syy, n, min_periods):
+    """Pearson correlations; NaN with fewer than `min_periods` pairs or a constant series."""
+    tolerance = max(TOLERANCE, 100 * np.finfo(cov.dtype).eps) # float32 replicates: larger rounding errors
+    constant = (vx <= tolerance * sxx) | (vy <= tolerance * syy)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = cov / np.sqrt(vx * vy)
+    return np.where((n >= min_periods) & ~constant, np.clip(corr, -1.0, 1.0), np.nan)
+
+
+def correlate(x, y=None, weights=None, groups=None, min_periods=2, per_group=True):
+    """
+    Pairwise-complete correlations between the columns of `x` and `y` (rows x
+    columns; `y` None: `x` with itself), pooled within `groups` (list of row
+    slices, default: all rows), for every row of `weights` (default: one
+    replicate of weight 1). Returns (corr, n, per-group corr or None), of
+    shapes (B, kx, ky) and (G, B, kx, ky).
+    """
+    weights = np.ones((1, len(x)), dtype=x.dtype) if weights is None else weights
+    groups = [slice(0, len(x))] if groups is None else groups
+    total, by_group = None, []
+    for rows in groups:
+        n, *sums = comoments(x[rows], None if y is None else y[rows], weights[:, rows])
+        cov, vx, vy, sxx, syy = centred(n, *sums)
+        if per_group:
+            by_group.append(normalise(cov, vx, vy, sxx, syy, n, min_periods))
+        parts = (cov, vx, vy, sxx, syy, n)
+        total = parts if total is None else tuple(a + b for a, b in zip(total, parts))
+    cov, vx, vy, sxx, syy, n = total
+    return normalise(cov, vx, vy, sxx, syy, n, min_periods), n, np.stack(by_group) if per_group else None
+
+
+def quantiles(replicates, probabilities):
+    """
+    Quantiles (linear interpolation, as np.quantile) along the first axis,
+    ignoring NaNs, for all cells at once; NaN where a cell has no value.
+    """
+    ordered = np.sort(replicates, axis=0) # NaNs last
+    valid = (~np.isnan(replicates)).sum(axis=0)
+    results = []
+    for p in probabilities:
+        position = p * np.maximum(valid - 1, 0)
+        below = np.floor(position).astype(int)
+        above = np.minimum(below + 1, np.maximum(valid - 1, 0))
+        low = np.take_along_axis(ordered, below[None], axis=0)[0]
+        high = np.take_along_axis(ordered, above[None], axis=0)[0]
+        results.append(np.where(valid > 0, low + (high - low) * (position - below), np.nan))
+    return results
+
+
+def upper_pairs(names):
+    """Long table (x, y) of the pairs of `names` above the diagonal, and their indices."""
+    i, j = np.triu_indices(len(names), 1)
+    return pd.DataFrame({'x': np.asarray(names, dtype=object)[i], 'y': np.asarray(names, dtype=object)[j]}), i, j
+
+
+# === Engine ===
+class CorrelationEngine:
+    """
+    Correlation statistics of `indicators` in `df`, computed once and served
+    per subset of indicators. `time` orders the rows (lags, rolling windows);
+    `by` groups them (panel data).
+    """
+
+    def __init__(self, df, indicators, by=None, time='Year', zeros_as_missing=True, min_periods=2):
+        self.indicators = list(dict.fromkeys(indicators))
+        self.by, self.time, self.min_periods = by, time, min_periods
+        self.position = {name: k for k, name in enumerate(self.indicators)}
+        self.cache = {}
+
+        # --- Complete (group, time) grid: every group has one row per period ---
+        values = df[([by] if by else []) + [time] + self.indicators]
+        if by:
+            values = values.assign(**{by: values[by].astype(str)})
+        keys = values.groupby(([by] if by else []) + [time], sort=True, observed=True).mean()
+        periods = keys.index.get_level_values(time).unique().sort_values()
+        if len(periods) and pd.api.types.is_integer_dtype(periods):
+            periods = pd.Index(np.arange(periods.min(), periods.max() + 1), name=time) # Years without data
+        self.groups = keys.index.get_level_values(by).unique().sort_values() if by else pd.Index([None])
+        grid = pd.MultiIndex.from_product([self.groups, periods], names=[by, time]) if by else periods
+        self.periods = periods
+        data = keys.reindex(grid).to_numpy(dtype='float64')
+        if zeros_as_missing:
+            data[data == 0] = np.nan
+        self.shape = (len(self.groups), len(periods))
+        cube = data.reshape(*self.shape, -1)
+        present = ~np.isnan(cube)
+        means = np.where(present, cube, 0.0).sum(axis=1, keepdims=True) / np.maximum(present.sum(axis=1, keepdims=True), 1)
+        self.values = (cube - means).reshape(data.shape) # Centred per group: fewer rounding errors
+        self.slices = [slice(g * len(periods), (g + 1) * len(periods)) for g in range(len(self.groups))]
+
+    def columns(self, names=None):
+        names = self.indicators if names is None else list(names)
+        return names, [self.position[name] for name in names]
+
+    # --- Contemporaneous correlations ---
+    def full(self):
+        if 'corr' not in self.cache:
+            corr, n, per_group = correlate(self.values, groups=self.slices, min_periods=self.min_periods)
+            self.cache['corr'] = (corr[0], n[0], per_group[:, 0])
+        return self.cache['corr']
+
+    def matrix(self, names=None):
+        """Correlation matrix of `names` (pooled within groups for panel data)."""
+        names, cols = self.columns(names)
+        return pd.DataFrame(self.full()[0][np.ix_(cols, cols)], index=names, columns=names)
+
+    def counts(self, names=None):
+        """Number of observations of every pair of `names`."""
+        names, cols = self.columns(names)
+        return pd.DataFrame(self.full()[1][np.ix_(cols, cols)].astype(int), index=names, columns=names)
+
+    def by_group(self, names=None):
+        """Per-group correlations of the pairs of `names`, as a long table (by, x, y, corr)."""
+        names, cols = self.columns(names)
+        pairs, i, j = upper_pairs(names)
+        cols = np.asarray(cols, dtype=int)
+        per_group = self.full()[2][:, cols[i], cols[j]]
+        table = pd.concat([pairs] * len(self.groups), ignore_index=True)
+        table.insert(0, self.by, np.repeat(self.groups.to_numpy(), len(pairs)))
+        table['corr'] = per_group.ravel()
+        return table
+
+    # --- Lagged cross-correlations ---
+    def shifted(self, lag):
+        """Values moved `lag` periods back within each group: row t holds period t + lag."""
+        cube = self.values.reshape(*self.shape, -1)
+        out = np.full_like(cube, np.nan)
+        if lag >= 0:
+            out[:, :self.shape[1] - lag] = cube[:, lag:]
+        else:
+            out[:, -lag:] = cube[:, :self.shape[1] + lag]
+        return out.reshape(self.values.shape)
+
+    def lagged(self, max_lag=3, names=None):
+        """
+        Cross-correlations corr(x[t], y[t + lag]) of every ordered pair of
+        `names` for lags -max_lag..max_lag; long table (lag, x, y, corr, n).
+        """
+        key = ('lagged', max_lag)
+        if key not in self.cache:
+            lags = range(-max_lag, max_lag + 1)
+            results = [correlate(self.values, self.shifted(lag), groups=self.slices, min_periods=self.min_periods,
+                                 per_group=False) for lag in lags]
+            self.cache[key] = (np.array(lags), np.stack([r[0][0] for r in results]), np.stack([r[1][0] for r in results]))
+        lags, corr, n = self.cache[key]
+        names, cols = self.columns(names)
+        k = len(names)
+        sub = np.ix_(range(len(lags)), cols, cols)
+        return pd.DataFrame({'lag': np.repeat(lags, k * k),
+                             'x': np.tile(np.repeat(names, k), len(lags)),
+                             'y': np.tile(names, k * len(lags)),
+                             'corr': corr[sub].ravel(),
+                             'n': n[sub].ravel().astype(int)})
+
+    # --- Rolling-window correlations ---
+    def rolling(self, window=10, names=None, pairs=None, min_periods=None):
+        """
+        Correlations of the `pairs` (default: all pairs of `names`) over the
+        `window` periods ending at every period, within each group. Returns a
+        wide table: one row per (by, time), one column per pair (x, y). A
+        window needs `min_periods` pairs of observations (default: `window`).
+        """
+        min_periods = window if min_periods is None else min_periods
+        if pairs is None:
+            table, _, _ = upper_pairs(self.columns(names)[0])
+            pairs = list(zip(table['x'], table['y']))
+        xi = np.array([self.position[x] for x, _ in pairs], dtype=int)
+        yi = np.array([self.position[y] for _, y in pairs], dtype=int)
+        n_groups, n_periods = self.shape
+        cube = self.values.reshape(n_groups, n_periods, -1)
+        end = np.arange(1, n_periods + 1)
+        start = np.clip(end - window, 0, None)
+
+        corr = np.empty((n_groups, n_periods, len(pairs)))
+        step = max(1, MAX_CELLS // max(1, n_groups * n_periods * 6))
+        for first in range(0, len(pairs), step): # Pairs in batches, all periods and groups at once
+            x, y = cube[:, :, xi[first:first + step]], cube[:, :, yi[first:first + step]]
+            both = ~np.isnan(x) & ~np.isnan(y)
+            x, y = np.where(both, x, 0.0), np.where(both, y, 0.0)
+            sums = []
+            for values in (both.astype('float64'), x, y, x * x, y * y, x * y):
+                cs = np.concatenate([np.zeros((n_groups, 1, values.shape[2])), values.cumsum(axis=1)], axis=1)
+                sums.append(cs[:, end] - cs[:, start])  # Window sums from cumulative sums
+            n, sx, sy, sxx, syy, sxy = sums
+            cov, vx, vy, sxx, syy = centred(n, sx, sy, sxx, syy, sxy)
+            corr[:, :, first:first + step] = normalise(cov, vx, vy, sxx, syy, n, max(min_periods, 2))
+
+        index = pd.MultiIndex.from_product([self.groups, self.periods], names=[self.by, self.time]) if self.by \
+            else self.periods
+        columns = pd.MultiIndex.from_tuples(pairs, names=['x', 'y'])
+        return pd.DataFrame(corr.reshape(n_groups * n_periods, len(pairs)), index=index, columns=columns)
+
+    # --- Bootstrap confidence intervals ---
+    def bootstrap(self, n_boot=1000, alpha=0.05, seed=0):
+        """
+        Percentile confidence intervals (1 - alpha) of all correlations, from
+        `n_boot` resamples of the rows with replacement (within each group).
+        Returns the (lower, upper) matrices of all indicators. Replicates are
+        computed and kept in float32, for the pairs above the diagonal only.
+        """
+        key = ('bootstrap', n_boot, alpha, seed)
+        if key not in self.cache:
+            rng = np.random.default_rng(seed)
+            n_groups, n_periods = self.shape
+            k = len(self.indicators)
+            upper = np.triu_indices(k, 1)
+            values = self.values.astype('float32')
+            batch = max(1, MAX_CELLS // max(1, k * k * 4))
+            replicates = np.empty((n_boot, len(upper[0])), dtype='float32')
+            for first in range(0, n_boot, batch):
+                size = min(batch, n_boot - first)
+                # Resample counts: how often each row is drawn, within its group
+                counts = rng.multinomial(n_periods, np.full(n_periods, 1.0 / n_periods), size=(size, n_groups))
+                weights = counts.reshape(size, n_groups * n_periods).astype('float32')
+                corr = correlate(values, None, weights, self.slices, self.min_periods, per_group=False)[0]
+                replicates[first:first + size] = corr[:, upper[0], upper[1]]
+            bounds = []
+            for bound in quantiles(replicates, [alpha / 2, 1 - alpha / 2]):
+                matrix = np.full((k, k), np.nan)
+                matrix[upper] = matrix[upper[::-1]] = bound
+                bounds.append(matrix)
+            self.cache[key] = tuple(bounds)
+        return self.cache[key]
+
+    def summary(self, names=None, n_boot=1000, alpha=0.05, seed=0):
+        """Long table (x, y, n, corr, ci_low, ci_high) of the pairs of `names`."""
+        names, cols = self.columns(names)
+        table, i, j = upper_pairs(names)
+        cols = np.asarray(cols, dtype=int)
+        corr, n, _ = self.full()
+        low, high = self.bootstrap(n_boot, alpha, seed)
+        table['n'] = n[cols[i], cols[j]].astype(int)
+        table['corr'] = corr[cols[i], cols[j]]
+        table['ci_low'], table['ci_high'] = low[cols[i], cols[j]], high[cols[i], cols[j]]
+        return table
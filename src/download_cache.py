@@ -0,0 +1,208 @@
+"""
+===============================================================================
+ Module Name: download_cache.py
+ Author: Igor Latii
+ Description:
+     Persistent on-disk cache for raw dataset downloads, keyed by dataset code.
+
+     For every cached dataset the cache keeps:
+        - the compressed payload as it came from the server (`{code}.gz`);
+        - freshness validators: the dataset's "last update of data" date from
+          the Eurostat table of contents, and the HTTP ETag / Last-Modified;
+        - the SHA-256 of the payload, to detect a re-download of identical data;
+        - the outputs written from the payload (path + parameters), so callers
+          can skip rewriting a CSV that would come out identical.
+
+     The index lives in `index.json` next to the payloads and is rewritten
+     atomically. When the total payload size exceeds `max_bytes`, the least
+     recently used entries are evicted.
+
+     Statistics (hits, misses, bytes saved, evictions) are collected per run
+     and can be printed with `format_stats()`.
+
+ Dependencies:
+     - json, hashlib, os, threading
+===============================================================================
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from storage import atomic_write
+
+
+class DownloadCache:
+    """Thread-safe on-disk cache of raw dataset payloads."""
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'unchanged': 0, 'bytes_saved': 0, 'evictions': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # A corrupt index only costs one full refresh
+            return {}
+
+    def _save_index(self):
+        def write(tmp):
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+        atomic_write(self.index_path, write)
+
+    def payload_path(self, code):
+        return os.path.join(self.cache_dir, f"{code}.gz")
+
+    # --- Lookups ---
+    def entry(self, code):
+        """Return the index entry of `code` if its payload is still on disk."""
+        with self._lock:
+            entry = self.index.get(code)
+        if entry is None or not os.path.exists(self.payload_path(code)):
+            return None
+        return entry
+
+    def is_fresh(self, code, last_update):
+        """True if the cached copy has the same Eurostat 'last update' date."""
+        entry = self.entry(code)
+        return entry is not None and last_update is not None and entry.get('last_update') == last_update
+
+    def conditional_headers(self, code):
+        """HTTP validators for a conditional GET of `code`."""
+        entry = self.entry(code) or {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def hit(self, code):
+        """Count a reuse of the cached payload of `code`."""
+        with self._lock:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += self.index[code].get('size', 0)
+            self.index[code]['last_access'] = time.time()
+            self._save_index()
+
+    def read(self, code):
+        """Return the cached payload and count it as a hit."""
+        with open(self.payload_path(code), 'rb') as f:
+            content = f.read()
+        self.hit(code)
+        return content
+
+    # --- Updates ---
+    def store(self, code, content, etag=None, last_modified=None, last_update=None):
+        """
+        Store a freshly downloaded payload. Returns True if its content differs
+        from the previously cached payload (or there was none).
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        return self._store(code, digest, len(content),
+                           lambda: atomic_write(self.payload_path(code), lambda tmp: _write_bytes(tmp, content)),
+                           etag, last_modified, last_update)
+
+    def store_file(self, code, path, etag=None, last_modified=None, last_update=None):
+        """
+        Like `store`, for a payload already downloaded to `path` (which is
+        moved into the cache, or removed if identical to the cached copy).
+        """
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 ** 2), b''):
+                sha.update(chunk)
+        changed = self._store(code, sha.hexdigest(), os.path.getsize(path),
+                              lambda: os.replace(path, self.payload_path(code)),
+                              etag, last_modified, last_update)
+        if os.path.exists(path):
+            os.remove(path)
+        return changed
+
+    def _store(self, code, digest, size, write_payload, etag, last_modified, last_update):
+        with self._lock:
+            previous = self.index.get(code, {})
+            changed = previous.get('sha256') != digest
+            self.stats['misses'] += 1
+            if not changed:
+                self.stats['unchanged'] += 1
+            if changed or not os.path.exists(self.payload_path(code)):
+                write_payload()
+            self.index[code] = {
+                'sha256': digest,
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'last_update': last_update,
+                'fetched_at': time.time(),
+                'last_access': time.time(),
+                # Outputs derived from an older payload are no longer valid
+                'outputs': previous.get('outputs', {}) if not changed else {},
+            }
+            self._evict()
+            self._save_index()
+        return changed
+
+    def touch(self, code, last_update=None):
+        """Record that `code` was revalidated (e.g. HTTP 304) without new content."""
+        with self._lock:
+            if code in self.index and last_update is not None:
+                self.index[code]['last_update'] = last_update
+                self._save_index()
+
+    # --- Derived outputs ---
+    @staticmethod
+    def _params_key(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def output_is_current(self, code, path, params):
+        """True if `path` was written from the cached payload with the same `params`."""
+        entry = self.entry(code)
+        if entry is None or not os.path.exists(path):
+            return False
+        return entry.get('outputs', {}).get(os.path.abspath(path)) == self._params_key(params)
+
+    def record_output(self, code, path, params):
+        with self._lock:
+            if code in self.index:
+                self.index[code].setdefault('outputs', {})[os.path.abspath(path)] = self._params_key(params)
+                self._save_index()
+
+    # --- Eviction ---
+    def total_bytes(self):
+        return sum(e.get('size', 0) for e in self.index.values())
+
+    def _evict(self):
+        # Least recently used first; called with the lock held
+        total = self.total_bytes()
+        for code in sorted(self.index, key=lambda c: self.index[c].get('last_access', 0)):
+            if total <= self.max_bytes:
+                break
+            total -= self.index[code].get('size', 0)
+            del self.index[code]
+            if os.path.exists(self.payload_path(code)):
+                os.remove(self.payload_path(code))
+            self.stats['evictions'] += 1
+
+    def format_stats(self):
+        s = self.stats
+        return (f"cache: {s['hits']} hits, {s['misses']} misses ({s['unchanged']} unchanged after download), "
+                f"{s['bytes_saved'] / 1024 ** 2:.1f} MB saved, {s['evictions']} evicted, "
+                f"{self.total_bytes() / 1024 ** 2:.1f} MB on disk")
+
+
+def _write_bytes(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
@@ -12,53 +12,107 @@
          • RQ3: Correlation between transport volumes and inflation.
 
  Workflow:
-     1. Load the annual dataset (merged_df_annual.csv).
+     1. Load the annual dataset (merged_df_annual, any storage format), with
+        the derived features stored next to it (merged_df_features: growth
+        rates, rolling means, lags, per-capita values, see feature_store.py).
      2. Filter observations from 1995 onwards to ensure consistent data coverage.
      3. For each Research Question (RQ):
          - Generate individual time series plots for all indicators.
          - Create scatter plots for selected variable pairs to visualize relationships.
          - Compute and visualize correlation matrices as heatmaps.
          - Produce combined plots for multi-indicator comparison (RQ1 only).
+         - Plot and correlate the derived features of the RQ (`features`)
+           as read from the feature store, next to the levels.
      4. Save all generated figures into dedicated subfolders under `/data/eda_plots/`.
 
+     The RQs of the study are `DEFAULT_RQS` below; a `/reports/rqs.json`
+     with the same layout replaces them (used for other datasets, e.g.
+     synthetic benchmark data).
+
+     Figures are described as specs (kind, file, labels and the slice of the
+     data they draw) and rendered in worker processes (`parallel.py`,
+     `PIPELINE_WORKERS`) on the non-interactive Agg backend. Each figure is
+     keyed by a hash of its spec, its data slice and the drawing code, kept
+     in `/data/eda_plots/.plot_cache.json`: figures whose key did not change
+     are not redrawn, and figures no longer produced are removed.
+
+     With `--grid` (or `PIPELINE_EDA_GRID=1`) the time series of each RQ are
+     drawn as one subplot grid (`timeseries_grid.png`) instead of one figure
+     per indicator.
+
+     Correlations come from one engine (correlation.py) over the union of
+     the indicators of all RQs; each RQ reads its submatrix. Besides the
+     heatmap every RQ folder gets:
+         - correlation_summary.csv     pairwise-complete correlation, number
+                                       of observations and bootstrap 95% CI;
+         - lagged_correlations.csv     corr(x[t], y[t + lag]), lags -3..3;
+         - rolling_correlations.csv    10-year rolling correlations of the
+                                       scatter pairs.
+
+     For a panel dataset (a `geo` column, see make_merged_df.py) the plots
+     show one line / colour per country, and the correlations are computed
+     within each country: the heatmap shows the pooled within-country
+     correlations, and the per-country values are saved as
+     `correlations_by_geo.csv`.
+
  Output:
      • Time series plots for each indicator.
      • Scatter plots for pairwise relationships.
      • Correlation heatmaps for grouped indicators.
      • Combined GDP–Exports–Transport visualization (for RQ1).
 
+     Runs on its own, or from `pipeline.py` when the annual dataset changed.
+
  Dependencies:
      - pandas
      - matplotlib
      - seaborn
-     - os
+     - argparse, hashlib, inspect, json, os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py, parallel.py,
+       correlation.py, feature_store.py, telemetry.py
 ===============================================================================
 """
 
+import argparse
+import hashlib
+import inspect
+import json
 import os
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from correlation import CorrelationEngine
+from feature_store import output_name as features_name
+from parallel import describe_failure, run_per_file
+from pipeline_paths import eda_dir, merged_dir, reports_dir
+from storage import atomic_open, atomic_write_csv, find_table, read_table
+import telemetry
+
+matplotlib.use('Agg') # Files only, safe in worker processes (no figure exists yet)
+
 # === PATH CONFIGURATION ===
 # Define paths for the input (merged dataset) and output (plots) directories.
-input_file = "../data/processed/merged/merged_df_annual.csv"
-output_dir = "../data/eda_plots"
-os.makedirs(output_dir, exist_ok=True)  # Create output directory if it doesn’t exist
+input_file = os.path.join(merged_dir, "merged_df_annual") # Table stem (see storage.py)
+output_dir = eda_dir
 
-# === DATA LOADING ===
-# Load the merged dataset that contains all relevant economic indicators.
-df = pd.read_csv(input_file)
+# Time series of each RQ as one subplot grid instead of one figure per indicator
+timeseries_grid = os.environ.get('PIPELINE_EDA_GRID', '').lower() in ('1', 'true', 'yes')
 
-# Filter data to include only observations from 1995 onward.
-# Earlier data may be sparse or inconsistent across indicators.
-df = df[df['Year'] >= 1995].copy()
+# === CORRELATION SETTINGS ===
+max_lag = 3            # Lagged correlations for lags -max_lag..max_lag (years)
+rolling_window = 10    # Years per rolling-window correlation
+n_boot = 1000          # Bootstrap resamples for the confidence intervals
 
 # === DEFINE RESEARCH QUESTIONS (RQs) AND ASSOCIATED INDICATORS ===
 # Each RQ focuses on a thematic relationship between several economic factors.
 # Indicators define which variables are analyzed for each question,
-# and scatter_pairs specify variable combinations for correlation plots.
-RQs = {
+# scatter_pairs specify variable combinations for correlation plots, and
+# features the derived series of the feature store (/reports/features.csv)
+# plotted and correlated with them. These are the RQs of the study, used
+# unless the reports directory has its own (see load_rqs below).
+DEFAULT_RQS = {
     "RQ1_GDP_Trade_Passengers": {
         # Investigates how GDP relates to trade and transport indicators.
         "indicators": ['GDP (Quarterly)', 'Exports (National Accounts)', 'Air Passenger Transport',
@@ -67,14 +121,19 @@ RQs = {
         "scatter_pairs": [('GDP (Quarterly)', 'Air Passenger Transport'),
                           ('GDP (Quarterly)', 'Road Passenger Transport'),
                           ('GDP (Quarterly)', 'Exports (National Accounts)')],
-        "combined": ['GDP (Quarterly)', 'Exports (National Accounts)', 'Air Passenger Transport']
+        "combined": ['GDP (Quarterly)', 'Exports (National Accounts)', 'Air Passenger Transport'],
+        "features": ['GDP (Quarterly) (YoY %)', 'Exports (National Accounts) (YoY %)',
+                     'Air Passenger Transport (YoY %)', 'Road Passenger Transport (YoY %)',
+                     'GDP (Quarterly) per capita']
     },
     "RQ2_Unemployment_Migration": {
         # Analyzes how unemployment correlates with migration trends and population changes.
         "indicators": ['Unemployment Rate', 'Net Migration (World Bank)', 'Emigration of Citizens',
                        'Population', 'Industrial Production Index', 'Retail Trade Turnover'],
         "scatter_pairs": [('Unemployment Rate', 'Emigration of Citizens'),
-                          ('Net Migration (World Bank)', 'Population')]
+                          ('Net Migration (World Bank)', 'Population')],
+        "features": ['Population (YoY %)', 'Emigration of Citizens per capita', 'Net Migration (World Bank) per capita',
+                     'Unemployment Rate (lag 1)', 'Unemployment Rate (3y mean)']
     },
     "RQ3_Transport_Inflation": {
         # Explores how transport activity correlates with inflation and production levels.
@@ -83,10 +142,27 @@ RQs = {
                        'Energy Prices'],
         "scatter_pairs": [('Inflation (HICP Manufacturing)', 'Freight Transport'),
                           ('Inflation (HICP Manufacturing)', 'Air Passenger Transport'),
-                          ('Inflation (HICP Manufacturing)', 'Road Passenger Transport')]
+                          ('Inflation (HICP Manufacturing)', 'Road Passenger Transport')],
+        "features": ['Inflation (HICP Manufacturing) (YoY %)', 'Freight Transport (YoY %)',
+                     'Energy Prices (YoY %)', 'Industrial Production Index (YoY %)']
     }
 }
 
+# A reports directory may define its own RQs in the same layout (rqs.json, e.g.
+# the synthetic data of benchmarks/synthetic_data.py); they replace DEFAULT_RQS.
+rqs_path = os.path.join(reports_dir, 'rqs.json')
+
+
+def load_rqs(path=rqs_path, default=DEFAULT_RQS):
+    """Research questions from `path` if it exists, else `default`."""
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+RQs = load_rqs() # The RQs analysed in this run
+
 # === VISUAL STYLE SETTINGS ===
 # Apply a consistent theme and font size for all plots for readability and publication-quality visuals.
 sns.set_theme(style="whitegrid", palette="Set2")
@@ -98,81 +174,302 @@ plt.rcParams.update({
     "legend.fontsize": 10
 })
 
-# === FUNCTION: GENERATE EDA PLOTS FOR EACH RESEARCH QUESTION ===
-def generate_eda_plots(df, rq_name, indicators, scatter_pairs, combined=None):
+
+# === PLOT SPECIFICATIONS ===
+# Every figure is described by a picklable spec: its kind, output file, labels
+# and the slice of the data it draws. Specs are rendered in worker processes.
+def plot_specs(df, rq_name, indicators, scatter_pairs, combined=None, output_dir=output_dir, grid=False,
+               engine=None, features=None):
     """
-    Generates exploratory data analysis (EDA) plots for a specific Research Question (RQ).
-    Creates:
-      - Time series plots for each indicator
+    Specs of the figures of one Research Question (RQ):
+      - Time series plots for each indicator (or one subplot grid with `grid`)
+      - Combined multi-indicator plot (for RQ1)
       - Scatter plots for selected variable pairs
       - Correlation heatmap across all indicators
-      - Combined multi-indicator plot (for RQ1)
-    Saves all figures to the respective output folder.
+    The derived `features` found in `df` (see load_dataset) are plotted and
+    correlated with the indicators. The correlation tables are saved here,
+    from `engine` (a CorrelationEngine over at least these columns; default:
+    one built for this RQ).
     """
+    indicators = list(indicators) + rq_features(df, rq_name, features)
     rq_dir = os.path.join(output_dir, rq_name)
     os.makedirs(rq_dir, exist_ok=True)
+    hue = 'geo' if 'geo' in df.columns else None # Panel data: one line / colour per country
+    keys = ['Year'] + ([hue] if hue else [])
+    specs = []
 
     # === TIME SERIES PLOTS ===
-    # For each indicator, create a line plot showing its trend over time.
-    for ind in indicators:
-        plt.figure(figsize=(12, 4))
-        sns.lineplot(data=df, x='Year', y=ind, linewidth=2)
-        plt.title(f'Time Series of {ind}')
-        plt.xlabel('Year')
-        plt.ylabel(ind)
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(rq_dir, f'timeseries_{ind}.png'))
-        plt.close()
+    if grid:
+        specs.append({'kind': 'grid', 'path': os.path.join(rq_dir, 'timeseries_grid.png'),
+                      'title': f'Time Series of {rq_name}', 'columns': list(indicators), 'hue': hue,
+                      'data': df[keys + list(indicators)]})
+    else:
+        for ind in indicators:
+            specs.append({'kind': 'timeseries', 'path': os.path.join(rq_dir, f'timeseries_{ind}.png'),
+                          'title': f'Time Series of {ind}', 'y': ind, 'hue': hue, 'data': df[keys + [ind]]})
 
     # === COMBINED TIME SERIES (RQ1 ONLY) ===
-    # Overlay multiple indicators to compare their evolution on the same plot.
     if combined:
-        plt.figure(figsize=(12, 6))
-        for ind in combined:
-            sns.lineplot(data=df, x='Year', y=ind, label=ind, linewidth=2)
-        plt.title("Combined Time Series: GDP, Exports and Air Passenger Transport")
-        plt.xlabel('Year')
-        plt.ylabel('Value')
-        plt.legend(title="Indicators")
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(rq_dir, "combined_timeseries_GDP_Exports_Transport.png"))
-        plt.close()
+        specs.append({'kind': 'combined', 'path': os.path.join(rq_dir, "combined_timeseries_GDP_Exports_Transport.png"),
+                      'title': "Combined Time Series: GDP, Exports and Air Passenger Transport",
+                      'columns': list(combined), 'data': df[['Year'] + list(combined)]})
 
     # === SCATTER PLOTS ===
-    # Scatter plots help visualize pairwise relationships between two variables.
     for x, y in scatter_pairs:
         if x in df.columns and y in df.columns:
-            plt.figure(figsize=(6, 4))
-            sns.scatterplot(data=df, x=x, y=y, s=60, alpha=0.8, edgecolor="w")
-            plt.title(f'Scatter Plot: {y} vs {x}')
-            plt.xlabel(x)
-            plt.ylabel(y)
-            plt.grid(True, alpha=0.3)
-            plt.tight_layout()
-            plt.savefig(os.path.join(rq_dir, f'scatter_{y}_vs_{x}.png'))
-            plt.close()
+            specs.append({'kind': 'scatter', 'path': os.path.join(rq_dir, f'scatter_{y}_vs_{x}.png'),
+                          'title': f'Scatter Plot: {y} vs {x}', 'x': x, 'y': y, 'hue': hue,
+                          'data': df[list(dict.fromkeys([x, y] + ([hue] if hue else [])))]})
 
     # === CORRELATION HEATMAP ===
-    # Compute and visualize correlations between all indicators.
     # Values close to +1 indicate a strong positive correlation,
     # values near -1 indicate an inverse relationship.
-    corr_data = df[indicators].replace(0, pd.NA).dropna()
-    if corr_data.empty:
+    engine = engine or CorrelationEngine(df, indicators, by=hue)
+    corr = engine.matrix(indicators)
+    if corr.isna().all().all():
         print(f"⚠️ Warning: No non-zero data for correlation heatmap in {rq_name}")
     else:
-        plt.figure(figsize=(10, 8))
-        corr = corr_data.corr()
-        sns.heatmap(corr, annot=True, fmt=".2f", cmap="coolwarm", cbar=True, square=True)
-        plt.title(f'Correlation Heatmap of {rq_name}')
-        plt.tight_layout()
-        plt.savefig(os.path.join(rq_dir, 'correlation_heatmap.png'))
-        plt.close()
-
-# === MAIN EXECUTION LOOP ===
-# Iterate over all defined research questions and generate their respective EDA outputs.
-for rq_name, rq_info in RQs.items():
-    generate_eda_plots(df, rq_name, rq_info['indicators'], rq_info['scatter_pairs'], rq_info.get('combined'))
-
-print(f"SUCCESS: EDA plots for all RQs saved in {output_dir}")
\ No newline at end of file
+        if hue:
+            # Panel data: correlations within each country, pooled for the heatmap
+            atomic_write_csv(engine.by_group(indicators), os.path.join(rq_dir, 'correlations_by_geo.csv'))
+        specs.append({'kind': 'heatmap', 'path': os.path.join(rq_dir, 'correlation_heatmap.png'),
+                      'title': f'Correlation Heatmap of {rq_name}' + (' (within countries)' if hue else ''),
+                      'data': corr})
+
+    # === CORRELATION TABLES ===
+    # Confidence intervals, lead / lag relationships and their stability over time.
+    atomic_write_csv(engine.summary(indicators, n_boot), os.path.join(rq_dir, 'correlation_summary.csv'))
+    atomic_write_csv(engine.lagged(max_lag, indicators), os.path.join(rq_dir, 'lagged_correlations.csv'))
+    pairs = [(x, y) for x, y in scatter_pairs if x in indicators and y in indicators]
+    if pairs:
+        rolling = engine.rolling(rolling_window, pairs=pairs)
+        rolling.columns = [f"{y} vs {x}" for x, y in rolling.columns]
+        atomic_write_csv(rolling.dropna(how='all'), os.path.join(rq_dir, 'rolling_correlations.csv'), index=True)
+    return specs
+
+
+def rq_features(df, rq_name, features):
+    """The derived features of an RQ present in `df`; the missing ones are reported."""
+    features = list(features or [])
+    missing = [f for f in features if f not in df.columns]
+    if missing:
+        print(f"⚠️ Warning: {len(missing)} feature(s) of {rq_name} not in the feature store "
+              f"(see /reports/features.csv): {missing}")
+    return [f for f in features if f in df.columns]
+
+
+# === RENDERING (one figure per call, Agg backend) ===
+def draw_timeseries(spec):
+    fig, ax = plt.subplots(figsize=(12, 4))
+    sns.lineplot(data=spec['data'], x='Year', y=spec['y'], hue=spec['hue'], linewidth=2, ax=ax)
+    ax.set_title(spec['title'])
+    ax.set_xlabel('Year')
+    ax.set_ylabel(spec['y'])
+    ax.grid(True, alpha=0.3)
+    return fig
+
+
+def draw_grid(spec):
+    columns, hue = spec['columns'], spec['hue']
+    nrows = (len(columns) + 1) // 2
+    fig, axes = plt.subplots(nrows, 2, figsize=(14, 3 * nrows), sharex=True, squeeze=False, layout='constrained')
+    for i, (ax, ind) in enumerate(zip(axes.flat, columns)):
+        sns.lineplot(data=spec['data'], x='Year', y=ind, hue=hue, linewidth=2, ax=ax, legend=bool(hue) and i == 0)
+        ax.set_title(ind)
+        ax.set_xlabel('Year' if i >= len(columns) - 2 else '') # Bottom plot of each column
+        ax.set_ylabel('')
+        ax.grid(True, alpha=0.3)
+    if len(columns) % 2:
+        axes[-1, 1].set_visible(False) # Odd number of indicators: the plot above keeps its year labels
+        if nrows > 1:
+            axes[-2, 1].xaxis.set_tick_params(labelbottom=True)
+            axes[-2, 1].xaxis.label.set_visible(True)
+    if hue:
+        # One country legend for the whole grid, outside the plots
+        handles, labels = axes[0, 0].get_legend_handles_labels()
+        axes[0, 0].get_legend().remove()
+        fig.legend(handles, labels, title=hue, loc='outside right upper', ncols=1 + len(labels) // (8 * nrows))
+    fig.suptitle(spec['title'])
+    return fig
+
+
+def draw_combined(spec):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    for ind in spec['columns']:
+        sns.lineplot(data=spec['data'], x='Year', y=ind, label=ind, linewidth=2, ax=ax)
+    ax.set_title(spec['title'])
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Value')
+    ax.legend(title="Indicators")
+    ax.grid(True, alpha=0.3)
+    return fig
+
+
+def draw_scatter(spec):
+    fig, ax = plt.subplots(figsize=(6, 4))
+    sns.scatterplot(data=spec['data'], x=spec['x'], y=spec['y'], hue=spec['hue'], s=60, alpha=0.8,
+                    edgecolor="w", ax=ax)
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel(spec['y'])
+    ax.grid(True, alpha=0.3)
+    return fig
+
+
+def draw_heatmap(spec):
+    fig, ax = plt.subplots(figsize=(10, 8))
+    sns.heatmap(spec['data'], annot=True, fmt=".2f", cmap="coolwarm", cbar=True, square=True, ax=ax)
+    ax.set_title(spec['title'])
+    return fig
+
+
+DRAW = {'timeseries': draw_timeseries, 'grid': draw_grid, 'combined': draw_combined,
+        'scatter': draw_scatter, 'heatmap': draw_heatmap}
+
+
+def render_plot(spec):
+    """Draw one figure and save it to spec['path'] (run in a worker process)."""
+    fig = DRAW[spec['kind']](spec)
+    try:
+        if fig.get_layout_engine() is None: # The grid lays itself out (constrained)
+            fig.tight_layout()
+        fig.savefig(spec['path'])
+    finally:
+        plt.close(fig)
+    telemetry.record_output(paths=spec['path'])
+    return spec['path']
+
+
+# === FIGURE CACHE ===
+# A figure is keyed by its spec, the bytes of its data slice and the drawing
+# code; figures whose key is unchanged (and whose file exists) are not redrawn.
+cache_name = '.plot_cache.json'
+DRAW_CODE = hashlib.sha1(''.join(inspect.getsource(f) for f in (*DRAW.values(), render_plot)).encode()).hexdigest()
+
+
+def figure_key(spec):
+    data = spec['data']
+    h = hashlib.sha1(DRAW_CODE.encode())
+    h.update(json.dumps({k: v for k, v in spec.items() if k not in ('data', 'path')}, sort_keys=True).encode())
+    h.update(json.dumps([list(map(str, data.columns)), list(map(str, data.dtypes))]).encode())
+    h.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def load_cache(output_dir):
+    try:
+        with open(os.path.join(output_dir, cache_name), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(cache, output_dir):
+    with atomic_open(os.path.join(output_dir, cache_name), encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def render_plots(specs, output_dir=output_dir, workers=None, force=False):
+    """
+    Render the specs whose figure changed since the last run, in `workers`
+    processes; figures of the previous run that are no longer produced are
+    removed. Returns the number of failed figures.
+    """
+    cache = {} if force else load_cache(output_dir)
+    keys = {os.path.relpath(s['path'], output_dir): figure_key(s) for s in specs}
+    todo = [s for s in specs
+            if cache.get(os.path.relpath(s['path'], output_dir)) != keys[os.path.relpath(s['path'], output_dir)]
+            or not os.path.exists(s['path'])]
+
+    results = run_per_file(render_plot, todo, workers) if todo else []
+    failed = {os.path.relpath(r['item']['path'], output_dir) for r in results if r['error']}
+    for r in results:
+        if r['error']:
+            print(describe_failure(r), end='')
+
+    # --- Stale figures (indicator, pair or layout no longer plotted) ---
+    for name in set(cache) - set(keys):
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    save_cache({name: key for name, key in keys.items() if name not in failed}, output_dir)
+    print(f"EDA: {len(todo) - len(failed)} figure(s) rendered, {len(specs) - len(todo)} unchanged, "
+          f"{len(failed)} failed")
+    return len(failed)
+
+
+def generate_eda_plots(df, rq_name, indicators, scatter_pairs, combined=None, output_dir=output_dir,
+                       grid=False, workers=None, features=None):
+    """
+    Generates exploratory data analysis (EDA) plots for a specific Research Question (RQ).
+    Saves all figures to the respective output folder (see plot_specs).
+    """
+    specs = plot_specs(df, rq_name, indicators, scatter_pairs, combined, output_dir, grid, features=features)
+    return render_plots(specs, os.path.join(output_dir, rq_name), workers)
+
+
+def features_stem(input_file=input_file):
+    """Feature store of an annual dataset: `merged_df_features` in the same directory (see feature_store.py)."""
+    return os.path.join(os.path.dirname(input_file), features_name)
+
+
+def load_dataset(input_file=input_file):
+    """
+    The annual dataset with its derived features joined on (geo,) Year, as
+    stored by feature_store.py (the levels alone if no features are stored).
+    """
+    df = read_table(input_file)
+    if find_table(features_stem(input_file)) is None:
+        return df
+    features = read_table(features_stem(input_file))
+    keys = [c for c in ('geo', 'Year') if c in df.columns]
+    features = features.drop(columns=[c for c in features.columns if c in df.columns and c not in keys])
+    return df.merge(features, on=keys, how='left', validate='one_to_one')
+
+
+def run_eda(input_file=input_file, output_dir=output_dir, grid=None, workers=None, force=False):
+    """Generate the plots of all research questions from the annual dataset and its features."""
+    os.makedirs(output_dir, exist_ok=True)  # Create output directory if it doesn’t exist
+    grid = timeseries_grid if grid is None else grid
+
+    # === DATA LOADING ===
+    # Load the merged dataset that contains all relevant economic indicators,
+    # and the features precomputed from it (growth rates, per-capita values, lags).
+    df = load_dataset(input_file)
+
+    # Filter data to include only observations from 1995 onward.
+    # Earlier data may be sparse or inconsistent across indicators.
+    df = df[df['Year'] >= 1995].copy()
+
+    # === MAIN EXECUTION LOOP ===
+    # Collect the figures of all research questions, then render the changed
+    # ones in one pool.
+    # All correlations are computed once, over the indicators of all RQs.
+    indicators = [ind for rq_info in RQs.values()
+                  for ind in rq_info['indicators'] + [f for f in rq_info.get('features', []) if f in df.columns]]
+    engine = CorrelationEngine(df, indicators, by='geo' if 'geo' in df.columns else None)
+    specs = []
+    for rq_name, rq_info in RQs.items():
+        specs += plot_specs(df, rq_name, rq_info['indicators'], rq_info['scatter_pairs'], rq_info.get('combined'),
+                            output_dir, grid, engine, rq_info.get('features'))
+    failed = render_plots(specs, output_dir, workers, force)
+    if failed:
+        raise RuntimeError(f"{failed} EDA figure(s) failed")
+
+    print(f"SUCCESS: EDA plots for all RQs saved in {output_dir}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the EDA plots of the annual dataset.")
+    parser.add_argument('--grid', action='store_true', default=timeseries_grid,
+                        help="one subplot grid of time series per RQ (default: PIPELINE_EDA_GRID)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: PIPELINE_WORKERS or CPUs)")
+    parser.add_argument('--force', action='store_true', help="redraw all figures")
+    args = parser.parse_args(argv)
+    run_eda(input_file, output_dir, args.grid, args.workers, args.force)
+
+
+if __name__ == '__main__':
+    with telemetry.stage('eda'):
+        main()
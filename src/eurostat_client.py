@@ -0,0 +1,382 @@
+"""
+===============================================================================
+ Module Name: eurostat_client.py
+ Author: Igor Latii
+ Description:
+     Thin HTTP client for the Eurostat SDMX 2.1 dissemination API, used by
+     `collecting_data.py` in place of `eurostat.get_data_df`.
+
+     Compared to the `eurostat` package it:
+        - talks to a configurable base URL, so the collector can be run against
+          a local stand-in HTTP server (see /benchmarks/bench_collecting.py);
+        - limits the number of in-flight requests per host, so several worker
+          threads can share one client without flooding Eurostat;
+        - retries transient failures (connection errors, timeouts, HTTP 429 and
+          5xx) with exponential backoff and jitter, honouring `Retry-After`.
+
+     Dimension filters (see `indicator_config.py`) are sent to Eurostat as an
+     SDMX query key built from the dataset's data structure, so only the
+     selected series are downloaded.
+
+     When a `DownloadCache` is passed, downloads are skipped for datasets whose
+     "last update of data" date in the Eurostat table of contents is unchanged,
+     and conditional requests (ETag / Last-Modified) are used otherwise.
+
+     The downloaded TSV is parsed into the same wide DataFrame layout returned by
+     `eurostat.get_data_df` (dimension columns, `geo\\TIME_PERIOD`, one column
+     per period, flags dropped), so the downstream scripts are unaffected.
+
+ Dependencies:
+     - requests
+     - pandas
+===============================================================================
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+
+# === Default endpoints ===
+EUROSTAT_BASE_URL = "https://ec.europa.eu/eurostat/api/dissemination/sdmx/2.1/"
+
+# HTTP status codes worth retrying (rate limiting and transient server errors)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Raised when a dataset cannot be downloaded after all retries."""
+
+
+class HostLimiter:
+    """
+    Limits concurrent requests per host.
+
+    Each host gets its own semaphore with `max_per_host` slots; optionally a
+    minimum interval (seconds) is enforced between two request starts on the
+    same host.
+    """
+
+    def __init__(self, max_per_host=4, min_interval=0.0):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._last_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _wait_interval(self, host):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._last_start.get(host, 0.0) + self.min_interval)
+            self._last_start[host] = start
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of the host's concurrency slots for the duration of the block."""
+        host = urlsplit(url).netloc
+        with self._semaphore(host):
+            self._wait_interval(host)
+            yield
+
+    def request(self, session, url, **kwargs):
+        """Perform `session.get(url)` inside the host's concurrency slot."""
+        with self.slot(url):
+            return session.get(url, **kwargs)
+
+
+class EurostatClient:
+    """
+    Downloads Eurostat datasets as wide DataFrames.
+
+    A single client is thread-safe and meant to be shared by all workers of a
+    collection run, so that the per-host limit applies to the run as a whole.
+    """
+
+    def __init__(self, base_url=EUROSTAT_BASE_URL, max_per_host=4, min_interval=0.0,
+                 retries=4, backoff=1.0, max_backoff=30.0, timeout=120):
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.limiter = HostLimiter(max_per_host, min_interval)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._dimension_orders = {}
+
+    # --- One requests.Session per thread (Session is not thread-safe) ---
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def data_url(self, code, key=None):
+        path = f"{code}/{key}" if key else code
+        return f"{self.base_url}data/{path}?format=TSV&compressed=true"
+
+    def structure_url(self, code):
+        return f"{self.base_url}datastructure/ESTAT/{code}"
+
+    def toc_url(self):
+        return self.base_url.replace('sdmx/2.1/', 'catalogue/') + "toc/txt?lang=en"
+
+    def codelist_url(self, codelist):
+        return f"{self.base_url}codelist/ESTAT/{codelist}"
+
+    def _sleep_before_retry(self, attempt, resp=None):
+        # Honour Retry-After (seconds) when the server sends it, else exponential backoff with jitter
+        delay = None
+        if resp is not None and resp.headers.get('Retry-After', '').isdigit():
+            delay = float(resp.headers['Retry-After'])
+        if delay is None:
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+        time.sleep(min(delay, self.max_backoff))
+
+    def get(self, url, headers=None, stream_to=None):
+        """
+        GET `url` with retries; returns the successful (or 304) response.
+        With `stream_to`, a 200 body is written to that path in chunks while the
+        host slot is held, instead of being loaded into memory.
+        """
+        last_error = None
+        for attempt in range(self.retries + 1):
+            resp = None
+            try:
+                with self.limiter.slot(url):
+                    resp = self.session.get(url, headers=headers, timeout=self.timeout,
+                                            stream=stream_to is not None)
+                    if resp.status_code not in RETRY_STATUS:
+                        resp.raise_for_status()
+                        if stream_to is not None and resp.status_code == 200:
+                            with open(stream_to, 'wb') as f:
+                                for chunk in resp.iter_content(chunk_size=1024 ** 2):
+                                    f.write(chunk)
+                        return resp
+                last_error = DownloadError(f"HTTP {resp.status_code} for {url}")
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                last_error = e
+            except requests.HTTPError as e:
+                # 4xx other than 429: the dataset does not exist or the query is wrong
+                raise DownloadError(str(e)) from e
+            if attempt < self.retries:
+                self._sleep_before_retry(attempt, resp)
+        raise DownloadError(f"Giving up on {url} after {self.retries + 1} attempts: {last_error}")
+
+    def _async_data_url(self, content):
+        # Large extractions are answered with an XML status message holding a key;
+        # poll the asynchronous API until the file is available and return its URL.
+        root = ET.fromstring(content)
+        fields = {el.tag.rsplit('}', 1)[-1]: el.text for el in root.iter()}
+        key = fields.get('Key')
+        if key is None:
+            raise DownloadError("Unexpected XML response without an async key")
+        async_url = self.base_url.replace('sdmx/2.1/', '1.0/async/')
+        status = fields.get('Status')
+        attempt = 0
+        while status != 'AVAILABLE':
+            if status in ('EXPIRED', 'UNKNOWN_REQUEST'):
+                raise DownloadError(f"Async request {key} failed with status {status}")
+            self._sleep_before_retry(min(attempt, 4))
+            attempt += 1
+            status_root = ET.fromstring(self.get(f"{async_url}status/{key}").content)
+            status = {el.tag.rsplit('}', 1)[-1]: el.text for el in status_root.iter()}.get('Status')
+        return f"{async_url}data/{key}"
+
+    def get_structure(self, code):
+        """
+        Dimensions of a dataset in query-key order, as (dimension id, code list
+        id) pairs from its data structure (code list None when not given).
+        """
+        root = ET.fromstring(self.get(self.structure_url(code)).content)
+        dims = []
+        for el in root.iter():
+            if el.tag.rsplit('}', 1)[-1] != 'Dimension':
+                continue
+            refs = [ref.get('id') for enum in el.iter() if enum.tag.rsplit('}', 1)[-1] == 'Enumeration'
+                    for ref in enum if ref.tag.rsplit('}', 1)[-1] == 'Ref']
+            dims.append((int(el.get('position', 0)), el.get('id'), refs[0] if refs else None))
+        return [(dim, codelist) for _, dim, codelist in sorted(dims)]
+
+    def get_dimension_order(self, code):
+        """Dimension ids of a dataset in query-key order (from its data structure)."""
+        if code not in self._dimension_orders:
+            self._dimension_orders[code] = [dim for dim, _ in self.get_structure(code)]
+        return self._dimension_orders[code]
+
+    def query_key(self, code, filters):
+        """
+        SDMX query key for `filters`, e.g. 'Q.CP_MEUR.SCA.B1GQ.LV+EE' (empty
+        positions mean "all codes"). Returns None when there is nothing to filter
+        or the data structure is unavailable; the caller then downloads the
+        whole table and filters it locally.
+        """
+        if not filters:
+            return None
+        try:
+            order = self.get_dimension_order(code)
+        except (DownloadError, ET.ParseError) as e:
+            print(f"  WARNING: {code}: data structure unavailable, downloading the full table ({e})")
+            return None
+        unknown = set(filters) - set(order) - {'geo'}
+        if unknown:
+            raise ValueError(f"{code}: unknown dimension(s) {', '.join(sorted(unknown))} (available: {order})")
+        key = '.'.join('+'.join(filters.get(dim, [])) for dim in order)
+        return key if key.strip('.') else None
+
+    def fetch_payload(self, code, cache=None, last_update=None, filters=None):
+        """
+        Return the gzip-compressed TSV of a dataset, using `cache` if given.
+        `filters` ({dimension: [codes]}) are sent to Eurostat as a query key.
+        Returns a (payload, changed) pair; `changed` is False when the cached
+        copy was reused or the download was identical to it.
+        """
+        key = cache_key(code, filters)
+        if cache is not None and cache.is_fresh(key, last_update):
+            return cache.read(key), False
+
+        headers = cache.conditional_headers(key) if cache is not None else None
+        resp = self.get(self.data_url(code, self.query_key(code, filters)), headers=headers)
+        if resp.status_code == 304 and cache is not None:
+            cache.touch(key, last_update)
+            return cache.read(key), False
+
+        content = resp.content
+        etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        if content.lstrip()[:1] == b'<':
+            content = self.get(self._async_data_url(content)).content
+            etag = last_modified = None  # validators belong to the status message
+        if cache is None:
+            return content, True
+        return content, cache.store(key, content, etag, last_modified, last_update)
+
+    def fetch_payload_file(self, code, dest_dir, cache=None, last_update=None, filters=None):
+        """
+        Streaming variant of `fetch_payload`: the payload is written to disk in
+        chunks and never held in memory. Returns a (path, changed) pair; the
+        path is the cached payload when a cache is used, else a file in `dest_dir`.
+        """
+        key = cache_key(code, filters)
+        if cache is not None and cache.is_fresh(key, last_update):
+            cache.hit(key)
+            return cache.payload_path(key), False
+
+        if cache is not None:
+            dest_dir = cache.cache_dir  # same filesystem, so the payload can be moved into the cache
+        os.makedirs(dest_dir, exist_ok=True)
+        tmp_path = os.path.join(dest_dir, f".{key}.{threading.get_ident()}.gz.part")
+        headers = cache.conditional_headers(key) if cache is not None else None
+        resp = self.get(self.data_url(code, self.query_key(code, filters)), headers=headers, stream_to=tmp_path)
+        if resp.status_code == 304 and cache is not None:
+            cache.touch(key, last_update)
+            cache.hit(key)
+            return cache.payload_path(key), False
+
+        etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        with open(tmp_path, 'rb') as f:
+            is_status_message = f.read(64).lstrip()[:1] == b'<'
+        if is_status_message:
+            with open(tmp_path, 'rb') as f:
+                data_url = self._async_data_url(f.read())
+            self.get(data_url, stream_to=tmp_path)
+            etag = last_modified = None
+        if cache is None:
+            return tmp_path, True
+        return cache.payload_path(key), cache.store_file(key, tmp_path, etag, last_modified, last_update)
+
+    def fetch_tsv(self, code):
+        """Download the gzip-compressed TSV of a dataset; returns the decoded text."""
+        return gzip.decompress(self.fetch_payload(code)[0]).decode('utf-8')
+
+    def get_data_df(self, code):
+        """Download a dataset and return it in the `eurostat.get_data_df` layout."""
+        return parse_tsv(self.fetch_tsv(code))
+
+    def get_last_updates(self):
+        """
+        Download the Eurostat table of contents and return a dict mapping each
+        dataset code to its "last update of data" date.
+        """
+        toc = parse_toc(self.get(self.toc_url()).content.decode('utf-8-sig'))
+        toc = toc[toc['last_update'] != '']
+        return dict(zip(toc['code'], toc['last_update']))
+
+
+def cache_key(code, filters=None):
+    """Cache key of a (dataset, query filters) pair: the code itself when unfiltered."""
+    if not filters:
+        return code
+    spec = json.dumps({dim: sorted(codes) for dim, codes in filters.items()}, sort_keys=True)
+    return f"{code}-{hashlib.sha1(spec.encode('utf-8')).hexdigest()[:10]}"
+
+
+def parse_toc(text):
+    """
+    Parse the Eurostat table of contents (tab-separated text) into a DataFrame
+    with one row per entry: code, title, type (folder / dataset / table),
+    last_update ("last update of data"), structure_change ("last table
+    structure change"), data_start, data_end; missing cells are ''.
+    """
+    columns = {'code': 'code', 'title': 'title', 'type': 'type', 'last update of data': 'last_update',
+               'last table structure change': 'structure_change', 'data start': 'data_start',
+               'data end': 'data_end'}
+    lines = text.splitlines()
+    if not lines:
+        return pd.DataFrame(columns=list(columns.values()))
+    header = [h.strip().strip('"') for h in lines[0].split('\t')]
+    positions = {name: header.index(source) for source, name in columns.items() if source in header}
+    rows = []
+    for line in lines[1:]:
+        cells = [c.strip().strip('"').strip() for c in line.split('\t')]
+        if len(cells) > positions['code'] and cells[positions['code']]:
+            rows.append([cells[i] if i < len(cells) else '' for i in positions.values()])
+    toc = pd.DataFrame(rows, columns=list(positions))
+    return toc.reindex(columns=list(columns.values()), fill_value='')
+
+
+def parse_value(cell):
+    # Cells look like '123.4 ', '12.3 p' or ': c' -> keep the number, drop the flag
+    token = cell.strip().split(' ')[0]
+    if token in (':', '0n', 'n', ''):
+        return None
+    try:
+        return float(token)
+    except ValueError:
+        return cell
+
+
+def parse_tsv(text):
+    """Parse an Eurostat TSV export into a wide DataFrame (flags dropped)."""
+    lines = text.splitlines()
+    if not lines:
+        return pd.DataFrame()
+    header = lines[0].split('\t')
+    dims = header[0].split(',')
+    columns = [c.strip() for c in dims + header[1:]]
+
+    rows = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        cells = line.split('\t')
+        rows.append(cells[0].split(',') + [parse_value(c) for c in cells[1:]])
+    return pd.DataFrame(rows, columns=columns) if rows else pd.DataFrame(columns=columns)
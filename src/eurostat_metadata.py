@@ -0,0 +1,391 @@
+"""
+===============================================================================
+ Module Name: eurostat_metadata.py
+ Author: Igor Latii
+ Description:
+     Local cache of Eurostat metadata: the table of contents (title, type and
+     update dates of every dataset) and the dimension dictionaries (code lists
+     such as UNIT, S_ADJ, NA_ITEM or GEO) of the datasets of the study. It is
+     downloaded once into `/data/cache/metadata/` and then answers all lookups
+     offline, from an in-memory index built when it is first used:
+
+        - title(code), last_update(code), last_updates()
+        - dimensions(code)            dimension ids and their code lists
+        - code_label(dim, code)       'unit', 'CP_MEUR' -> 'Current prices, million euro'
+        - describe(code, filters)     readable dimension selection of a dataset
+        - search(query)               datasets whose code or title contain all
+                                      the words (or word prefixes) of the query
+
+     Storage (storage.py: Parquet by default, text columns categorical):
+        - toc          one row per entry of the table of contents;
+        - structures   (dataset, position, dimension, codelist);
+        - codes        (codelist, code, label);
+        - index.json   validators of the table of contents (ETag,
+                       Last-Modified, SHA-256 and the date of its latest data
+                       update), the "last table structure change" date of
+                       every cached structure and the fetch time of every
+                       code list.
+
+     `refresh(client, codes)` downloads only what changed at the source:
+        - the table of contents with a conditional request (HTTP 304 when
+          unchanged); a download identical to the cached one is not rewritten;
+        - the data structure of a dataset when it is not cached yet or its
+          "last table structure change" date in the table of contents moved;
+        - a code list when it is not cached yet or a structure using it was
+          downloaded again.
+     `collecting_data.py` refreshes the cache for the datasets of
+     indicators.csv and takes the "last update of data" dates from it.
+
+ Usage:
+     python eurostat_metadata.py refresh [--base-url URL] [--force]
+     python eurostat_metadata.py search unemployment monthly
+     python eurostat_metadata.py describe namq_10_gdp
+     python eurostat_metadata.py label unit CP_MEUR
+
+ Dependencies:
+     - pandas, numpy
+     - argparse, bisect, hashlib, json, os, re, time, xml.etree.ElementTree
+     - storage.py, pipeline_paths.py, eurostat_client.py (refresh only),
+       indicator_config.py (command line)
+===============================================================================
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from pipeline_paths import metadata_dir
+from storage import atomic_write, compact_dtypes, find_table, read_table, write_table
+
+COLUMNS = {'toc': ['code', 'title', 'type', 'last_update', 'structure_change', 'data_start', 'data_end'],
+           'structures': ['dataset', 'position', 'dimension', 'codelist'],
+           'codes': ['codelist', 'code', 'label']}
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+def local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def parse_codelists(content, lang='en'):
+    """(codelist, code, label) rows of an SDMX-ML structure message with code lists."""
+    rows = []
+    for codelist in ET.fromstring(content).iter():
+        if local_name(codelist) != 'Codelist':
+            continue
+        for code in codelist:
+            if local_name(code) != 'Code':
+                continue
+            names = {n.get(XML_LANG, lang): (n.text or '').strip() for n in code if local_name(n) == 'Name'}
+            rows.append((codelist.get('id'), code.get('id'), names.get(lang, next(iter(names.values()), ''))))
+    return rows
+
+
+def words(text):
+    return re.findall(r'[a-z0-9]+', str(text).lower())
+
+
+class EurostatMetadata:
+    """Cached Eurostat table of contents and code lists, with an in-memory index for lookups and search."""
+
+    def __init__(self, directory=metadata_dir):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.state = self._load_state()
+        self._index = None   # built on first lookup
+        self._search = None  # built on first search
+
+    # --- Stored tables ---
+    def _load_state(self):
+        if not os.path.exists(self.index_path):
+            return {'toc': {}, 'structures': {}, 'codelists': {}}
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # A corrupt index only costs one full refresh
+            return {'toc': {}, 'structures': {}, 'codelists': {}}
+
+    def _save_state(self):
+        def write(tmp):
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=1, sort_keys=True)
+        atomic_write(self.index_path, write)
+
+    def table(self, name):
+        """One of the stored tables (toc, structures, codes); empty if not cached yet."""
+        stem = os.path.join(self.directory, name)
+        if find_table(stem) is None:
+            return pd.DataFrame(columns=COLUMNS[name])
+        return read_table(stem)
+
+    def _write(self, name, df):
+        write_table(compact_dtypes(df[COLUMNS[name]].reset_index(drop=True)), os.path.join(self.directory, name),
+                    export_csv=False)
+
+    def available(self):
+        return find_table(os.path.join(self.directory, 'toc')) is not None
+
+    # --- In-memory index ---
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    def _build_index(self):
+        toc = self.table('toc').astype(str)
+        structures = self.table('structures')
+        codes = self.table('codes').astype(str)
+        index = {'toc': toc, 'title': dict(zip(toc['code'], toc['title'])),
+                 'last_update': dict(zip(toc['code'], toc['last_update'])),
+                 'dimensions': {}, 'labels': {}, 'codelist_of': {}}
+        for dataset, rows in structures.groupby('dataset', sort=False, observed=True):
+            rows = rows.sort_values('position')
+            index['dimensions'][str(dataset)] = list(zip(rows['dimension'].astype(str),
+                                                         rows['codelist'].astype(str)))
+            for dim, codelist in index['dimensions'][str(dataset)]:
+                index['codelist_of'].setdefault(dim.lower(), codelist)
+        for codelist, rows in codes.groupby('codelist', sort=False):
+            index['labels'][codelist] = dict(zip(rows['code'], rows['label']))
+        return index
+
+    # --- Lookups ---
+    def title(self, code):
+        """Title of a dataset in the table of contents, or None."""
+        return self.index['title'].get(code) or None
+
+    def last_update(self, code):
+        """'last update of data' date of a dataset, or None."""
+        return self.index['last_update'].get(code) or None
+
+    def last_updates(self):
+        """{dataset code: 'last update of data'} for all datasets of the table of contents."""
+        return {code: date for code, date in self.index['last_update'].items() if date}
+
+    def dimensions(self, code):
+        """Dimensions of a cached dataset structure as (dimension, codelist) pairs, [] if not cached."""
+        return self.index['dimensions'].get(code, [])
+
+    def codelist(self, dimension, dataset=None):
+        """Code list of a dimension (of `dataset`, else as used by any cached structure; by default its id upper-cased)."""
+        for dim, codelist in self.dimensions(dataset) if dataset else []:
+            if dim.lower() == dimension.lower():
+                return codelist
+        return self.index['codelist_of'].get(dimension.lower(), dimension.upper())
+
+    def code_label(self, dimension, code, dataset=None):
+        """Label of a dimension code ('unit', 'CP_MEUR' -> 'Current prices, million euro'), or None."""
+        return self.index['labels'].get(self.codelist(dimension, dataset), {}).get(code)
+
+    def unknown_codes(self, dataset, filters):
+        """Codes of `filters` ({dimension: [codes]}) missing from cached code lists, as {dimension: [codes]}."""
+        unknown = {}
+        for dim, codes in filters.items():
+            labels = self.index['labels'].get(self.codelist(dim, dataset))
+            if labels is not None:
+                missing = [c for c in codes if c not in labels]
+                if missing:
+                    unknown[dim] = missing
+        return unknown
+
+    def describe(self, dataset, filters=None):
+        """Readable dataset and dimension selection, e.g. 'GDP ... | unit: Current prices, million euro'."""
+        parts = [self.title(dataset) or dataset]
+        for dim, codes in (filters or {}).items():
+            labels = [self.code_label(dim, c, dataset) or c for c in codes]
+            parts.append(f"{dim}: {' + '.join(labels)}")
+        return ' | '.join(parts)
+
+    # --- Search ---
+    def _build_search(self):
+        toc = self.index['toc']
+        postings = {}
+        for row, text in enumerate(toc['code'] + ' ' + toc['title']):
+            for word in set(words(text)):
+                postings.setdefault(word, []).append(row)
+        return {'postings': postings, 'vocabulary': sorted(postings),
+                'codes': toc['code'].str.lower().to_numpy(), 'types': toc['type'].to_numpy(),
+                'lengths': toc['title'].str.len().to_numpy()}
+
+    def _rows_with_prefix(self, prefix):
+        vocabulary, postings = self._search['vocabulary'], self._search['postings']
+        rows = set()
+        for i in range(bisect.bisect_left(vocabulary, prefix), len(vocabulary)):
+            if not vocabulary[i].startswith(prefix):
+                break
+            rows.update(postings[vocabulary[i]])
+        return rows
+
+    def search(self, query, limit=20, types=('dataset', 'table')):
+        """
+        Entries of the table of contents whose code or title contain every word
+        of `query` (as a word prefix), datasets and tables only by default; an
+        exact code match comes first, then the shortest titles.
+        """
+        if self._search is None:
+            self._search = self._build_search()
+        rows = None
+        for word in words(query):
+            found = self._rows_with_prefix(word)
+            rows = found if rows is None else rows & found
+        rows = np.fromiter(rows or (), dtype=np.int64)
+        if types:
+            rows = rows[np.isin(self._search['types'][rows], list(types))]
+        exact = self._search['codes'][rows] == query.strip().lower()
+        rows = rows[np.lexsort((rows, self._search['lengths'][rows], ~exact))]
+        return self.index['toc'].iloc[rows[:limit]].reset_index(drop=True)
+
+    # --- Refresh ---
+    def _refresh_toc(self, client, force=False):
+        """Download the table of contents if it changed; returns 'updated', 'unchanged' or 'not modified'."""
+        from eurostat_client import parse_toc
+        cached = self.state.get('toc', {})
+        headers = {}
+        if not force and self.available():
+            headers = {k: v for k, v in (('If-None-Match', cached.get('etag')),
+                                         ('If-Modified-Since', cached.get('last_modified'))) if v}
+        resp = client.get(client.toc_url(), headers=headers or None)
+        if resp.status_code == 304:
+            return 'not modified'
+        digest = hashlib.sha256(resp.content).hexdigest()
+        status = 'unchanged'
+        if force or digest != cached.get('sha256') or not self.available():
+            toc = parse_toc(resp.content.decode('utf-8-sig')).drop_duplicates('code') # datasets sit in several folders
+            self._write('toc', toc)
+            status = 'updated'
+            cached = {'last_update': max((d for d in toc['last_update'] if d), default=None, key=toc_date)}
+        self.state['toc'] = {**cached, 'sha256': digest, 'etag': resp.headers.get('ETag'),
+                             'last_modified': resp.headers.get('Last-Modified'), 'fetched_at': time.time()}
+        return status
+
+    def refresh(self, client, codes=(), force=False):
+        """
+        Bring the cache up to date for the datasets `codes` (see the module
+        description); returns counts of what was downloaded. Datasets whose
+        structure cannot be downloaded are reported and skipped.
+        """
+        from eurostat_client import DownloadError
+        stats = {'toc': self._refresh_toc(client, force), 'structures': 0, 'codelists': 0}
+        self._index = self._search = None
+        changes = dict(zip(self.index['toc']['code'], self.index['toc']['structure_change']))
+
+        # --- Structures whose date moved ---
+        structures = self.table('structures')
+        fetched, changed_lists = [], set()
+        for code in dict.fromkeys(codes):
+            if code not in changes:
+                continue  # not an Eurostat dataset (World Bank code) or withdrawn
+            if not force and code in self.index['dimensions'] and self.state['structures'].get(code) == changes[code]:
+                continue
+            try:
+                dims = client.get_structure(code)
+            except (DownloadError, ET.ParseError) as e:
+                print(f"  WARNING: {code}: data structure unavailable ({e})")
+                continue
+            fetched.append(pd.DataFrame([(code, i + 1, dim, codelist or dim.upper()) for i, (dim, codelist)
+                                         in enumerate(dims)], columns=COLUMNS['structures']))
+            self.state['structures'][code] = changes[code]
+            changed_lists |= {codelist or dim.upper() for dim, codelist in dims}
+        if fetched:
+            kept = structures[~structures['dataset'].astype(str).isin([f['dataset'].iat[0] for f in fetched if len(f)])]
+            structures = pd.concat([kept.astype({'dataset': str, 'dimension': str, 'codelist': str})] + fetched,
+                                   ignore_index=True)
+            self._write('structures', structures)
+            stats['structures'] = len(fetched)
+
+        # --- Code lists that are new or used by a new structure ---
+        codes_table = self.table('codes')
+        cached_lists = set(codes_table['codelist'].astype(str))
+        needed = sorted(set(structures['codelist'].astype(str)))
+        todo = [c for c in needed if force or c in changed_lists or c not in cached_lists]
+        rows = []
+        for codelist in todo:
+            try:
+                rows += parse_codelists(client.get(client.codelist_url(codelist)).content)
+            except (DownloadError, ET.ParseError) as e:
+                print(f"  WARNING: code list {codelist} unavailable ({e})")
+                continue
+            self.state['codelists'][codelist] = time.time()
+            stats['codelists'] += 1
+        if stats['codelists']:
+            refreshed = pd.DataFrame(rows, columns=COLUMNS['codes'])
+            kept = codes_table[~codes_table['codelist'].astype(str).isin(set(refreshed['codelist']) | set(todo))]
+            self._write('codes', pd.concat([kept.astype(str), refreshed], ignore_index=True))
+
+        self._save_state()
+        self._index = self._search = None
+        return stats
+
+    def format_stats(self, stats):
+        return (f"metadata: table of contents {stats['toc']}, {stats['structures']} structure(s) and "
+                f"{stats['codelists']} code list(s) downloaded, {len(self.index['toc'])} entries cached")
+
+
+def toc_date(text):
+    """Sort key of a table of contents date ('15/10/2025 11:00' or ISO 'YYYY-MM-DD...')."""
+    match = re.match(r'(\d{2})[./](\d{2})[./](\d{4})(.*)', text)
+    return f"{match.group(3)}-{match.group(2)}-{match.group(1)}{match.group(4)}" if match else text
+
+
+# === Shared instances ===
+_instances = {}
+
+
+def load_metadata(directory=metadata_dir):
+    """The metadata cache of `directory`, loaded once per process (empty if it was never refreshed)."""
+    if directory not in _instances:
+        _instances[directory] = EurostatMetadata(directory)
+    return _instances[directory]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cached Eurostat metadata: refresh, search and label lookups.")
+    parser.add_argument('--dir', default=metadata_dir, help="metadata cache directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    refresh = commands.add_parser('refresh', help="update the cache for the datasets of indicators.csv")
+    refresh.add_argument('--base-url', help="Eurostat SDMX 2.1 API base URL")
+    refresh.add_argument('--force', action='store_true', help="download everything again")
+    search = commands.add_parser('search', help="find datasets by code or title words")
+    search.add_argument('words', nargs='+')
+    search.add_argument('--limit', type=int, default=20)
+    describe = commands.add_parser('describe', help="title, update dates and dimensions of a dataset")
+    describe.add_argument('code')
+    label = commands.add_parser('label', help="label of a dimension code")
+    label.add_argument('dimension')
+    label.add_argument('code')
+    args = parser.parse_args(argv)
+
+    metadata = EurostatMetadata(args.dir)
+    if args.command == 'refresh':
+        from eurostat_client import EUROSTAT_BASE_URL, EurostatClient
+        from indicator_config import load_indicators
+        codes = [str(c).strip() for c in load_indicators()['code']]
+        stats = metadata.refresh(EurostatClient(args.base_url or EUROSTAT_BASE_URL), codes, args.force)
+        print(metadata.format_stats(stats))
+    elif args.command == 'search':
+        start = time.perf_counter()
+        found = metadata.search(' '.join(args.words), args.limit)
+        for _, row in found.iterrows():
+            print(f"{row['code']:<24} {row['last_update']:<18} {row['title']}")
+        print(f"({len(found)} shown, {(time.perf_counter() - start) * 1000:.1f} ms)")
+    elif args.command == 'describe':
+        print(f"{args.code}: {metadata.title(args.code) or '(not in the cached table of contents)'}")
+        print(f"  last update of data: {metadata.last_update(args.code) or '-'}")
+        for dim, codelist in metadata.dimensions(args.code):
+            labels = metadata.index['labels'].get(codelist, {})
+            print(f"  {dim:<12} {codelist:<12} {len(labels)} codes")
+    else:
+        print(metadata.code_label(args.dimension, args.code) or f"{args.code} (not in the cached code lists)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+===============================================================================
+ Module Name: eurostat_stream.py
+ Author: Igor Latii
+ Description:
+     Streaming reader for Eurostat bulk TSV.gz files.
+
+     `parse_tsv` (see `eurostat_client.py`) builds a DataFrame of the whole
+     table - all geos and all dimension combinations - before anything is
+     filtered out. For large tables such as `sts_inpr_m` or `tour_occ_nim` that
+     is far more than what is kept.
+
+     This module instead decompresses the file line by line, checks the geo and
+     the other dimension codes of each row as soon as the row key is read, and
+     writes matching rows straight to the per-geo output CSVs. Values of
+     non-matching rows are never parsed. Peak memory is one line plus the
+     output buffers, whatever the size of the source table.
+
+     The CSVs written here are identical to those produced by the DataFrame
+     path (`parse_tsv` + geo filter + `to_csv`).
+
+ Dependencies:
+     - csv, gzip
+===============================================================================
+"""
+
+import csv
+import gzip
+import os
+from contextlib import ExitStack
+
+from eurostat_client import parse_value
+from storage import atomic_open
+
+
+def read_header(line):
+    """Split the TSV header into (dimension names, period labels)."""
+    cells = line.rstrip('\r\n').split('\t')
+    dims = [d.strip() for d in cells[0].split(',')]
+    periods = [c.strip() for c in cells[1:]]
+    return dims, periods
+
+
+def geo_index(dims):
+    """Position of the geo dimension (named `geo` or `geo\\TIME_PERIOD`), or None."""
+    for i, dim in enumerate(dims):
+        if dim.split('\\')[0] == 'geo':
+            return i
+    return None
+
+
+def format_value(cell):
+    # Same text pandas writes for the value returned by `parse_value`
+    value = parse_value(cell)
+    if value is None:
+        return ''
+    return repr(value) if isinstance(value, float) else value
+
+
+def stream_filter(source, outputs, filters=None):
+    """
+    Stream the gzip-compressed Eurostat TSV at `source` into per-geo CSVs.
+
+    `outputs` maps each requested geo to its output path; `filters` optionally
+    maps dimension names to allowed codes (e.g. {'unit': {'CP_MEUR'}}).
+    Tables without a geo dimension are written whole to every output.
+    Returns a dict with the number of rows read and written per geo.
+    """
+    filters = filters or {}
+    counts = {'rows_read': 0, **{geo: 0 for geo in outputs}}
+
+    with gzip.open(source, 'rt', encoding='utf-8', newline='') as f, ExitStack() as stack:
+        dims, periods = read_header(f.readline())
+        unknown = set(filters) - {d.split('\\')[0] for d in dims}
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) in filter: {', '.join(sorted(unknown))} (available: {dims})")
+        dim_filters = [(i, set(filters[d.split('\\')[0]])) for i, d in enumerate(dims)
+                       if d.split('\\')[0] in filters]
+        geo_idx = geo_index(dims)
+
+        writers = {}
+        for geo, path in outputs.items():
+            out = stack.enter_context(atomic_open(path, 'w', encoding='utf-8', newline=''))
+            writers[geo] = csv.writer(out, lineterminator=os.linesep)
+            writers[geo].writerow(dims + periods)
+
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            counts['rows_read'] += 1
+            key, _, rest = line.partition('\t')
+            keys = key.split(',')
+
+            # Decide on the row key alone; values of skipped rows are never parsed
+            if geo_idx is None:
+                targets = list(writers)
+            elif keys[geo_idx] in writers:
+                targets = [keys[geo_idx]]
+            else:
+                continue
+            if any(keys[i] not in allowed for i, allowed in dim_filters):
+                continue
+
+            row = keys + [format_value(c) for c in rest.split('\t')]
+            for geo in targets:
+                writers[geo].writerow(row)
+                counts[geo] += 1
+    return counts
@@ -0,0 +1,313 @@
+"""
+===============================================================================
+ Script Name: feature_store.py
+ Author: Igor Latii
+ Description:
+     This script builds the derived features of the annual dataset
+     (`merged_df_annual`) once, for all indicators and countries, and stores
+     them for the EDA (eda_visualization.py), instead of recomputing growth
+     rates or per-capita values wherever they are needed.
+
+     The features are configured in `/reports/features.csv`, one row per
+     feature kind:
+
+        - feature     growth       growth over `periods` years, in percent of
+                                   the earlier value ((x[t] - x[t-n]) / |x[t-n]|);
+                      rolling_mean mean of the last `periods` years (all of
+                                   them present);
+                      lag          value `periods` years earlier;
+                      per_capita   value divided by the `base` indicator
+                                   (default `Population`);
+        - indicators  indicator names separated by ';', or `*` for all
+                      indicators of the annual dataset (except the base of
+                      per_capita);
+        - periods     years of growth / rolling_mean / lag (default 1);
+        - base        denominator of per_capita.
+
+     Columns are named after the indicator: 'GDP (Quarterly) (YoY %)',
+     'GDP (Quarterly) (3y growth %)', 'GDP (Quarterly) (3y mean)',
+     'GDP (Quarterly) (lag 1)', 'GDP (Quarterly) per capita' (per_capita
+     with another base: 'GDP (Quarterly) per Households').
+
+     All features are computed at once with NumPy on a (geo, year, indicator)
+     cube with one row per calendar year, so lags and growth rates never
+     cross countries and a missing year is a gap, not the previous row.
+     Zeros of the annual dataset are treated as missing (an empty period
+     summed with min_count 0 gives 0, see resampling.py).
+
+     In delta mode (`pipeline.py --delta`), and when run on its own, only the
+     rows of the features that depend on a new, revised or removed annual
+     row (the same year and the `periods` years after it) are computed
+     again; the others come from the stored feature table. The annual levels
+     the features were computed from are kept for this (`*_levels`). A new
+     feature configuration or other indicators rebuild the table in full.
+
+ Output:
+     /data/processed/merged/merged_df_features.parquet (+ .csv with PIPELINE_EXPORT_CSV):
+         (geo,) Year and the feature columns, one row per annual row
+     /data/processed/merged/merged_df_features_levels (annual levels used, for delta updates)
+
+     Runs on its own, or from `pipeline.py` when the annual dataset or the
+     feature configuration changed.
+
+ Dependencies:
+     - pandas, numpy
+     - argparse, os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py,
+       telemetry.py
+===============================================================================
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline_paths import merged_dir, reports_dir
+from storage import find_table, read_table, write_table
+import telemetry
+
+# === PATH CONFIGURATION ===
+features_path = os.path.join(reports_dir, 'features.csv')
+input_file = os.path.join(merged_dir, 'merged_df_annual')    # Annual dataset stem (see storage.py)
+output_name = 'merged_df_features'
+
+FEATURES = ['growth', 'rolling_mean', 'lag', 'per_capita']
+
+
+def output_stem(output_dir=merged_dir):
+    return os.path.join(output_dir, output_name)
+
+
+def levels_stem(output_dir=merged_dir):
+    """Annual levels the stored features were computed from, kept for delta updates."""
+    return output_stem(output_dir) + '_levels'
+
+
+# === Configuration ===
+def load_features(path=features_path):
+    """Feature rules in file order; raises ValueError on invalid rules."""
+    specs = pd.read_csv(path, skipinitialspace=True, dtype=str)
+    specs = specs.loc[:, ~specs.columns.str.startswith('Unnamed')]
+    specs = specs.reindex(columns=['feature', 'indicators', 'periods', 'base'])
+    specs['feature'] = specs['feature'].fillna('').str.strip().str.lower()
+    specs['indicators'] = specs['indicators'].fillna('*').str.strip()
+    specs['periods'] = pd.to_numeric(specs['periods']).fillna(1).astype(int)
+    specs['base'] = specs['base'].fillna('Population').str.strip()
+
+    invalid = specs.loc[~specs['feature'].isin(FEATURES)]
+    if not invalid.empty:
+        raise ValueError(f"Unknown feature '{invalid.iloc[0]['feature']}' (expected one of {', '.join(FEATURES)})")
+    if (specs['periods'] < 1).any():
+        raise ValueError(f"Invalid periods {specs['periods'].min()} (expected 1 or more)")
+    return specs
+
+
+def feature_name(indicator, feature, periods=1, base='Population'):
+    """Column name of one feature of `indicator`."""
+    if feature == 'growth':
+        return f"{indicator} (YoY %)" if periods == 1 else f"{indicator} ({periods}y growth %)"
+    if feature == 'rolling_mean':
+        return f"{indicator} ({periods}y mean)"
+    if feature == 'lag':
+        return f"{indicator} (lag {periods})"
+    return f"{indicator} per capita" if base == 'Population' else f"{indicator} per {base}"
+
+
+def lookback(feature, periods):
+    """Earlier years a feature value depends on."""
+    return {'growth': periods, 'rolling_mean': periods - 1, 'lag': periods}.get(feature, 0)
+
+
+def plan(specs, indicators):
+    """
+    The features of `specs` over the annual `indicators`, as a list of
+    (feature, periods, base, [indicators], [column names]); raises KeyError
+    if an indicator (or base) is not in the annual dataset, ValueError if a
+    column would be configured twice.
+    """
+    groups = []
+    for _, spec in specs.iterrows():
+        if spec['indicators'] == '*':
+            names = [c for c in indicators if not (spec['feature'] == 'per_capita' and c == spec['base'])]
+        else:
+            names = [n.strip() for n in spec['indicators'].split(';') if n.strip()]
+        needed = names + ([spec['base']] if spec['feature'] == 'per_capita' else [])
+        missing = [n for n in needed if n not in indicators]
+        if missing:
+            raise KeyError(f"Indicators not found in the annual dataset: {missing}")
+        columns = [feature_name(n, spec['feature'], spec['periods'], spec['base']) for n in names]
+        groups.append((spec['feature'], spec['periods'], spec['base'], names, columns))
+    columns = pd.Index([c for *_, cols in groups for c in cols])
+    if columns.duplicated().any():
+        raise ValueError(f"Features configured twice: {list(columns[columns.duplicated()].unique())}")
+    return groups
+
+
+# === Computation ===
+def shifted(cube, n):
+    """Values `n` years earlier along the year axis (NaN before the first year)."""
+    out = np.full_like(cube, np.nan)
+    out[:, n:] = cube[:, :cube.shape[1] - n]
+    return out
+
+
+def compute(cube, position, groups):
+    """
+    Feature cube (geo, year, feature column) of the level cube `cube` (geo,
+    year, indicator; `position`: indicator -> index), for the planned groups.
+    """
+    out = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for feature, periods, base, names, _ in groups:
+            x = cube[:, :, [position[n] for n in names]]
+            if feature == 'growth':
+                earlier = shifted(x, periods)
+                values = (x - earlier) / np.abs(earlier) * 100.0
+            elif feature == 'rolling_mean':
+                total = x.copy()
+                for k in range(1, periods): # Same order for every row: a delta update gives the same sums
+                    total += shifted(x, k)
+                values = total / periods
+            elif feature == 'lag':
+                values = shifted(x, periods)
+            else:
+                values = x / cube[:, :, [position[base]]]
+            out.append(values)
+    result = np.concatenate(out, axis=2) if out else np.empty(cube.shape[:2] + (0,))
+    result[~np.isfinite(result)] = np.nan # Divisions by a missing or zero value
+    return result
+
+
+def level_cube(annual, by, indicators, years):
+    """Levels of `indicators` on the complete (geo, year) grid of `years`, zeros as missing."""
+    keys = by + ['Year']
+    groups = pd.Index(annual[by[0]].astype(str).unique()).sort_values() if by else pd.Index([None])
+    grid = pd.MultiIndex.from_product([groups, years], names=keys) if by else pd.Index(years, name='Year')
+    levels = annual.assign(**{c: annual[c].astype(str) for c in by}).set_index(keys)[indicators]
+    cube = levels.reindex(grid).to_numpy(dtype='float64').reshape(len(groups), len(years), len(indicators))
+    cube[cube == 0] = np.nan
+    return cube, grid
+
+
+def feature_rows(annual, groups, rows=None):
+    """
+    Features of the annual rows `rows` (a boolean mask, default all), as a
+    DataFrame with the key columns of `annual` and the feature columns.
+    """
+    by = ['geo'] if 'geo' in annual.columns else []
+    rows = np.ones(len(annual), dtype=bool) if rows is None else np.asarray(rows)
+    columns = [c for *_, cols in groups for c in cols]
+    selected = annual.loc[rows, by + ['Year']].reset_index(drop=True)
+    if not rows.any():
+        return selected.assign(**dict.fromkeys(columns, np.nan))
+
+    # Years of the selected rows and the years their features look back on
+    depth = max((lookback(f, p) for f, p, *_ in groups), default=0)
+    first, last = int(selected['Year'].min()), int(selected['Year'].max())
+    years = np.arange(first - depth, last + 1)
+    indicators = list(dict.fromkeys(n for feature, _, base, names, _ in groups
+                                    for n in names + ([base] if feature == 'per_capita' else [])))
+    needed = annual[annual['Year'].between(first - depth, last)]
+    cube, grid = level_cube(needed, by, indicators, years)
+    values = compute(cube, {n: k for k, n in enumerate(indicators)}, groups)
+
+    flat = pd.DataFrame(values.reshape(-1, len(columns)), index=grid, columns=columns)
+    keys = selected.assign(**{c: selected[c].astype(str) for c in by}).set_index(by + ['Year']).index
+    return pd.concat([selected, flat.reindex(keys).reset_index(drop=True)], axis=1)
+
+
+# === Full build and delta update ===
+def indicator_columns(annual):
+    return [c for c in annual.columns if c not in ('geo', 'Year')]
+
+
+def save(features, levels, output_dir=merged_dir):
+    write_table(levels, levels_stem(output_dir))
+    output = write_table(features, output_stem(output_dir))
+    print(f"SUCCESS: Created {os.path.basename(output)} ({features.shape[0]} rows, {features.shape[1]} columns)")
+    return output
+
+
+def build(input_file=input_file, output_dir=merged_dir, specs=None):
+    """Compute all features of the annual dataset; returns the written path."""
+    specs = load_features() if specs is None else specs
+    annual = read_table(input_file)
+    groups = plan(specs, indicator_columns(annual))
+    return save(feature_rows(annual, groups), annual, output_dir)
+
+
+def changed_rows(annual, stored, by):
+    """
+    (geo, Year) keys of the annual rows that are new, revised or removed
+    compared with the stored levels, as a DataFrame.
+    """
+    keys = by + ['Year']
+    old = stored.assign(**{c: stored[c].astype(str) for c in by}).set_index(keys)
+    new = annual.assign(**{c: annual[c].astype(str) for c in by}).set_index(keys)
+    joined = new.join(old, how='outer', lsuffix='_new', rsuffix='_old')
+    columns = indicator_columns(annual)
+    a = joined[[f"{c}_new" for c in columns]].to_numpy(dtype='float64')
+    b = joined[[f"{c}_old" for c in columns]].to_numpy(dtype='float64')
+    differ = ((a != b) & ~(np.isnan(a) & np.isnan(b))).any(axis=1)
+    differ |= ~joined.index.isin(new.index) | ~joined.index.isin(old.index) # added or removed rows
+    return joined.index[differ].to_frame(index=False)
+
+
+def update(input_file=input_file, output_dir=merged_dir, specs=None):
+    """
+    Delta update after the annual dataset changed: only the feature rows
+    depending on a new, revised or removed annual row (that year and the
+    years whose features look back on it) are computed again; the other
+    rows come from the stored feature table. Returns the [geo, Year] keys of
+    the changed annual rows (geo None without a panel), or None if the
+    features have to be built in full (nothing stored, other indicators or
+    another configuration).
+    """
+    specs = load_features() if specs is None else specs
+    if find_table(output_stem(output_dir)) is None or find_table(levels_stem(output_dir)) is None:
+        return None
+    annual = read_table(input_file)
+    stored_levels, stored = read_table(levels_stem(output_dir)), read_table(output_stem(output_dir))
+    groups = plan(specs, indicator_columns(annual))
+    by = ['geo'] if 'geo' in annual.columns else []
+    columns = [c for *_, cols in groups for c in cols]
+    if (indicator_columns(stored_levels) != indicator_columns(annual) or list(stored.columns) != by + ['Year'] + columns
+            or by != (['geo'] if 'geo' in stored_levels.columns else [])):
+        return None
+
+    # === ROWS DEPENDING ON A CHANGED ANNUAL ROW ===
+    changed = changed_rows(annual, stored_levels, by)
+    depth = max((lookback(f, p) for f, p, *_ in groups), default=0)
+    affected = pd.concat([changed.assign(Year=changed['Year'] + k) for k in range(depth + 1)], ignore_index=True)
+    keys = annual[by + ['Year']].astype({c: str for c in by})
+    rows = pd.MultiIndex.from_frame(keys).isin(pd.MultiIndex.from_frame(affected[by + ['Year']])) if by \
+        else keys['Year'].isin(affected['Year']).to_numpy()
+
+    # === COMPUTE THEM AGAIN, KEEP THE OTHER ROWS ===
+    recomputed = feature_rows(annual, groups, rows)
+    index = pd.MultiIndex.from_frame(keys) if by else pd.Index(keys['Year'])
+    values = stored.astype({c: str for c in by}).set_index(by + ['Year'])[columns].reindex(index).to_numpy(
+        dtype='float64')
+    values[rows] = recomputed[columns].to_numpy(dtype='float64')
+    features = pd.concat([annual[by + ['Year']].reset_index(drop=True), pd.DataFrame(values, columns=columns)], axis=1)
+    print(f"DELTA: {output_name}: {int(rows.sum())} of {len(annual)} rows computed again "
+          f"({len(changed)} annual row(s) changed)")
+    save(features, annual, output_dir)
+    return [[str(row[0]) if by else None, int(row[-1])] for row in changed[by + ['Year']].itertuples(index=False)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the derived features of the annual dataset.")
+    parser.add_argument('--features', default=features_path, help="feature configuration (CSV)")
+    parser.add_argument('--full', action='store_true', help="compute all rows, not only the changed ones")
+    args = parser.parse_args(argv)
+    specs = load_features(args.features)
+    if args.full or update(input_file, merged_dir, specs) is None:
+        build(input_file, merged_dir, specs)
+
+
+if __name__ == '__main__':
+    with telemetry.stage('features'):
+        main()
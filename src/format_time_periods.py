@@ -5,90 +5,89 @@
  Description:
      This script standardizes the TIME_PERIOD column across all Eurostat datasets
      previously transformed into long format. It ensures temporal consistency
-     between indicators with different reporting frequencies (annual, quarterly,
-     monthly, and semestrial).
+     between indicators with different reporting frequencies (annual, semestrial,
+     quarterly, monthly, weekly and daily).
 
  Workflow:
-     1. Load all CSV files from /data/processed/transformed_to_long_format/.
+     1. Load all long-format tables from /data/processed/transformed_to_long_format/.
      2. Remove rows with zero values (treated as missing data).
-     3. Detect the time format of each observation:
+     3. Detect the time format of each observation (time_periods.py):
           - YYYY          → annual (converted to January 1 of that year)
-          - YYYY-MM       → monthly (first day of the month)
-          - YYYY-Q[1–4]   → quarterly (first month of the respective quarter)
           - YYYY-S[1–2]   → semestrial (January or July)
-     4. Convert all formats to a unified datetime structure.
+          - YYYY-Q[1–4]   → quarterly (first month of the respective quarter)
+          - YYYY-MM       → monthly (first day of the month)
+          - YYYY-Wnn      → weekly (Monday of the ISO week)
+          - YYYY-MM-DD    → daily
+        Each distinct label is parsed once and the result is broadcast to all
+        rows with that label.
+     4. Convert all formats to a unified datetime structure and record the
+        frequency of each observation in a FREQ column (A/S/Q/M/W/D).
      5. Sort each dataset chronologically by TIME_PERIOD.
-     6. Save the cleaned and standardized output to /data/processed/formatted_time_periods/.
+     6. Save the cleaned and standardized output to /data/processed/formatted_time_periods/
+        (TIME_PERIOD stored as datetime64, see storage.py).
 
  Output:
-     - One formatted CSV file per indicator with standardized time structure.
+     - One formatted table per indicator with standardized time structure.
      - Ensures that all datasets can be merged seamlessly in the next stage.
 
+     Runs on its own, or file by file from `pipeline.py` (incremental rebuilds).
+     Tables are processed in parallel worker processes (PIPELINE_WORKERS, see
+     parallel.py); a failing table is reported without stopping the rest.
+
  Dependencies:
      - pandas
      - os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py, parallel.py, time_periods.py,
+       telemetry.py
 ===============================================================================
 """
 
-import pandas as pd
 import os
+from functools import partial
+
+from parallel import report_failures, run_per_file
+from pipeline_paths import formatted_dir, long_dir
+from storage import list_tables, read_table, write_table
+import telemetry
+from time_periods import parse_time_periods
+
 
-# === Paths ===
-base_dir = os.path.dirname(__file__) # Base directory of the script
-initial_dir = os.path.join(base_dir, '../data/processed/transformed_to_long_format') # Directory with long-format CSVs
-processed_dir = os.path.join(base_dir, '../data/processed/formatted_time_periods') # Directory to save formatted CSVs
-os.makedirs(processed_dir, exist_ok=True) # Create processed directory if it does not exist
+def input_stems(input_dir=long_dir):
+    """Long-format tables to format (stems ending with '_long')."""
+    return list_tables(input_dir, suffix='_long')
 
-# === Process all Eurostat CSV files ===
-for file in os.listdir(initial_dir):
-    if not file.endswith('_long.csv'):
-        continue
 
-    print(f"Formatting {file} ...")
-    path = os.path.join(initial_dir, file)
-    df = pd.read_csv(path)
+def output_stem(stem, output_dir=formatted_dir):
+    return os.path.join(output_dir, os.path.basename(stem)[:-len('_long')] + '_formatted')
+
+
+def format_file(stem, output_dir=formatted_dir):
+    """Convert TIME_PERIOD of one long-format table to dates and return the written path."""
+    print(f"Formatting {os.path.basename(stem)} ...")
+    df = read_table(stem)
 
     # --- Remove zero values (considered as missing or invalid data) ---
     df = df[df["VALUE"] != 0]
 
-    # --- Convert TIME_PERIOD to datetime ---
-    tp = df['TIME_PERIOD'].astype(str) # Work with string representation of time
-    df['TIME_PERIOD'] = df['TIME_PERIOD'].astype(object) # Prepare column for datetime assignment
-
-    # --- Define masks for different time period formats ---
-    mask_year = tp.str.match(r'^\d{4}$')            # e.g., '2023'
-    mask_month = tp.str.match(r'^\d{4}-\d{2}$')     # e.g., '2023-05'
-    mask_quarter = tp.str.match(r'^\d{4}-Q[1-4]$')  # e.g., '2023-Q2'
-    mask_semester = tp.str.match(r'^\d{4}-S[1-2]$') # e.g., '2023-S1'
-
-    # --- Year: convert to first day of the year ---
-    df.loc[mask_year, 'TIME_PERIOD'] = pd.to_datetime(tp[mask_year] + '-01-01', format='%Y-%m-%d', errors='coerce')
-    # --- Month: convert to first day of the month ---
-    df.loc[mask_month, 'TIME_PERIOD'] = pd.to_datetime(tp[mask_month] + '-01', format='%Y-%m-%d', errors='coerce')
-    # --- Quarter: convert to first month of the quarter ---
-    years = tp[mask_quarter].str[:4].astype(int)
-    quarters = tp[mask_quarter].str[-1].astype(int)
-    months = (quarters - 1) * 3 + 1 # Q1 -> January, Q2 -> April, etc.
-    df.loc[mask_quarter, 'TIME_PERIOD'] = pd.to_datetime(
-        years.astype(str) + '-' + months.astype(str).str.zfill(2) + '-01',
-        format='%Y-%m-%d',
-        errors='coerce'
-    )
-
-    # --- Semester: convert to first month of the semester ---
-    years_s = tp[mask_semester].str[:4].astype(int)
-    semesters = tp[mask_semester].str[-1].astype(int)
-    months_s = (semesters - 1) * 6 + 1  # S1 -> January, S2 -> July
-    df.loc[mask_semester, 'TIME_PERIOD'] = pd.to_datetime(
-        years_s.astype(str) + '-' + months_s.astype(str).str.zfill(2) + '-01',
-        format='%Y-%m-%d',
-        errors='coerce'
-    )
+    # --- Convert TIME_PERIOD to datetime and add its frequency (A/S/Q/M/W/D) ---
+    # Each distinct label is parsed once and broadcast to the rows (see time_periods.py)
+    df['TIME_PERIOD'], df['FREQ'] = parse_time_periods(df['TIME_PERIOD'])
 
     # --- Sort by TIME_PERIOD ---
-    df = df.sort_values('TIME_PERIOD')
+    df = df.sort_values('TIME_PERIOD', kind='stable')
+
+    # --- Save the formatted table ---
+    output = write_table(df, output_stem(stem, output_dir))
+    print(f"Saved: {output}")
+    return output
+
+
+def main():
+    # === Process all long-format tables (one worker process per file) ===
+    results = run_per_file(partial(format_file, output_dir=formatted_dir), input_stems())
+    report_failures(results, 'format_time_periods')
+
 
-    # --- Save the formatted CSV ---
-    output = os.path.join(processed_dir, file.replace('_long.csv', '_formatted.csv'))
-    df.to_csv(output, index=False)
-    print(f"Saved: {output}")
\ No newline at end of file
+if __name__ == '__main__':
+    with telemetry.stage('format'):
+        main()
@@ -0,0 +1,215 @@
+"""
+===============================================================================
+ Module Name: frequency_blocks.py
+ Author: Igor Latii
+ Description:
+     Storage of the merged dataset as one block per native frequency, used by
+     `make_merged_df.py` (writer) and `aggregate_annual_indicators.py`,
+     `pipeline.py` (readers).
+
+     Outer-joining monthly, quarterly and annual indicators on a single
+     TIME_PERIOD axis gives a table that is mostly NaN: an annual indicator
+     fills one row in twelve of a monthly axis. Instead, every indicator goes
+     into the block of its native frequency (A, S, Q, M, W or D, see
+     time_periods.py), and each block is a dense wide table over the
+     timestamps of its own indicators only:
+
+        merged_df_readable_A.parquet     TIME_PERIOD + annual indicators
+        merged_df_readable_Q.parquet     TIME_PERIOD + quarterly indicators
+        merged_df_readable_M.parquet     TIME_PERIOD + monthly indicators
+        merged_df_readable.blocks.json   manifest: column order, block of
+                                         every indicator, rows per block
+
+     In panel mode (several countries, see indicator_config.py) the blocks
+     are keyed on (geo, TIME_PERIOD) instead of TIME_PERIOD, with one row per
+     country and period.
+
+     The blocks are ordinary tables of the storage layer (storage.py), so they
+     follow `PIPELINE_FORMAT` and `PIPELINE_EXPORT_CSV`. `read_blocks` returns
+     the blocks (optionally only some columns), `read_wide` materializes the
+     former single wide table, identical to the outer join of all indicators.
+     `update_blocks` rewrites only some blocks of a stored dataset (delta
+     updates of make_merged_df.py), the others are kept as they are.
+
+ Dependencies:
+     - pandas, numpy
+     - json, os
+     - storage.py, time_periods.py
+===============================================================================
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from storage import atomic_open, filter_rows, read_table, remove_other_formats, write_table
+from time_periods import FREQUENCIES
+
+# === Keys ===
+KEY_COLUMNS = ['geo', 'TIME_PERIOD'] # Row keys of a block, in sort order ('geo' in panel mode only)
+
+
+def key_columns(df):
+    return [c for c in KEY_COLUMNS if c in df.columns]
+
+
+def align_keys(indexes):
+    """
+    Sorted union of several key indexes (TIME_PERIOD, or (geo, TIME_PERIOD) as
+    a MultiIndex) and the position of every entry of each index in it.
+    """
+    if isinstance(indexes[0], pd.MultiIndex):
+        keys = indexes[0].append(list(indexes[1:])).unique().sort_values()
+        return keys, [keys.get_indexer(index) for index in indexes]
+    keys = np.unique(np.concatenate([index.to_numpy() for index in indexes]))
+    return pd.Index(keys, name='TIME_PERIOD'), [np.searchsorted(keys, index.to_numpy()) for index in indexes]
+
+
+def block_index(block):
+    """Key index of a block: TIME_PERIOD, or a (geo, TIME_PERIOD) MultiIndex."""
+    keys = key_columns(block)
+    return pd.MultiIndex.from_frame(block[keys]) if len(keys) > 1 else pd.Index(block['TIME_PERIOD'])
+
+
+def key_records(index):
+    """
+    Keys of `index` (TIME_PERIOD, or (geo, TIME_PERIOD)) as JSON-friendly
+    [geo, 'YYYY-MM-DD'] pairs, geo None without a geo level.
+    """
+    frame = index.to_frame(index=False)
+    geos = frame['geo'].astype(str).tolist() if 'geo' in frame.columns else [None] * len(frame)
+    return [[geo, date] for geo, date in zip(geos, pd.to_datetime(frame['TIME_PERIOD']).dt.strftime('%Y-%m-%d'))]
+
+
+def records_frame(records):
+    """Inverse of `key_records`: DataFrame(geo, TIME_PERIOD), without geo if the keys have none."""
+    frame = pd.DataFrame(records, columns=['geo', 'TIME_PERIOD'])
+    frame['TIME_PERIOD'] = pd.to_datetime(frame['TIME_PERIOD'])
+    return frame if frame['geo'].notna().any() else frame[['TIME_PERIOD']]
+
+
+# === Paths ===
+def manifest_path(stem):
+    return stem + '.blocks.json'
+
+
+def block_stem(stem, freq):
+    return f"{stem}_{freq}"
+
+
+# === Writing ===
+def write_blocks(blocks, columns, stem, fmt=None, export_csv=None, kept=None, keys=None):
+    """
+    Write the frequency blocks {freq: DataFrame(TIME_PERIOD, indicators...)}
+    of the dataset `stem` and its manifest; `columns` is the order of the
+    indicators in the wide view. Blocks of frequencies no longer present are
+    removed, except those of `kept` ({freq: manifest entry} of blocks already
+    stored, with row keys `keys`). Returns the manifest path.
+    """
+    kept = kept or {}
+    manifest = {'columns': list(columns), 'keys': list(keys or ['TIME_PERIOD']), 'blocks': {}}
+    for freq in FREQUENCIES:
+        if freq in kept:
+            manifest['blocks'][freq] = kept[freq]
+            continue
+        if freq not in blocks:
+            remove_other_formats(block_stem(stem, freq), keep=[]) # Stale block from a previous run
+            continue
+        block = blocks[freq]
+        write_table(block, block_stem(stem, freq), fmt, export_csv)
+        manifest['keys'] = key_columns(block)
+        manifest['blocks'][freq] = {'columns': [c for c in block.columns if c not in KEY_COLUMNS],
+                                    'rows': len(block)}
+
+    # The manifest is written last: readers never see it point to missing blocks
+    with atomic_open(manifest_path(stem), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest_path(stem)
+
+
+def update_blocks(blocks, columns, stem, fmt=None, export_csv=None):
+    """
+    Rewrite only the blocks {freq: DataFrame} of the stored dataset `stem`
+    (an empty DataFrame removes the block of its frequency); the other blocks
+    of the manifest are kept. Returns the manifest path.
+    """
+    manifest = read_manifest(stem)
+    kept = {freq: info for freq, info in manifest['blocks'].items() if freq not in blocks}
+    return write_blocks({freq: b for freq, b in blocks.items() if len(b)}, columns, stem, fmt, export_csv,
+                        kept, manifest.get('keys'))
+
+
+# === Reading ===
+def read_manifest(stem):
+    """Manifest of the dataset `stem`; raises FileNotFoundError if it was not written."""
+    with open(manifest_path(stem), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def block_stems(stem):
+    """Stems of the block tables of the dataset `stem` (empty if there is no manifest)."""
+    if not os.path.exists(manifest_path(stem)):
+        return []
+    return [block_stem(stem, freq) for freq in read_manifest(stem)['blocks']]
+
+
+def read_block(stem, freq, keys=('TIME_PERIOD',), columns=None, filters=None):
+    """
+    One stored block of the dataset `stem`: its key columns and `columns`
+    (default: all indicators), and only the rows matching the key `filters`
+    if given (see storage.read_table).
+    """
+    block = read_table(block_stem(stem, freq), columns=None if columns is None else list(keys) + list(columns),
+                       filters=filters)
+    if not pd.api.types.is_datetime64_any_dtype(block['TIME_PERIOD']):
+        block['TIME_PERIOD'] = pd.to_datetime(block['TIME_PERIOD'].astype(str)) # CSV blocks
+    return filter_rows(block, filters) if filters else block
+
+
+def read_blocks(stem, columns=None, filters=None):
+    """
+    Read the dataset `stem` as {freq: DataFrame(TIME_PERIOD, indicators...)}.
+    With `columns`, only the blocks holding some of these indicators are read,
+    and only those columns; with `filters`, only the matching rows.
+    """
+    manifest = read_manifest(stem)
+    wanted = None if columns is None else set(columns)
+    blocks = {}
+    for freq, info in manifest['blocks'].items():
+        block_columns = [c for c in info['columns'] if wanted is None or c in wanted]
+        if block_columns:
+            blocks[freq] = read_block(stem, freq, manifest.get('keys', ['TIME_PERIOD']), block_columns, filters)
+    return blocks
+
+
+def widen(blocks, columns):
+    """
+    One wide table over the union of the block keys (timestamps, or geo and
+    timestamp), with the indicators in the order `columns` (NaN where an
+    indicator has no value).
+    """
+    if not blocks:
+        return pd.DataFrame({'TIME_PERIOD': pd.Series(dtype='datetime64[ns]'),
+                             **{name: pd.Series(dtype='float64') for name in columns}})
+    keys, positions = align_keys([block_index(b) for b in blocks.values()])
+    position = {name: j for j, name in enumerate(columns)}
+    values = np.full((len(keys), len(columns)), np.nan, order='F') # one contiguous column per indicator
+    for block, rows in zip(blocks.values(), positions):
+        for name in block.columns.drop(key_columns(block)):
+            values[rows, position[name]] = block[name].to_numpy()
+    return keyed_frame(keys, values, columns)
+
+
+def keyed_frame(keys, values, columns):
+    """DataFrame of the key columns of `keys` followed by the 2-D `values`."""
+    return pd.concat([keys.to_frame(index=False), pd.DataFrame(values, columns=list(columns))], axis=1)
+
+
+def read_wide(stem, columns=None):
+    """Materialize the dataset `stem` as the single wide table (all or `columns` indicators)."""
+    order = read_manifest(stem)['columns']
+    if columns is not None:
+        order = [c for c in order if c in set(columns)]
+    return widen(read_blocks(stem, order), order)
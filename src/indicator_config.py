@@ -0,0 +1,156 @@
+"""
+===============================================================================
+ Module Name: indicator_config.py
+ Author: Igor Latii
+ Description:
+     Reads the indicator list `/reports/indicators.csv` shared by all pipeline
+     stages and parses its per-indicator settings:
+
+        - code        Eurostat dataset code (or World Bank indicator code);
+        - name        readable name;
+        - geo_filter  geo code(s), separated by ';' (e.g. `LV;EE;LT`);
+        - dimensions  optional dimension selection, e.g. `unit=CP_MEUR;s_adj=SCA`.
+                      Several codes of one dimension are joined with '+'
+                      (`unit=CP_MEUR+CLV10_MEUR`), as in SDMX query keys;
+        - years       optional years of a World Bank indicator, e.g. `1995-2024`
+                      or `2000;2010-2020` (default: all years of the file);
+        - label       optional column name in the merged dataset (default:
+                      the dataset title of the Eurostat metadata cache, see
+                      eurostat_metadata.py, else the code).
+
+     It also holds the panel switch: with `PIPELINE_PANEL=1`, the stages after
+     collection key every table on (geo, TIME_PERIOD) and process all
+     countries of the study together (see make_merged_df.py); otherwise they
+     produce one series per indicator and geo file, as before.
+
+ Dependencies:
+     - pandas
+     - os, re
+     - pipeline_paths.py
+===============================================================================
+"""
+
+import os
+import re
+
+import pandas as pd
+
+from pipeline_paths import reports_dir
+
+# === File paths ===
+indicators_path = os.path.join(reports_dir, 'indicators.csv')
+
+
+def load_indicators(path=indicators_path):
+    """Load the indicator list from `/reports/indicators.csv`."""
+    indicators = pd.read_csv(path, skipinitialspace=True)
+    # Drop the unnamed columns produced by trailing commas
+    return indicators.loc[:, ~indicators.columns.str.startswith('Unnamed')]
+
+
+def parse_geos(value, default='LV'):
+    """Split a `geo_filter` cell such as 'LV;EE;LT' into a list of geo codes."""
+    if not isinstance(value, str) or not value.strip():
+        return [default]
+    return [g.strip() for g in value.split(';') if g.strip()]
+
+
+def study_geos(indicators):
+    """All geo codes of the indicator list, in order of first appearance."""
+    geos = []
+    for value in indicators.get('geo_filter', pd.Series(dtype=object)):
+        geos += [g for g in parse_geos(value) if g not in geos]
+    return geos or parse_geos(None)
+
+
+def panel_enabled():
+    """Panel mode (`PIPELINE_PANEL`): tables keyed on (geo, TIME_PERIOD) instead of TIME_PERIOD."""
+    return os.environ.get('PIPELINE_PANEL', '').lower() in ('1', 'true', 'yes')
+
+
+def parse_years(value):
+    """
+    Parse a `years` cell such as '1995-2024' or '2000;2010-2020' into a
+    sorted list of years; empty cells give None (all years).
+    """
+    if isinstance(value, (int, float)) and not pd.isna(value):  # a single year read as a number
+        value = str(int(value))
+    if not isinstance(value, str) or not value.strip():
+        return None
+    years = set()
+    for part in value.split(';'):
+        first, _, last = part.strip().partition('-')
+        if not first.strip().isdigit() or (last and not last.strip().isdigit()):
+            raise ValueError(f"Invalid years '{part}' (expected 'YYYY' or 'YYYY-YYYY')")
+        years.update(range(int(first), int(last or first) + 1))
+    return sorted(years)
+
+
+def parse_dimension_filters(value):
+    """
+    Parse a `dimensions` cell such as 'unit=CP_MEUR+CLV10_MEUR;s_adj=SCA' into
+    {'unit': ['CP_MEUR', 'CLV10_MEUR'], 's_adj': ['SCA']}. Empty cells give {}.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return {}
+    filters = {}
+    for part in value.split(';'):
+        if not part.strip():
+            continue
+        if '=' not in part:
+            raise ValueError(f"Invalid dimension filter '{part}' (expected 'dim=CODE[+CODE...]')")
+        dim, codes = part.split('=', 1)
+        filters[dim.strip()] = [c.strip() for c in codes.split('+') if c.strip()]
+    return filters
+
+
+def dimension_filters_by_code(indicators):
+    """Map each indicator code to its parsed dimension filters."""
+    if 'dimensions' not in indicators.columns:
+        return {}
+    return {row['code']: parse_dimension_filters(row['dimensions']) for _, row in indicators.iterrows()}
+
+
+def apply_dimension_filters(df, filters, code=''):
+    """
+    Keep only the rows of a wide Eurostat table whose dimension codes match
+    `filters`. Column names may carry the Eurostat suffix (`geo\\TIME_PERIOD`).
+    """
+    available = {c.split('\\')[0]: c for c in df.columns}
+    unknown = set(filters) - set(available)
+    if unknown:
+        raise ValueError(f"{code}: unknown dimension(s) {', '.join(sorted(unknown))} (available: {list(available)})")
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for dim, codes in filters.items():
+        mask &= df[available[dim]].astype(str).isin(codes)
+    return df[mask]
+
+
+def labels_by_code(indicators):
+    """Map each indicator code to its non-empty `label`."""
+    if 'label' not in indicators.columns:
+        return {}
+    return {str(row['code']).strip(): row['label'].strip() for _, row in indicators.iterrows()
+            if isinstance(row['label'], str) and row['label'].strip()}
+
+
+def indicator_code(key):
+    """
+    Indicator code and geo of a merged column key: 'une_rt_m__EE' -> ('une_rt_m', 'EE'),
+    'WDI_SM.POP.NETM' and 'API_SM.POP.NETM_DS2_en_csv_v2_126864' -> ('SM.POP.NETM', None),
+    'WDI_SM.POP.NETM__EE' -> ('SM.POP.NETM', 'EE').
+    """
+    code, _, geo = key.partition('__')
+    match = re.match(r'^API_(.+?)_DS2', code) or re.match(r'^WDI_(.+)$', code)
+    return (match.group(1) if match else code), geo or None
+
+
+def code_from_file_name(file_name, suffix):
+    """
+    Recover the dataset code from a stage file name, e.g.
+    'namq_10_gdp__LV_raw.csv' with suffix '_raw.csv' -> 'namq_10_gdp'.
+    """
+    stem = file_name[:-len(suffix)] if file_name.endswith(suffix) else os.path.splitext(file_name)[0]
+    return stem.split('__')[0]
@@ -4,97 +4,412 @@
  Author: Igor Latii
  Description:
      This script merges all preprocessed and formatted Eurostat and World Bank
-     indicator CSV files into a single unified dataset (`merged_df_readable.csv`).
+     indicator tables into a single unified dataset (`merged_df_readable`).
 
      Each dataset in `/data/processed/formatted_time_periods/` contains two key
      columns: TIME_PERIOD (date) and VALUE (numeric indicator value). The script:
-        1. Loads all formatted CSV files from the directory.
-        2. Converts technical indicator codes to human-readable names.
+        1. Loads all formatted tables from the directory (see storage.py).
+        2. Converts technical indicator codes to human-readable names: the
+           `label` column of indicators.csv, else the dataset title from the
+           local Eurostat metadata cache (eurostat_metadata.py, no download),
+           else the code itself; per-geo tables get the geo appended
+           ('Unemployment Rate (EE)').
         3. Aggregates data by TIME_PERIOD (summing multiple records if needed).
-        4. Merges all indicators into one wide-format DataFrame.
-        5. Saves the final merged dataset for later annual aggregation and EDA.
+        4. Merges the indicators of each native frequency (FREQ column, or
+           inferred from the dates) into one wide block with a single k-way
+           alignment on the union of their timestamps (same result as chained
+           outer merges, in time linear in the number of indicators).
+        5. Saves the frequency blocks for later annual aggregation and EDA
+           (see frequency_blocks.py), and the wide view of all indicators as
+           CSV.
+
+     With `PIPELINE_ENGINE=sqlite` steps 1, 3 and 4 run as SQL queries over
+     the formatted tables streamed from disk into a temporary database, for
+     panels too large for memory (see sql_engine.py); the blocks are
+     identical to the pandas ones.
+
+     In delta mode (`pipeline.py --delta`, `update_tables`) only the
+     indicators whose formatted tables changed are read again, and only the
+     frequency blocks holding them are rebuilt, from their new series and the
+     stored columns of the other indicators; the wide CSV is patched at the
+     changed rows only (`update_wide`). The keys (geo, TIME_PERIOD) whose
+     value changed are passed on to aggregate_annual_indicators.py. A changed
+     indicator is still read over its whole history: the formatted tables are
+     one file each, rewritten in full by the formatting stage.
+
+     In panel mode (`PIPELINE_PANEL=1`, see indicator_config.py) the per-geo
+     tables of an indicator (`{code}__{geo}_raw_formatted`) form one series
+     keyed on (geo, TIME_PERIOD), and all countries are aligned together in
+     the same single pass, instead of one column per indicator and geo.
 
  Output:
-     /data/processed/merged/merged_df_readable.csv
+     /data/processed/merged/merged_df_readable_{A,Q,M,...}.parquet + .blocks.json
+     /data/processed/merged/merged_df_readable.csv (wide view)
+
+     Runs on its own, or from `pipeline.py` when a formatted table changed.
 
  Dependencies:
-     - pandas
+     - pandas, numpy
      - os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py,
+       frequency_blocks.py, time_periods.py, telemetry.py,
+       indicator_config.py, eurostat_metadata.py, sql_engine.py
 
 ===============================================================================
 """
 
+import heapq
 import os
+
+import numpy as np
 import pandas as pd
 
-# === Define input and output paths ===
-processed_dir = "../data/processed/formatted_time_periods"
-output_dir = "../data/processed/merged"
-os.makedirs(output_dir, exist_ok=True)
-
-# === Mapping of technical indicator codes to descriptive names ===
-indicator_mapping = {
-    "API_SM.POP.NETM_DS2_en_csv_v2_126864": "Net Migration (World Bank)",
-    "avia_paocc": "Air Passenger Transport",
-    "demo_pjan": "Population",
-    "lfsi_emp_q": "Employment",
-    "migr_emi1ctz": "Emigration of Citizens",
-    "nama_10_exi": "Exports (National Accounts)",
-    "namq_10_gdp": "GDP (Quarterly)",
-    "nrg_pc_202": "Energy Prices",
-    "prc_hicp_manr": "Inflation (HICP Manufacturing)",
-    "road_pa_mov": "Road Passenger Transport",
-    "sts_inpr_m": "Industrial Production Index",
-    "sts_trtu_m": "Retail Trade Turnover",
-    "tour_occ_nim": "Tourist Overnight Stays",
-    "tran_hv_frtra": "Freight Transport",
-    "une_rt_m": "Unemployment Rate"
-}
-
-dfs = [] # list to store each processed DataFrame
-
-# === Iterate through all formatted indicator files ===
-for file in os.listdir(processed_dir):
-    if not file.endswith('.csv'):
-        continue # skip non-CSV files
-
-    # Extract clean indicator name from filename
-    indicator_name = os.path.splitext(file)[0]
-    indicator_name = indicator_name.replace('_raw_formatted', '').replace('_formatted', '')
-
-    file_path = os.path.join(processed_dir, file)
-    df = pd.read_csv(file_path)
-
-    # Convert TIME_PERIOD to datetime and VALUE to numeric
-    df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'], errors='coerce')
-    df['VALUE'] = pd.to_numeric(df['VALUE'], errors='coerce')
-
-    # === Aggregate values by TIME_PERIOD ===
-    # If multiple entries exist for the same period, sum them.
-    df = df.groupby('TIME_PERIOD', as_index=False)['VALUE'].sum()
-
-    # Apply readable indicator name (fallback to file name if not mapped)
-    readable_name = indicator_mapping.get(indicator_name, indicator_name)
-
-    # Rename columns and drop duplicates to keep clean structure
-    df = df[['TIME_PERIOD', 'VALUE']].rename(columns={'VALUE': readable_name})
-    df = df.drop_duplicates(subset=['TIME_PERIOD'])
-
-    dfs.append(df)
-    print(f"SUCCES: Loaded  {readable_name} ({len(df)} строк)")
-
-# === Merge all datasets into one table by TIME_PERIOD ===
-if dfs:
-    merged_df = dfs[0]
-    for df in dfs[1:]:
-        merged_df = pd.merge(merged_df, df, on='TIME_PERIOD', how='outer')
-
-    merged_df = merged_df.sort_values('TIME_PERIOD')
-
-    # Save merged dataset
-    output_file = os.path.join(output_dir, 'merged_df_readable.csv')
-    merged_df.to_csv(output_file, index=False)
-
-    print(f"\nSUCCESS: Successfully created merged_df_readable.csv ({merged_df.shape[0]} rows, {merged_df.shape[1]} columns)")
-else:
-    print("ERROR: No CSV files found for merging.")
+from frequency_blocks import (align_keys, block_index, key_records, keyed_frame, manifest_path, read_block,
+                              read_manifest, records_frame, update_blocks, widen, write_blocks)
+from eurostat_metadata import load_metadata
+from indicator_config import indicator_code, indicators_path, labels_by_code, load_indicators, panel_enabled
+from pipeline_paths import formatted_dir, merged_dir
+import sql_engine
+from storage import (apply_schema, atomic_open, list_tables, read_columns, read_table, read_tables, table_path,
+                     write_table)
+import telemetry
+from time_periods import FREQUENCIES, infer_frequency
+
+
+def input_stems(input_dir=formatted_dir):
+    """All formatted indicator tables."""
+    return list_tables(input_dir)
+
+
+def output_stem(output_dir=merged_dir):
+    return os.path.join(output_dir, 'merged_df_readable')
+
+
+def indicator_series(df, name, keys=('TIME_PERIOD',)):
+    """
+    One indicator as a Series indexed by its sorted, unique TIME_PERIODs (or
+    (geo, TIME_PERIOD) pairs with keys=('geo', 'TIME_PERIOD')). Duplicate keys
+    (several series or dimension codes in one table) are summed; rows without
+    a valid TIME_PERIOD are dropped.
+    """
+    series = df.groupby(list(keys), sort=True, observed=True)['VALUE'].sum()
+    series.name = name
+    return series
+
+
+def native_frequency(df):
+    """
+    Frequency block of an indicator table: the highest frequency in its FREQ
+    column (a table mixing annual and quarterly rows goes to the quarterly
+    block), or the one inferred from the dates for tables without FREQ.
+    """
+    if 'FREQ' in df.columns:
+        present = set(df['FREQ'].dropna().astype(str))
+        known = [f for f in FREQUENCIES if f in present]
+        if known:
+            return known[-1]
+    return infer_frequency(df['TIME_PERIOD']) or 'A'
+
+
+def align_series(series_list):
+    """
+    Outer-align indicator series on the union of their time indexes in one
+    pass: the union is built once, then each series is written into its
+    column at the positions of its timestamps. Equivalent to chaining
+    `pd.merge(..., how='outer')` over the series and sorting by TIME_PERIOD,
+    without re-sorting and copying the growing table for every indicator.
+    Panel series indexed by (geo, TIME_PERIOD) are aligned the same way.
+    """
+    keys, positions = align_keys([s.index for s in series_list])
+    values = np.full((len(keys), len(series_list)), np.nan, order='F') # one contiguous column per indicator
+    for j, (series, rows) in enumerate(zip(series_list, positions)):
+        values[rows, j] = series.to_numpy()
+    return keyed_frame(keys, values, [s.name for s in series_list])
+
+
+def indicator_name_from(stem):
+    """Extract clean indicator name from filename: 'une_rt_m__EE_raw_formatted' -> 'une_rt_m__EE'."""
+    return os.path.basename(stem).replace('_raw_formatted', '').replace('_formatted', '')
+
+
+def indicator_key(stem, panel=False):
+    """
+    Indicator of a formatted table: its clean file name, without the geo
+    suffix of per-geo tables in panel mode ('une_rt_m__EE' -> 'une_rt_m'), so
+    that all countries of an indicator form one series.
+    """
+    indicator_name = indicator_name_from(stem)
+    return indicator_name.split('__')[0] if panel else indicator_name
+
+
+def read_indicator_table(stems, panel=False):
+    """
+    Columns used for merging of all the formatted tables of one indicator, as
+    one DataFrame with typed TIME_PERIOD / VALUE (and geo in panel mode).
+    """
+    available = set.intersection(*(set(read_columns(stem)) for stem in stems))
+    columns = ['TIME_PERIOD', 'VALUE'] + [c for c in ['FREQ'] + (['geo'] if panel else []) if c in available]
+    if panel and 'geo' not in available:
+        # Geo of every row from the geo suffix of the per-geo file names
+        df = pd.concat([read_table(stem, columns=columns).assign(geo=indicator_name_from(stem).partition('__')[2])
+                        for stem in stems], ignore_index=True)
+    else:
+        df = read_tables(stems, columns) # Only the columns used here, all files in one scan
+
+    # Convert TIME_PERIOD to datetime and VALUE to numeric (skipped for typed columnar tables)
+    if not pd.api.types.is_datetime64_any_dtype(df['TIME_PERIOD']):
+        df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'], errors='coerce')
+    if not pd.api.types.is_float_dtype(df['VALUE']):
+        df['VALUE'] = pd.to_numeric(df['VALUE'], errors='coerce')
+    if panel:
+        # One code per row; sorted categories keep the rows of the blocks in geo order
+        geo = df['geo'].astype('category')
+        df['geo'] = geo.cat.reorder_categories(sorted(geo.cat.categories))
+    return df
+
+
+def indicator_labels(indicators_file=indicators_path, metadata=None):
+    """
+    Readable name of every indicator code: the `label` column of
+    indicators.csv, else the dataset title of the Eurostat metadata cache
+    (see eurostat_metadata.py), looked up when a key is named.
+    """
+    labels = labels_by_code(load_indicators(indicators_file)) if os.path.exists(indicators_file) else {}
+    metadata = load_metadata() if metadata is None else metadata
+    return lambda code: labels.get(code) or metadata.title(code)
+
+
+def column_name(indicator_name, label_of):
+    """'une_rt_m' -> 'Unemployment Rate', 'une_rt_m__EE' -> 'Unemployment Rate (EE)', unknown codes unchanged."""
+    code, geo = indicator_code(indicator_name)
+    label = label_of(code)
+    if not label:
+        return indicator_name
+    return f"{label} ({geo})" if geo else label
+
+
+def readable_names(indicator_keys, label_of=None):
+    """
+    Readable column name of every indicator (fallback to file name if it has
+    no label). Two indicators mapped to the same name keep both columns, told
+    apart by their file name.
+    """
+    label_of = indicator_labels() if label_of is None else label_of
+    names = {}
+    for indicator_name in indicator_keys:
+        readable = column_name(indicator_name, label_of)
+        if readable in names.values():
+            print(f"WARNING: duplicate indicator name '{readable}', using '{readable} [{indicator_name}]'")
+            readable = f"{readable} [{indicator_name}]"
+        names[indicator_name] = readable
+    return names
+
+
+def group_tables(stems, panel=False):
+    """Formatted tables grouped by indicator (one table per geo in panel mode), in file order."""
+    tables = {}
+    for stem in stems:
+        tables.setdefault(indicator_key(stem, panel), []).append(stem)
+    return tables
+
+
+def merge_tables(stems, output_dir=merged_dir, panel=None):
+    """Merge the formatted tables `stems` into frequency blocks; returns the manifest path or None."""
+    panel = panel_enabled() if panel is None else panel
+    keys = ('geo', 'TIME_PERIOD') if panel else ('TIME_PERIOD',)
+
+    # === Group the formatted tables by indicator (one table per geo in panel mode) ===
+    tables = group_tables(stems, panel)
+    names = readable_names(tables)
+    if not tables:
+        print("ERROR: No formatted tables found for merging.")
+        return None
+
+    # === Aggregate by key and merge into one block per frequency ===
+    # One dense block per frequency, each sorted by TIME_PERIOD (by geo first in panel mode)
+    if sql_engine.selected_engine() == 'sqlite':
+        blocks = sql_engine.merge_blocks(tables, names, panel, native_frequency,
+                                         lambda stem: indicator_name_from(stem).partition('__')[2])
+    else:
+        blocks = merge_blocks(tables, names, panel)
+    columns = [names[key] for key in tables]
+    stem = output_stem(output_dir)
+    write_blocks(blocks, columns, stem)
+    save_wide(blocks, columns, stem, keys)
+    return manifest_path(stem)
+
+
+def merge_blocks(tables, names, panel=False):
+    """In-memory merge (pandas backend): {indicator key: stems} -> frequency blocks {freq: DataFrame}."""
+    keys = ('geo', 'TIME_PERIOD') if panel else ('TIME_PERIOD',)
+    series_list = [] # one Series per indicator, indexed by TIME_PERIOD (or geo and TIME_PERIOD)
+    frequencies = {} # readable name -> native frequency
+
+    # === Iterate through all indicators ===
+    for indicator_name, indicator_stems in tables.items():
+        df = read_indicator_table(indicator_stems, panel)
+        readable_name = names[indicator_name]
+
+        # === Aggregate values by TIME_PERIOD ===
+        # If multiple entries exist for the same period, sum them.
+        series = indicator_series(df, readable_name, keys)
+
+        series_list.append(series)
+        frequencies[readable_name] = native_frequency(df)
+        geos = f", {df['geo'].nunique()} geo" if panel else ''
+        print(f"SUCCES: Loaded  {readable_name} ({len(series)} строк, {frequencies[readable_name]}{geos})")
+
+    # === Merge all datasets into one table by TIME_PERIOD ===
+    blocks = {}
+    for freq in FREQUENCIES:
+        members = [s for s in series_list if frequencies[s.name] == freq]
+        if members:
+            blocks[freq] = align_series(members)
+    return blocks
+
+
+def save_wide(blocks, columns, stem, keys):
+    """Wide view of all indicators, kept as CSV: it is a deliverable of the project."""
+    merged_df = widen(blocks, columns)
+    write_table(merged_df, stem, fmt='csv', export_csv=False)
+
+    stored = sum(b.shape[0] * (b.shape[1] - len(keys)) for b in blocks.values())
+    wide = merged_df.shape[0] * len(columns)
+    print(f"\nSUCCESS: Successfully created {os.path.basename(stem)} ({merged_df.shape[0]} rows, {merged_df.shape[1]} columns)")
+    print(f"    blocks: {', '.join(f'{f} {b.shape[0]}x{b.shape[1] - len(keys)}' for f, b in blocks.items())} "
+          f"({stored:,} cells instead of {wide:,})")
+
+
+# === Delta updates ===
+def block_series(block, keys):
+    """The indicators of a stored block as Series indexed by its keys, without the NaN padding."""
+    index = block_index(block)
+    return {name: pd.Series(block[name].to_numpy(), index=index, name=name).dropna()
+            for name in block.columns.drop(list(keys))}
+
+
+def changed_keys(old, new):
+    """Keys at which an indicator series gained, lost or changed a value (`old` / `new` None if absent)."""
+    if old is None or new is None:
+        return (new if old is None else old).index
+    joined = pd.concat([old.rename('old'), new.rename('new')], axis=1)
+    return joined.index[joined['old'].ne(joined['new'])] # NaN on one side only: a key added or removed
+
+
+def update_tables(stems, changed, output_dir=merged_dir, panel=None):
+    """
+    Delta update of the stored merged dataset after the formatted tables
+    `changed` (file names of new, rewritten or deleted tables) changed: only
+    their indicators are read again, and only the blocks of their frequencies
+    are rebuilt, from the new series and the stored columns of the other
+    indicators (same blocks as a full merge). Returns the changed keys as
+    [geo, 'YYYY-MM-DD'] pairs (see frequency_blocks.key_records), or None if
+    the dataset has to be merged in full (nothing stored yet, other keys or
+    other columns).
+    """
+    panel = panel_enabled() if panel is None else panel
+    keys = ('geo', 'TIME_PERIOD') if panel else ('TIME_PERIOD',)
+    stem = output_stem(output_dir)
+    if not os.path.exists(manifest_path(stem)):
+        return None
+    manifest = read_manifest(stem)
+    if manifest.get('keys', ['TIME_PERIOD']) != list(keys):
+        return None
+
+    tables = group_tables(stems, panel)
+    names = readable_names(tables)
+    columns = list(names.values())
+    stored = {name: freq for freq, info in manifest['blocks'].items() for name in info['columns']}
+    affected = [names[key] for key in tables if key in {indicator_key(name, panel) for name in changed}]
+    removed = [name for name in stored if name not in columns]
+    if any(name not in stored for name in columns if name not in affected):
+        return None # An unchanged indicator under another name (e.g. duplicate names resolved differently)
+
+    # === Read the changed indicators only ===
+    series, frequencies = {}, {name: stored[name] for name in columns if name in stored}
+    for indicator_name, readable_name in names.items():
+        if readable_name in affected:
+            df = read_indicator_table(tables[indicator_name], panel)
+            series[readable_name] = indicator_series(df, readable_name, keys)
+            frequencies[readable_name] = native_frequency(df)
+
+    # === Rebuild the blocks holding (or losing) a changed indicator ===
+    touched = {stored[name] for name in affected + removed if name in stored} | {frequencies[n] for n in affected}
+    previous = {}
+    for freq in touched & set(manifest['blocks']):
+        previous.update(block_series(read_block(stem, freq, keys), keys))
+    blocks = {}
+    for freq in FREQUENCIES:
+        if freq in touched:
+            members = [series.get(name, previous.get(name)) for name in columns if frequencies[name] == freq]
+            blocks[freq] = align_series(members) if members else pd.DataFrame()
+    update_blocks(blocks, columns, stem)
+
+    changes = [changed_keys(previous.get(name), series.get(name)) for name in affected + removed]
+    records = sorted({tuple(r) for index in changes for r in key_records(index)}, key=lambda r: (r[0] or '', r[1]))
+    print(f"DELTA: {len(affected)} indicator(s) updated, {len(removed)} removed, {len(records)} key(s) changed "
+          f"(blocks {', '.join(f for f in FREQUENCIES if f in touched)})")
+
+    update_wide(blocks, columns, stem, keys, records)
+    return [list(r) for r in records]
+
+
+def wide_key(line, n_keys):
+    """Key fields of a line of the wide CSV: ('2024-01-01',) or ('LV', '2024-01-01')."""
+    return tuple(line.split(',', n_keys)[:n_keys])
+
+
+def update_wide(blocks, columns, stem, keys, records):
+    """
+    Rewrite only the rows of the wide CSV at the changed keys `records`
+    ([geo, 'YYYY-MM-DD'] pairs), after the delta update of `blocks` (the
+    rebuilt blocks; the rows of the others are read at those keys only).
+    The other lines are copied as text, in the same key order as a full
+    write; the file is written in full (save_wide) when it is missing or
+    its columns changed.
+    """
+    path = table_path(stem, 'csv')
+    frequencies = [freq for freq in FREQUENCIES if freq in read_manifest(stem)['blocks']]
+    stored_header = None
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            stored_header = f.readline().rstrip('\n')
+    if stored_header != pd.DataFrame(columns=list(keys) + list(columns)).to_csv(index=False).rstrip('\n'):
+        all_blocks = {freq: blocks[freq] if freq in blocks else read_block(stem, freq, keys) for freq in frequencies}
+        return save_wide(all_blocks, columns, stem, keys)
+    if not records:
+        return None
+
+    # === The new rows at the changed keys, formatted as in a full write ===
+    changed = records_frame(records)
+    index = pd.MultiIndex.from_frame(changed) if len(keys) > 1 else pd.Index(changed['TIME_PERIOD'])
+    filters = [('TIME_PERIOD', '>=', changed['TIME_PERIOD'].min()), ('TIME_PERIOD', '<=', changed['TIME_PERIOD'].max())]
+    filters += [('geo', 'in', sorted(changed['geo'].unique()))] if len(keys) > 1 else []
+    rows = {}
+    for freq in frequencies:
+        block = blocks[freq] if freq in blocks else read_block(stem, freq, keys, filters=filters)
+        block = block[block_index(block.astype({k: str for k in keys[:-1]})).isin(index)]
+        if len(block):
+            rows[freq] = block
+    new_lines = apply_schema(widen(rows, columns)).to_csv(index=False, header=False).splitlines() if rows else []
+
+    # === Merge them into the stored lines, replacing the lines of the changed keys ===
+    changed_keys = {(*([geo] if len(keys) > 1 else []), date) for geo, date in records}
+    n_lines = 0
+    with atomic_open(path, 'w', encoding='utf-8') as out, open(path, encoding='utf-8') as old:
+        out.write(old.readline())
+        kept = (line.rstrip('\n') for line in old if wide_key(line, len(keys)) not in changed_keys)
+        for line in heapq.merge(kept, new_lines, key=lambda line: wide_key(line, len(keys))):
+            out.write(line + '\n')
+            n_lines += 1
+    telemetry.record_output(len(new_lines), path)
+    print(f"DELTA: {os.path.basename(path)}: {len(new_lines)} of {n_lines} rows written again")
+
+
+def main():
+    merge_tables(input_stems(), merged_dir)
+
+
+if __name__ == '__main__':
+    with telemetry.stage('merge'):
+        main()
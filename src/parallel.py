@@ -0,0 +1,130 @@
+"""
+===============================================================================
+ Module Name: parallel.py
+ Author: Igor Latii
+ Description:
+     Process-pool execution of per-file stage functions, shared by
+     `transform_to_long_format_EStat.py`, `transform_to_long_format_WB.py`,
+     `format_time_periods.py` and the runner `pipeline.py`.
+
+     The files of these stages are independent, so each one is handed to a
+     worker process (pandas work holds the GIL, threads would not help):
+
+        - the number of workers comes from `PIPELINE_WORKERS` (default: the
+          number of CPUs); with 1 worker, or a single file, everything runs in
+          the current process as before;
+        - output is deterministic: every file is written by exactly one task,
+          results come back in input order, and the messages each task prints
+          are captured and replayed in input order instead of interleaving;
+        - a failing file does not stop the batch: its error is recorded and
+          reported with the others at the end (`report_failures`);
+        - every file is measured as a telemetry span (telemetry.py); worker
+          processes send their records back with the result, and the rows /
+          bytes of the file count for the stage. While a stage is profiled
+          the files are processed in the current process.
+
+     Stage functions must be module-level functions (or `functools.partial`
+     objects of them) so that they can be sent to the worker processes.
+
+ Dependencies:
+     - concurrent.futures, contextlib, io, os, time, traceback
+     - telemetry.py
+===============================================================================
+"""
+
+import io
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import telemetry
+
+
+def default_workers():
+    """Worker processes from `PIPELINE_WORKERS`, or the number of CPUs."""
+    value = os.environ.get('PIPELINE_WORKERS')
+    if value:
+        return max(1, int(value))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows, macOS
+        return os.cpu_count() or 1
+
+
+def run_task(func, item, send_records=False):
+    """
+    Call `func(item)` and return a result dict instead of raising:
+    {'item', 'output', 'error', 'log', 'seconds', 'counts'} (rows / bytes in
+    and out), plus the telemetry 'records' of a worker with `send_records`.
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    output, error = None, None
+    with redirect_stdout(log), telemetry.span(item_name(item)) as span:
+        try:
+            output = func(item)
+        except Exception:
+            error = traceback.format_exc()
+            span.set(status='error')
+    result = {'item': item, 'output': output, 'error': error, 'log': log.getvalue(),
+              'seconds': time.perf_counter() - start, 'counts': span.counts}
+    if send_records:
+        result['records'] = telemetry.collect()
+    return result
+
+
+def run_per_file(func, items, workers=None, verbose=True):
+    """
+    Apply `func` to every item (file stem or path), in `workers` processes.
+    Returns the result dicts of `run_task` in the order of `items`.
+    """
+    items = list(items)
+    workers = 1 if telemetry.profiling() else min(workers or default_workers(), len(items)) or 1
+    results = []
+
+    if workers == 1:
+        for item in items:
+            results.append(run_task(func, item))
+            replay(results[-1], verbose)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_task, func, item, True) for item in items]
+        # Collect in submission order: logs and results do not depend on scheduling
+        for future in futures:
+            result = future.result()
+            telemetry.merge(result.pop('records'), result['counts'])
+            replay(result, verbose)
+            results.append(result)
+    return results
+
+
+def item_name(item):
+    """File name of a task item: a stem / path, or a dict with a 'path' (e.g. a plot spec)."""
+    return os.path.basename(str(item['path'] if isinstance(item, dict) else item))
+
+
+def replay(result, verbose=True):
+    if verbose and result['log']:
+        print(result['log'], end='')
+    if result['error']:
+        print(f"ERROR: {item_name(result['item'])} failed "
+              f"({result['error'].strip().splitlines()[-1]})")
+
+
+def describe_failure(result):
+    """Name of a failed file and the last lines of its traceback, for summaries."""
+    return f"  FAILED  {item_name(result['item'])}\n" + \
+        ''.join(f"    {line}\n" for line in result['error'].strip().splitlines()[-3:])
+
+
+def report_failures(results, stage=''):
+    """Print a summary of the processed and failed files; returns the number of failures."""
+    failed = [r for r in results if r['error']]
+    print(f"\n{stage + ': ' if stage else ''}{len(results) - len(failed)} of {len(results)} file(s) processed, "
+          f"{len(failed)} failed")
+    for r in failed:
+        print(describe_failure(r), end='')
+    return len(failed)
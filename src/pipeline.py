@@ -0,0 +1,527 @@
+"""
+===============================================================================
+ Script Name: pipeline.py
+ Author: Igor Latii
+ Description:
+     Single entry point for the whole pipeline. The stages are modelled as a
+     dependency graph:
+
+        collect ─┬─> long_estat ─┬─> format ─> merge ─> annual ─> features ─> eda
+                 └─> long_wb ────┘
+
+        collect      collecting_data.py (only with --collect: it needs the network)
+        long_estat   transform_to_long_format_EStat.py   (per file)
+        long_wb      transform_to_long_format_WB.py      (per file)
+        format       format_time_periods.py              (per file)
+        merge        make_merged_df.py
+        annual       aggregate_annual_indicators.py
+        features     feature_store.py
+        eda          eda_visualization.py
+
+     Rebuilds are incremental. For every output the runner stores a hash of
+     everything the output depends on in `/data/.pipeline_state.json`:
+        - the content of its input file(s);
+        - the source code of the stage script and of the local modules it
+          imports (storage.py, indicator_config.py, ...);
+        - its parameters: storage format, and for Eurostat tables the
+          dimension selection of that indicator in indicators.csv.
+     An output is rebuilt only when this hash changed or the output is
+     missing. The all-inputs stages (merge and after) also store the content
+     hash of every output they wrote, merge listing each frequency block of
+     its manifest, so that an output deleted or changed outside the runner is
+     rebuilt. Per-file stages rebuild only the files whose inputs changed, and
+     outputs whose input disappeared are deleted. Because downstream stages
+     hash file *contents*, a rebuilt file with unchanged content does not
+     trigger anything further.
+
+     File contents are hashed once and then remembered by size and
+     modification time, so an up-to-date run does not read the data again.
+
+     The files to rebuild in a per-file stage are processed in parallel worker
+     processes (see parallel.py). A failing file is reported and skipped; its
+     stale output is removed and it is retried on the next run.
+
+     With `--delta` (or `PIPELINE_DELTA=1`) merge, annual and features apply
+     only the changes since their last run: merge reads the indicators whose
+     formatted tables changed, rewrites their frequency blocks and the changed
+     rows of the wide CSV, annual reads and aggregates again the periods
+     holding a changed (geo, period) key and keeps the others, features
+     computes again the rows depending on a changed annual row. The state
+     keeps, per stage, the hashes of the files it wrote and the keys changed
+     since (`deltas`); when a stored file was changed outside the runner, or
+     code or parameters changed, the stage is rebuilt in full. The per-file
+     stages have no delta: a refreshed raw table is transformed and formatted
+     again over its whole history, and merge reads its indicator again in
+     full.
+
+     Every stage and every file it processes is measured (wall and CPU time,
+     peak memory, rows and bytes in / out, see telemetry.py). With
+     `--telemetry FILE` the measurements are saved as JSON lines, or as a
+     Chrome trace for a `.json` file; `--profile STAGE` runs one stage under
+     cProfile.
+
+ Usage:
+     python pipeline.py                   # incremental run of all local stages
+     python pipeline.py --collect         # download first (extra arguments go to collecting_data.py)
+     python pipeline.py --only format merge
+     python pipeline.py --force           # ignore the recorded hashes
+     python pipeline.py --dry-run         # only report what would be rebuilt
+     python pipeline.py --workers 8       # worker processes for the per-file stages
+     python pipeline.py --delta           # merge / annual / features apply only the changed periods
+     PIPELINE_ENGINE=sqlite python pipeline.py   # merge / annual as out-of-core SQL (sql_engine.py)
+     python pipeline.py --telemetry ../data/telemetry.jsonl --profile merge
+
+ Dependencies:
+     - hashlib, json, importlib, ast
+     - pipeline scripts in /src, telemetry.py
+===============================================================================
+"""
+
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import time
+from collections import namedtuple
+from functools import partial
+
+import telemetry
+from frequency_blocks import block_stems, manifest_path
+from indicator_config import dimension_filters_by_code, load_indicators, panel_enabled
+from parallel import describe_failure, run_per_file
+from pipeline_paths import base_dir, eda_dir, formatted_dir, long_dir, merged_dir, state_file
+from resampling import load_rules
+from storage import atomic_open, default_format, export_csv_enabled, find_table, remove_other_formats
+
+# === Stage graph ===
+# kind: 'map' stages turn each input file into one output file (or a fixed list
+# of them, e.g. the indicators of a World Bank bulk export), 'reduce' stages
+# turn all their inputs into a fixed set of outputs.
+Stage = namedtuple('Stage', ['name', 'module', 'deps', 'kind'])
+
+STAGES = [
+    Stage('collect', 'collecting_data', [], 'external'),
+    Stage('long_estat', 'transform_to_long_format_EStat', ['collect'], 'map'),
+    Stage('long_wb', 'transform_to_long_format_WB', ['collect'], 'map'),
+    Stage('format', 'format_time_periods', ['long_estat', 'long_wb'], 'map'),
+    Stage('merge', 'make_merged_df', ['format'], 'reduce'),
+    Stage('annual', 'aggregate_annual_indicators', ['merge'], 'reduce'),
+    Stage('features', 'feature_store', ['annual'], 'reduce'),
+    Stage('eda', 'eda_visualization', ['annual', 'features'], 'reduce'),
+]
+
+
+def topological_order(stages):
+    """Order `stages` so that every stage comes after its dependencies."""
+    by_name = {s.name: s for s in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Dependency cycle at stage '{stage.name}'")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+# === Hashing ===
+def digest(obj):
+    """Stable SHA-1 of a JSON-serialisable object."""
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def local_modules(module, seen=None):
+    """`module` and the modules of /src it imports, directly or indirectly."""
+    seen = set() if seen is None else seen
+    path = os.path.join(base_dir, module + '.py')
+    if module in seen or not os.path.exists(path):
+        return seen
+    seen.add(module)
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_modules(name.split('.')[0], seen)
+    return seen
+
+
+def code_hash(module):
+    """Hash of the source of a stage script and of the local modules it imports."""
+    h = hashlib.sha1()
+    for name in sorted(local_modules(module)):
+        with open(os.path.join(base_dir, name + '.py'), 'rb') as f:
+            h.update(name.encode('utf-8') + b'\0' + f.read())
+    return h.hexdigest()
+
+
+class FileHasher:
+    """
+    Content hashes of files, remembered by (size, mtime) between runs so that
+    unchanged files are not read again.
+    """
+
+    def __init__(self, memo=None):
+        self.memo = memo or {}
+        self.hashed = 0  # files actually read in this run
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        known = self.memo.get(key)
+        if known and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns:
+            return known['sha1']
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        self.hashed += 1
+        self.memo[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': h.hexdigest()}
+        return self.memo[key]['sha1']
+
+    def table_hash(self, stem):
+        """Hash of a table given its stem (or a plain file path)."""
+        path = stem if os.path.isfile(stem) else find_table(stem)
+        return self.file_hash(path) if path else None
+
+
+# === Runner state ===
+def load_state(path=state_file):
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state, path=state_file):
+    with atomic_open(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def output_exists(path):
+    return os.path.exists(path) or find_table(path) is not None
+
+
+def remove_output(path):
+    if os.path.isfile(path):
+        os.remove(path)
+    else:
+        remove_other_formats(path, keep=[])
+
+
+# === Stage adapters ===
+# Each adapter imports its script and describes the work of the stage:
+#   map:    inputs, output(input) or outputs(input), params(input), run(input)
+#   reduce: inputs, outputs, params, run()
+# `run` of map stages is sent to worker processes (parallel.py), so it is a
+# partial of a module-level function rather than a lambda.
+def stage_long_estat(module):
+    dimension_filters = dimension_filters_by_code(load_indicators())
+    return {'inputs': module.input_stems(), 'output': module.output_stem,
+            'params': lambda stem: module.file_params(stem, dimension_filters),
+            'run': partial(module.transform_file, output_dir=long_dir, dimension_filters=dimension_filters)}
+
+
+def stage_long_wb(module):
+    indicators = load_indicators()
+    return {'inputs': module.input_stems(), 'outputs': lambda path: module.output_stems(path, long_dir, indicators),
+            'params': lambda path: module.file_params(path, indicators),
+            'run': partial(module.transform_file, output_dir=long_dir)}
+
+
+def stage_format(module):
+    return {'inputs': module.input_stems(), 'output': module.output_stem,
+            'params': lambda stem: {}, 'run': partial(module.format_file, output_dir=formatted_dir)}
+
+
+def stage_merge(module):
+    stems = module.input_stems()
+    stem = module.output_stem(merged_dir)
+    # Column names come from indicators.csv and the metadata cache: a new label rebuilds the merge
+    label_of = module.indicator_labels()
+    names = {key: module.column_name(key, label_of) for key in module.group_tables(stems, panel_enabled())}
+
+    def outputs():
+        # The manifest and the block tables it lists (listed again after a run that adds or drops a frequency)
+        return [manifest_path(stem)] + block_stems(stem)
+
+    return {'inputs': stems, 'outputs': outputs, 'params': {'names': names},
+            'run': lambda: module.merge_tables(stems, merged_dir),
+            'delta': lambda changed, keys: module.update_tables(stems, changed, merged_dir),
+            'products': outputs}
+
+
+def stage_annual(module):
+    # The merged dataset is a manifest plus one table per frequency block
+    inputs = [manifest_path(module.input_file)] + block_stems(module.input_file)
+    outputs = [module.output_stem(t) for t in module.targets] + [module.periods_stem(t) for t in module.targets]
+
+    def delta(changed, keys):
+        # Only the periods of the keys changed by the merge (None: not known, full run); passed on as they are
+        if keys is None or module.update(keys, module.input_file, module.targets, merged_dir) is None:
+            return None
+        return keys
+
+    return {'inputs': inputs, 'outputs': outputs,
+            'params': {'targets': module.targets, 'rules': load_rules().to_csv()},
+            'run': lambda: module.aggregate(module.input_file, module.targets, merged_dir),
+            'delta': delta, 'products': lambda: outputs}
+
+
+def stage_features(module):
+    outputs = [module.output_stem(merged_dir), module.levels_stem(merged_dir)]
+
+    def delta(changed, keys):
+        # The changed annual rows are found by comparing with the stored levels; None: full run
+        return module.update(module.input_file, merged_dir)
+
+    return {'inputs': [module.input_file], 'outputs': outputs,
+            'params': {'features': module.load_features().to_csv()},
+            'run': lambda: module.build(module.input_file, merged_dir),
+            'delta': delta, 'products': lambda: outputs}
+
+
+def stage_eda(module):
+    return {'inputs': [module.input_file, module.features_stem(module.input_file)], 'outputs': [eda_dir],
+            'params': {'grid': module.timeseries_grid, 'rqs': module.RQs},
+            'run': lambda: module.run_eda(module.input_file, eda_dir)}
+
+
+ADAPTERS = {'long_estat': stage_long_estat, 'long_wb': stage_long_wb, 'format': stage_format,
+            'merge': stage_merge, 'annual': stage_annual, 'features': stage_features, 'eda': stage_eda}
+
+
+# === Execution ===
+def source_outputs(work, source):
+    """Outputs of one input file of a map stage."""
+    return work['outputs'](source) if 'outputs' in work else [work['output'](source)]
+
+
+def run_map_stage(stage, work, record, hasher, common, force, dry_run, workers=None):
+    """Rebuild the outputs of a per-file stage whose inputs changed; returns the new record."""
+    new_record, counts = {}, {'rebuilt': 0, 'skipped': 0, 'removed': 0, 'failed': 0}
+    keys, outputs, todo = {}, {}, []
+    for source in work['inputs']:
+        outputs[source] = source_outputs(work, source)
+        keys[source] = key = digest({**common, 'input': hasher.table_hash(source), 'params': work['params'](source)})
+        if not force and all(record.get(o) == key and output_exists(o) for o in outputs[source]):
+            counts['skipped'] += 1
+            new_record.update(dict.fromkeys(outputs[source], key))
+        else:
+            todo.append(source)
+
+    # --- Rebuild the changed files in worker processes ---
+    if dry_run:
+        counts['rebuilt'] = len(todo)
+        new_record.update({o: keys[s] for s in todo for o in outputs[s]})
+    else:
+        for result in run_per_file(work['run'], todo, workers):
+            source = result['item']
+            if result['error']:
+                # Do not leave the outputs of the previous input behind; retried on the next run
+                for output in outputs[source]:
+                    if output_exists(output):
+                        remove_output(output)
+                counts['failed'] += 1
+                counts.setdefault('errors', []).append(result)
+            else:
+                counts['rebuilt'] += 1
+                new_record.update(dict.fromkeys(outputs[source], keys[source]))
+
+    # Outputs whose input no longer exists would otherwise be merged downstream
+    for output in set(record) - set(new_record) - {o for s in todo for o in outputs[s]}:
+        if output_exists(output):
+            if not dry_run:
+                remove_output(output)
+            counts['removed'] += 1
+    return (record if dry_run else new_record), counts
+
+
+def run_reduce_stage(stage, work, record, hasher, common, force, dry_run, workers=None, delta=None):
+    """
+    Rebuild the outputs of an all-inputs stage if any input changed or an
+    output is missing or no longer the one written; returns the new record
+    ({output: [key, content hash]}). With `delta` (see delta_base) the adapter's delta
+    function applies only the changes, with a full rebuild when it returns
+    None; counts['keys'] are the keys it changed (None after a full rebuild).
+    """
+    inputs = {os.path.basename(s): hasher.table_hash(s) for s in work['inputs']}
+    key = digest({**common, 'inputs': inputs, 'params': work['params']})
+    outputs = reduce_outputs(work)
+    if not force and all(output_exists(o) and record.get(o) == [key, hasher.table_hash(o)] for o in outputs):
+        return record, {'rebuilt': 0, 'skipped': len(outputs), 'removed': 0, 'failed': 0}
+    if dry_run:
+        return record, {'rebuilt': len(outputs), 'skipped': 0, 'removed': 0, 'failed': 0}
+    counts = {'rebuilt': len(outputs), 'skipped': 0, 'removed': 0, 'failed': 0, 'keys': None}
+    if delta is not None and not force:
+        changed = sorted(n for n in set(inputs) | set(delta['inputs']) if inputs.get(n) != delta['inputs'].get(n))
+        counts['keys'] = work['delta'](changed, delta['keys'])
+    if counts['keys'] is None:
+        work['run']()
+    return {o: [key, hasher.table_hash(o)] for o in reduce_outputs(work)}, counts
+
+
+def reduce_outputs(work):
+    """Outputs of an all-inputs stage: a list, or a function listing them (merge: the blocks of its manifest)."""
+    outputs = work['outputs']
+    return outputs() if callable(outputs) else outputs
+
+
+# === Delta updates ===
+# For the stages with a 'delta' function, state['deltas'][stage] keeps what
+# a delta update builds on: the base hash (code, format, parameters), the
+# input hashes and the hashes of the files the stage wrote at its last run,
+# and the keys changed since then by the stage before it (None: unknown).
+def delta_enabled():
+    return os.environ.get('PIPELINE_DELTA', '').lower() in ('1', 'true', 'yes')
+
+
+def delta_base(stage, work, state, hasher, common):
+    """
+    The last run of `stage` for a delta update, or None when it has to be
+    rebuilt in full: other code or parameters, its files or the files it
+    reads from an earlier stage changed since they were written by the
+    runner (e.g. by a script run on its own).
+    """
+    deltas = state.get('deltas', {})
+    previous = deltas.get(stage.name)
+    if 'delta' not in work or previous is None or previous['base'] != digest({**common, 'params': work['params']}):
+        return None
+    written = {**previous['products'], **{name: h for dep in stage.deps for name, h in
+                                          deltas.get(dep, {}).get('products', {}).items()}}
+    current = {os.path.basename(p): hasher.table_hash(p) for p in work['products']() + work['inputs']}
+    if any(current.get(name, h) != h for name, h in written.items() if name in current):
+        return None
+    if any(current.get(name) is None for name in previous['products']):
+        return None
+    return previous
+
+
+def record_delta(stage, work, state, hasher, common, counts):
+    """After a rebuild of `stage`: its delta base, and its changed keys for the stages after it."""
+    deltas = state.setdefault('deltas', {})
+    if 'products' in work:
+        deltas[stage.name] = {'base': digest({**common, 'params': work['params']}), 'keys': [],
+                              'inputs': {os.path.basename(s): hasher.table_hash(s) for s in work['inputs']},
+                              'products': {os.path.basename(p): hasher.table_hash(p) for p in work['products']()}}
+    for after in STAGES:
+        if stage.name in after.deps and after.name in deltas:
+            pending, keys = deltas[after.name]['keys'], counts.get('keys')
+            merged = None if pending is None or keys is None else {tuple(k) for k in pending + keys}
+            deltas[after.name]['keys'] = None if merged is None else [list(k) for k in sorted(
+                merged, key=lambda k: (k[0] or '', k[1]))]
+
+
+def run_stage(stage, state, hasher, force=False, dry_run=False, collect_args=None, workers=None, delta=False):
+    """Run one stage of the graph (incrementally) and record it in `state`; returns its counts."""
+    start = time.perf_counter()
+    print(f"\n=== Stage {stage.name} ({stage.module}.py) ===")
+    module = importlib.import_module(stage.module)
+
+    if stage.kind == 'external':
+        # Downloads are not hashed here: collecting_data.py has its own freshness checks (download_cache.py)
+        if not dry_run:
+            module.main(collect_args or [])
+        return {'rebuilt': 1, 'skipped': 0, 'removed': 0, 'failed': 0, 'seconds': time.perf_counter() - start}
+
+    work = ADAPTERS[stage.name](module)
+    common = {'code': code_hash(stage.module), 'format': default_format(), 'export_csv': export_csv_enabled(),
+              'panel': panel_enabled()}
+    record = state['stages'].get(stage.name, {})
+    if stage.kind == 'map':
+        state['stages'][stage.name], counts = run_map_stage(stage, work, record, hasher, common, force, dry_run,
+                                                            workers)
+    else:
+        base = delta_base(stage, work, state, hasher, common) if delta else None
+        state['stages'][stage.name], counts = run_reduce_stage(stage, work, record, hasher, common, force,
+                                                               dry_run, workers, base)
+        if counts['rebuilt'] and not dry_run:
+            record_delta(stage, work, state, hasher, common, counts)
+    counts['seconds'] = time.perf_counter() - start
+
+    if not dry_run:
+        state['files'] = hasher.memo
+        save_state(state) # Keep the progress of finished stages if a later stage fails
+    mode = f", delta: {len(counts['keys'])} key(s)" if counts.get('keys') is not None else ''
+    print(f"--- {stage.name}: {counts['rebuilt']} rebuilt{mode}, {counts['skipped']} up to date, "
+          f"{counts['removed']} removed, {counts['failed']} failed ({counts['seconds']:.2f}s)")
+    return counts
+
+
+def run_pipeline(only=None, force=False, dry_run=False, collect=False, collect_args=None, workers=None,
+                 delta=None):
+    """Run the stage graph incrementally (`delta`: delta updates, default PIPELINE_DELTA); returns {stage: counts}."""
+    delta = delta_enabled() if delta is None else delta
+    state = load_state()
+    hasher = FileHasher(state.get('files'))
+    selected = set(only) if only else {s.name for s in STAGES}
+    if not collect and not (only and 'collect' in only):
+        selected.discard('collect')
+    summary = {}
+
+    for stage in topological_order(STAGES):
+        if stage.name not in selected:
+            continue
+        with telemetry.stage(stage.name, module=stage.module) as span:
+            summary[stage.name] = counts = run_stage(stage, state, hasher, force, dry_run, collect_args, workers,
+                                                     delta)
+            span.set(**{k: counts[k] for k in ('rebuilt', 'skipped', 'removed', 'failed')})
+    return summary
+
+
+def print_summary(summary, elapsed, dry_run):
+    print(f"\n=== Pipeline {'plan' if dry_run else 'summary'} ({elapsed:.2f}s) ===")
+    for name, c in summary.items():
+        print(f"  {name:<11} {c['rebuilt']:>4} {'to rebuild' if dry_run else 'rebuilt':<10} "
+              f"{c['skipped']:>4} up to date  {c['removed']:>3} removed  {c['failed']:>3} failed  {c['seconds']:6.2f}s")
+    failures = [r for c in summary.values() for r in c.get('errors', [])]
+    for r in failures:
+        print(describe_failure(r), end='')
+    return len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline stages incrementally.",
+                                     epilog="Unknown arguments are passed on to collecting_data.py with --collect.")
+    parser.add_argument('--only', nargs='+', choices=[s.name for s in STAGES], help="run only these stages")
+    parser.add_argument('--force', action='store_true', help="rebuild everything, ignoring the recorded hashes")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be rebuilt")
+    parser.add_argument('--collect', action='store_true', help="download the indicators first (network)")
+    parser.add_argument('--delta', action='store_true', default=None,
+                        help="apply only the new / revised periods in merge, annual and features "
+                             "(default: PIPELINE_DELTA)")
+    parser.add_argument('--workers', type=int, help="worker processes for per-file stages (default: PIPELINE_WORKERS or CPUs)")
+    parser.add_argument('--telemetry', help="save stage / file measurements: JSON lines, or a Chrome trace (.json) "
+                                            "(default: PIPELINE_TELEMETRY)")
+    parser.add_argument('--profile', choices=[s.name for s in STAGES],
+                        help="run this stage under cProfile (default: PIPELINE_PROFILE)")
+    args, collect_args = parser.parse_known_args()
+    if collect_args and not args.collect:
+        parser.error(f"unrecognized arguments: {' '.join(collect_args)}")
+    telemetry.configure(args.telemetry, args.profile)
+
+    start = time.perf_counter()
+    summary = run_pipeline(args.only, args.force, args.dry_run, args.collect, collect_args, args.workers,
+                           args.delta)
+    if print_summary(summary, time.perf_counter() - start, args.dry_run):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+===============================================================================
+ Module Name: pipeline_paths.py
+ Author: Igor Latii
+ Description:
+     Directory layout of the pipeline, shared by all stages and the runner
+     (`pipeline.py`). The scripts used to build these paths themselves, partly
+     relative to the current working directory (`../data/...`), so they only
+     worked when started from `/src`.
+
+     All paths are absolute and derived from the data directory, which is
+     `/data` next to `/src` unless the environment variable
+     `PIPELINE_DATA_DIR` points elsewhere (e.g. a scratch copy of the data).
+     The configuration files (indicators.csv, resampling.csv) are read from
+     `/reports`, or from `PIPELINE_REPORTS_DIR` (e.g. a synthetic
+     configuration, see benchmarks/synthetic_data.py).
+
+ Dependencies:
+     - os
+===============================================================================
+"""
+
+import os
+
+# === Root directories ===
+base_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.abspath(os.environ.get('PIPELINE_DATA_DIR', os.path.join(base_dir, '..', 'data')))
+reports_dir = os.path.abspath(os.environ.get('PIPELINE_REPORTS_DIR', os.path.join(base_dir, '..', 'reports')))
+
+# === Stage directories ===
+raw_dir = os.path.join(data_dir, 'raw')                                                # collecting_data.py
+cache_dir = os.path.join(data_dir, 'cache', 'raw')                                     # raw download cache
+metadata_dir = os.path.join(data_dir, 'cache', 'metadata')                             # eurostat_metadata.py
+sql_dir = os.path.join(data_dir, 'cache', 'sql')                                       # sql_engine.py work databases
+long_dir = os.path.join(data_dir, 'processed', 'transformed_to_long_format')           # transform_*.py
+formatted_dir = os.path.join(data_dir, 'processed', 'formatted_time_periods')          # format_time_periods.py
+merged_dir = os.path.join(data_dir, 'processed', 'merged')                             # make_merged_df.py
+eda_dir = os.path.join(data_dir, 'eda_plots')                                          # eda_visualization.py
+profiles_dir = os.path.join(data_dir, 'profiles')                                      # cProfile output (telemetry.py)
+
+# === Runner state (hashes of the inputs of every stage output) ===
+state_file = os.path.join(data_dir, '.pipeline_state.json')
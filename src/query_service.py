@@ -0,0 +1,407 @@
+"""
+===============================================================================
+ Module Name: query_service.py
+ Author: Igor Latii
+ Description:
+     Local query service over the outputs of the pipeline, for dashboards
+     that would otherwise read `merged_df_readable.csv` / `merged_df_annual.csv`
+     again and filter them with pandas on every request.
+
+     The datasets are loaded once into typed arrays, one block per dataset
+     and frequency:
+        - merged      frequency blocks of make_merged_df.py (A, S, Q, M, ...);
+        - annual      outputs of aggregate_annual_indicators.py
+          quarterly   (`merged_df_annual`, `merged_df_quarterly`,
+          monthly     `merged_df_monthly`, when they were built).
+     A block holds the period of every row as int64 nanoseconds, its period
+     label ('2024', '2024-Q1', '2024-03'), the indicators as one float64
+     column each, the position of every indicator name and, in panel mode
+     (see indicator_config.py), the row range of every geo (rows are sorted
+     by geo, then period). A slice by indicator, geo, time range and
+     frequency is then a dictionary lookup per geo and two binary searches
+     per geo range (`np.searchsorted`), without scanning the table; rows
+     where none of the requested indicators has a value are dropped.
+
+     Results are kept in an LRU cache (`--cache-size` entries, as DataFrames
+     in-process and as encoded JSON for HTTP), so repeated queries cost one
+     lookup. At most every `--check-interval` seconds, a query checks the
+     modification times of the output files: when the pipeline wrote new
+     outputs, the datasets are loaded again and the cache is emptied.
+     While a reload fails (outputs half written), the previous data is served.
+
+     HTTP endpoints (JSON):
+        GET /query?dataset=annual&indicator=GDP (Quarterly)&geo=LV;EE&start=2010&end=2020-06&freq=Q
+            `indicator` and `geo` may be repeated or ';'-separated; `start` /
+            `end` are inclusive periods ('2010', '2010-03', '2010-03-15').
+            Returns {"dataset", "blocks": {freq: {"columns", "data"}}}.
+        GET /catalog   datasets, frequencies, indicators, geos and period range
+        GET /stats     cache hits / misses, reloads, rows loaded
+
+ Usage:
+     python query_service.py serve [--port 8765] [--cache-size 1024] [--check-interval 1]
+     python query_service.py query --dataset annual --indicator 'Unemployment Rate' --start 2015
+
+     In-process:
+         service = QueryService()
+         blocks = service.query('merged', ['GDP (Quarterly)'], start='2015', freq=['Q'])
+
+ Dependencies:
+     - pandas, numpy
+     - argparse, functools, json, os, threading, time, http.server, urllib
+     - storage.py, pipeline_paths.py, frequency_blocks.py,
+       aggregate_annual_indicators.py
+===============================================================================
+"""
+
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from aggregate_annual_indicators import output_names
+from aggregate_annual_indicators import output_stem as target_stem
+from frequency_blocks import block_stem, manifest_path, read_block, read_manifest
+from pipeline_paths import merged_dir
+from storage import find_table, read_table
+
+# === Datasets ===
+merged_name = 'merged_df_readable'
+TARGET_DATASETS = {target: name.replace('merged_df_', '') for target, name in output_names.items()}
+
+
+def period_labels(times, freq):
+    """Labels of period starts: '2024' (A), '2024-S1', '2024-Q1', '2024-03' (M), '2024-03-15' (W, D)."""
+    dates = pd.DatetimeIndex(times)
+    years = dates.year.astype(str)
+    if freq == 'A':
+        return np.asarray(years, dtype=object)
+    if freq in ('S', 'Q'):
+        parts = (dates.month - 1) // (6 if freq == 'S' else 3) + 1
+        return np.asarray(years + f"-{freq}" + parts.astype(str), dtype=object)
+    return np.asarray(dates.strftime('%Y-%m' if freq == 'M' else '%Y-%m-%d'), dtype=object)
+
+
+def parse_bound(value, end=False):
+    """Inclusive time bound in int64 nanoseconds: start (or end) of the period '2010', '2010-03', '2010-03-15'."""
+    if value is None or value == '':
+        return None
+    period = pd.Period(str(value))
+    return (period.end_time if end else period.start_time).value
+
+
+class Block:
+    """One dataset and frequency as typed arrays, with row ranges per geo and sorted periods."""
+
+    def __init__(self, df, freq):
+        self.freq = freq
+        if 'Year' in df.columns: # annual outputs of resampling.py
+            df = df.rename(columns={'Year': 'TIME_PERIOD'})
+            df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'].astype(str), format='%Y')
+        elif not pd.api.types.is_datetime64_any_dtype(df['TIME_PERIOD']):
+            df['TIME_PERIOD'] = pd.to_datetime(df['TIME_PERIOD'].astype(str)) # CSV tables
+        times = df['TIME_PERIOD'].to_numpy('datetime64[ns]').view('int64')
+        geos = df['geo'].astype(str).to_numpy() if 'geo' in df.columns else None
+        order = np.lexsort((times,) if geos is None else (times, pd.factorize(geos, sort=True)[0]))
+        self.times = times[order]
+        self.labels = period_labels(self.times, freq)
+        self.names = [c for c in df.columns if c not in ('geo', 'TIME_PERIOD')]
+        self.columns = {name: j for j, name in enumerate(self.names)}
+        self.values = np.asfortranarray(df[self.names].to_numpy('float64')[order])
+        self.geos, self.bounds = None, {None: (0, len(order))}
+        if geos is not None:
+            self.geos = geos[order].astype(object)
+            codes, first = np.unique(self.geos, return_index=True)
+            self.bounds = {code: (int(lo), int(hi)) for code, lo, hi in zip(codes, first, [*first[1:], len(order)])}
+
+    def rows(self, geos=None, start=None, end=None):
+        """Row positions of the geos (all if None) within [start, end], in geo and period order."""
+        if self.geos is None or not geos:
+            ranges = self.bounds.values()
+        else:
+            ranges = [self.bounds[g] for g in geos if g in self.bounds]
+        parts = []
+        for lo, hi in ranges:
+            if start is not None:
+                lo += int(np.searchsorted(self.times[lo:hi], start, 'left'))
+            if end is not None:
+                hi = lo + int(np.searchsorted(self.times[lo:hi], end, 'right'))
+            if hi > lo:
+                parts.append(np.arange(lo, hi))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def frame(self, rows, names):
+        """Rows `rows` of the indicators `names` where at least one of them has a value."""
+        values = self.values[np.ix_(rows, [self.columns[n] for n in names])]
+        keep = ~np.isnan(values).all(axis=1)
+        rows, values = rows[keep], values[keep]
+        keys = {} if self.geos is None else {'geo': self.geos[rows]}
+        keys['TIME_PERIOD'] = self.labels[rows]
+        return pd.DataFrame({**keys, **dict(zip(names, values.T))})
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes + self.labels.nbytes
+
+
+# === Loading ===
+def dataset_files(directory=merged_dir):
+    """Output files read by the service, as {dataset: [paths]} (only those present)."""
+    files = {}
+    stem = os.path.join(directory, merged_name)
+    if os.path.exists(manifest_path(stem)):
+        blocks = (find_table(block_stem(stem, f)) for f in read_manifest(stem)['blocks'])
+        files['merged'] = [manifest_path(stem)] + [p for p in blocks if p]
+    for target, name in TARGET_DATASETS.items():
+        path = find_table(target_stem(target, directory))
+        if path:
+            files[name] = [path]
+    return files
+
+
+def signature(directory=merged_dir):
+    """Modification time and size of every output file: changes when the pipeline writes new outputs."""
+    stamps = []
+    for paths in dataset_files(directory).values():
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def load_datasets(directory=merged_dir):
+    """All datasets of `directory` as {dataset: {freq: Block}}."""
+    datasets = {}
+    stem = os.path.join(directory, merged_name)
+    if os.path.exists(manifest_path(stem)):
+        manifest = read_manifest(stem)
+        keys = manifest.get('keys', ['TIME_PERIOD'])
+        datasets['merged'] = {freq: Block(read_block(stem, freq, keys), freq) for freq in manifest['blocks']}
+    for target, name in TARGET_DATASETS.items():
+        if find_table(target_stem(target, directory)):
+            datasets[name] = {target: Block(read_table(target_stem(target, directory)), target)}
+    return datasets
+
+
+class QueryService:
+    """Indexed, cached slices of the pipeline outputs of `directory`, reloaded when they change."""
+
+    def __init__(self, directory=merged_dir, cache_size=1024, check_interval=1.0):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.stats = {'reloads': 0, 'failed_reloads': 0, 'load_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._signature = None
+        self.datasets = {}
+        self._reset_caches()
+        self.reload()
+
+    def _reset_caches(self):
+        self._query = functools.lru_cache(self.cache_size)(self._slice)
+        self._json = functools.lru_cache(self.cache_size)(self._encode)
+
+    # --- Reloading ---
+    def reload(self):
+        """Load the datasets again if their files changed; returns True when new data was loaded."""
+        with self._lock:
+            current = signature(self.directory)
+            if current == self._signature:
+                return False
+            start = time.perf_counter()
+            try:
+                datasets = load_datasets(self.directory)
+            except (OSError, ValueError, KeyError) as e:
+                # Outputs being rewritten: keep serving the previous data, retry at the next check
+                self.stats['failed_reloads'] += 1
+                print(f"WARNING: reload of {self.directory} failed, previous data kept: {e}")
+                return False
+            self.datasets, self._signature = datasets, current
+            self._reset_caches()
+            self.stats['reloads'] += 1
+            self.stats['load_seconds'] = time.perf_counter() - start
+            return True
+
+    def check(self):
+        """Reload if the check interval has elapsed and the outputs changed."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self.reload()
+
+    # --- Queries ---
+    def _slice(self, dataset, indicators, geos, start, end, freqs):
+        if dataset not in self.datasets:
+            raise KeyError(f"Unknown dataset '{dataset}' (available: {', '.join(self.datasets)})")
+        blocks = self.datasets[dataset]
+        if indicators:
+            known = {name for block in blocks.values() for name in block.columns}
+            unknown = [name for name in indicators if name not in known]
+            if unknown:
+                raise KeyError(f"Unknown indicator(s) in {dataset}: {', '.join(unknown)}")
+        start, end = parse_bound(start), parse_bound(end, end=True)
+        result = {}
+        for freq, block in blocks.items():
+            if freqs and freq not in freqs:
+                continue
+            names = [n for n in indicators if n in block.columns] if indicators else block.names
+            if names:
+                result[freq] = block.frame(block.rows(geos, start, end), names)
+        return result
+
+    def _encode(self, dataset, indicators, geos, start, end, freqs):
+        blocks = self._query(dataset, indicators, geos, start, end, freqs)
+        parts = [f'{json.dumps(freq)}:{df.to_json(orient="split", index=False)}' for freq, df in blocks.items()]
+        return f'{{"dataset":{json.dumps(dataset)},"blocks":{{{",".join(parts)}}}}}'.encode('utf-8')
+
+    def query(self, dataset='merged', indicators=None, geos=None, start=None, end=None, freq=None):
+        """
+        Slice of `dataset` as {freq: DataFrame(geo, TIME_PERIOD, indicators...)}:
+        the `indicators` (default all), `geos` (panel datasets, default all),
+        periods from `start` to `end` inclusive and frequencies `freq`. The
+        DataFrames are shared with the cache: do not modify them.
+        """
+        self.check()
+        return self._query(dataset, *normalize(indicators, geos, start, end, freq))
+
+    def query_json(self, dataset='merged', indicators=None, geos=None, start=None, end=None, freq=None):
+        """Same slice as `query`, encoded as JSON bytes (cached)."""
+        self.check()
+        return self._json(dataset, *normalize(indicators, geos, start, end, freq))
+
+    def catalog(self):
+        """Datasets with, per frequency, their indicators, geos and period range."""
+        self.check()
+        return {name: {freq: {'indicators': block.names, 'rows': len(block.times),
+                              'geos': [g for g in block.bounds if g is not None],
+                              'first': block.labels[0] if len(block.labels) else None,
+                              'last': block.labels[-1] if len(block.labels) else None}
+                       for freq, block in blocks.items()}
+                for name, blocks in self.datasets.items()}
+
+    def cache_stats(self):
+        info = self._query.cache_info()
+        encoded = self._json.cache_info()
+        return {**self.stats, 'hits': info.hits + encoded.hits, 'misses': info.misses + encoded.misses,
+                'cached': info.currsize + encoded.currsize,
+                'loaded_mb': sum(b.nbytes for blocks in self.datasets.values() for b in blocks.values()) / 1024 ** 2}
+
+
+def as_tuple(values):
+    """Query parameter(s) as a tuple: None, 'LV;EE' or ['LV', 'EE;LT'] -> ('LV', 'EE', 'LT')."""
+    if values is None:
+        return ()
+    if isinstance(values, str):
+        values = [values]
+    return tuple(v.strip() for value in values for v in str(value).split(';') if v.strip())
+
+
+def normalize(indicators, geos, start, end, freq):
+    """Hashable cache key of a query (the same slice always gives the same key)."""
+    return (as_tuple(indicators), as_tuple(geos), None if start in (None, '') else str(start),
+            None if end in (None, '') else str(end), tuple(f.upper() for f in as_tuple(freq)))
+
+
+# === HTTP server ===
+def first_param(params, name):
+    """First value of the query string parameter `name` (None when absent)."""
+    return params.get(name, [None])[0]
+
+
+def make_handler(service):
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'    # keep-alive connections
+        disable_nagle_algorithm = True  # headers and body are separate writes
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            try:
+                if url.path == '/query':
+                    body = service.query_json(first_param(params, 'dataset') or 'merged', params.get('indicator'),
+                                              params.get('geo'), first_param(params, 'start'),
+                                              first_param(params, 'end'), params.get('freq'))
+                elif url.path == '/catalog':
+                    body = json.dumps(service.catalog(), ensure_ascii=False).encode('utf-8')
+                elif url.path == '/stats':
+                    body = json.dumps(service.cache_stats()).encode('utf-8')
+                else:
+                    return self.send_json(404, json.dumps({'error': f"Unknown path {url.path}"}).encode('utf-8'))
+            except (KeyError, ValueError) as e:
+                message = e.args[0] if e.args else str(e)
+                return self.send_json(400, json.dumps({'error': str(message)}, ensure_ascii=False).encode('utf-8'))
+            self.send_json(200, body)
+
+        def send_json(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return QueryHandler
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """HTTP server answering the queries of `service` (one thread per connection)."""
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query service over the merged and annual datasets.")
+    parser.add_argument('--dir', default=merged_dir, help="directory of the merged / annual outputs")
+    parser.add_argument('--cache-size', type=int, default=1024, help="cached query results")
+    parser.add_argument('--check-interval', type=float, default=1.0, help="seconds between checks for new outputs")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="run the HTTP service")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    query = commands.add_parser('query', help="print one slice")
+    query.add_argument('--dataset', default='merged')
+    query.add_argument('--indicator', action='append')
+    query.add_argument('--geo', action='append')
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--freq', action='append')
+    args = parser.parse_args(argv)
+
+    service = QueryService(args.dir, args.cache_size, args.check_interval)
+    stats = service.cache_stats()
+    print(f"Loaded {', '.join(service.datasets) or 'no datasets'} from {args.dir} "
+          f"({stats['loaded_mb']:.1f} MB in {stats['load_seconds']:.2f}s)")
+    if args.command == 'serve':
+        server = make_server(service, args.host, args.port)
+        print(f"Serving on http://{args.host}:{server.server_address[1]}/ (/query, /catalog, /stats)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        try:
+            result = service.query(args.dataset, args.indicator, args.geo, args.start, args.end, args.freq)
+        except (KeyError, ValueError) as e:
+            # Same message as the HTTP error response; exit status 1
+            message = e.args[0] if e.args else str(e)
+            raise SystemExit(f"ERROR: {message}")
+        for freq, df in result.items():
+            print(f"\n=== {args.dataset} {freq}: {len(df)} rows ===")
+            print(df.to_string(index=False, max_rows=40))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+===============================================================================
+ Module Name: resampling.py
+ Author: Igor Latii
+ Description:
+     Resampling engine of the merged dataset, used by
+     `aggregate_annual_indicators.py`. It converts the frequency blocks of the
+     merged dataset (see frequency_blocks.py) to one annual, quarterly or
+     monthly table, with the rules of every indicator read from
+     `/reports/resampling.csv`:
+
+        - indicator      merged column name (e.g. `GDP (Quarterly)`);
+        - aggregation    sum | mean | first | last | min | max | weighted
+                         (`weighted`: mean weighted by the length in days of
+                         the source periods, e.g. months of 28-31 days);
+        - min_count      observations needed in a target period for a value
+                         (default 0: an empty period gives a total of 0 with
+                         `sum`, and a missing value otherwise);
+        - interpolation  none | linear | ffill, applied to the missing target
+                         periods after aggregation;
+        - max_gap        longest gap (in target periods) that is filled; empty
+                         means any length. `linear` only fills gaps between two
+                         observations, `ffill` at most `max_gap` periods after
+                         the last observation.
+
+     Only the indicators listed in the rules are kept, in the order of the
+     file. Aggregation runs per block and per rule (all columns sharing a rule
+     in one groupby), and interpolation runs over all columns of a rule at
+     once with numpy, without a Python loop over indicators or series.
+
+     Rows can additionally be grouped by key columns (`by`, e.g. ['geo'] for
+     a multi-country panel); periods and gaps are then handled per group.
+
+     A series of lower frequency than the target (annual GDP in a quarterly
+     table) is not split: its value goes to the target period that contains
+     its own start date.
+
+     `resample` runs in two steps: `aggregate_periods` (one row per target
+     period, from the observations of that period only) and `complete` (zero
+     totals and interpolation across periods). Keeping the aggregated periods
+     lets aggregate_annual_indicators.py recompute only the periods with new
+     or revised observations.
+
+ Dependencies:
+     - pandas, numpy
+     - os
+     - pipeline_paths.py
+===============================================================================
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline_paths import reports_dir
+
+# === Configuration ===
+rules_path = os.path.join(reports_dir, 'resampling.csv')
+
+AGGREGATIONS = ['sum', 'mean', 'first', 'last', 'min', 'max', 'weighted']
+INTERPOLATIONS = ['none', 'linear', 'ffill']
+TARGETS = ['A', 'Q', 'M']                        # Supported target frequencies
+MONTHS = {'A': 12, 'S': 6, 'Q': 3, 'M': 1}       # Length of the month-based periods
+
+
+def load_rules(path=rules_path):
+    """Resampling rules indexed by indicator name, in file order; raises ValueError on invalid rules."""
+    rules = pd.read_csv(path, skipinitialspace=True, dtype=str)
+    rules = rules.loc[:, ~rules.columns.str.startswith('Unnamed')]
+    rules = rules.reindex(columns=['indicator', 'aggregation', 'min_count', 'interpolation', 'max_gap'])
+    rules['indicator'] = rules['indicator'].str.strip()
+    rules['aggregation'] = rules['aggregation'].fillna('mean').str.strip().str.lower()
+    rules['interpolation'] = rules['interpolation'].fillna('none').str.strip().str.lower()
+    rules['min_count'] = pd.to_numeric(rules['min_count']).fillna(0).astype(int)
+    rules['max_gap'] = pd.to_numeric(rules['max_gap']).astype('float64') # NaN: gaps of any length
+
+    for column, allowed in (('aggregation', AGGREGATIONS), ('interpolation', INTERPOLATIONS)):
+        invalid = rules.loc[~rules[column].isin(allowed)]
+        if not invalid.empty:
+            row = invalid.iloc[0]
+            raise ValueError(f"{row['indicator']}: unknown {column} '{row[column]}' (expected one of {', '.join(allowed)})")
+    duplicated = rules['indicator'][rules['indicator'].duplicated()]
+    if not duplicated.empty:
+        raise ValueError(f"Duplicate resampling rules for {', '.join(duplicated)}")
+    return rules.set_index('indicator')
+
+
+# === Periods ===
+def period_start(dates, target):
+    """Start of the `target` period ('A', 'Q' or 'M') containing each date, as datetime64[ns]."""
+    months = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[M]')
+    if target != 'M':
+        index = months.astype('int64') # Months since January 1970 (January -> multiple of 12)
+        months = (index - index % MONTHS[target]).astype('datetime64[M]')
+    return months.astype('datetime64[ns]')
+
+
+def period_days(dates, freq):
+    """Length in days of the source periods of frequency `freq` starting at `dates`."""
+    if freq in MONTHS:
+        start = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[M]')
+        end = start + MONTHS[freq]
+        return (end.astype('datetime64[D]') - start.astype('datetime64[D]')).astype('float64')
+    return np.full(len(dates), 7.0 if freq == 'W' else 1.0)
+
+
+# === Aggregation ===
+def aggregate_block(block, freq, rules, target, by=()):
+    """
+    Aggregate one frequency block (TIME_PERIOD, `by` keys, indicators) to the
+    `target` periods; returns a DataFrame indexed by (`by`..., TIME_PERIOD).
+    """
+    keys = [block[c] for c in by] + [pd.Series(period_start(block['TIME_PERIOD'], target),
+                                               index=block.index, name='TIME_PERIOD')]
+    names = [c for c in rules.index if c in block.columns]
+    parts = []
+    for (aggregation, min_count), group in rules.loc[names].groupby(['aggregation', 'min_count'], sort=False):
+        values = block[list(group.index)]
+        if aggregation == 'sum':
+            parts.append(values.groupby(keys, observed=True).sum(min_count=min_count))
+            continue
+        if aggregation == 'weighted':
+            weights = period_days(block['TIME_PERIOD'], freq)
+            total = values.mul(weights, axis=0).groupby(keys, observed=True).sum(min_count=1)
+            part = total / values.notna().mul(weights, axis=0).groupby(keys, observed=True).sum()
+        else:
+            part = getattr(values.groupby(keys, observed=True), aggregation)()
+        if min_count > 1:
+            part = part.where(values.notna().groupby(keys, observed=True).sum() >= min_count)
+        parts.append(part)
+    return pd.concat(parts, axis=1) if parts else None
+
+
+# === Interpolation ===
+def fill_gaps(values, groups, method, max_gap=None):
+    """
+    Fill the NaNs of the 2-D array `values` (rows sorted by group, then period)
+    column by column, without crossing group boundaries (`groups`: one group
+    id per row). Rows are treated as equally spaced, as in pandas.
+    """
+    n = len(values)
+    if n == 0 or method == 'none':
+        return values
+    rows = np.arange(n)[:, None]
+    cols = np.arange(values.shape[1])[None, :]
+    valid = ~np.isnan(values)
+
+    # Last observation at or before each row, first observation at or after it
+    prev = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]
+    safe_prev, safe_next = prev.clip(0), nxt.clip(max=n - 1)
+    fill = ~valid & (prev >= 0) & (groups[safe_prev] == groups[:, None])
+
+    if method == 'linear':
+        fill &= (nxt < n) & (groups[safe_next] == groups[:, None])
+        if max_gap is not None:
+            fill &= (nxt - prev - 1) <= max_gap
+        y0, y1 = values[safe_prev, cols], values[safe_next, cols]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            filled = y0 + (y1 - y0) * (rows - prev) / (nxt - prev)
+    else:  # ffill
+        if max_gap is not None:
+            fill &= (rows - prev) <= max_gap
+        filled = values[safe_prev, cols]
+    return np.where(fill, filled, values)
+
+
+# === Engine ===
+def aggregate_periods(blocks, rules, target='A', by=()):
+    """
+    First step of `resample`: the frequency blocks aggregated to the `target`
+    periods, one row per (`by`..., period start) present in any block, with
+    the indicators of `rules` in their order and NaN where an indicator has
+    no value (before zero totals and interpolation). A row depends only on
+    the observations of its own period, so the rows of some periods can be
+    recomputed from those observations alone (delta updates). Raises
+    KeyError if an indicator of the rules is missing.
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target frequency '{target}' (expected one of {', '.join(TARGETS)})")
+    by = list(by)
+    available = set().union(*(b.columns for b in blocks.values())) if blocks else set()
+    missing = [c for c in rules.index if c not in available]
+    if missing:
+        raise KeyError(f"Indicators not found in the merged dataset: {missing}")
+
+    parts = [aggregate_block(block, freq, rules, target, by) for freq, block in blocks.items()]
+    return join_periods([p for p in parts if p is not None], rules)
+
+
+def join_periods(parts, rules):
+    """The aggregated blocks `parts` joined on the periods present in any of them, columns in rule order."""
+    index = parts[0].index
+    for part in parts[1:]:
+        index = index.union(part.index)
+    return pd.concat([p.reindex(index) for p in parts], axis=1)[list(rules.index)]
+
+
+def complete(aggregated, rules, target='A', by=()):
+    """
+    Second step of `resample`: zero totals and interpolation of the
+    aggregated periods (see aggregate_periods), over all periods at once.
+    """
+    # As in a groupby over the wide table, a period in which an indicator has
+    # no value gives a total of 0 (`sum` with min_count 0) and a missing value
+    # for the other aggregations.
+    result = aggregated.copy()
+    index = result.index
+    zero_totals = rules.index[(rules['aggregation'] == 'sum') & (rules['min_count'] == 0)]
+    result[zero_totals] = result[zero_totals].fillna(0.0)
+
+    # --- Interpolation, all columns of one rule at a time ---
+    groups = index.droplevel(-1).factorize()[0] if by else np.zeros(len(result), dtype=int)
+    interpolated = rules[rules['interpolation'] != 'none']
+    for (method, max_gap), group in interpolated.groupby(['interpolation', 'max_gap'], sort=False, dropna=False):
+        cols = list(group.index)
+        result[cols] = fill_gaps(result[cols].to_numpy(dtype='float64'), groups, method,
+                                 None if pd.isna(max_gap) else int(max_gap))
+
+    result = result.reset_index()
+    if target == 'A':
+        result['TIME_PERIOD'] = result['TIME_PERIOD'].dt.year
+        result = result.rename(columns={'TIME_PERIOD': 'Year'})
+    return result
+
+
+def resample(blocks, rules, target='A', by=()):
+    """
+    Resample the frequency blocks {freq: DataFrame} to the `target` frequency
+    with `rules` (see load_rules). Returns one row per (`by`..., period), with
+    the period as 'Year' (int) for annual targets and as 'TIME_PERIOD' (period
+    start) otherwise. Raises KeyError if an indicator of the rules is missing.
+    """
+    return complete(aggregate_periods(blocks, rules, target, by), rules, target, by)
@@ -0,0 +1,394 @@
+"""
+===============================================================================
+ Module Name: sql_engine.py
+ Author: Igor Latii
+ Description:
+     SQL execution backend of the merge (make_merged_df.py) and of the period
+     aggregation (aggregate_annual_indicators.py), for panels too large for
+     the in-memory pandas steps (many countries, hundreds of indicators).
+
+     With `PIPELINE_ENGINE=sqlite` the stored tables are streamed from disk
+     in chunks of `PIPELINE_SQL_CHUNK_ROWS` rows into a temporary SQLite
+     database under /data/cache/sql/, and the work runs as SQL queries over
+     it; SQLite sorts and groups out of core, with a page cache bounded by
+     `PIPELINE_SQL_CACHE_MB`. Only the results (one frequency block, one
+     aggregated target) are held in memory as arrays.
+
+        - merge:      the long observations (indicator, geo, TIME_PERIOD,
+                      VALUE, FREQ) of every formatted table, summed per key,
+                      the native frequency of every indicator, and the outer
+                      alignment of each frequency block on the union of its
+                      keys (`merge_blocks`);
+        - aggregate:  the indicators of a stored block melted to long rows
+                      without their NaN padding, then one grouped query per
+                      rule of `/reports/resampling.csv` (sum / mean / first /
+                      last / min / max / weighted, with min_count) per target
+                      period (`aggregate_periods`).
+
+     The results are identical to the pandas backend, bit for bit: sums and
+     means use the compensated (Kahan) summation of pandas' groupby, and
+     first / last follow the row order of the tables, as SQL aggregate
+     functions defined here (`kahan_sum`, `kahan_mean`, `first_value`,
+     `last_value`). The zero totals, interpolation and output tables are
+     shared with the pandas backend (resampling.py).
+
+     `PIPELINE_ENGINE` selects the backend: `pandas` (default) or `sqlite`.
+     Delta updates (`pipeline.py --delta`) always run in pandas: they touch
+     a few periods only.
+
+ Usage:
+     PIPELINE_ENGINE=sqlite python pipeline.py --only merge annual
+     PIPELINE_ENGINE=sqlite python make_merged_df.py
+
+ Dependencies:
+     - pandas, numpy
+     - sqlite3, contextlib, itertools, os, tempfile
+     - storage.py, frequency_blocks.py, resampling.py, pipeline_paths.py
+===============================================================================
+"""
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from frequency_blocks import block_stem, keyed_frame, read_block, read_manifest
+from pipeline_paths import sql_dir
+from resampling import TARGETS, join_periods, period_days, period_start
+from storage import iter_table, read_columns
+from time_periods import FREQUENCIES
+
+# === Configuration ===
+ENGINES = ['pandas', 'sqlite']
+chunk_rows = int(os.environ.get('PIPELINE_SQL_CHUNK_ROWS', 100_000)) # rows per insert / fetch
+cache_mb = int(os.environ.get('PIPELINE_SQL_CACHE_MB', 64))           # SQLite page cache
+NAT = np.iinfo('int64').min                                          # NaT as int64
+
+
+def selected_engine():
+    """Execution backend of merge and annual (`PIPELINE_ENGINE`); raises ValueError if unknown."""
+    engine = os.environ.get('PIPELINE_ENGINE', '').strip().lower() or 'pandas'
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown PIPELINE_ENGINE '{engine}' (expected one of {', '.join(ENGINES)})")
+    return engine
+
+
+# === Aggregate functions matching pandas ===
+def kahan(values):
+    """Sum of `values` with the compensated summation of pandas' groupby sum and mean."""
+    total = compensation = 0.0
+    for value in values:
+        y = value - compensation
+        t = total + y
+        compensation = t - total - y
+        if compensation != compensation: # inf - inf: pandas drops the compensation
+            compensation = 0.0
+        total = t
+    return total
+
+
+class OrderedValues:
+    """
+    Base of the aggregates: collects the non-NULL values of a group with
+    their row number `seq`, and gives them back in row order (SQLite feeds a
+    group in any order).
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def step(self, seq, value):
+        if value is not None:
+            self.items.append((seq, value))
+
+    def values(self):
+        self.items.sort()
+        return [value for _, value in self.items]
+
+
+class KahanSum(OrderedValues):
+    def finalize(self):
+        return kahan(self.values())
+
+
+class KahanMean(OrderedValues):
+    def finalize(self):
+        return kahan(self.values()) / len(self.items) if self.items else None
+
+
+class FirstValue(OrderedValues):
+    def finalize(self):
+        return min(self.items)[1] if self.items else None
+
+
+class LastValue(OrderedValues):
+    def finalize(self):
+        return max(self.items)[1] if self.items else None
+
+
+@contextmanager
+def connect(directory=sql_dir):
+    """A temporary on-disk database with the aggregate functions, removed on exit."""
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        con = sqlite3.connect(os.path.join(tmp, 'engine.db'))
+        # Scratch data: no journal, no fsync; sorts and temp tables spill to disk
+        for pragma in ('journal_mode=OFF', 'synchronous=OFF', 'temp_store=FILE', f'cache_size=-{cache_mb * 1024}'):
+            con.execute(f'PRAGMA {pragma}')
+        for name, cls in (('kahan_sum', KahanSum), ('kahan_mean', KahanMean),
+                          ('first_value', FirstValue), ('last_value', LastValue)):
+            con.create_aggregate(name, 2, cls)
+        try:
+            yield con
+        finally:
+            con.close()
+
+
+def fetch_chunks(cursor):
+    """Rows of a query as float64 arrays of at most `chunk_rows` rows."""
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield np.array(rows, dtype='float64')
+
+
+def marks(items):
+    return ', '.join('?' * len(items))
+
+
+def text(series):
+    """Values of a column as str, None where missing."""
+    return [None if missing else str(v) for v, missing in zip(series.tolist(), series.isna().tolist())]
+
+
+def nanoseconds(dates):
+    """Dates as int64 nanoseconds since 1970 (exact, unlike floats), None for NaT."""
+    dates = pd.Series(dates).astype('datetime64[ns]')
+    return [None if missing else v for v, missing in zip(dates.to_numpy().view('int64').tolist(),
+                                                         dates.isna().tolist())]
+
+
+def as_dates(values):
+    """Inverse of `nanoseconds`: int64 nanoseconds (or None) as datetime64[ns]."""
+    return np.array([NAT if v is None else v for v in values], dtype='int64').view('datetime64[ns]')
+
+
+# === Merge ===
+def load_indicator(con, ind, stems, panel, file_geo, seq=0):
+    """
+    Stream the formatted tables `stems` of indicator number `ind` into
+    `obs`, with the conversions of make_merged_df.read_indicator_table; rows
+    are numbered from `seq` on. Returns whether they have a FREQ column, and
+    the next row number.
+    """
+    available = set.intersection(*(set(read_columns(stem)) for stem in stems))
+    columns = ['TIME_PERIOD', 'VALUE'] + [c for c in ['FREQ'] + (['geo'] if panel else []) if c in available]
+    for stem in stems:
+        for chunk in iter_table(stem, chunk_rows, columns):
+            n = len(chunk)
+            dates = chunk['TIME_PERIOD']
+            if not pd.api.types.is_datetime64_any_dtype(dates):
+                dates = pd.to_datetime(dates, errors='coerce')
+            values = chunk['VALUE']
+            if not pd.api.types.is_float_dtype(values):
+                values = pd.to_numeric(values, errors='coerce')
+            if not panel:
+                geos = repeat('', n)
+            elif 'geo' in columns:
+                geos = text(chunk['geo'])
+            else:
+                geos = repeat(file_geo(stem), n)
+            freqs = text(chunk['FREQ']) if 'FREQ' in columns else repeat(None, n)
+            con.executemany('INSERT INTO obs VALUES (?, ?, ?, ?, ?, ?)',
+                            zip(repeat(ind, n), geos, nanoseconds(dates), values.astype('float64').tolist(),
+                                freqs, range(seq, seq + n))) # NaN values are stored as NULL
+            seq += n
+    return 'FREQ' in columns, seq
+
+
+def native_frequencies(con, has_freq, frequency):
+    """Native frequency of every indicator, from its distinct (FREQ, TIME_PERIOD) pairs."""
+    rows = con.execute('SELECT DISTINCT ind, freq, t FROM obs').fetchall()
+    pairs = pd.DataFrame({'ind': [r[0] for r in rows], 'FREQ': pd.Series([r[1] for r in rows], dtype=object),
+                          'TIME_PERIOD': as_dates([r[2] for r in rows])})
+    frequencies = {}
+    for ind, freq_rows in pairs.groupby('ind', sort=False):
+        columns = ['TIME_PERIOD', 'FREQ'] if has_freq[ind] else ['TIME_PERIOD']
+        frequencies[ind] = frequency(freq_rows[columns].reset_index(drop=True))
+    return frequencies
+
+
+def block_frame(con, members, names, panel):
+    """
+    Outer alignment of the indicators `members` (in column order) on the
+    union of their keys, sorted by (geo,) TIME_PERIOD, as a block DataFrame.
+    """
+    con.execute('DROP TABLE IF EXISTS block_keys')
+    con.execute('CREATE TEMP TABLE block_keys (pos INTEGER PRIMARY KEY, geo TEXT, t INTEGER)')
+    con.execute(f'INSERT INTO block_keys (geo, t) SELECT DISTINCT geo, t FROM series '
+                f'WHERE ind IN ({marks(members)}) ORDER BY geo, t', members)
+    con.execute('CREATE UNIQUE INDEX block_keys_geo_t ON block_keys (geo, t)')
+    geos, times = [], []
+    cursor = con.execute('SELECT geo, t FROM block_keys ORDER BY pos')
+    while rows := cursor.fetchmany(chunk_rows):
+        geo, t = zip(*rows)
+        geos.extend(geo)
+        times.extend(t)
+
+    # Each indicator written into its column at the positions of its keys
+    column = {ind: j for j, ind in enumerate(members)}
+    values = np.full((len(times), len(members)), np.nan, order='F')
+    cursor = con.execute(f'SELECT k.pos - 1, s.ind, s.value FROM series s JOIN block_keys k '
+                         f'ON k.geo = s.geo AND k.t = s.t WHERE s.ind IN ({marks(members)})', members)
+    for rows in fetch_chunks(cursor):
+        cols = np.array([column[i] for i in rows[:, 1].astype('int64')])
+        values[rows[:, 0].astype('int64'), cols] = rows[:, 2]
+
+    dates = pd.DatetimeIndex(as_dates(times), name='TIME_PERIOD')
+    if panel:
+        keys = pd.MultiIndex.from_arrays([pd.Categorical(geos, categories=sorted(set(geos))), dates],
+                                         names=['geo', 'TIME_PERIOD'])
+    else:
+        keys = dates
+    return keyed_frame(keys, values, [names[i] for i in members])
+
+
+def merge_blocks(tables, names, panel, frequency, file_geo):
+    """
+    SQL version of the merge loop of make_merged_df.merge_tables: `tables`
+    {indicator key: formatted table stems}, `names` {indicator key: column}.
+    Returns the frequency blocks {freq: DataFrame}, same as the pandas
+    backend, and prints one line per indicator.
+    """
+    keys = list(tables)
+    with connect() as con:
+        # --- Long observations of all indicators, streamed from disk ---
+        con.execute('CREATE TABLE obs (ind INTEGER, geo TEXT, t INTEGER, value, freq TEXT, seq INTEGER)')
+        has_freq, seq = [], 0
+        for ind, key in enumerate(keys):
+            freq, seq = load_indicator(con, ind, tables[key], panel, file_geo, seq)
+            has_freq.append(freq)
+
+        # --- One value per key and indicator: duplicates summed, rows without a date dropped ---
+        con.execute('CREATE TABLE series AS SELECT ind, geo, t, kahan_sum(seq, value) AS value FROM obs '
+                    'WHERE t IS NOT NULL AND geo IS NOT NULL GROUP BY ind, geo, t')
+        frequencies = native_frequencies(con, has_freq, frequency)
+        counts = {ind: (rows, geos) for ind, rows, geos in con.execute(
+            'SELECT ind, COUNT(*), COUNT(DISTINCT geo) FROM series GROUP BY ind')}
+        con.execute('DROP TABLE obs')
+        for ind, key in enumerate(keys):
+            rows, geos = counts.get(ind, (0, 0))
+            geos = f", {geos} geo" if panel else ''
+            print(f"SUCCESS: Loaded {names[key]} ({rows} rows, {frequencies.get(ind, 'A')}{geos})")
+
+        # --- One block per frequency, aligned in SQL ---
+        blocks = {}
+        for freq in FREQUENCIES:
+            members = [ind for ind in range(len(keys)) if frequencies.get(ind, 'A') == freq]
+            if members:
+                blocks[freq] = block_frame(con, members, dict(enumerate(names[k] for k in keys)), panel)
+    return blocks
+
+
+# === Period aggregation ===
+def load_cells(con, stem, freq, names, weighted, group_ids, weights):
+    """
+    Stream the indicators `names` of one stored block into `cells` as long
+    rows (col, gid, seq, value), skipping NaN; the `weighted` indicators keep
+    all rows, with value * weight (`vw`) and notna * weight (`wn`).
+    """
+    con.execute('DROP TABLE IF EXISTS cells')
+    con.execute('CREATE TABLE cells (col INTEGER, gid INTEGER, seq INTEGER, value, vw, wn)')
+    offset = 0
+    for chunk in iter_table(block_stem(stem, freq), chunk_rows, names):
+        n = len(chunk)
+        rows = np.arange(offset, offset + n)
+        gids, w = group_ids[offset:offset + n], weights[offset:offset + n]
+        for j, name in enumerate(names):
+            values = chunk[name].to_numpy(dtype='float64')
+            if name in weighted:
+                columns = (values.tolist(), (values * w).tolist(), (~np.isnan(values) * w).tolist())
+                keep = slice(None)
+            else:
+                keep = ~np.isnan(values)
+                columns = (values[keep].tolist(), repeat(None), repeat(None))
+            con.executemany('INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?)',
+                            zip(repeat(j), gids[keep].tolist(), rows[keep].tolist(), *columns))
+        offset += n
+    con.execute('CREATE INDEX cells_col ON cells (col)')
+
+
+QUERIES = {
+    'sum': 'kahan_sum(seq, value)',
+    'mean': 'kahan_mean(seq, value)',
+    'first': 'first_value(seq, value)',
+    'last': 'last_value(seq, value)',
+    'min': 'MIN(value)',
+    'max': 'MAX(value)',
+    'weighted': 'kahan_sum(seq, vw) / kahan_sum(seq, wn)',
+}
+
+
+def aggregate_block(con, stem, freq, keys, names, rules, target, by):
+    """
+    SQL version of resampling.aggregate_block for one stored block; returns a
+    DataFrame indexed by (`by`..., TIME_PERIOD) with the columns `names`.
+    """
+    # Target period of every row, from the key columns only
+    key_frame = read_block(stem, freq, keys, columns=[])
+    groups = key_frame['TIME_PERIOD'].groupby(
+        [key_frame[c] for c in by] + [pd.Series(period_start(key_frame['TIME_PERIOD'], target),
+                                                index=key_frame.index, name='TIME_PERIOD')], observed=True)
+    index = groups.size().index
+    weighted = set(rules.index[rules['aggregation'] == 'weighted']) & set(names)
+    weights = period_days(key_frame['TIME_PERIOD'], freq) if weighted else np.ones(len(key_frame))
+    load_cells(con, stem, freq, names, weighted, groups.ngroup().to_numpy(), weights)
+
+    values = np.full((len(index), len(names)), np.nan, order='F')
+    for (aggregation, min_count), group in rules.loc[names].groupby(['aggregation', 'min_count'], sort=False):
+        cols = [names.index(c) for c in group.index]
+        counts = np.zeros((len(index), len(cols)))
+        if aggregation == 'sum' and min_count == 0:
+            values[:, cols] = 0.0 # a period without values totals 0, as in pandas
+        cursor = con.execute(f'SELECT col, gid, {QUERIES[aggregation]}, COUNT(value) FROM cells '
+                             f'WHERE col IN ({marks(cols)}) GROUP BY col, gid', cols)
+        position = {c: k for k, c in enumerate(cols)}
+        for rows in fetch_chunks(cursor):
+            col, gid = rows[:, 0].astype('int64'), rows[:, 1].astype('int64')
+            values[gid, col] = rows[:, 2]
+            counts[gid, [position[c] for c in col]] = rows[:, 3]
+        # Same missing values as pandas: below min_count (at least 1 value for weighted)
+        limit = max(min_count, 1) if aggregation == 'weighted' else min_count
+        values[:, cols] = np.where(counts < limit, np.nan, values[:, cols])
+    con.execute('DROP TABLE cells')
+    return pd.DataFrame(values, index=index, columns=names)
+
+
+def aggregate_periods(stem, rules, target='A', by=()):
+    """
+    SQL version of resampling.aggregate_periods over the stored dataset
+    `stem` (frequency blocks + manifest): same result, with the blocks
+    streamed from disk instead of read in full. Raises KeyError if an
+    indicator of the rules is missing.
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target frequency '{target}' (expected one of {', '.join(TARGETS)})")
+    manifest = read_manifest(stem)
+    keys, by = manifest.get('keys', ['TIME_PERIOD']), list(by)
+    available = {c for info in manifest['blocks'].values() for c in info['columns']}
+    missing = [c for c in rules.index if c not in available]
+    if missing:
+        raise KeyError(f"Indicators not found in the merged dataset: {missing}")
+
+    parts = []
+    with connect() as con:
+        for freq, info in manifest['blocks'].items():
+            names = [c for c in rules.index if c in set(info['columns'])]
+            if names:
+                parts.append(aggregate_block(con, stem, freq, keys, names, rules, target, by))
+    return join_periods(parts, rules)
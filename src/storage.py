@@ -0,0 +1,539 @@
+"""
+===============================================================================
+ Module Name: storage.py
+ Author: Igor Latii
+ Description:
+     Storage layer for all intermediate and final tables of the pipeline.
+
+     Tables are addressed by a path *stem* without extension (e.g.
+     `../data/processed/formatted_time_periods/une_rt_m_raw_formatted`); the
+     extension follows the storage format:
+
+        - parquet  compressed (zstd) columnar files - the default;
+        - feather  Arrow IPC files (zstd), fastest to read;
+        - csv      plain text, as in the first version of the pipeline; values
+                   are read back with round-trip float parsing, so a table
+                   read from CSV holds exactly the values written.
+
+     The format is chosen with the environment variable `PIPELINE_FORMAT`
+     (`parquet` / `feather` / `csv`); Parquet and Feather need `pyarrow` and the
+     layer falls back to CSV when it is not installed. Setting
+     `PIPELINE_EXPORT_CSV=1` additionally writes a CSV copy of every table.
+
+     Before writing, every table goes through `apply_schema`:
+        - TIME_PERIOD holding dates -> datetime64[ns] (period labels such as
+          '2020-Q1' -> categorical);
+        - VALUE and other numeric columns -> float64; Year -> int64;
+        - text columns (geo, unit, s_adj, na_item, ...) -> categorical.
+     Columnar files keep these dtypes, so later stages do not re-parse text,
+     re-infer dtypes or re-run `pd.to_datetime`.
+
+     Tables read back go through a load-time dtype policy (`compact_dtypes`),
+     so that every stage holds the same compact types whatever the format:
+        - text columns repeated on every row (geo, unit, s_adj, freq, World
+          Bank indicator codes, period labels, ...) -> categorical, i.e. one
+          small integer code per row instead of a Python string;
+        - with `PIPELINE_FLOAT32=1`, float64 values -> float32 (half the
+          memory, about 7 significant digits), kept as float32 when written.
+     Parquet / Feather tables already come back with categoricals, so the
+     policy mostly matters for CSV tables. `PIPELINE_DTYPES=plain` keeps the
+     types as read (for comparisons, see benchmarks/bench_dtypes.py).
+
+     Files are first written to a temporary file in the target directory and
+     then moved into place with `os.replace`, which is atomic on both Windows
+     and Linux. A crash or an interrupted download therefore never leaves a
+     half-written file behind for the next stage to pick up.
+
+     Large tables can also be processed in row chunks: `read_columns` reads
+     only the header, `iter_table` yields the rows in chunks (Parquet row
+     groups are kept to about one million cells for this), and `TableWriter`
+     appends chunks to a table, atomically as well. Many small tables with the
+     same columns are read in one scan with `read_tables`. `read_table` with
+     row `filters` reads only the matching rows of a Parquet table (row groups
+     without any are skipped, e.g. the periods of a delta update).
+
+     Every table read or written is counted (rows, bytes on disk) for the
+     current telemetry span (see telemetry.py).
+
+ Dependencies:
+     - pandas
+     - pyarrow (optional, for Parquet / Feather)
+     - os, tempfile
+     - telemetry.py
+===============================================================================
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+import telemetry
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# === Storage formats ===
+EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+ROW_GROUP_CELLS = 1_000_000 # Parquet row group size in cells (rows x columns), bounds chunked reads
+_warned_fallback = []
+
+
+def default_format():
+    """Storage format from `PIPELINE_FORMAT` (parquet unless pyarrow is missing)."""
+    fmt = os.environ.get('PIPELINE_FORMAT', 'parquet').lower()
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown PIPELINE_FORMAT '{fmt}' (expected one of {', '.join(EXTENSIONS)})")
+    if fmt != 'csv' and not HAS_PYARROW:
+        if not _warned_fallback:
+            print(f"WARNING: pyarrow is not installed, writing CSV instead of {fmt}.")
+            _warned_fallback.append(fmt)
+        return 'csv'
+    return fmt
+
+
+def export_csv_enabled():
+    return os.environ.get('PIPELINE_EXPORT_CSV', '').lower() in ('1', 'true', 'yes')
+
+
+def compact_enabled():
+    """Load-time dtype policy from `PIPELINE_DTYPES`: 'compact' (default) or 'plain'."""
+    policy = os.environ.get('PIPELINE_DTYPES', 'compact').lower()
+    if policy not in ('compact', 'plain'):
+        raise ValueError(f"Unknown PIPELINE_DTYPES '{policy}' (expected compact or plain)")
+    return policy == 'compact'
+
+
+def float32_enabled():
+    return compact_enabled() and os.environ.get('PIPELINE_FLOAT32', '').lower() in ('1', 'true', 'yes')
+
+
+def atomic_write(path, write_func, suffix='.tmp'):
+    """
+    Call `write_func(tmp_path)` and atomically move the result to `path`.
+    The temporary file is removed if `write_func` raises.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix=suffix)
+    os.close(fd)
+    try:
+        write_func(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_csv(df, path, **kwargs):
+    """Write a DataFrame to CSV atomically (defaults to `index=False`)."""
+    kwargs.setdefault('index', False)
+    atomic_write(path, lambda tmp: df.to_csv(tmp, **kwargs))
+
+
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    """
+    Context manager version of `atomic_write`: yields a file object opened on a
+    temporary file, which replaces `path` only if the block exits cleanly.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# === Typed schema ===
+def apply_schema(df):
+    """Return a copy of `df` with the pipeline's column types (see module docstring)."""
+    df = df.copy()
+    for col in df.columns:
+        series = df[col]
+        if col == 'Year':
+            df[col] = pd.to_numeric(series, errors='coerce').astype('int64')
+            continue
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        if series.dtype == 'float32' and float32_enabled():
+            continue
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            df[col] = series.astype('float64')
+            continue
+        kind = pd.api.types.infer_dtype(series, skipna=True)
+        if kind in ('datetime', 'datetime64', 'date') or (col == 'TIME_PERIOD' and kind == 'mixed'):
+            df[col] = pd.to_datetime(series, errors='coerce')
+        elif kind == 'string' and col != 'VALUE':
+            df[col] = series.astype('category')
+        else:
+            # Numbers stored as objects, all-missing columns and stray flags -> float64
+            df[col] = pd.to_numeric(series, errors='coerce').astype('float64')
+    return df
+
+
+def compact_dtypes(df):
+    """
+    Load-time dtype policy (see module docstring): text columns ->
+    categorical, float64 -> float32 with `PIPELINE_FLOAT32`. Returns `df`
+    itself when nothing changes.
+    """
+    if not compact_enabled():
+        return df
+    text = [col for col, dtype in df.dtypes.items()
+            if dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == 'string']
+    if text:
+        df = df.astype(dict.fromkeys(text, 'category'))
+    floats = [col for col, dtype in df.dtypes.items() if dtype == 'float64'] if float32_enabled() else []
+    if floats:
+        # One conversion of the whole float block: raw tables have hundreds of period columns
+        df = pd.concat([df.drop(columns=floats), df[floats].astype('float32')], axis=1)[list(df.columns)]
+    return df
+
+
+# === Tables ===
+def table_path(stem, fmt=None):
+    """File path of the table `stem` in format `fmt` (default format if None)."""
+    return stem + EXTENSIONS[fmt or default_format()]
+
+
+def find_table(stem):
+    """Existing file of the table `stem`, preferring the default format, or None."""
+    preferred = default_format()
+    for fmt in [preferred] + [f for f in EXTENSIONS if f != preferred]:
+        if os.path.exists(stem + EXTENSIONS[fmt]):
+            return stem + EXTENSIONS[fmt]
+    return None
+
+
+def split_extension(path):
+    """('dir/name', '.parquet') for a table file; the extension is '' if unknown."""
+    for ext in EXTENSIONS.values():
+        if path.endswith(ext):
+            return path[:-len(ext)], ext
+    return path, ''
+
+
+def list_tables(directory, suffix=''):
+    """Sorted stems of the tables in `directory` whose names end with `suffix`."""
+    if not os.path.isdir(directory):
+        return []
+    stems = set()
+    for name in os.listdir(directory):
+        stem, ext = split_extension(name)
+        if ext and not name.startswith('.') and stem.endswith(suffix):
+            stems.add(os.path.join(directory, stem))
+    return sorted(stems)
+
+
+def write_table(df, stem, fmt=None, export_csv=None):
+    """
+    Write `df` atomically as the table `stem` and return the written path.
+    Copies of the table in other formats are removed so that readers never
+    pick up a stale file; a CSV copy is kept when `export_csv` is set
+    (default: `PIPELINE_EXPORT_CSV`).
+    """
+    fmt = fmt or default_format()
+    export_csv = export_csv_enabled() if export_csv is None else export_csv
+    df = apply_schema(df).reset_index(drop=True)
+    path = table_path(stem, fmt)
+
+    if fmt == 'parquet':
+        atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False, compression='zstd',
+                                                     row_group_size=row_group_rows(len(df.columns))))
+    elif fmt == 'feather':
+        atomic_write(path, lambda tmp: df.to_feather(tmp, compression='zstd'))
+    else:
+        atomic_write_csv(df, path)
+    if export_csv and fmt != 'csv':
+        atomic_write_csv(df, table_path(stem, 'csv'))
+
+    remove_other_formats(stem, keep=[fmt, 'csv'] if export_csv else [fmt])
+    telemetry.record_output(len(df), [path, table_path(stem, 'csv')] if export_csv and fmt != 'csv' else path)
+    return path
+
+
+def row_group_rows(n_columns):
+    return max(1024, ROW_GROUP_CELLS // max(n_columns, 1))
+
+
+def remove_other_formats(stem, keep):
+    """Delete the files of table `stem` in formats not listed in `keep`."""
+    for fmt, ext in EXTENSIONS.items():
+        if fmt not in keep and os.path.exists(stem + ext):
+            os.remove(stem + ext)
+
+
+def resolve_table(path):
+    """File of a table given its stem or file path; raises FileNotFoundError."""
+    stem, ext = split_extension(path)
+    file = path if ext else find_table(stem)
+    if file is None or not os.path.exists(file):
+        raise FileNotFoundError(f"No table found for {path}")
+    return file
+
+
+def read_table(path, columns=None, filters=None):
+    """
+    Read a table given its stem (any stored format) or its file path.
+    `filters` ([(column, op, value)], all of them true) selects rows while
+    reading a Parquet file, skipping the row groups that hold none of them;
+    other formats are read in full (see filter_rows).
+    Raises FileNotFoundError if no file exists.
+    """
+    file = resolve_table(path)
+    if file.endswith('.parquet'):
+        df = pd.read_parquet(file, columns=columns, filters=filters or None)
+    elif file.endswith('.feather'):
+        df = pd.read_feather(file, columns=columns)
+    else:
+        df = pd.read_csv(file, usecols=columns, float_precision='round_trip')
+    df = compact_dtypes(df)
+    telemetry.record_input(len(df), file, frame=df)
+    return df
+
+
+def filter_rows(df, filters):
+    """Rows of `df` matching all `filters` ([(column, op, value)], op one of == != < <= > >= in)."""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters or []:
+        values = df[column]
+        if op == 'in':
+            mask &= values.isin(value)
+        else:
+            mask &= getattr(values, {'==': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}[op])(value)
+    return df if mask.all() else df[mask.to_numpy()]
+
+
+def read_tables(paths, columns=None):
+    """
+    Read several tables with the same columns as one DataFrame, rows in the
+    order of `paths`. Parquet or Feather files are scanned together by
+    pyarrow, much faster than one read per small file (e.g. one table per
+    indicator and country).
+    """
+    files = [resolve_table(p) for p in paths]
+    extensions = {split_extension(f)[1] for f in files}
+    if HAS_PYARROW and len(extensions) == 1 and extensions <= {'.parquet', '.feather'}:
+        dataset = pa_dataset.dataset(files, format='parquet' if '.parquet' in extensions else 'feather')
+        df = compact_dtypes(dataset.to_table(columns=columns).to_pandas())
+        telemetry.record_input(len(df), files, frame=df)
+        return df
+    return pd.concat([read_table(f, columns) for f in files], ignore_index=True)
+
+
+# === Chunked access ===
+def read_columns(path):
+    """Column names of a table, read from the header / schema only."""
+    file = resolve_table(path)
+    if file.endswith('.parquet'):
+        return pq.read_schema(file).names
+    if file.endswith('.feather'):
+        with pa.memory_map(file) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(file, nrows=0).columns)
+
+
+def iter_table(path, chunk_rows=None, columns=None):
+    """
+    Yield a table as DataFrames of at most `chunk_rows` rows (the whole table
+    at once if `chunk_rows` is None). Only one chunk is decoded at a time.
+    """
+    file = resolve_table(path)
+    if chunk_rows is None:
+        yield read_table(file, columns)
+        return
+    telemetry.record_input(paths=file)
+    for chunk in _iter_chunks(file, chunk_rows, columns):
+        chunk = compact_dtypes(chunk)
+        telemetry.record_input(len(chunk), frame=chunk)
+        yield chunk
+
+
+def _iter_chunks(file, chunk_rows, columns=None):
+    if file.endswith('.parquet'):
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    elif file.endswith('.feather'):
+        with pa.memory_map(file) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                batch = batch.select(columns) if columns else batch
+                for start in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(start, chunk_rows).to_pandas()
+    else:
+        yield from pd.read_csv(file, usecols=columns, chunksize=chunk_rows, float_precision='round_trip')
+
+
+def chunk_schema(df):
+    """
+    Arrow schema of a chunk, with 32-bit codes for categorical columns: pandas
+    picks the smallest code type per chunk, which would not match later chunks.
+    A categorical column without values (all missing) gets string values.
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = [pa.field(f.name, pa.dictionary(pa.int32(), pa.string() if pa.types.is_null(f.type.value_type)
+                                             else f.type.value_type, f.type.ordered))
+              if pa.types.is_dictionary(f.type) else f for f in schema]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def as_text(series):
+    """Codes of a column as strings ('10', not '10.0'); missing values stay missing."""
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    return series.astype(object).where(series.notna()).map(lambda v: v if pd.isna(v) else str(v))
+
+
+def text_category(series):
+    """`series` as a categorical of strings (string categories even when all values are missing)."""
+    values = as_text(series)
+    return pd.Series(pd.Categorical(values, categories=pd.Index(sorted(values.dropna().unique()), dtype=object)),
+                     index=series.index)
+
+
+def conform_chunk(df, raw, dtypes):
+    """
+    Cast the typed chunk `df` (from the untyped `raw`) to the column `dtypes`
+    of the first chunk: `apply_schema` types every chunk on its own, so a
+    text column that is empty or looks numeric in a later chunk comes out as
+    float64. Raises ValueError for text in a column stored as numbers.
+    """
+    for col, dtype in dtypes.items():
+        series = df[col]
+        if isinstance(dtype, pd.CategoricalDtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+            df[col] = text_category(raw[col])
+        elif pd.api.types.is_float_dtype(dtype) and isinstance(series.dtype, pd.CategoricalDtype):
+            values = pd.to_numeric(raw[col], errors='coerce')
+            if values.isna().sum() != raw[col].isna().sum():
+                raise ValueError(f"Column '{col}' holds text, but earlier chunks stored it as numbers")
+            df[col] = values.astype(dtype)
+    return df
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to the table `stem` and publish it atomically on
+    `close()` (or at the end of a `with` block). Every chunk goes through
+    `apply_schema`; the column types of the first chunk fix the schema, and
+    later chunks are cast to it (see `conform_chunk`). The `text_columns`
+    (e.g. the dimensions of a Eurostat table) are stored as text whatever
+    their values: a first chunk in which they are empty or look numeric
+    does not make them numbers.
+
+        - parquet: each chunk becomes one row group, nothing is kept in memory;
+        - feather: chunks are kept as compact Arrow tables and written on close
+          (IPC files need one dictionary per categorical column);
+        - csv: chunks are appended as text.
+
+    `columns` gives the header of the table if no chunk is ever written.
+    """
+
+    def __init__(self, stem, fmt=None, export_csv=None, columns=None, text_columns=()):
+        self.stem = stem
+        self.fmt = fmt or default_format()
+        self.export_csv = export_csv_enabled() if export_csv is None else export_csv
+        self.columns = columns
+        self.text_columns = list(text_columns)
+        self.path = table_path(stem, self.fmt)
+        self.rows = 0
+        self._schema = None
+        self._dtypes = None
+        self._writer = None
+        self._tables = []
+        self._tmp_paths = {}
+
+    def _tmp(self, fmt):
+        if fmt not in self._tmp_paths:
+            directory = os.path.dirname(os.path.abspath(self.stem))
+            os.makedirs(directory, exist_ok=True)
+            fd, self._tmp_paths[fmt] = tempfile.mkstemp(
+                dir=directory, prefix='.' + os.path.basename(self.stem) + '.', suffix='.tmp')
+            os.close(fd)
+        return self._tmp_paths[fmt]
+
+    def write(self, df):
+        if df.empty:
+            # Empty chunks carry no types; only remember the header
+            self.columns = self.columns or list(df.columns)
+            return
+        self._write(df)
+
+    def _write(self, df):
+        raw = df.reset_index(drop=True)
+        df = apply_schema(raw)
+        for col in self.text_columns:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = text_category(raw[col])
+        if self._dtypes is None:
+            self._dtypes = df.dtypes.to_dict()
+        else:
+            df = conform_chunk(df, raw, self._dtypes)
+        if self.fmt == 'csv' or self.export_csv:
+            df.to_csv(self._tmp('csv'), mode='a', header=self.rows == 0, index=False)
+        if self.fmt != 'csv':
+            if self._schema is None:
+                self._schema = chunk_schema(df)
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self.fmt == 'parquet':
+                if self._writer is None:
+                    self._writer = pq.ParquetWriter(self._tmp('parquet'), self._schema, compression='zstd')
+                self._writer.write_table(table, row_group_size=row_group_rows(len(df.columns)))
+            else:
+                self._tables.append(table)
+        self.rows += len(df)
+
+    def close(self):
+        """Finish the table and move it into place; returns the written path."""
+        try:
+            if self.rows == 0:
+                self._write(pd.DataFrame(columns=self.columns or []))
+            if self._writer is not None:
+                self._writer.close()
+            if self.fmt == 'feather':
+                table = pa.concat_tables(self._tables).unify_dictionaries()
+                feather.write_feather(table, self._tmp('feather'), compression='zstd')
+            written = [table_path(self.stem, fmt) for fmt in self._tmp_paths]
+            for fmt, tmp in self._tmp_paths.items():
+                os.replace(tmp, table_path(self.stem, fmt))
+            self._tmp_paths = {}
+        finally:
+            self.abort()
+        remove_other_formats(self.stem, keep=[self.fmt, 'csv'] if self.export_csv else [self.fmt])
+        telemetry.record_output(self.rows, written)
+        return self.path
+
+    def abort(self):
+        """Drop the temporary files (used when the block raised)."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for tmp in self._tmp_paths.values():
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._tmp_paths = {}
+        self._tables = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,310 @@
+"""
+===============================================================================
+ Module Name: telemetry.py
+ Author: Igor Latii
+ Description:
+     Structured telemetry of the pipeline: time, memory and data volume of
+     every stage and of every file it processes, instead of reading them off
+     the printed messages.
+
+     Work is measured in spans. For each span the following is recorded:
+        - wall_s, cpu_s       wall time and CPU time of the process;
+        - peak_rss_mb         peak resident memory of the process so far (a
+                              worker handles several files, so for a file
+                              this is an upper bound), rss_mb the current one;
+        - rows_in, bytes_in   rows and bytes on disk of the tables read;
+        - rows_out, bytes_out rows and bytes on disk of the tables written;
+        - memory_in           in-memory size of the tables read (deep, summed
+                              over chunks), which shows the effect of the
+                              load-time dtype policy (see storage.py).
+     The rows and bytes are counted by the storage layer (storage.py) for
+     every table read or written, so the scripts do not count them
+     themselves; the counts of a span are added to its parent.
+
+     Spans come in two kinds:
+        - stage   one per stage, from pipeline.py or from a script run on its
+                  own; it also reports the CPU time and peak RSS of the worker
+                  processes that ended during the stage;
+        - file    one per file of a per-file stage (parallel.py), per EDA
+                  figure and per downloaded indicator.
+
+     Telemetry is off unless `PIPELINE_TELEMETRY` names an output file
+     (`pipeline.py --telemetry FILE`):
+        - `*.json`   Chrome trace (chrome://tracing, https://ui.perfetto.dev),
+                     one complete event per span, one track per process;
+        - otherwise  JSON lines, one record per span.
+     Records are added to the file at the end of every stage; those of worker
+     processes are sent back with the results of their tasks.
+
+     `PIPELINE_PROFILE=<stage>` (`pipeline.py --profile STAGE`) runs that
+     stage under cProfile, all in the current process (its files are not sent
+     to worker processes then), saves the statistics as
+     `/data/profiles/<stage>.prof` (`python -m pstats`, snakeviz) and prints
+     the functions with the highest cumulative time.
+
+ Dependencies:
+     - cProfile, json, os, pstats, resource (Unix), sys, threading, time
+     - pipeline_paths.py
+===============================================================================
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from pipeline_paths import profiles_dir
+
+COUNTS = ('rows_in', 'rows_out', 'bytes_in', 'bytes_out', 'memory_in')
+
+_records = []             # finished spans, until written out by flush()
+_lock = threading.Lock()  # downloads run in threads (collecting_data.py)
+_main_spans = []          # open spans of the main thread
+_local = threading.local()
+_profiler = None
+
+
+# === Configuration ===
+def output_path():
+    """Telemetry file from `PIPELINE_TELEMETRY`, or None (telemetry off)."""
+    return os.environ.get('PIPELINE_TELEMETRY') or None
+
+
+def enabled():
+    return output_path() is not None
+
+
+def profile_stage():
+    """Stage to run under cProfile, from `PIPELINE_PROFILE`."""
+    return os.environ.get('PIPELINE_PROFILE') or None
+
+
+def configure(path=None, profile=None):
+    """Set the telemetry file and the profiled stage (through the environment, seen by worker processes too)."""
+    if path:
+        os.environ['PIPELINE_TELEMETRY'] = os.path.abspath(path)
+    if profile:
+        os.environ['PIPELINE_PROFILE'] = profile
+
+
+def profiling():
+    """True while a stage of this process runs under cProfile."""
+    return _profiler is not None
+
+
+# === Process measurements ===
+def peak_rss_mb(who=None):
+    """Peak resident memory of this process (or of its ended children) in MB; None on Windows."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def rss_mb():
+    """Current resident memory in MB (Linux), None elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def file_bytes(paths):
+    """Total size of the existing files among `paths` (a path or a list)."""
+    paths = [paths] if isinstance(paths, str) else paths
+    return sum(os.path.getsize(p) for p in paths if p and os.path.isfile(p))
+
+
+# === Spans ===
+class Span:
+    """One measured piece of work: attributes (`set`) and rows / bytes counts (`add`)."""
+
+    def __init__(self, name, cat, parent=None, **attrs):
+        self.name = name
+        self.cat = cat
+        self.parent = parent
+        self.attrs = attrs
+        self.counts = dict.fromkeys(COUNTS, 0)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        with _lock:
+            for key, value in counts.items():
+                self.counts[key] += value or 0
+
+
+def _open_spans():
+    if threading.current_thread() is threading.main_thread():
+        return _main_spans
+    if not hasattr(_local, 'spans'):
+        _local.spans = []
+    return _local.spans
+
+
+def current_span():
+    """Innermost open span of this thread (or of the main thread, for worker threads), or None."""
+    spans = _open_spans() or _main_spans
+    return spans[-1] if spans else None
+
+
+@contextmanager
+def span(name, cat='file', **attrs):
+    """Measure the enclosed block as a span; yields the `Span`."""
+    parent = current_span()
+    current = Span(name, cat, parent, **attrs)
+    spans = _open_spans()
+    spans.append(current)
+    ts, start, cpu, worker_cpu = time.time(), time.perf_counter(), time.process_time(), children_cpu()
+    status = 'ok'
+    try:
+        yield current
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        spans.pop()
+        if parent is not None:
+            parent.add(**current.counts)
+        if enabled():
+            record = {'name': name, 'cat': cat, 'ts': ts, 'wall_s': time.perf_counter() - start,
+                      'cpu_s': time.process_time() - cpu, 'peak_rss_mb': peak_rss_mb(), 'rss_mb': rss_mb(),
+                      **current.counts, 'status': status, 'parent': parent.name if parent else None,
+                      'pid': os.getpid(), 'tid': threading.get_ident()}
+            if cat == 'stage':
+                record['worker_cpu_s'] = children_cpu() - worker_cpu
+                record['worker_peak_rss_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+            record.update(current.attrs)
+            with _lock:
+                _records.append(record)
+
+
+def call(name, func, *args, **kwargs):
+    """`func(*args, **kwargs)` in a file span named `name` (e.g. a task of a thread pool)."""
+    with span(name):
+        return func(*args, **kwargs)
+
+
+def record_input(rows=0, paths=(), nbytes=0, frame=None):
+    """
+    Count rows and bytes read (the size of `paths` on disk, plus `nbytes`) for
+    the current span, and the in-memory size of the loaded `frame`.
+    """
+    current = current_span()
+    if current is not None and enabled():
+        memory = int(frame.memory_usage(deep=True).sum()) if frame is not None else 0
+        current.add(rows_in=rows, bytes_in=nbytes + file_bytes(paths), memory_in=memory)
+
+
+def record_output(rows=0, paths=(), nbytes=0):
+    """Count rows and bytes written (the size of `paths` on disk, plus `nbytes`) for the current span."""
+    current = current_span()
+    if current is not None and enabled():
+        current.add(rows_out=rows, bytes_out=nbytes + file_bytes(paths))
+
+
+# === Worker processes ===
+def collect():
+    """Remove and return the records of this process (a worker sends them back with its result)."""
+    pid = os.getpid()
+    with _lock:
+        mine = [r for r in _records if r['pid'] == pid]
+        _records[:] = [r for r in _records if r['pid'] != pid]  # forked workers inherit the parent's records
+    return mine
+
+
+def merge(records, counts=None):
+    """Add the records sent back by a worker; its `counts` go to the current span."""
+    with _lock:
+        _records.extend(records)
+    current = current_span()
+    if counts and current is not None:
+        current.add(**counts)
+
+
+# === Output ===
+def trace_events(records, named=()):
+    """Chrome trace events of the records: one complete ('X') event each, plus the names of new processes."""
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+               'args': {'name': 'pipeline' if pid == os.getpid() else f"worker {pid}"}}
+              for pid in sorted({r['pid'] for r in records} - set(named))]
+    for r in records:
+        args = {k: v for k, v in r.items() if k not in ('name', 'cat', 'ts', 'pid', 'tid')}
+        events.append({'name': r['name'], 'cat': r['cat'], 'ph': 'X', 'ts': round(r['ts'] * 1e6),
+                       'dur': round(r['wall_s'] * 1e6), 'pid': r['pid'], 'tid': r['tid'], 'args': args})
+    return events
+
+
+def flush():
+    """Add the records of this run to the telemetry file (if telemetry is on)."""
+    path = output_path()
+    with _lock:
+        records, _records[:] = sorted(_records, key=lambda r: r['ts']), []
+    if path is None or not records:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if not path.endswith('.json'):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(r) + '\n' for r in records)
+        return
+
+    # Chrome trace: one JSON document, so the events of earlier runs are read back and kept
+    from storage import atomic_open  # storage.py counts rows / bytes through this module
+    events = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            events = json.load(f).get('traceEvents', [])
+    with atomic_open(path, 'w', encoding='utf-8') as f:
+        named = {e['pid'] for e in events if e['ph'] == 'M'}
+        json.dump({'traceEvents': events + trace_events(records, named), 'displayTimeUnit': 'ms'}, f)
+
+
+# === Stages ===
+def save_profile(profiler, name, top=15):
+    """Save the statistics of a profiled stage and print its `top` functions by cumulative time."""
+    os.makedirs(profiles_dir, exist_ok=True)
+    path = os.path.join(profiles_dir, f"{name}.prof")
+    profiler.dump_stats(path)
+    print(f"\n=== Profile of stage {name}: {path} ===")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+
+@contextmanager
+def stage(name, **attrs):
+    """
+    Span of a whole stage. The stage runs under cProfile if it is
+    `PIPELINE_PROFILE`, and the records are written out when it ends.
+    """
+    global _profiler
+    profiler = cProfile.Profile() if profile_stage() == name and _profiler is None else None
+    try:
+        with span(name, 'stage', **attrs) as current:
+            if profiler is not None:
+                _profiler = profiler
+                profiler.enable()
+            try:
+                yield current
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    _profiler = None
+    finally:
+        if profiler is not None:
+            save_profile(profiler, name)
+        flush()
@@ -0,0 +1,116 @@
+"""
+===============================================================================
+ Module Name: time_periods.py
+ Author: Igor Latii
+ Description:
+     Parser for Eurostat / World Bank TIME_PERIOD labels, used by
+     `format_time_periods.py`.
+
+     Supported labels and the date they are mapped to (start of the period):
+
+        YYYY          A  annual       → January 1
+        YYYY-S[1-2]   S  semestrial   → January 1 / July 1
+        YYYY-Q[1-4]   Q  quarterly    → first day of the quarter
+        YYYY-MM       M  monthly      → first day of the month
+        YYYY-Wnn      W  weekly       → Monday of the ISO week
+        YYYY-MM-DD    D  daily        → that day
+
+     A table has millions of rows but only a few hundred distinct labels, so
+     the column is factorized once (TIME_PERIOD is already categorical in the
+     long-format tables), every distinct label is parsed once with a single
+     regular expression, and the results are broadcast back to the rows
+     through the category codes. Parsed labels are kept in a cache shared by
+     all tables processed in the same process.
+
+     Unknown or invalid labels (e.g. '2020-Q5', '2020-13') give NaT and an
+     empty frequency.
+
+     `infer_frequency` goes the other way for tables stored without a FREQ
+     column: the lowest frequency whose period starts cover all the dates.
+
+ Dependencies:
+     - pandas, numpy
+     - re, datetime, functools
+===============================================================================
+"""
+
+import re
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# === Frequencies ===
+FREQUENCIES = ['A', 'S', 'Q', 'M', 'W', 'D'] # SDMX frequency codes, from lowest to highest
+
+# One pass over the label: year, then month(-day), quarter, semester or week
+LABEL_PATTERN = re.compile(r'^(\d{4})(?:-(?:(\d{2})(?:-(\d{2}))?|Q([1-4])|S([12])|W(\d{2})))?$')
+
+
+@lru_cache(maxsize=65536)
+def parse_label(label):
+    """Parse one TIME_PERIOD label into (datetime64 or NaT, frequency code or None)."""
+    match = LABEL_PATTERN.match(str(label).strip())
+    if not match:
+        return np.datetime64('NaT'), None
+    year, month, day, quarter, semester, week = match.groups()
+    year = int(year)
+    try:
+        if day:
+            value, freq = date(year, int(month), int(day)), 'D'
+        elif month:
+            value, freq = date(year, int(month), 1), 'M'
+        elif quarter:
+            value, freq = date(year, (int(quarter) - 1) * 3 + 1, 1), 'Q' # Q1 -> January, Q2 -> April, etc.
+        elif semester:
+            value, freq = date(year, (int(semester) - 1) * 6 + 1, 1), 'S' # S1 -> January, S2 -> July
+        elif week:
+            value, freq = date.fromisocalendar(year, int(week), 1), 'W'
+        else:
+            value, freq = date(year, 1, 1), 'A'
+    except ValueError:  # month 13, week 54, February 30, ...
+        return np.datetime64('NaT'), None
+    return np.datetime64(value, 'ns'), freq
+
+
+def parse_time_periods(values):
+    """
+    Parse a column of TIME_PERIOD labels.
+
+    Returns two Series aligned with `values`: the period start as datetime64[ns]
+    and the frequency code (categorical with categories `FREQUENCIES`).
+    """
+    values = pd.Series(values)
+    labels = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+    categories = labels.cat.categories
+    codes = labels.cat.codes.to_numpy() # -1 for missing labels
+
+    # --- Parse each distinct label once (plus a trailing slot for missing labels, code -1) ---
+    parsed = [parse_label(label) for label in categories]
+    dates = np.array([d for d, _ in parsed] + [np.datetime64('NaT')], dtype='datetime64[ns]')
+    freq_codes = np.array([FREQUENCIES.index(f) if f else -1 for _, f in parsed] + [-1], dtype='int8')
+
+    # --- Broadcast to the rows through the category codes ---
+    parsed_dates = pd.Series(dates[codes], index=values.index, name=values.name)
+    freqs = pd.Series(pd.Categorical.from_codes(freq_codes[codes], categories=FREQUENCIES),
+                      index=values.index, name='FREQ')
+    return parsed_dates, freqs
+
+
+def infer_frequency(dates):
+    """
+    Lowest frequency code whose period starts include all `dates` (e.g. 'Q'
+    if every date is January 1, April 1, July 1 or October 1, but not all
+    are January 1); None if there is no valid date.
+    """
+    dates = pd.DatetimeIndex(pd.Series(dates).dropna())
+    if dates.empty:
+        return None
+    if (dates.day == 1).all():
+        months = set(np.unique(dates.month))
+        for freq, starts in (('A', {1}), ('S', {1, 7}), ('Q', {1, 4, 7, 10})):
+            if months <= starts:
+                return freq
+        return 'M'
+    return 'W' if (dates.dayofweek == 0).all() else 'D'
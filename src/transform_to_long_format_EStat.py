@@ -7,77 +7,147 @@
      preparing them for consistent analysis and further time-based processing.
 
  Workflow:
-     1. Load all raw CSV files from /data/raw/ that end with "_raw.csv".
-     2. Detect and rename Eurostat-specific columns (e.g., 'geo\\TIME_PERIOD' → 'geo').
-     3. Identify time-period columns (columns that start with a year or contain 'Q').
-     4. Separate metadata columns (non-period columns) from period data.
-     5. Transform each dataset from wide to long format using pandas.melt().
-     6. Remove empty or invalid rows (where VALUE is NaN).
-     7. Save the reshaped tables to /data/processed/transformed_to_long_format/
-        with the "_long.csv" suffix.
+     1. Find all raw tables in /data/raw/ that end with "_raw" (any storage
+        format, see storage.py).
+     2. Read the header once: rename Eurostat-specific columns
+        (e.g., 'geo\\TIME_PERIOD' → 'geo'), identify time-period columns (columns
+        that start with a year or contain 'Q') and metadata columns.
+     3. Read the table in chunks of `chunk_rows` rows (PIPELINE_CHUNK_ROWS,
+        default 2000). For each chunk:
+        - keep only the series selected in the `dimensions` column of
+          /reports/indicators.csv (e.g. 'unit=CP_MEUR;s_adj=SCA');
+        - transform it from wide to long format, keeping only the non-empty
+          cells (the result of pandas.melt() followed by dropna on VALUE);
+        - append it to the output table.
+        Peak memory therefore follows the chunk size, not the table size:
+        the full melt (rows × periods, mostly empty for long monthly tables)
+        is never built. The reduction in rows and bytes from the dimension
+        selection is reported per table.
+     4. Save the reshaped tables to /data/processed/transformed_to_long_format/
+        with the "_long" suffix (Parquet by default, CSV as optional export).
 
  Output:
-     - One cleaned and reshaped long-format CSV file per indicator.
+     - One cleaned and reshaped long-format table per indicator.
      - Standard columns: TIME_PERIOD, VALUE, and all relevant metadata fields.
 
  Purpose:
      - Standardizes Eurostat datasets for temporal harmonization and merging.
      - Serves as an intermediate step before date formatting and aggregation.
+     - Runs on its own, or file by file from `pipeline.py`, which only
+       re-transforms the raw tables (or dimension selections) that changed.
+     - Tables are processed in parallel worker processes (PIPELINE_WORKERS,
+       see parallel.py); a failing table is reported without stopping the rest.
 
  Dependencies:
      - pandas
      - os
+     - storage.py (pyarrow for Parquet / Feather), pipeline_paths.py, parallel.py, telemetry.py
 ===============================================================================
 """
 
-import pandas as pd
 import os
+from functools import partial
 
-# === Paths ===
-base_dir = os.path.dirname(__file__) # Base directory of the script
-raw_dir = os.path.join(base_dir, '../data/raw') # Directory containing raw CSV files
-processed_dir = os.path.join(base_dir, '../data/processed/transformed_to_long_format') # Directory to save processed files
-os.makedirs(processed_dir, exist_ok=True) # Create processed directory if it does not exist
+import numpy as np
+import pandas as pd
 
-# === Process all Eurostat files in the raw directory ===
-for file in os.listdir(raw_dir):
-    if not file.lower().endswith("_raw.csv"):
-        continue # Skip files that do not match the pattern
+from indicator_config import apply_dimension_filters, code_from_file_name, dimension_filters_by_code, load_indicators
+from parallel import report_failures, run_per_file
+from pipeline_paths import long_dir, raw_dir
+from storage import TableWriter, iter_table, list_tables, read_columns
+import telemetry
+
+# === Chunking ===
+chunk_rows = int(os.environ.get('PIPELINE_CHUNK_ROWS', 2000)) # Raw rows melted at a time
+
+
+def input_stems(input_dir=raw_dir):
+    """Raw Eurostat tables to transform (stems ending with '_raw')."""
+    return list_tables(input_dir, suffix='_raw')
+
+
+def output_stem(stem, output_dir=long_dir):
+    return os.path.join(output_dir, os.path.basename(stem) + "_long")
+
+
+def file_params(stem, dimension_filters):
+    """Settings that affect the output of one file (used by pipeline.py for hashing)."""
+    return {'dimensions': dimension_filters.get(code_from_file_name(os.path.basename(stem), '_raw'), {})}
 
-    print(f"Processing {file} ...")
 
-    file_path = os.path.join(raw_dir, file)
-    # --- Read the CSV file ---
-    df = pd.read_csv(file_path)
+def melt_non_empty(df, meta_cols, period_cols):
+    """
+    Wide-to-long reshape of one chunk that skips empty cells: same rows, order
+    and columns as `df.melt(...).dropna(subset=['VALUE'])`, but the empty cells
+    (often most of a monthly table) are never materialised. TIME_PERIOD is
+    categorical with the period columns of the header as categories.
+    """
+    values = df[period_cols].to_numpy().T                 # periods x rows, i.e. melt order
+    period_idx, row_idx = np.nonzero(pd.notna(values))    # positions of non-empty cells
+    df_long = df[meta_cols].iloc[row_idx].reset_index(drop=True)
+    df_long['TIME_PERIOD'] = pd.Categorical.from_codes(period_idx, categories=period_cols)
+    df_long['VALUE'] = values[period_idx, row_idx]
+    return df_long
 
-    # --- Rename Eurostat-specific column ---
+
+def transform_file(stem, output_dir=long_dir, dimension_filters=None, chunk_rows=chunk_rows):
+    """
+    Reshape one raw Eurostat table to long format, `chunk_rows` rows at a time
+    (the whole table at once if None), and return the written path.
+    """
+    file = os.path.basename(stem)
+    print(f"Processing {file} ...")
+
+    # --- Read the header only ---
     # Some Eurostat CSVs have 'geo\TIME_PERIOD' as a column, rename it to 'geo'
-    if 'geo\\TIME_PERIOD' in df.columns:
-        df = df.rename(columns={'geo\\TIME_PERIOD': 'geo'})
+    rename = {'geo\\TIME_PERIOD': 'geo'}
+    columns = [rename.get(c, c) for c in read_columns(stem)]
 
     # --- Identify period columns ---
     # Columns representing time periods usually start with a year (4 digits) or contain 'Q' for quarters
-    period_cols = [c for c in df.columns if c[:4].isdigit() or 'Q' in c]
+    period_cols = [c for c in columns if c[:4].isdigit() or 'Q' in c]
     print(period_cols)
 
     # --- Identify metadata columns ---
     # All columns that are not period columns are considered metadata
-    meta_cols = [c for c in df.columns if c not in period_cols]
+    meta_cols = [c for c in columns if c not in period_cols]
     print(meta_cols)
 
-    # --- Transform from wide to long format ---
-    df_long = df.melt(
-        id_vars=meta_cols,       # Columns to keep as-is
-        value_vars=period_cols,  # Columns to unpivot
-        var_name='TIME_PERIOD',  # Name for the new column containing period labels
-        value_name='VALUE'       # Name for the new column containing values
-    )
+    filters = file_params(stem, dimension_filters or {})['dimensions']
+    rows_before = rows_after = bytes_before = bytes_after = 0
+
+    # --- Melt chunk by chunk and append to the output table ---
+    with TableWriter(output_stem(stem, output_dir), columns=meta_cols + ['TIME_PERIOD', 'VALUE'],
+                     text_columns=meta_cols) as writer:
+        for df in iter_table(stem, chunk_rows):
+            df = df.rename(columns=rename)
+
+            # --- Keep only the selected series (unit, s_adj, na_item, ...) ---
+            if filters:
+                rows_before, bytes_before = rows_before + len(df), bytes_before + df.memory_usage(deep=True).sum()
+                df = apply_dimension_filters(df, filters, file)
+                rows_after, bytes_after = rows_after + len(df), bytes_after + df.memory_usage(deep=True).sum()
+
+            # --- Transform from wide to long format, keeping non-empty cells only ---
+            writer.write(melt_non_empty(df, meta_cols, period_cols))
+
+    if filters:
+        print(f"Dimension filter {filters}: rows {rows_before} → {rows_after}, "
+              f"bytes {bytes_before} → {bytes_after} (-{1 - bytes_after / max(bytes_before, 1):.0%})")
+    print(f"Done: {writer.rows} rows  → {writer.path}")
+    return writer.path
+
+
+def main():
+    # === Dimension selection per indicator (from indicators.csv) ===
+    dimension_filters = dimension_filters_by_code(load_indicators())
 
-    # --- Remove empty rows ---
-    df_long = df_long.dropna(subset=["VALUE"]) # Drop rows where VALUE is NaN
+    # === Process all Eurostat tables in the raw directory (one worker process per file) ===
+    task = partial(transform_file, output_dir=long_dir, dimension_filters=dimension_filters)
+    results = run_per_file(task, input_stems()) # Only tables matching the Eurostat pattern
+    report_failures(results, 'transform_to_long_format_EStat')
 
-    # --- Save the processed data ---
-    output_file = os.path.join(processed_dir, os.path.basename(file).replace(".csv", "_long.csv"))
-    df_long.to_csv(output_file, index=False) # Save to CSV without the index
 
-    print(f"Done: {len(df_long)} rows  → {output_file}")
\ No newline at end of file
+if __name__ == '__main__':
+    with telemetry.stage('long_estat'):
+        main()
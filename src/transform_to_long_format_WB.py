@@ -2,72 +2,276 @@
 World Bank Data Transformation Script
 =====================================
 
-This script processes raw World Bank CSV files and converts them into a clean,
+This script processes raw World Bank files and converts them into a clean,
 standardized long-format structure for further analysis.
 
+Input files in ../data/raw/:
+- indicator downloads `API_{code}_DS2_*.csv` (e.g. API_SM.POP.NETM_DS2_en_csv_v2_126864.csv),
+  or the zip they come in (`API_{code}_DS2_*.zip`);
+- the bulk export of the World Development Indicators (`WDI_CSV.zip`, or the
+  extracted `WDICSV.csv` / `WDIData.csv`): every indicator of every country,
+  from which all World Bank codes of indicators.csv are taken in one pass.
+A zip is skipped when its data file is also present extracted.
+
 Steps performed:
-1. Reads raw CSV files from ../data/raw/ (only those matching the World Bank pattern).
-2. Skips the initial metadata rows (first 4 lines).
-3. Cleans column names by trimming spaces.
-4. Identifies metadata columns and period columns (years).
-5. Transforms the dataset from wide to long format using pandas.melt().
-6. Converts VALUE fields to numeric and TIME_PERIOD to string.
-7. Filters the dataset to include only rows for Latvia.
-8. Removes empty rows (NaN values).
-9. Saves the cleaned output as *_long.csv into ../data/processed/transformed_to_long_format/.
+1. Opens the file (the data member of a zip is read without extracting it) and
+   finds the header line ("Country Name", "Country Code", ...), after the
+   metadata lines of the indicator downloads.
+2. Filters the rows while reading: only the lines of the selected countries
+   (the `geo_filter` of each indicator in indicators.csv, default LV, i.e.
+   Latvia; World Bank ISO 3166 alpha-3 codes -> Eurostat geo codes, e.g.
+   LVA -> LV, GRC -> EL) and of the requested indicator codes are parsed at
+   all. The others (aggregates such as EUU or WLD, other countries, other
+   indicators of the bulk export) are dropped as text lines.
+3. Parses only the needed columns: Country Code, Indicator Code and the
+   requested years (the optional `years` column of indicators.csv, default
+   all years of the file); country and indicator names are not loaded.
+4. Transforms the rows from wide to long format, keeping only the non-empty
+   cells (VALUE converted to numeric), per indicator.
+5. Saves one table per indicator, in the long schema of the Eurostat side:
+   freq ('A'), indicator, geo, TIME_PERIOD (year label, categorical), VALUE,
+   as *_long (Parquet by default, see storage.py) into
+   ../data/processed/transformed_to_long_format/. An indicator download keeps
+   its file name (API_..._long), an indicator of the bulk export is named
+   WDI_{code}_long. Codes with their own download file are not taken from the
+   bulk export. An indicator with several countries in its geo_filter gets
+   one table per country, named with a `__{geo}` suffix like the Eurostat
+   raw tables of collecting_data.py (API_...__EE_long, WDI_{code}__EE_long),
+   so that the countries stay separate columns when merged outside panel mode.
 
 This preprocessing ensures that World Bank data is consistent with Eurostat datasets,
 allowing for seamless merging and annual aggregation in subsequent analysis steps.
+Runs on its own, or file by file from pipeline.py (incremental rebuilds), with files
+processed in parallel worker processes (PIPELINE_WORKERS, see parallel.py).
 """
 
+import csv
+import io
 import os
+import re
+import zipfile
+from contextlib import contextmanager
+from functools import partial
+
 import pandas as pd
 
-# === Paths ===
-base_dir = os.path.dirname(__file__) # Base directory of the script
-raw_dir = os.path.join(base_dir, '../data/raw') # Directory with raw CSV files
-processed_dir = os.path.join(base_dir, '../data/processed/transformed_to_long_format') # Directory to save processed files
-os.makedirs(processed_dir, exist_ok=True) # Create processed directory if it doesn't exist
+from indicator_config import load_indicators, parse_geos, parse_years
+from parallel import report_failures, run_per_file
+from pipeline_paths import long_dir, raw_dir
+from storage import compact_dtypes, write_table
+import telemetry
+from transform_to_long_format_EStat import melt_non_empty
+
+# === Country codes: World Bank (ISO 3166 alpha-3) -> Eurostat geo ===
+eurostat_geo = {
+    'AUT': 'AT', 'BEL': 'BE', 'BGR': 'BG', 'HRV': 'HR', 'CYP': 'CY', 'CZE': 'CZ', 'DNK': 'DK',
+    'EST': 'EE', 'FIN': 'FI', 'FRA': 'FR', 'DEU': 'DE', 'GRC': 'EL', 'HUN': 'HU', 'IRL': 'IE',
+    'ITA': 'IT', 'LVA': 'LV', 'LTU': 'LT', 'LUX': 'LU', 'MLT': 'MT', 'NLD': 'NL', 'POL': 'PL',
+    'PRT': 'PT', 'ROU': 'RO', 'SVK': 'SK', 'SVN': 'SI', 'ESP': 'ES', 'SWE': 'SE',       # EU-27
+    'ISL': 'IS', 'NOR': 'NO', 'CHE': 'CH', 'LIE': 'LI', 'GBR': 'UK', 'TUR': 'TR', 'MNE': 'ME',
+    'MKD': 'MK', 'ALB': 'AL', 'SRB': 'RS', 'BIH': 'BA', 'XKX': 'XK', 'UKR': 'UA', 'MDA': 'MD',
+    'GEO': 'GE', 'ARM': 'AM', 'AZE': 'AZ', 'BLR': 'BY', 'USA': 'US', 'JPN': 'JP', 'CHN': 'CN',
+}
+iso3_codes = {geo: iso3 for iso3, geo in eurostat_geo.items()}
+
+# === File names ===
+api_file = re.compile(r'^API_(.+?)_DS2.*\.(csv|zip)$', re.IGNORECASE)  # one indicator
+bulk_file = re.compile(r'^(WDI_?CSV\.zip|WDICSV\.csv|WDIData\.csv)$', re.IGNORECASE)  # all indicators
+bulk_member = re.compile(r'(^|/)(WDICSV|WDIData)\.csv$', re.IGNORECASE)
+wb_code = re.compile(r'^[A-Z][A-Z0-9_]*(\.[A-Z0-9_]+)+$')  # SM.POP.NETM (Eurostat codes are lower case)
+
+LONG_COLUMNS = ['freq', 'indicator', 'geo', 'TIME_PERIOD', 'VALUE']
+
+
+def is_bulk(file_path):
+    return bool(bulk_file.match(os.path.basename(file_path)))
+
+
+def data_member(zip_path):
+    """Name of the data file inside a World Bank zip (the API_ or WDI CSV, not the Metadata_ files)."""
+    with zipfile.ZipFile(zip_path) as archive:
+        names = archive.namelist()
+    pattern = bulk_member if is_bulk(zip_path) else re.compile(r'(^|/)API_[^/]*\.csv$', re.IGNORECASE)
+    matches = [n for n in names if pattern.search(n)]
+    if not matches:
+        raise ValueError(f"{os.path.basename(zip_path)}: no World Bank data file in the archive")
+    return matches[0]
+
+
+def input_stems(input_dir=raw_dir):
+    """World Bank files in the raw directory: indicator downloads and the bulk export (CSV or zip)."""
+    if not os.path.isdir(input_dir):
+        return []
+    files = sorted(f for f in os.listdir(input_dir) if api_file.match(f) or bulk_file.match(f))
+    stems = []
+    for name in files:
+        path = os.path.join(input_dir, name)
+        # A zip next to its extracted data file would give the same tables twice
+        if name.lower().endswith('.zip') and os.path.basename(data_member(path)) in files:
+            continue
+        stems.append(path)
+    return stems
+
+
+# === Indicators of a file ===
+def file_code(file_path):
+    """World Bank code of an indicator download ('API_SM.POP.NETM_DS2_...' -> SM.POP.NETM), None for the bulk export."""
+    match = api_file.match(os.path.basename(file_path))
+    return match.group(1) if match else None
+
+
+def indicator_settings(row):
+    return {'geos': parse_geos(row.get('geo_filter')), 'years': parse_years(row.get('years'))}
+
+
+def file_indicators(file_path, indicators=None):
+    """
+    Indicators to take from a World Bank file, as {code: {'geos', 'years'}}:
+    the code of an indicator download (LV and all years when it is not in
+    indicators.csv), or every World Bank code of indicators.csv without its
+    own download file for the bulk export.
+    """
+    indicators = load_indicators() if indicators is None else indicators
+    settings = {str(row['code']).strip(): indicator_settings(row) for _, row in indicators.iterrows()}
+    code = file_code(file_path)
+    if code is not None:
+        return {code: settings.get(code, {'geos': parse_geos(None), 'years': None})}
+    downloaded = {file_code(p) for p in input_stems(os.path.dirname(file_path))}
+    return {c: s for c, s in settings.items() if wb_code.match(c) and c not in downloaded}
+
 
-# === Process all WorldBank files in the raw directory ===
-for file in os.listdir(raw_dir):
-    if not file.lower().endswith("126864.csv"):
-        continue # Skip files that do not match the pattern
+def file_params(file_path, indicators=None):
+    """Settings that affect the outputs of one file (used by pipeline.py for hashing)."""
+    return {'indicators': file_indicators(file_path, indicators)}
 
-    print(f"Processing  {file} ...")
-    file_path = os.path.join(raw_dir, file)
 
-    # --- Read the CSV file ---
-    # Skip first 4 rows which usually contain metadata (source, date, empty row, header row)
-    df = pd.read_csv(file_path, skiprows=4, sep=",", quotechar='"')
+def output_stem(file_path, output_dir=long_dir, code=None, geo=None):
+    """
+    Long table of an indicator download (its file name), or of one `code` of
+    the bulk export; `{name}__{geo}_long` for one `geo` of a multi-geo indicator.
+    """
+    if code is None or not is_bulk(file_path):
+        name = os.path.splitext(os.path.basename(file_path))[0]
+    else:
+        name = f"WDI_{code}"
+    return os.path.join(output_dir, f"{name}__{geo}_long" if geo else f"{name}_long")
 
-    # --- Clean column names ---
-    # Remove leading/trailing whitespace from column names
+
+def table_geos(settings):
+    """Geo of each long table of an indicator: [None] (one table) for a single geo, else one per geo."""
+    return settings['geos'] if len(settings['geos']) > 1 else [None]
+
+
+def output_stems(file_path, output_dir=long_dir, indicators=None):
+    """All long tables written for one World Bank file (one per indicator of the bulk export, and per geo)."""
+    return [output_stem(file_path, output_dir, code, geo)
+            for code, settings in file_indicators(file_path, indicators).items() for geo in table_geos(settings)]
+
+
+# === Reading ===
+@contextmanager
+def open_data(file_path):
+    """Text stream of a World Bank CSV, or of the data file of a zip (read without extracting)."""
+    if file_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(file_path) as archive, archive.open(data_member(file_path)) as raw:
+            yield io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    else:
+        with open(file_path, encoding='utf-8-sig', newline='') as f:
+            yield f
+
+
+def read_header(stream, max_lines=20):
+    """Skip the metadata lines (source, last update date) and return the header line."""
+    for _ in range(max_lines):
+        line = stream.readline()
+        if line.lstrip('"').startswith('Country Name'):
+            return line
+    raise ValueError("No 'Country Name' header line found")
+
+
+def row_filter(iso3, codes):
+    """
+    Regex matching the lines whose 2nd field (Country Code) is one of `iso3`
+    and 4th field (Indicator Code) one of `codes`, quoted or not; the names
+    in fields 1 and 3 may hold quoted commas.
+    """
+    field = r'(?:"(?:[^"]|"")*"|[^,"]*)'
+    return re.compile(rf'{field},"?(?:{alternatives(iso3)})"?,{field},"?(?:{alternatives(codes)})"?,')
+
+
+def alternatives(values):
+    """Regex alternation of the literal `values`: {'LVA', 'EST'} -> 'EST|LVA'."""
+    return '|'.join(re.escape(v) for v in sorted(values))
+
+
+def read_selected(file_path, wanted):
+    """
+    Rows of the selected countries and indicators of a World Bank file, with
+    only the Country Code, Indicator Code and requested year columns. The
+    other lines are skipped as text, before pandas parses anything.
+    """
+    iso3 = {iso3_codes[g] for s in wanted.values() for g in s['geos'] if g in iso3_codes}
+    with open_data(file_path) as stream:
+        header = read_header(stream)
+        columns = [c.strip() for c in next(csv.reader([header]))]
+        years = [c for c in columns if c.isdigit() and len(c) == 4]
+        requested = set()
+        for settings in wanted.values():
+            requested |= set(years) if settings['years'] is None else {str(y) for y in settings['years']}
+        lines = []
+        if iso3 and wanted:
+            match = row_filter(iso3, wanted).match
+            lines = [line for line in stream if match(line)]
+
+    usecols = ['Country Code', 'Indicator Code'] + [c for c in years if c in requested]
+    df = pd.read_csv(io.StringIO(header + ''.join(lines)), usecols=lambda c: c.strip() in usecols,
+                     dtype=str, keep_default_na=False)
     df.columns = [c.strip() for c in df.columns]
+    return df[usecols]
+
+
+def indicator_long(df, code, settings):
+    """Long table of one indicator from the selected rows (non-empty cells of its countries and years)."""
+    rows = df[(df['Indicator Code'] == code) & df['geo'].isin(settings['geos'])]
+    years = [c for c in df.columns if c.isdigit() and (settings['years'] is None or int(c) in settings['years'])]
+    values = rows[years].apply(pd.to_numeric, errors='coerce') # Invalid parsing becomes NaN
+    wide = pd.concat([rows[['geo']].assign(indicator=code), values], axis=1)
+    df_long = melt_non_empty(wide, ['indicator', 'geo'], years)
+    df_long['TIME_PERIOD'] = df_long['TIME_PERIOD'].cat.remove_unused_categories()
+    df_long.insert(0, 'freq', 'A')
+    return compact_dtypes(df_long[LONG_COLUMNS])
+
+
+def transform_file(file_path, output_dir=long_dir, indicators=None):
+    """Reshape the selected indicators of one World Bank file to long format and return the written path(s)."""
+    print(f"Processing  {os.path.basename(file_path)} ...")
+    wanted = file_indicators(file_path, indicators)
 
-    # --- Identify metadata and period columns ---
-    meta_cols = ["Country Name", "Country Code", "Indicator Name", "Indicator Code"] # Columns describing metadata
-    period_cols = [c for c in df.columns if c not in meta_cols] # Remaining columns are time periods (years)
+    # --- Read only the selected rows and columns ---
+    df = read_selected(file_path, wanted)
+    telemetry.record_input(len(df), file_path, frame=df)
+    df['geo'] = df['Country Code'].map(eurostat_geo) # Eurostat code of every country
 
-    # --- Transform from wide to long format ---
-    df_long = df.melt(
-        id_vars=meta_cols,       # Columns to keep as-is
-        value_vars=period_cols,  # Columns to unpivot
-        var_name="TIME_PERIOD",  # Name for the new column containing period labels
-        value_name="VALUE"       # Name for the new column containing values
-    )
+    # --- One long table per indicator (and per geo of a multi-geo indicator) ---
+    written = []
+    for code, settings in wanted.items():
+        for geo in table_geos(settings):
+            geos = settings['geos'] if geo is None else [geo]
+            df_long = indicator_long(df, code, {**settings, 'geos': geos})
+            if df_long.empty:
+                print(f"WARNING: no values of {code} for {';'.join(geos)} in {os.path.basename(file_path)}")
+            output_file = write_table(df_long, output_stem(file_path, output_dir, code, geo)) # Typed, atomic write
+            print(f"Done: {code} {len(df_long)} rows  → {output_file}")
+            written.append(output_file)
+    return written[0] if len(written) == 1 else written
 
-    # --- Clean data ---
-    df_long["TIME_PERIOD"] = df_long["TIME_PERIOD"].astype(str).str.strip() # Strip whitespace from period labels
-    df_long["VALUE"] = pd.to_numeric(df_long["VALUE"], errors='coerce') # Convert values to numeric, invalid parsing becomes NaN
 
-    # --- Remove empty rows ---
-    df_long = df_long.dropna(subset=["VALUE"]) # Drop rows where VALUE is NaN
+def main():
+    # === Process all WorldBank files in the raw directory (one worker process per file) ===
+    results = run_per_file(partial(transform_file, output_dir=long_dir), input_stems())
+    report_failures(results, 'transform_to_long_format_WB')
 
-    # --- Filter by specific country ---
-    df_long = df_long[df_long["Country Name"] == "Latvia"] # Keep only rows for Latvia
 
-    # --- Save the processed data ---
-    output_file = os.path.join(processed_dir, file.replace(".csv", "_long.csv"))
-    df_long.to_csv(output_file, index=False) # Save to CSV without the index
-    print(f"Done: {len(df_long)} rows  → {output_file}")
+if __name__ == '__main__':
+    with telemetry.stage('long_wb'):
+        main()
@@ -0,0 +1,89 @@
+"""
+===============================================================================
+ Script Name: test_delta.py
+ Author: Igor Latii
+ Description:
+     Tests of the row-level delta updates: the merged dataset updated after a
+     changed formatted table (src/make_merged_df.py, the wide CSV patched at
+     the changed keys only) is identical to a full merge, byte for byte; the
+     row filters of the annual update (src/aggregate_annual_indicators.py)
+     cover every period holding a changed key.
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import make_merged_df  # noqa: E402
+from aggregate_annual_indicators import period_filters  # noqa: E402
+from frequency_blocks import read_wide, records_frame  # noqa: E402
+from storage import filter_rows, write_table  # noqa: E402
+
+
+def write_formatted(directory, name, labels, values):
+    write_table(pd.DataFrame({'TIME_PERIOD': labels, 'VALUE': values}), os.path.join(directory, name + '_formatted'))
+
+
+def write_inputs(directory, panel, revised=False):
+    """Quarterly GDP and annual Population (per geo in panel mode); `revised`: one GDP value changed, a quarter added."""
+    os.makedirs(directory, exist_ok=True)
+    quarters = [f"{y}-{m:02d}-01" for y in (2019, 2020) for m in (1, 4, 7, 10)]
+    for geo, scale in [('EE', 1.0), ('LV', 2.0)] if panel else [(None, 1.0)]:
+        suffix = f"__{geo}" if geo else ''
+        gdp = list(np.arange(8) * scale)
+        if revised and geo != 'EE':
+            gdp[2], quarters_gdp = gdp[2] + 0.5, quarters + ['2021-01-01']
+            gdp.append(9.0)
+        else:
+            quarters_gdp = quarters
+        write_formatted(directory, 'gdp_q' + suffix, quarters_gdp, gdp)
+        write_formatted(directory, 'pop_a' + suffix, ['2019-01-01', '2020-01-01'], [1.5 * scale, 1.4 * scale])
+
+
+def merged_after(mode, tmp_path, panel):
+    formatted, output_dir = str(tmp_path / mode / 'formatted'), str(tmp_path / mode / 'merged')
+    write_inputs(formatted, panel)
+    make_merged_df.merge_tables(make_merged_df.input_stems(formatted), output_dir, panel=panel)
+    write_inputs(formatted, panel, revised=True)
+    stems = make_merged_df.input_stems(formatted)
+    if mode == 'full':
+        keys = make_merged_df.merge_tables(stems, output_dir, panel=panel)
+    else:
+        changed = ['gdp_q__LV_formatted'] if panel else ['gdp_q_formatted']
+        keys = make_merged_df.update_tables(stems, changed, output_dir, panel=panel)
+    stem = make_merged_df.output_stem(output_dir)
+    with open(stem + '.csv', encoding='utf-8') as f:
+        return keys, read_wide(stem), f.read()
+
+
+@pytest.mark.parametrize('panel', [True, False])
+def test_update_matches_merge(tmp_path, panel):
+    _, full, full_csv = merged_after('full', tmp_path, panel)
+    keys, delta, delta_csv = merged_after('delta', tmp_path, panel)
+
+    pd.testing.assert_frame_equal(delta, full)
+    assert delta_csv == full_csv
+    geo = 'LV' if panel else None
+    assert keys == [[geo, '2019-07-01'], [geo, '2021-01-01']]
+
+
+def test_period_filters():
+    changed = records_frame([['LV', '2020-02-01'], ['EE', '2021-11-01']])
+    filters = period_filters(changed, ['A', 'Q'], ['geo'])
+
+    assert filters == [('TIME_PERIOD', '>=', pd.Timestamp('2020-01-01')), ('TIME_PERIOD', '<', pd.Timestamp('2022-01-01')),
+                       ('geo', 'in', ['EE', 'LV'])]
+    assert period_filters(changed.iloc[:0], ['A'], ['geo']) is None
+
+    rows = pd.DataFrame({'geo': ['LV', 'LV', 'DE', 'EE'],
+                         'TIME_PERIOD': pd.to_datetime(['2019-12-01', '2020-06-01', '2020-06-01', '2021-12-01'])})
+    assert filter_rows(rows, filters).index.tolist() == [1, 3]
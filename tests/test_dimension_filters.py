@@ -0,0 +1,89 @@
+"""
+===============================================================================
+ Script Name: test_dimension_filters.py
+ Author: Igor Latii
+ Description:
+     Tests of the Eurostat dimension filters (the `dimensions` column of
+     indicators.csv, src/indicator_config.py): parsing, the row filter on a
+     wide table, the streaming download path (src/eurostat_stream.py) and the
+     long format (src/transform_to_long_format_EStat.py).
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import csv
+import gzip
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from eurostat_stream import stream_filter  # noqa: E402
+from indicator_config import apply_dimension_filters, dimension_filters_by_code, parse_dimension_filters  # noqa: E402
+from storage import read_table  # noqa: E402
+from transform_to_long_format_EStat import transform_file  # noqa: E402
+
+FILTERS = {'unit': ['CP_MEUR', 'CLV10_MEUR'], 's_adj': ['SCA']}
+
+
+def wide_table():
+    return pd.DataFrame({'freq': ['Q'] * 4, 'unit': ['CP_MEUR', 'CLV10_MEUR', 'PCH_PRE', 'CP_MEUR'],
+                         's_adj': ['SCA', 'SCA', 'SCA', 'NSA'], 'geo\\TIME_PERIOD': ['LV'] * 4,
+                         '2020-Q1': [1.0, 2.0, 3.0, 4.0]})
+
+
+def test_parse_dimension_filters():
+    assert parse_dimension_filters('unit=CP_MEUR+CLV10_MEUR; s_adj=SCA;') == FILTERS
+    assert parse_dimension_filters('') == {} and parse_dimension_filters(float('nan')) == {}
+    with pytest.raises(ValueError, match="Invalid dimension filter 'unit'"):
+        parse_dimension_filters('unit')
+
+
+def test_dimension_filters_by_code():
+    indicators = pd.DataFrame({'code': ['namq_10_gdp', 'une_rt_m'],
+                               'dimensions': ['unit=CP_MEUR+CLV10_MEUR;s_adj=SCA', '']})
+    assert dimension_filters_by_code(indicators) == {'namq_10_gdp': FILTERS, 'une_rt_m': {}}
+    assert dimension_filters_by_code(indicators.drop(columns='dimensions')) == {}
+
+
+def test_apply_dimension_filters():
+    kept = apply_dimension_filters(wide_table(), FILTERS, 'namq_10_gdp')
+    assert kept['unit'].tolist() == ['CP_MEUR', 'CLV10_MEUR']
+    # Dimensions are matched by name, also with the Eurostat suffix of the geo column
+    assert apply_dimension_filters(wide_table(), {'geo': ['EE']}).empty
+    with pytest.raises(ValueError, match="namq_10_gdp: unknown dimension"):
+        apply_dimension_filters(wide_table(), {'na_item': ['B1GQ']}, 'namq_10_gdp')
+
+
+def test_stream_filter_skips_other_series(tmp_path):
+    source = tmp_path / 'namq_10_gdp.tsv.gz'
+    lines = ["freq,unit,s_adj,geo\\TIME_PERIOD\t2020-Q1 ", "Q,CP_MEUR,SCA,LV\t1.0 ", "Q,CLV10_MEUR,SCA,LV\t2.0 p",
+             "Q,CP_MEUR,SCA,EE\t3.0 ", "Q,PCH_PRE,SCA,LV\t: ", "Q,CP_MEUR,NSA,LV\t4.0 "]
+    with gzip.open(source, 'wt', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    output = tmp_path / 'namq_10_gdp_raw.csv'
+
+    counts = stream_filter(str(source), {'LV': str(output)}, {dim: set(codes) for dim, codes in FILTERS.items()})
+
+    assert counts == {'rows_read': 5, 'LV': 2}
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert [r[1] for r in rows[1:]] == ['CP_MEUR', 'CLV10_MEUR']
+    assert [r[4] for r in rows[1:]] == ['1.0', '2.0'] # flags dropped
+    with pytest.raises(ValueError, match="Unknown dimension"):
+        stream_filter(str(source), {'LV': str(output)}, {'na_item': {'B1GQ'}})
+
+
+def test_long_format_applies_the_filters(tmp_path):
+    wide_table().to_csv(tmp_path / 'namq_10_gdp_raw.csv', index=False)
+
+    path = transform_file(str(tmp_path / 'namq_10_gdp_raw'), str(tmp_path), {'namq_10_gdp': FILTERS}, chunk_rows=3)
+    df = read_table(path)
+
+    assert df['unit'].tolist() == ['CP_MEUR', 'CLV10_MEUR']
+    assert df['VALUE'].tolist() == [1.0, 2.0]
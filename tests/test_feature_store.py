@@ -0,0 +1,77 @@
+"""
+===============================================================================
+ Script Name: test_feature_store.py
+ Author: Igor Latii
+ Description:
+     Tests of the derived-feature store (src/feature_store.py): a delta
+     update() after new and revised annual rows gives the same table as a
+     full build(), and returns the changed (geo, Year) keys; update() asks for
+     a full build when nothing is stored or the indicators changed.
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import feature_store  # noqa: E402
+from storage import read_table, write_table  # noqa: E402
+
+SPECS = pd.DataFrame({'feature': ['growth', 'rolling_mean', 'lag', 'per_capita'], 'indicators': ['*'] * 4,
+                      'periods': [1, 3, 2, 1], 'base': ['', '', '', 'Population']})
+
+
+def make_annual(panel, years=range(2000, 2012)):
+    rng = np.random.default_rng(0)
+    geos = ['EE', 'LV'] if panel else [None]
+    keys = pd.DataFrame([(g, y) for g in geos for y in years], columns=['geo', 'Year'])
+    values = rng.lognormal(3, 1, (len(keys), 3))
+    values[3, 1] = np.nan
+    annual = pd.concat([keys, pd.DataFrame(values, columns=['Population', 'GDP', 'Exports'])], axis=1)
+    return annual.astype({'geo': 'category'}) if panel else annual.drop(columns='geo')
+
+
+def features_after(mode, tmp_path, history, annual):
+    out_dir = str(tmp_path / mode)
+    os.makedirs(out_dir)
+    input_file = os.path.join(out_dir, 'merged_df_annual')
+    write_table(history, input_file)
+    feature_store.build(input_file, out_dir, SPECS)
+    write_table(annual, input_file)
+    keys = feature_store.build(input_file, out_dir, SPECS) if mode == 'full' else \
+        feature_store.update(input_file, out_dir, SPECS)
+    return keys, read_table(feature_store.output_stem(out_dir))
+
+
+@pytest.mark.parametrize('panel', [True, False])
+def test_update_matches_build(tmp_path, panel):
+    annual = make_annual(panel)
+    history = annual[annual['Year'] < 2011].reset_index(drop=True)
+    revised = annual['Year'] == 2008
+    annual.loc[revised, 'GDP'] = annual.loc[revised, 'GDP'] * 1.1 # a revision in the stored history
+
+    _, full = features_after('full', tmp_path, history, annual)
+    keys, delta = features_after('delta', tmp_path, history, annual)
+
+    pd.testing.assert_frame_equal(delta, full)
+    geos = ['EE', 'LV'] if panel else [None]
+    assert keys == sorted([[g, y] for g in geos for y in (2008, 2011)], key=lambda k: (k[0] or '', k[1]))
+
+
+def test_update_needs_a_full_build(tmp_path):
+    input_file = str(tmp_path / 'merged_df_annual')
+    annual = make_annual(panel=True)
+    write_table(annual, input_file)
+    assert feature_store.update(input_file, str(tmp_path), SPECS) is None # nothing stored yet
+
+    feature_store.build(input_file, str(tmp_path), SPECS)
+    write_table(annual.drop(columns='Exports'), input_file)
+    assert feature_store.update(input_file, str(tmp_path), SPECS) is None # other indicators
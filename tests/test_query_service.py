@@ -0,0 +1,118 @@
+"""
+===============================================================================
+ Script Name: test_query_service.py
+ Author: Igor Latii
+ Description:
+     Tests of the query service (src/query_service.py) on a small panel:
+     slices by indicator, geo, inclusive time range and frequency, rows
+     without any requested value dropped, the reload when the outputs are
+     rewritten, and bad query arguments reported as errors (KeyError /
+     ValueError in-process, 400 over HTTP, exit message in the CLI).
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import json
+import os
+import sys
+import threading
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from frequency_blocks import write_blocks  # noqa: E402
+from query_service import QueryService, main, make_server  # noqa: E402
+
+
+def write_merged(directory, scale=1.0):
+    """Merged dataset with a quarterly block (GDP, Exports) and an annual one (Population), geos LV and EE."""
+    quarters = pd.date_range('2019-01-01', periods=8, freq='QS')
+    q = pd.DataFrame({'geo': np.repeat(['LV', 'EE'], 8), 'TIME_PERIOD': np.tile(quarters, 2),
+                      'GDP': np.arange(16, dtype='float64') * scale, 'Exports': np.nan})
+    q.loc[[0, 9], 'GDP'] = np.nan # LV 2019-Q1 and EE 2019-Q2 have no GDP
+    q.loc[9, 'Exports'] = 5.0
+    a = pd.DataFrame({'geo': ['LV', 'LV', 'EE'], 'TIME_PERIOD': pd.to_datetime(['2019', '2020', '2020']),
+                      'Population': [1.9, 1.8, 1.3]})
+    blocks = {'Q': q.astype({'geo': 'category'}), 'A': a.astype({'geo': 'category'})}
+    write_blocks(blocks, ['GDP', 'Exports', 'Population'], os.path.join(directory, 'merged_df_readable'),
+                 keys=['geo', 'TIME_PERIOD'])
+
+
+@pytest.fixture
+def service(tmp_path):
+    write_merged(str(tmp_path))
+    return QueryService(str(tmp_path), check_interval=0)
+
+
+def test_slice_by_indicator_geo_and_time(service):
+    blocks = service.query('merged', ['GDP'], geos='EE', start='2019-04', end='2020')
+
+    assert list(blocks) == ['Q']
+    df = blocks['Q']
+    # 2019-Q2 has no GDP for EE: dropped; the end bound '2020' includes the whole year
+    assert df['TIME_PERIOD'].tolist() == ['2019-Q3', '2019-Q4', '2020-Q1', '2020-Q2', '2020-Q3', '2020-Q4']
+    assert df['geo'].tolist() == ['EE'] * 6
+    assert df['GDP'].tolist() == [10.0, 11.0, 12.0, 13.0, 14.0, 15.0]
+
+
+def test_rows_kept_when_any_indicator_has_a_value(service):
+    df = service.query('merged', 'GDP;Exports', geos=['EE'], start='2019-Q2', end='2019-Q2')['Q']
+    assert df['TIME_PERIOD'].tolist() == ['2019-Q2']
+    assert np.isnan(df['GDP'].iloc[0]) and df['Exports'].iloc[0] == 5.0
+
+
+def test_all_geos_and_frequencies(service):
+    blocks = service.query('merged', start='2020', end='2020')
+    assert sorted(blocks) == ['A', 'Q']
+    assert blocks['A']['geo'].tolist() == ['EE', 'LV'] # rows in geo, then period order
+    assert blocks['A']['TIME_PERIOD'].tolist() == ['2020', '2020']
+    assert list(service.query('merged', freq='a')) == ['A']
+
+
+def test_reload_after_new_outputs(service, tmp_path):
+    before = service.query('merged', ['GDP'], geos='LV', start='2019-Q2', end='2019-Q2')['Q']['GDP'].tolist()
+    assert service.query('merged', ['GDP'], geos='LV', start='2019-Q2', end='2019-Q2')['Q']['GDP'].tolist() == before
+    assert service.cache_stats()['hits'] == 1
+
+    write_merged(str(tmp_path), scale=10.0)
+    after = service.query('merged', ['GDP'], geos='LV', start='2019-Q2', end='2019-Q2')['Q']['GDP'].tolist()
+    assert (before, after) == ([1.0], [10.0])
+    assert service.stats['reloads'] == 2
+
+
+@pytest.mark.parametrize('kwargs, error, message', [({'dataset': 'weekly'}, KeyError, "Unknown dataset 'weekly'"),
+                                                    ({'indicators': 'GNP'}, KeyError, "Unknown indicator"),
+                                                    ({'start': '2020-Q5'}, ValueError, None)])
+def test_bad_arguments(service, kwargs, error, message):
+    with pytest.raises(error, match=message):
+        service.query(**kwargs)
+
+
+def test_http(service):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urlopen(f"{url}/query?indicator={quote('GDP')}&geo=LV&start=2020-Q4") as response:
+            body = json.loads(response.read())
+        assert body['blocks']['Q']['data'] == [['LV', '2020-Q4', 7.0]]
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/query?indicator=GNP")
+        assert error.value.code == 400 and 'GNP' in json.loads(error.value.read())['error']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cli_error_without_traceback(tmp_path):
+    write_merged(str(tmp_path))
+    with pytest.raises(SystemExit, match="^ERROR: Unknown indicator"):
+        main(['--dir', str(tmp_path), 'query', '--indicator', 'GNP'])
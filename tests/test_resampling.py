@@ -0,0 +1,114 @@
+"""
+===============================================================================
+ Script Name: test_resampling.py
+ Author: Igor Latii
+ Description:
+     Tests of the resampling rules (src/resampling.py): every aggregation,
+     min_count, linear / ffill interpolation with max_gap, gaps that are
+     never filled across countries, and the validation of resampling.csv.
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from resampling import load_rules, resample  # noqa: E402
+
+
+def rules_file(tmp_path, text):
+    path = tmp_path / 'resampling.csv'
+    path.write_text(text, encoding='utf-8')
+    return load_rules(str(path))
+
+
+def monthly_block(values, start='2020-01-01', **keys):
+    block = pd.DataFrame({'TIME_PERIOD': pd.date_range(start, periods=len(values), freq='MS'), 'x': values})
+    return block.assign(**keys)[list(keys) + ['TIME_PERIOD', 'x']]
+
+
+@pytest.mark.parametrize('aggregation, expected', [('sum', [6.0, 15.0]), ('mean', [2.0, 5.0]), ('first', [1.0, 4.0]),
+                                                   ('last', [3.0, 6.0]), ('min', [1.0, 4.0]), ('max', [3.0, 6.0])])
+def test_aggregations_to_quarters(tmp_path, aggregation, expected):
+    rules = rules_file(tmp_path, f"indicator,aggregation\nx,{aggregation}\n")
+    result = resample({'M': monthly_block([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])}, rules, target='Q')
+
+    assert result['TIME_PERIOD'].tolist() == [pd.Timestamp('2020-01-01'), pd.Timestamp('2020-04-01')]
+    assert result['x'].tolist() == expected
+
+
+def test_weighted_mean_by_days(tmp_path):
+    # January (31 days) and February 2020 (29 days): weights 31 and 29
+    rules = rules_file(tmp_path, "indicator,aggregation\nx,weighted\n")
+    result = resample({'M': monthly_block([1.0, 2.0])}, rules, target='A')
+
+    assert result['Year'].tolist() == [2020]
+    assert result['x'].tolist() == pytest.approx([(31 * 1.0 + 29 * 2.0) / 60])
+
+
+def test_min_count_and_zero_totals(tmp_path):
+    rules = rules_file(tmp_path, "indicator,aggregation,min_count\nx,sum,0\ny,sum,2\nz,mean,2\n")
+    block = monthly_block([1.0, np.nan, np.nan, np.nan, np.nan, np.nan]).assign(y=[1.0, 2.0, 3.0, 4.0, np.nan, np.nan])
+    block['z'] = block['y']
+    result = resample({'M': block}, rules, target='Q')
+
+    assert result['x'].tolist() == [1.0, 0.0] # an empty quarter totals 0 with min_count 0
+    assert result['y'].tolist()[0] == 6.0 and np.isnan(result['y'].tolist()[1])
+    assert result['z'].tolist()[0] == 2.0 and np.isnan(result['z'].tolist()[1])
+
+
+@pytest.mark.parametrize('interpolation, max_gap, expected', [
+    ('linear', '', [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]),
+    ('linear', '2', [1.0, 2.0, 3.0, 4.0, np.nan, np.nan, np.nan, 8.0]),    # the 3-month gap is too long
+    ('ffill', '', [1.0, 1.0, 1.0, 4.0, 4.0, 4.0, 4.0, 8.0]),
+    ('ffill', '2', [1.0, 1.0, 1.0, 4.0, 4.0, 4.0, np.nan, 8.0]),
+    ('none', '', [1.0, np.nan, np.nan, 4.0, np.nan, np.nan, np.nan, 8.0])])
+def test_interpolation_and_max_gap(tmp_path, interpolation, max_gap, expected):
+    rules = rules_file(tmp_path, f"indicator,aggregation,interpolation,max_gap\nx,mean,{interpolation},{max_gap}\n")
+    values = [1.0, np.nan, np.nan, 4.0, np.nan, np.nan, np.nan, 8.0]
+    result = resample({'M': monthly_block(values)}, rules, target='M')
+
+    np.testing.assert_array_equal(result['x'].to_numpy(), expected)
+
+
+def test_gaps_are_not_filled_across_countries(tmp_path):
+    rules = rules_file(tmp_path, "indicator,aggregation,interpolation\nx,mean,ffill\n")
+    block = pd.concat([monthly_block([1.0, 2.0], geo='EE'), monthly_block([np.nan, 3.0], geo='LV')],
+                      ignore_index=True)
+    result = resample({'M': block}, rules, target='M', by=['geo'])
+
+    assert result['geo'].tolist() == ['EE', 'EE', 'LV', 'LV']
+    np.testing.assert_array_equal(result['x'].to_numpy(), [1.0, 2.0, np.nan, 3.0])
+
+
+def test_annual_series_in_quarterly_target(tmp_path):
+    # A lower frequency is not split: the annual value goes to the quarter of its start date
+    rules = rules_file(tmp_path, "indicator,aggregation\nx,sum\ny,mean\n")
+    blocks = {'A': pd.DataFrame({'TIME_PERIOD': pd.to_datetime(['2020-01-01']), 'y': [10.0]}),
+              'M': monthly_block([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])}
+    result = resample(blocks, rules, target='Q')
+
+    assert result['x'].tolist() == [6.0, 15.0]
+    np.testing.assert_array_equal(result['y'].to_numpy(), [10.0, np.nan])
+
+
+@pytest.mark.parametrize('text, message', [("indicator,aggregation\nx,median\n", "unknown aggregation 'median'"),
+                                           ("indicator,interpolation\nx,cubic\n", "unknown interpolation 'cubic'"),
+                                           ("indicator,aggregation\nx,sum\nx,mean\n", "Duplicate resampling rules")])
+def test_invalid_rules(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        rules_file(tmp_path, text)
+
+
+def test_missing_indicator(tmp_path):
+    rules = rules_file(tmp_path, "indicator,aggregation\nx,sum\nGDP,mean\n")
+    with pytest.raises(KeyError, match="GDP"):
+        resample({'M': monthly_block([1.0])}, rules)
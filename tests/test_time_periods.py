@@ -0,0 +1,58 @@
+"""
+===============================================================================
+ Script Name: test_time_periods.py
+ Author: Igor Latii
+ Description:
+     Tests of the TIME_PERIOD parser (src/time_periods.py): every supported
+     label and the start date it maps to, invalid labels (NaT, no
+     frequency), the column parser on categorical and missing labels, and
+     infer_frequency.
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from time_periods import infer_frequency, parse_label, parse_time_periods  # noqa: E402
+
+
+@pytest.mark.parametrize('label, expected, freq', [('2020', '2020-01-01', 'A'), ('2020-S2', '2020-07-01', 'S'),
+                                                   ('2020-Q3', '2020-07-01', 'Q'), ('2020-11', '2020-11-01', 'M'),
+                                                   ('2020-W01', '2019-12-30', 'W'), ('2020-02-29', '2020-02-29', 'D'),
+                                                   (' 2021 ', '2021-01-01', 'A'), (2022, '2022-01-01', 'A')])
+def test_parse_label(label, expected, freq):
+    assert parse_label(label) == (np.datetime64(expected, 'ns'), freq)
+
+
+@pytest.mark.parametrize('label', ['2020-Q5', '2020-13', '2020-S3', '2021-02-29', '2020-W54', '2020Q1', '20', '', None])
+def test_invalid_label(label):
+    value, freq = parse_label(label)
+    assert np.isnat(value) and freq is None
+
+
+def test_parse_time_periods():
+    labels = pd.Series(['2020-Q1', None, '2020-Q5', '2020', '2020-Q1'], dtype='category', name='TIME_PERIOD')
+    dates, freqs = parse_time_periods(labels)
+
+    assert dates.dtype == 'datetime64[ns]' and dates.name == 'TIME_PERIOD'
+    assert dates.tolist()[0] == pd.Timestamp('2020-01-01') and dates.tolist()[3] == pd.Timestamp('2020-01-01')
+    assert dates.isna().tolist() == [False, True, True, False, False]
+    assert freqs.tolist()[:1] + freqs.tolist()[3:] == ['Q', 'A', 'Q']
+    assert freqs.isna().tolist() == [False, True, True, False, False]
+
+
+@pytest.mark.parametrize('dates, expected', [(['2020-01-01', '2021-01-01'], 'A'), (['2020-01-01', '2020-07-01'], 'S'),
+                                             (['2020-01-01', '2020-04-01'], 'Q'), (['2020-02-01'], 'M'),
+                                             (['2020-01-06', '2020-01-13'], 'W'), (['2020-01-07'], 'D'),
+                                             ([None], None)])
+def test_infer_frequency(dates, expected):
+    assert infer_frequency(pd.to_datetime(pd.Series(dates))) == expected
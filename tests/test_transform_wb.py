@@ -0,0 +1,64 @@
+"""
+===============================================================================
+ Script Name: test_transform_wb.py
+ Author: Igor Latii
+ Description:
+     Tests of the World Bank long format (src/transform_to_long_format_WB.py):
+     an indicator with several countries in its geo_filter is written as one
+     table per country (`__{geo}` suffix), so that merging outside panel mode
+     keeps the countries apart instead of summing them.
+
+ Usage:
+     python -m pytest tests
+===============================================================================
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from indicator_config import indicator_code  # noqa: E402
+from storage import read_table  # noqa: E402
+from transform_to_long_format_WB import output_stems, transform_file  # noqa: E402
+
+API_FILE = 'API_SM.POP.NETM_DS2_en_csv_v2_126864.csv'
+
+
+def write_api_file(path):
+    lines = ['"Data Source","World Development Indicators",', '', '"Last Updated Date","2024-01-01",', '',
+             '"Country Name","Country Code","Indicator Name","Indicator Code","2020","2021",',
+             '"Latvia","LVA","Net migration","SM.POP.NETM","1","2",',
+             '"Estonia","EST","Net migration","SM.POP.NETM","10","",',
+             '"Lithuania","LTU","Net migration","SM.POP.NETM","100","200",']
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def indicators(geo_filter):
+    return pd.DataFrame({'code': ['SM.POP.NETM'], 'geo_filter': [geo_filter], 'years': ['']})
+
+
+def test_one_table_per_geo(tmp_path):
+    source = write_api_file(tmp_path / API_FILE)
+    paths = transform_file(source, str(tmp_path), indicators('LV;EE'))
+
+    stems = output_stems(source, str(tmp_path), indicators('LV;EE'))
+    assert [os.path.basename(s) for s in stems] == ['API_SM.POP.NETM_DS2_en_csv_v2_126864__LV_long',
+                                                    'API_SM.POP.NETM_DS2_en_csv_v2_126864__EE_long']
+    lv, ee = (read_table(p) for p in paths)
+    assert lv['geo'].tolist() == ['LV', 'LV'] and lv['VALUE'].tolist() == [1.0, 2.0]
+    assert ee['geo'].tolist() == ['EE'] and ee['VALUE'].tolist() == [10.0]
+    # Merged column key of the formatted EE table: code and geo as for Eurostat tables
+    assert indicator_code('API_SM.POP.NETM_DS2_en_csv_v2_126864__EE') == ('SM.POP.NETM', 'EE')
+
+
+def test_single_geo_keeps_file_name(tmp_path):
+    source = write_api_file(tmp_path / API_FILE)
+    path = transform_file(source, str(tmp_path), indicators('LT'))
+
+    assert os.path.basename(output_stems(source, str(tmp_path), indicators('LT'))[0]) == \
+        'API_SM.POP.NETM_DS2_en_csv_v2_126864_long'
+    assert read_table(path)['VALUE'].tolist() == [100.0, 200.0]